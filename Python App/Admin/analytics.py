@@ -0,0 +1,135 @@
+import numpy as np
+
+from .snapshot import AnalyticsSnapshot, from_epoch_us
+
+
+# Vectorized Admin Analytics over the columnar snapshot (Admin/snapshot.py)
+#
+# Group-bys are np.unique(..., return_inverse=True) + np.bincount over the
+# memory-mapped columns; nothing goes through the ORM. Money is int64 paise
+# throughout and only turned into rupee strings for output. The platform fee
+# is 5% rounded down per payment, the same as wallet.ledger.admin_fee.
+
+MICROSECONDS_PER_HOUR = 3_600_000_000
+
+
+def rupees(paise):
+    paise = int(paise)
+    sign = '-' if paise < 0 else ''
+    return f"{sign}{abs(paise) // 100}.{abs(paise) % 100:02d}"
+
+
+def fee_paise(amount_paise):
+    return amount_paise * 5 // 100
+
+
+def successful_payments(snapshot, start=None, end=None):
+    """
+    Columns of the SUCCESS payments, optionally limited to created_at in
+    [start, end) given as epoch microseconds.
+    """
+    payments = snapshot.table('payments')
+    mask = payments['status'] == snapshot.choice_code('payments', 'status', 'SUCCESS')
+    if start is not None:
+        mask &= payments['created_at'] >= start
+    if end is not None:
+        mask &= payments['created_at'] < end
+    return {column: values[mask] for column, values in payments.items()}
+
+
+def revenue_by_hour(snapshot, start=None, end=None, hour_of_day=False):
+    """
+    Payments, gross and platform fee per UTC hour bucket, or per hour of
+    the day (0-23) summed over the whole range when ``hour_of_day`` is set.
+    """
+    payments = successful_payments(snapshot, start, end)
+    hours = payments['created_at'] // MICROSECONDS_PER_HOUR
+    if hour_of_day:
+        hours = hours % 24
+    buckets, inverse = np.unique(hours, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(buckets))
+    gross = np.bincount(inverse, weights=payments['amount'], minlength=len(buckets))
+    fees = np.bincount(inverse, weights=fee_paise(payments['amount']), minlength=len(buckets))
+    return [
+        {
+            ("hour" if hour_of_day else "bucket"):
+                int(bucket) if hour_of_day else from_epoch_us(int(bucket) * MICROSECONDS_PER_HOUR),
+            "payment_count": int(count),
+            "gross_amount": rupees(round(total)),
+            "platform_fee": rupees(round(fee)),
+        }
+        for bucket, count, total, fee in zip(buckets, counts, gross, fees)
+    ]
+
+
+def driver_earnings(snapshot, start=None, end=None):
+    # (driver codes, gross paise per driver) over the SUCCESS payments
+    payments = successful_payments(snapshot, start, end)
+    drivers, inverse = np.unique(payments['driver_id'], return_inverse=True)
+    # bincount weights are float64, exact for sums below 2**53 paise
+    gross = np.bincount(inverse, weights=payments['amount'], minlength=len(drivers)).astype(np.int64)
+    return drivers, gross
+
+
+def driver_percentiles(snapshot, percentiles=(50, 75, 90, 99), start=None, end=None):
+    """
+    Percentiles of per-driver gross earnings, plus the top drivers.
+    """
+    drivers, gross = driver_earnings(snapshot, start, end)
+    if not len(drivers):
+        return {"drivers": 0, "percentiles": {}, "top": []}
+    values = np.percentile(gross, percentiles, method='lower')
+    top = np.argsort(gross)[::-1][:10]
+    return {
+        "drivers": int(len(drivers)),
+        "percentiles": {f"p{p}": rupees(value) for p, value in zip(percentiles, values)},
+        "top": [
+            {"driver_id": str(driver_id), "gross_amount": rupees(gross[i])}
+            for driver_id, i in zip(snapshot.decode('driver_id', drivers[top]), top)
+        ],
+    }
+
+
+def payment_method_mix(snapshot, start=None, end=None):
+    """
+    Share of SUCCESS payments and of gross amount per payment method.
+    """
+    payments = successful_payments(snapshot, start, end)
+    methods = snapshot.choices('payments', 'payment_method')
+    counts = np.bincount(payments['payment_method'], minlength=len(methods))
+    gross = np.bincount(payments['payment_method'], weights=payments['amount'], minlength=len(methods))
+    total_count, total_gross = counts.sum(), gross.sum()
+    return {
+        method: {
+            "payment_count": int(counts[code]),
+            "gross_amount": rupees(round(gross[code])),
+            "count_share": round(float(counts[code] / total_count), 4) if total_count else 0.0,
+            "gross_share": round(float(gross[code] / total_gross), 4) if total_gross else 0.0,
+        }
+        for code, method in enumerate(methods)
+    }
+
+
+def wallet_balance_percentiles(snapshot, percentiles=(50, 90, 99)):
+    # actual_balance over active wallets
+    wallets = snapshot.table('wallets')
+    balances = wallets['actual_balance'][wallets['is_active'] == 1]
+    if not len(balances):
+        return {"wallets": 0, "percentiles": {}}
+    values = np.percentile(balances, percentiles, method='lower')
+    return {
+        "wallets": int(len(balances)),
+        "percentiles": {f"p{p}": rupees(value) for p, value in zip(percentiles, values)},
+        "pending_deductions": rupees(wallets['a_deduct'][wallets['is_active'] == 1].sum()),
+    }
+
+
+def analytics_report(directory=None, start=None, end=None):
+    snapshot = AnalyticsSnapshot(directory)
+    return {
+        "generated_at": snapshot.generated_at,
+        "revenue_by_hour_of_day": revenue_by_hour(snapshot, start, end, hour_of_day=True),
+        "driver_earnings": driver_percentiles(snapshot, start=start, end=end),
+        "payment_method_mix": payment_method_mix(snapshot, start, end),
+        "wallet_balances": wallet_balance_percentiles(snapshot),
+    }
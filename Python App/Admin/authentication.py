@@ -0,0 +1,71 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
+
+from .tokens import ACCESS, TokenError, verify_token
+
+
+# The Admin Behind A Verified Access Token (no database read)
+class AdminPrincipal:
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        self.claims = claims
+        self.admin_id = claims['sub']
+        self.email = claims.get('email')
+        self.role = claims.get('role')
+
+    def __str__(self):
+        return f"{self.email} ({self.role})"
+
+
+# `Authorization: Bearer <access token>`, see Admin/tokens.py
+class AdminTokenAuthentication(BaseAuthentication):
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(parts) != 2:
+            raise AuthenticationFailed("Invalid Authorization header")
+        try:
+            token = parts[1].decode()
+            claims = verify_token(token, ACCESS)
+        except (TokenError, UnicodeDecodeError) as e:
+            raise AuthenticationFailed(str(e))
+        return AdminPrincipal(claims), token
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+# Admin Only, Unless The View's requires_admin(request) Says Otherwise
+class IsAdmin(BasePermission):
+    message = "Admin authentication required"
+
+    def has_permission(self, request, view):
+        requires_admin = getattr(view, 'requires_admin', None)
+        if requires_admin is not None and not requires_admin(request):
+            return True
+        if not settings.ADMIN_TOKENS.get('REQUIRED', True):
+            return True
+        return isinstance(request.user, AdminPrincipal)
+
+
+ADMIN_AUTHENTICATION = [AdminTokenAuthentication]
+ADMIN_PERMISSIONS = [IsAdmin]
+
+
+# Prometheus Scrapes: The Scrape Token, Or An Address From METRICS_ALLOWED_IPS
+def scrape_allowed(request):
+    token = getattr(settings, 'METRICS_SCRAPE_TOKEN', '')
+    if token:
+        parts = get_authorization_header(request).split()
+        if len(parts) == 2 and parts[0].lower() == b'bearer' and hmac.compare_digest(parts[1], token.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
@@ -0,0 +1,390 @@
+import hashlib
+import hmac
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .benchmarks import summarize_latencies
+
+
+# End-to-end Benchmark Suite (`manage.py bench_suite`)
+#
+# Every route of payments/urls.py, wallet/urls.py and Admin/urls.py is one
+# Scenario: a request factory over the seeded data plus an optional untimed
+# setup for requests that consume state (a withdrawal can only be settled
+# once, a wallet only deactivated once). Scenarios are driven through the
+# Django test client from a pool of worker threads, each with its own
+# database connection, and every request is timed and its queries counted.
+# Results are plain JSON so two runs can be diffed with compare_results().
+
+KEY_ID = 'rzp_bench'
+KEY_SECRET = 'bench'
+WEBHOOK_SECRET = 'bench_webhook'
+SCRAPE_TOKEN = 'bench_scrape'
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # request(i) -> (path, body or None) for the i-th request
+    request: object
+    # Untimed, called with the request count before the run
+    setup: object = None
+    # Upper bound on requests for slow or heavy routes
+    max_requests: int = None
+    # headers(raw_body) -> extra request headers, e.g. a body signature
+    headers: object = None
+
+
+@dataclass
+class BenchData:
+    wallets: list
+    payments: list
+    rng: random.Random
+
+    def active_wallets(self):
+        return [wallet for wallet in self.wallets if wallet.is_active]
+
+
+def _signed(secret, message):
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+def _coordinate(rng):
+    return [72.8 + rng.random() * 0.2, 19.0 + rng.random() * 0.2]
+
+
+def _new_wallets(count):
+    from wallet.models import Wallet
+    return Wallet.objects.bulk_create([Wallet(driver_id=uuid.uuid4(), actual_balance=Decimal("1000.00"))
+                                       for _ in range(count)])
+
+
+def _pending_payments(count, wallets, rng):
+    from payments.models import Payment
+    payments = []
+    for i in range(count):
+        wallet = wallets[i % len(wallets)]
+        order_id = f"order_bench{uuid.uuid4().hex[:12]}"
+        payments.append(Payment(
+            wallet=wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(), driver_id=wallet.driver_id,
+            amount=Decimal(rng.randint(50, 900)), payment_method='UPI', status='PENDING',
+            transaction_meta_data={"id": order_id}, razorpay_order_id=order_id))
+    return Payment.objects.bulk_create(payments)
+
+
+def _requested_withdrawals(count, wallets):
+    from wallet.models import Withdraw
+    return Withdraw.objects.bulk_create([
+        Withdraw(wallet=wallets[i % len(wallets)], amount=Decimal("10.00"), account_holder_name="Driver",
+                 bank_name="Bank", ifsc_code="IFSC0001", account_number="1234567890")
+        for i in range(count)
+    ])
+
+
+def build_scenarios(data):
+    """
+    One Scenario per route. Consumable state (pending payments, fresh
+    wallets, REQUESTED withdrawals, admins) is created by each scenario's
+    setup so every timed request does real work.
+    """
+    rng = data.rng
+    active = data.active_wallets()
+    state = {}
+
+    def pick(items):
+        return items[rng.randrange(len(items))]
+
+    def ride(wallet):
+        return {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                "driver_id": str(wallet.driver_id), "amount": "150.00"}
+
+    def order(i):
+        return {**ride(pick(active)), "amount": 150, "payment_method": "CARD"}
+
+    def verify(i):
+        payment = state['verify'][i]
+        razorpay_payment_id = f"pay_bench{i:010d}"
+        order_id = payment.razorpay_order_id
+        return {"payment_id": str(payment.payment_id), "ride_id": str(payment.ride_id),
+                "razorpay_order_id": order_id, "razorpay_payment_id": razorpay_payment_id,
+                "razorpay_signature": _signed(KEY_SECRET, f"{order_id}|{razorpay_payment_id}")}
+
+    def setup_verify(count):
+        state['verify'] = _pending_payments(count, active, rng)
+
+    def webhook(i):
+        payment = state['webhook'][i]
+        return {"event": "payment.captured", "payload": {"payment": {"entity": {
+            "id": f"pay_hook{i:010d}", "order_id": payment.razorpay_order_id,
+            "amount": int(payment.amount * 100)}}}}
+
+    def setup_webhook(count):
+        state['webhook'] = _pending_payments(count, active, rng)
+
+    def setup_fresh_wallets(key):
+        def setup(count):
+            state[key] = _new_wallets(count)
+        return setup
+
+    def setup_withdrawals(count):
+        state['withdrawals'] = _requested_withdrawals(count, _new_wallets(count))
+
+    def setup_bonus_job(count):
+        from wallet.bonus_jobs import create_bonus_job
+        state['bonus_job'] = create_bonus_job(Decimal("1.00"))
+
+    def setup_admins(count):
+        from django.contrib.auth.hashers import make_password
+        from Admin.models import Admin
+        if len(state.get('admins', ())) >= count:
+            return
+        password = make_password("bench-password")
+        state['admins'] = Admin.objects.bulk_create([
+            Admin(name="Bench Admin", email=f"bench-{uuid.uuid4().hex[:12]}@example.com", phone="9999999999",
+                  password=password)
+            for _ in range(max(count, 1))
+        ])
+
+    def setup_token_pairs(key):
+        def setup(count):
+            from .tokens import issue_tokens
+            setup_admins(1)
+            state[key] = [issue_tokens(state['admins'][0]) for _ in range(count)]
+        return setup
+
+    def logout_headers(raw):
+        # Each logout revokes its own access token, found by the refresh token in the body
+        refresh = json.loads(raw)["refresh"]
+        access = next(pair["access"] for pair in state['logout'] if pair["refresh"] == refresh)
+        return {"Authorization": f"Bearer {access}"}
+
+    def fare_pairs(i):
+        return {"pairs": [{"origin": _coordinate(rng), "destination": _coordinate(rng)} for _ in range(20)]}
+
+    # Admin-only routes carry one access token, verified once then served from the LRU
+    from .models import Admin
+    from .tokens import auth_header
+    authorization = auth_header(Admin(name="Bench Admin", email="bench-admin@example.com"))
+
+    def as_admin(raw):
+        return authorization
+
+    earnings_range = "?start=2020-01-01&end=2100-01-01"
+    return [
+        # payments/urls.py
+        Scenario('payments.create_order', 'POST', lambda i: ('/payments/create-order/', order(i))),
+        Scenario('payments.create_order_async', 'POST', lambda i: ('/payments/create-order-async/', order(i))),
+        Scenario('payments.verify_payment', 'POST', lambda i: ('/payments/verify-payment/', verify(i)),
+                 setup=setup_verify),
+        Scenario('payments.verify_payment_async', 'POST',
+                 lambda i: ('/payments/verify-payment-async/', verify(i)), setup=setup_verify),
+        Scenario('payments.checkout', 'GET', lambda i: ('/payments/checkout/', None)),
+        Scenario('payments.completed_payments', 'GET', lambda i: ('/payments/completed-payments/?limit=50', None),
+                 headers=as_admin),
+        Scenario('payments.completed_payments_by_wallet', 'GET',
+                 lambda i: (f'/payments/completed-payments/{pick(data.wallets).wallet_id}/', None)),
+        Scenario('payments.payment_details', 'GET',
+                 lambda i: (f'/payments/getPaymentDetails/{pick(data.payments).ride_id}/', None)),
+        Scenario('payments.cash_payment', 'POST', lambda i: ('/payments/cash-payment/', ride(pick(active)))),
+        Scenario('payments.cash_payment_bulk', 'POST', lambda i: (
+            '/payments/cash-payment/bulk/', {"payments": [ride(pick(active)) for _ in range(50)]}),
+            max_requests=40),
+        Scenario('payments.webhook', 'POST', lambda i: ('/payments/webhook/', webhook(i)), setup=setup_webhook,
+                 headers=lambda raw: {"X-Razorpay-Signature": _signed(WEBHOOK_SECRET, raw)}),
+
+        # wallet/urls.py
+        Scenario('wallet.list', 'GET', lambda i: ('/wallet/driver-wallet/?limit=50', None), headers=as_admin),
+        Scenario('wallet.get', 'GET', lambda i: (f'/wallet/driver-wallet/{pick(active).driver_id}/', None)),
+        Scenario('wallet.create', 'POST', lambda i: (f'/wallet/driver-wallet/{uuid.uuid4()}/', None)),
+        Scenario('wallet.deactivate', 'PATCH',
+                 lambda i: (f"/wallet/driver-wallet/{state['deactivate'][i].driver_id}/", None),
+                 setup=setup_fresh_wallets('deactivate')),
+        Scenario('wallet.withdraw_list', 'GET', lambda i: (f'/wallet/withdraw/{pick(data.wallets).driver_id}/', None)),
+        Scenario('wallet.withdraw_create', 'POST', lambda i: (
+            f"/wallet/withdraw/{state['withdraw'][i].driver_id}/",
+            {"amount": "25.00", "account_holder_name": "Driver", "bank_name": "Bank",
+             "ifsc_code": "IFSC0001", "account_number": "1234567890"}),
+            setup=setup_fresh_wallets('withdraw')),
+        Scenario('wallet.withdraw_requested', 'GET', lambda i: ('/wallet/withdraw/', None), max_requests=50,
+                 headers=as_admin),
+        Scenario('wallet.withdraw_status', 'PATCH', lambda i: (
+            f"/wallet/withdraw/status/{state['withdrawals'][i].withdraw_id}/", {"status": "COMPLETED"}),
+            setup=setup_withdrawals, headers=as_admin),
+        Scenario('wallet.bonus_single', 'POST',
+                 lambda i: (f'/wallet/bonus/{pick(active).wallet_id}/', {"amount": "5"}), headers=as_admin),
+        Scenario('wallet.bonus_all', 'POST', lambda i: ('/wallet/bonus/', {"amount": "1"}), max_requests=3,
+                 headers=as_admin),
+        Scenario('wallet.bonus_job_status', 'GET',
+                 lambda i: (f"/wallet/bonus/jobs/{state['bonus_job'].job_id}/", None), setup=setup_bonus_job,
+                 headers=as_admin),
+        Scenario('wallet.cache_stats', 'GET', lambda i: ('/wallet/cache-stats/', None), headers=as_admin),
+
+        # Admin/urls.py
+        Scenario('admin.fare', 'POST',
+                 lambda i: ('/analysis/fare-cal', {"cordinates": [_coordinate(rng), _coordinate(rng)]})),
+        Scenario('admin.fare_async', 'POST',
+                 lambda i: ('/analysis/fare-cal-async', {"cordinates": [_coordinate(rng), _coordinate(rng)]})),
+        Scenario('admin.fare_batch', 'POST', lambda i: ('/analysis/fare-cal/batch', fare_pairs(i))),
+        Scenario('admin.fare_cache_stats', 'GET', lambda i: ('/analysis/fare-cal/cache-stats', None), headers=as_admin),
+        Scenario('admin.outbound_metrics', 'GET', lambda i: ('/analysis/outbound-metrics', None), headers=as_admin),
+        Scenario('admin.metrics', 'GET', lambda i: ('/analysis/metrics', None),
+                 headers=lambda raw: {"Authorization": f"Bearer {SCRAPE_TOKEN}"}),
+        Scenario('admin.earnings', 'GET', lambda i: (f'/analysis/earnings/{earnings_range}', None), headers=as_admin),
+        Scenario('admin.earnings_top_drivers', 'GET', lambda i: (f'/analysis/earnings/drivers/{earnings_range}', None),
+                 headers=as_admin),
+        Scenario('admin.earnings_driver', 'GET', lambda i: (
+            f'/analysis/earnings/drivers/{pick(active).driver_id}/{earnings_range}', None), headers=as_admin),
+        # Password hashing dominates these three, keep them short
+        Scenario('admin.register', 'POST', lambda i: ('/analysis/register/', {
+            "name": "Bench Admin", "email": f"new{i}-{uuid.uuid4().hex[:8]}@example.com",
+            "phone": "9999999999", "password": "bench-password"}), max_requests=20, headers=as_admin),
+        Scenario('admin.login', 'POST', lambda i: ('/analysis/login/', {
+            "email": state['admins'][i].email, "password": "bench-password"}), setup=setup_admins, max_requests=20),
+        Scenario('admin.token_refresh', 'POST',
+                 lambda i: ('/analysis/token/refresh/', {"refresh": state['refresh'][i]["refresh"]}),
+                 setup=setup_token_pairs('refresh')),
+        Scenario('admin.logout', 'POST', lambda i: ('/analysis/logout/', {"refresh": state['logout'][i]["refresh"]}),
+                 setup=setup_token_pairs('logout'), headers=logout_headers),
+        Scenario('admin.detail', 'GET',
+                 lambda i: (f"/analysis/admin/{state['admins'][i % len(state['admins'])].email}/", None),
+                 setup=setup_admins, headers=as_admin),
+    ]
+
+
+def seed(wallets, payments_per_wallet, withdrawals_per_wallet, seed_value=7):
+    from RideHailingApp.query_plans import seed_dataset
+    from payments.models import Payment
+
+    wallet_rows = seed_dataset(wallets, payments_per_wallet, withdrawals_per_wallet, seed=seed_value)
+    return BenchData(
+        wallets=wallet_rows,
+        payments=list(Payment.objects.only('payment_id', 'ride_id')),
+        rng=random.Random(seed_value),
+    )
+
+
+def run_scenario(scenario, requests, concurrency):
+    """
+    Send `requests` requests from `concurrency` threads. Returns throughput,
+    latency percentiles, status counts and queries per request.
+    """
+    count = min(requests, scenario.max_requests or requests)
+    if scenario.setup:
+        scenario.setup(count)
+    # Built up front so request factories never race on the shared RNG
+    pending = queue.Queue()
+    for i in range(count):
+        path, body = scenario.request(i)
+        raw = json.dumps(body) if body is not None else None
+        headers = scenario.headers(raw) if scenario.headers else {}
+        pending.put((path, raw, headers))
+
+    samples, statuses, query_counts = [], [], []
+    errors = {}
+    lock = threading.Lock()
+
+    def worker():
+        client = Client()
+        send = getattr(client, scenario.method.lower())
+        try:
+            while True:
+                try:
+                    path, raw, headers = pending.get_nowait()
+                except queue.Empty:
+                    return
+                kwargs = {"content_type": "application/json", "headers": headers}
+                if raw is not None:
+                    kwargs["data"] = raw
+                with CaptureQueriesContext(connections['default']) as queries:
+                    started = time.perf_counter()
+                    try:
+                        response = send(path, **kwargs)
+                        code = response.status_code
+                        content = b"".join(response.streaming_content) if response.streaming else response.content
+                    except Exception as e:
+                        # Raised past the view, e.g. a lock timeout outside its try block
+                        code, content = 'exception', f"{type(e).__name__}: {e}".encode()
+                    elapsed = time.perf_counter() - started
+                with lock:
+                    samples.append(elapsed)
+                    statuses.append(code)
+                    query_counts.append(len(queries))
+                    if code == 'exception' or code >= 400:
+                        errors.setdefault(content[:200].decode(errors='replace'), 0)
+                        errors[content[:200].decode(errors='replace')] += 1
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, count) or 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "method": scenario.method,
+        "requests": count,
+        "requests_per_second": round(count / elapsed, 1) if elapsed else None,
+        "errors": sum(errors.values()),
+        "statuses": {str(code): statuses.count(code) for code in sorted(set(statuses), key=str)},
+        # A few error bodies, so a regression can be told apart from lock contention
+        "error_samples": dict(sorted(errors.items(), key=lambda item: -item[1])[:3]),
+        "latency": summarize_latencies(samples),
+        "queries_per_request": {
+            "mean": round(sum(query_counts) / len(query_counts), 2) if query_counts else 0,
+            "max": max(query_counts, default=0),
+        },
+    }
+
+
+def compare_results(baseline, current, latency_tolerance=0.25, throughput_tolerance=0.25):
+    """
+    Regressions of `current` against `baseline` (two bench_suite JSON
+    results): p95 latency or throughput worse by more than the tolerance,
+    more queries per request, or more errors.
+    """
+    regressions = []
+    for name, now in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        checks = [
+            ("p95_ms", before["latency"].get("p95_ms"), now["latency"].get("p95_ms"),
+             lambda old, new: new > old * (1 + latency_tolerance)),
+            ("requests_per_second", before["requests_per_second"], now["requests_per_second"],
+             lambda old, new: new < old * (1 - throughput_tolerance)),
+            ("queries_per_request", before["queries_per_request"]["mean"], now["queries_per_request"]["mean"],
+             lambda old, new: new > old),
+            ("errors", before["errors"], now["errors"], lambda old, new: new > old),
+        ]
+        for metric, old, new, worse in checks:
+            if old is not None and new is not None and worse(old, new):
+                regressions.append({"scenario": name, "metric": metric, "baseline": old, "current": new})
+    return regressions
+
+
+def bench_settings_overrides(upstream_url, metrics=True):
+    return dict(
+        METRICS_ENABLED=metrics,
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ORS_BASE_URL=upstream_url,
+        RAZORPAY_API_BASE=upstream_url,
+        RAZORPAY_WEBHOOK_SECRET=WEBHOOK_SECRET,
+        METRICS_SCRAPE_TOKEN=SCRAPE_TOKEN,
+        ROUTING_BACKEND='ors',
+        BONUS_JOB_RUN_IN_BACKGROUND=False,
+    )
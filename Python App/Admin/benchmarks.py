@@ -0,0 +1,151 @@
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+from django.db import connections
+
+
+# Shared helpers for the bench_* management commands
+
+
+def summarize_latencies(samples):
+    """
+    Summarize latency samples (seconds) as milliseconds percentiles.
+    """
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(values.tolist()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(values.max()), 4),
+    }
+
+
+# Local stand-in for ORS and Razorpay: answers the matrix and order endpoints
+# after a fixed delay, so benchmarks measure how views wait on upstream I/O.
+# It runs on its own event loop thread so the stand-in itself never becomes
+# the bottleneck, however many connections the benchmark opens.
+class FakeUpstreamServer:
+    def __init__(self, latency=0.1):
+        self.latency = latency
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle_connection, "127.0.0.1", 0, backlog=1024))
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        async def close():
+            self.server.close()
+            # Drop keep-alive connections the clients left open
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                path = request_line.split(" ")[1]
+                headers = dict(line.split(":", 1) for line in header_lines if ":" in line)
+                headers = {key.strip().lower(): value.strip() for key, value in headers.items()}
+                length = int(headers.get("content-length") or 0)
+                payload = json.loads(await reader.readexactly(length) or b"{}")
+
+                await asyncio.sleep(self.latency)
+                status, body = self.respond(path, payload)
+                body = json.dumps(body).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, path, payload):
+        if path == "/v2/matrix/driving-car":
+            return 200, self.matrix(payload)
+        if path == "/v1/orders":
+            return 200, {
+                "id": f"order_{uuid.uuid4().hex[:14]}",
+                "entity": "order",
+                "amount": payload.get("amount"),
+                "currency": payload.get("currency", "INR"),
+                "status": "created",
+            }
+        return 404, {"error": {"description": "Unknown endpoint"}}
+
+    @staticmethod
+    def matrix(payload):
+        # Straight-line metres between locations, enough to price a fare
+        locations = np.radians(np.asarray(payload["locations"], dtype=np.float64))
+        sources = payload.get("sources", list(range(len(locations))))
+        destinations = payload.get("destinations", list(range(len(locations))))
+        origins = locations[sources][:, None, :]
+        targets = locations[destinations][None, :, :]
+        dlon = targets[..., 0] - origins[..., 0]
+        dlat = targets[..., 1] - origins[..., 1]
+        a = np.sin(dlat / 2) ** 2 + np.cos(origins[..., 1]) * np.cos(targets[..., 1]) * np.sin(dlon / 2) ** 2
+        distances = 2 * 6_371_000 * np.arcsin(np.sqrt(a))
+        return {"distances": distances.tolist(), "durations": (distances / 7).tolist()}
+
+
+@contextlib.contextmanager
+def fake_upstream(latency=0.1):
+    server = FakeUpstreamServer(latency)
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+@contextlib.contextmanager
+def benchmark_database():
+    """
+    Create a throwaway test database for a benchmark run. SQLite gets a
+    temporary file instead of the shared in-memory database so concurrent
+    worker threads do not trip over table locks.
+    """
+    connection = connections["default"]
+    tmpdir = None
+    if connection.vendor == "sqlite":
+        tmpdir = tempfile.mkdtemp(prefix="bench-db-")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
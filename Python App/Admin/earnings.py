@@ -0,0 +1,262 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from payments.models import Payment
+from wallet.ledger import CENTS, ZERO, admin_fee, to_amount
+from .models import DriverEarningsRollup, PlatformEarningsRollup
+
+
+# Earnings Rollups
+#
+# Successful payments are summed into hourly and daily buckets (UTC), per
+# driver and platform-wide, split by payment method. Payment.process_wallet_update
+# calls record_payment_rollups() in the transaction that applies the payment,
+# so dashboards read a few rollup rows instead of every Payment. Buckets are
+# keyed on the payment's created_at, which lets rebuild_day() recompute them
+# from history with the same result. platform_fee is the 5% admin fee from
+# wallet.ledger.admin_fee, rounded per payment exactly as the ledger does.
+#
+# Every payment would otherwise update the same platform-wide hour and day
+# rows, serializing all payment transactions behind them (and undoing the
+# wallet striping of wallet/stripes.py). Platform buckets are therefore split
+# over EARNINGS_PLATFORM_STRIPES rows, picked by the payment id like wallet
+# stripes; readers sum over them. Driver rows are only contended by the
+# driver's own payments and are not striped.
+#
+# rebuild_day() reads a day's payments and replaces its rows in one
+# transaction that holds off rollup writers (on PostgreSQL an explicit table
+# lock, SQLite transactions already exclude other writers), so a payment
+# committed during a backfill is either counted by it or added on top of it.
+
+GRANULARITIES = ('HOUR', 'DAY')
+BUCKET_SIZE = {'HOUR': timedelta(hours=1), 'DAY': timedelta(days=1)}
+ROLLUP_MODELS = (PlatformEarningsRollup, DriverEarningsRollup)
+
+# Longest hourly series served by one request
+MAX_SERIES_BUCKETS = 24 * 31
+
+
+def bucket_start(moment, granularity):
+    moment = moment.astimezone(dt_timezone.utc)
+    if granularity == 'DAY':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def payment_figures(amount):
+    # (gross, platform fee, driver net) of one payment
+    gross = to_amount(amount)
+    fee = admin_fee(gross)
+    return gross, fee, gross - fee
+
+
+def platform_stripe(payment_id):
+    return payment_id.int % max(1, getattr(settings, 'EARNINGS_PLATFORM_STRIPES', 1))
+
+
+def rollup_keys(driver_id, payment_method, created_at, stripe=0):
+    for granularity in GRANULARITIES:
+        key = {"granularity": granularity, "bucket": bucket_start(created_at, granularity),
+               "payment_method": payment_method}
+        yield PlatformEarningsRollup, {**key, "stripe": stripe}
+        yield DriverEarningsRollup, {**key, "driver_id": driver_id}
+
+
+def increment_rollup(model, key, count, gross, fee):
+    deltas = {
+        "payment_count": F("payment_count") + count,
+        "gross_amount": F("gross_amount") + gross,
+        "platform_fee": F("platform_fee") + fee,
+        "net_amount": F("net_amount") + (gross - fee),
+        "updated_at": timezone.now(),
+    }
+    if model.objects.filter(**key).update(**deltas):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, payment_count=count, gross_amount=gross,
+                                 platform_fee=fee, net_amount=gross - fee)
+    except IntegrityError:
+        # Another payment opened the bucket first
+        model.objects.filter(**key).update(**deltas)
+
+
+@transaction.atomic
+def record_payment_rollups(payment):
+    # Same rows rebuild_day() counts
+    if payment.status != 'SUCCESS':
+        return
+    gross, fee, _ = payment_figures(payment.amount)
+    for model, key in rollup_keys(payment.driver_id, payment.payment_method, payment.created_at,
+                                  platform_stripe(payment.payment_id)):
+        increment_rollup(model, key, 1, gross, fee)
+
+
+@transaction.atomic
+def record_payments_rollups(payments):
+    # Many payments at once: summed per bucket first, one increment per bucket,
+    # all on the platform stripe of the batch's first payment
+    payments = [payment for payment in payments if payment.status == 'SUCCESS']
+    if not payments:
+        return
+    stripe = platform_stripe(payments[0].payment_id)
+    totals = {}
+    for payment in payments:
+        gross, fee, _ = payment_figures(payment.amount)
+        for model, key in rollup_keys(payment.driver_id, payment.payment_method, payment.created_at, stripe):
+            row = totals.setdefault((model, tuple(sorted(key.items()))), [0, ZERO, ZERO])
+            row[0] += 1
+            row[1] += gross
+            row[2] += fee
+    for (model, key), (count, gross, fee) in totals.items():
+        increment_rollup(model, dict(key), count, gross, fee)
+
+
+def lock_rollups():
+    # Block rollup writers, not readers, until the transaction ends
+    connection = transaction.get_connection()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for model in ROLLUP_MODELS:
+                cursor.execute(f'LOCK TABLE {connection.ops.quote_name(model._meta.db_table)} '
+                               f'IN SHARE ROW EXCLUSIVE MODE')
+
+
+@transaction.atomic
+def rebuild_day(day, chunk_size=2000):
+    """
+    Recompute every rollup bucket of one UTC day from its successful
+    payments, replacing what is stored. Returns the number of payments.
+    """
+    lock_rollups()
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    end = start + timedelta(days=1)
+    payments = (Payment.objects.filter(status='SUCCESS', created_at__gte=start, created_at__lt=end)
+                .values_list('payment_id', 'driver_id', 'payment_method', 'amount', 'created_at'))
+
+    totals, count = {}, 0
+    for payment_id, driver_id, payment_method, amount, created_at in payments.iterator(chunk_size=chunk_size):
+        gross, fee, _ = payment_figures(amount)
+        count += 1
+        for model, key in rollup_keys(driver_id, payment_method, created_at, platform_stripe(payment_id)):
+            row = totals.setdefault((model, tuple(sorted(key.items()))), [0, ZERO, ZERO])
+            row[0] += 1
+            row[1] += gross
+            row[2] += fee
+
+    for model in ROLLUP_MODELS:
+        model.objects.filter(granularity__in=GRANULARITIES, bucket__gte=start, bucket__lt=end).delete()
+    for model in ROLLUP_MODELS:
+        model.objects.bulk_create([
+            model(**dict(key), payment_count=payment_count, gross_amount=gross,
+                  platform_fee=fee, net_amount=gross - fee)
+            for (row_model, key), (payment_count, gross, fee) in totals.items() if row_model is model
+        ], batch_size=1000)
+    return count
+
+
+def rebuild_rollups(start_day, end_day, chunk_size=2000):
+    # Day by day, each day in its own transaction; yields (day, payments)
+    day = start_day
+    while day < end_day:
+        yield day, rebuild_day(day, chunk_size)
+        day += timedelta(days=1)
+
+
+def parse_moment(value, granularity):
+    # ISO date or datetime; naive values are UTC
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return bucket_start(moment, granularity)
+
+
+def parse_range(params, default_days=30):
+    """
+    (start, end, granularity) from ?start=&end=&granularity=day|hour, aligned
+    to whole buckets with end exclusive. Defaults to the last default_days.
+    """
+    granularity = params.get('granularity', 'day').upper()
+    if granularity not in GRANULARITIES:
+        raise ValueError("granularity must be 'day' or 'hour'")
+    size = BUCKET_SIZE[granularity]
+
+    end = parse_moment(params['end'], granularity) if params.get('end') else \
+        bucket_start(timezone.now(), granularity) + size
+    start = parse_moment(params['start'], granularity) if params.get('start') else \
+        bucket_start(end - timedelta(days=default_days), granularity)
+    if start >= end:
+        raise ValueError("start must be before end")
+    if granularity == 'HOUR' and (end - start) / size > MAX_SERIES_BUCKETS:
+        raise ValueError(f"Hourly ranges are limited to {MAX_SERIES_BUCKETS} hours")
+    return start, end, granularity
+
+
+# Aliases differ from the field names, annotate() refuses to shadow a field
+ROLLUP_SUMS = {
+    "sum_count": Sum("payment_count"),
+    "sum_gross": Sum("gross_amount"),
+    "sum_fee": Sum("platform_fee"),
+    "sum_net": Sum("net_amount"),
+}
+
+
+def _money(value):
+    # SQLite sums decimals as floats
+    return str(Decimal(value or ZERO).quantize(CENTS))
+
+
+def _figures(row):
+    return {
+        "payment_count": row["sum_count"] or 0,
+        "gross_amount": _money(row["sum_gross"]),
+        "platform_fee": _money(row["sum_fee"]),
+        "net_amount": _money(row["sum_net"]),
+    }
+
+
+def earnings_summary(start, end, granularity='DAY', driver_id=None):
+    """
+    Totals, per payment method totals and the per-bucket series for
+    [start, end), platform-wide or for one driver.
+    """
+    if driver_id:
+        rows = DriverEarningsRollup.objects.filter(driver_id=driver_id)
+    else:
+        rows = PlatformEarningsRollup.objects.all()
+    rows = rows.filter(granularity=granularity, bucket__gte=start, bucket__lt=end)
+
+    return {
+        "start": start,
+        "end": end,
+        "granularity": granularity.lower(),
+        "totals": _figures(rows.aggregate(**ROLLUP_SUMS)),
+        "by_payment_method": {
+            row["payment_method"]: _figures(row)
+            for row in rows.values("payment_method").annotate(**ROLLUP_SUMS).order_by("payment_method")
+        },
+        "series": [
+            {"bucket": row["bucket"], **_figures(row)}
+            for row in rows.values("bucket").annotate(**ROLLUP_SUMS).order_by("bucket")
+        ],
+    }
+
+
+def top_drivers(start, end, limit=50):
+    # Drivers by net earnings over [start, end), from the daily buckets
+    rows = (DriverEarningsRollup.objects
+            .filter(granularity='DAY', bucket__gte=start, bucket__lt=end)
+            .values("driver_id").annotate(days=Count("bucket", distinct=True), **ROLLUP_SUMS)
+            .order_by("-sum_net", "driver_id")[:limit])
+    return [{"driver_id": str(row["driver_id"]), "active_days": row["days"], **_figures(row)} for row in rows]
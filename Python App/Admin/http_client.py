@@ -0,0 +1,352 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from RideHailingApp.metrics import observe_outbound
+
+
+# Outbound HTTP Client
+#
+# One pooled keep-alive requests.Session per upstream (ORS, ...) with
+# connect/read timeouts, bounded retries with jittered backoff for 429/5xx
+# and a circuit breaker that fails fast while the upstream is degraded.
+# Clients are configured per name from settings.OUTBOUND_HTTP.
+
+DEFAULT_CLIENT_CONFIG = {
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': 20,
+    'POOL_BLOCK': False,
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'RETRIES': 2,
+    'BACKOFF_FACTOR': 0.2,
+    'BACKOFF_JITTER': 0.2,
+    # Upper bounds on one wait between attempts, urllib3 would otherwise back
+    # off for up to 120s and honour a Retry-After of up to six hours
+    'BACKOFF_MAX': 10,
+    'MAX_RETRY_AFTER': 10,
+    'RETRY_METHODS': ['GET', 'POST'],
+    'RETRY_STATUSES': [429, 500, 502, 503, 504],
+    'BREAKER_FAILURE_THRESHOLD': 5,
+    'BREAKER_RECOVERY_TIMEOUT': 30,
+}
+
+
+class CappedRetry(Retry):
+    """
+    urllib3 Retry that waits at most ``max_retry_after`` seconds for a
+    Retry-After header (urllib3 only caps it in recent versions).
+    """
+
+    def __init__(self, *args, max_retry_after=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs):
+        # Each attempt gets a fresh Retry built from the __init__ arguments only
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def parse_retry_after(self, retry_after):
+        return min(super().parse_retry_after(retry_after), self.max_retry_after)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                # Let a single trial request through to probe the upstream
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        # The call ended without a verdict, let the next request probe instead
+        with self._lock:
+            self._trial_in_flight = False
+
+    def as_dict(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class OutboundClient:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = {**DEFAULT_CLIENT_CONFIG, **config}
+        self.timeout = (self.config['CONNECT_TIMEOUT'], self.config['READ_TIMEOUT'])
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.config['BREAKER_FAILURE_THRESHOLD'],
+            recovery_timeout=self.config['BREAKER_RECOVERY_TIMEOUT'],
+        )
+        self.retry_statuses = frozenset(self.config['RETRY_STATUSES'])
+        self.requests_sent = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+        retry = CappedRetry(
+            total=self.config['RETRIES'],
+            backoff_factor=self.config['BACKOFF_FACTOR'],
+            backoff_jitter=self.config['BACKOFF_JITTER'],
+            backoff_max=self.config['BACKOFF_MAX'],
+            max_retry_after=self.config['MAX_RETRY_AFTER'],
+            status_forcelist=self.retry_statuses,
+            allowed_methods=frozenset(self.config['RETRY_METHODS']),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=self.config['POOL_CONNECTIONS'],
+            pool_maxsize=self.config['POOL_MAXSIZE'],
+            pool_block=self.config['POOL_BLOCK'],
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def _count(self, failed):
+        with self._lock:
+            self.requests_sent += 1
+            if failed:
+                self.failures += 1
+
+    def request(self, method, url, **kwargs):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Circuit breaker for {self.name} is open")
+        try:
+            return self._send(method, url, **kwargs)
+        except BaseException:
+            # Errors the breaker doesn't count must still free a half-open trial
+            self.breaker.release_trial()
+            raise
+
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            observe_outbound(self.name, 'error', time.perf_counter() - started)
+            self._count(failed=True)
+            self.breaker.record_failure()
+            raise
+        observe_outbound(self.name, response.status_code, time.perf_counter() - started)
+
+        # Retries are already exhausted here, a 429/5xx means the upstream is degraded
+        failed = response.status_code in self.retry_statuses
+        self._count(failed)
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def pool_stats(self):
+        pools = []
+        container = self.adapter.poolmanager.pools
+        for key in list(container.keys()):
+            pool = container.get(key)
+            if pool is None:
+                continue
+            queue = pool.pool
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "maxsize": queue.maxsize if queue is not None else 0,
+                "connections_created": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": queue.qsize() if queue is not None else 0,
+            })
+        return pools
+
+    def metrics(self):
+        return {
+            "requests": self.requests_sent,
+            "failures": self.failures,
+            "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+            "pool": {
+                "pool_connections": self.config['POOL_CONNECTIONS'],
+                "pool_maxsize": self.config['POOL_MAXSIZE'],
+                "hosts": self.pool_stats(),
+            },
+            "breaker": self.breaker.as_dict(),
+        }
+
+
+# Async variant for ASGI views: an httpx.AsyncClient with the same pool size,
+# timeouts and retry policy, sharing the breaker and counters of the sync client
+class AsyncOutboundClient:
+    def __init__(self, sync_client):
+        self.sync = sync_client
+        config = sync_client.config
+        self.retries = config['RETRIES']
+        self.retry_methods = frozenset(config['RETRY_METHODS'])
+        # Like requests with POOL_BLOCK off, connections beyond the pool size
+        # are opened on demand and only POOL_MAXSIZE are kept alive
+        max_connections = config['POOL_MAXSIZE'] if config['POOL_BLOCK'] else None
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=config['POOL_MAXSIZE']),
+            timeout=httpx.Timeout(config['READ_TIMEOUT'], connect=config['CONNECT_TIMEOUT']),
+        )
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.sync.config['MAX_RETRY_AFTER'])
+        config = self.sync.config
+        backoff = config['BACKOFF_FACTOR'] * (2 ** attempt) + random.uniform(0, config['BACKOFF_JITTER'])
+        return min(backoff, config['BACKOFF_MAX'])
+
+    async def request(self, method, url, **kwargs):
+        breaker = self.sync.breaker
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit breaker for {self.sync.name} is open")
+        try:
+            return await self._send(method, url, **kwargs)
+        except BaseException:
+            # Includes cancellation, which would otherwise leave the trial held forever
+            breaker.release_trial()
+            raise
+
+    async def _send(self, method, url, **kwargs):
+        sync = self.sync
+        can_retry = method in self.retry_methods
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if can_retry and attempt < self.retries:
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                observe_outbound(sync.name, 'error', time.perf_counter() - started)
+                sync._count(failed=True)
+                sync.breaker.record_failure()
+                raise
+            if response.status_code in sync.retry_statuses and can_retry and attempt < self.retries:
+                await asyncio.sleep(self._backoff(attempt, response))
+                attempt += 1
+                continue
+            break
+
+        # Like the sync client, retries are part of the call's latency
+        observe_outbound(sync.name, response.status_code, time.perf_counter() - started)
+        failed = response.status_code in sync.retry_statuses
+        sync._count(failed)
+        if failed:
+            sync.breaker.record_failure()
+        else:
+            sync.breaker.record_success()
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# httpx connections belong to the event loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(name):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                config = getattr(settings, 'OUTBOUND_HTTP', {}).get(name, {})
+                client = _clients[name] = OutboundClient(name, config)
+    return client
+
+
+def get_async_client(name):
+    sync_client = get_client(name)
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(name)
+    if client is None or client.sync is not sync_client:
+        client = clients[name] = AsyncOutboundClient(sync_client)
+    return client
+
+
+def all_client_metrics():
+    return {name: client.metrics() for name, client in list(_clients.items())}
+
+
+def reset_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
+        _async_clients.clear()
@@ -0,0 +1,432 @@
+import heapq
+import math
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+
+# Local Routing Engine
+#
+# In-process routing over a road graph file, answered with a contraction
+# hierarchy (CH) so a query only explores the small "upward" search spaces of
+# its two endpoints instead of the whole graph.
+#
+# Road graph file (NumPy .npz, e.g. a preprocessed OSM extract):
+#   node_lon, node_lat        float64[N]  node coordinates
+#   edge_from, edge_to        int32[E]    directed edges (add both directions for two-way roads)
+#   edge_length               float32[E]  metres
+#   edge_duration             float32[E]  seconds, used as the routing weight
+#
+# Contraction hierarchy file (.npz) written by ContractionHierarchy.save():
+#   node_lon, node_lat, rank and two CSR graphs, "up" (edges to higher ranked
+#   nodes) and "down" (edges from higher ranked nodes, stored at their head),
+#   each as <name>_offsets, <name>_targets, <name>_weights, <name>_lengths.
+
+CH_FORMAT_VERSION = 1
+_INF = math.inf
+_METRES_PER_DEGREE = 111_320.0
+
+
+class LocalRoutingError(Exception):
+    """
+    Raised when the local graph cannot answer a query (off-graph point, no path).
+    """
+
+
+class RoadGraph:
+    def __init__(self, node_lon, node_lat, edge_from, edge_to, edge_length, edge_duration):
+        self.node_lon = np.asarray(node_lon, dtype=np.float64)
+        self.node_lat = np.asarray(node_lat, dtype=np.float64)
+        self.edge_from = np.asarray(edge_from, dtype=np.int32)
+        self.edge_to = np.asarray(edge_to, dtype=np.int32)
+        self.edge_length = np.asarray(edge_length, dtype=np.float32)
+        self.edge_duration = np.asarray(edge_duration, dtype=np.float32)
+
+    @property
+    def node_count(self):
+        return len(self.node_lon)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*(data[name] for name in (
+                'node_lon', 'node_lat', 'edge_from', 'edge_to', 'edge_length', 'edge_duration')))
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            node_lon=self.node_lon, node_lat=self.node_lat,
+            edge_from=self.edge_from, edge_to=self.edge_to,
+            edge_length=self.edge_length, edge_duration=self.edge_duration,
+        )
+
+
+def _to_csr(node_count, adjacency):
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    targets, weights, lengths = [], [], []
+    for node in range(node_count):
+        for target, (weight, length) in adjacency[node].items():
+            targets.append(target)
+            weights.append(weight)
+            lengths.append(length)
+        offsets[node + 1] = len(targets)
+    return (
+        offsets,
+        np.asarray(targets, dtype=np.int32),
+        np.asarray(weights, dtype=np.float64),
+        np.asarray(lengths, dtype=np.float64),
+    )
+
+
+def build_contraction_hierarchy(graph, witness_settle_limit=60):
+    """
+    Contract every node of ``graph`` in edge-difference order, adding shortcut
+    edges whenever no witness path exists, and return the resulting hierarchy.
+    """
+    n = graph.node_count
+    out_adj = [dict() for _ in range(n)]
+    in_adj = [dict() for _ in range(n)]
+
+    # Keep only the fastest of parallel edges
+    for u, v, length, duration in zip(graph.edge_from.tolist(), graph.edge_to.tolist(),
+                                      graph.edge_length.tolist(), graph.edge_duration.tolist()):
+        if u == v:
+            continue
+        current = out_adj[u].get(v)
+        if current is None or duration < current[0]:
+            out_adj[u][v] = in_adj[v][u] = (duration, length)
+
+    contracted = [False] * n
+    contracted_neighbours = [0] * n
+    rank = [0] * n
+
+    def witness_distances(source, skip, max_cost):
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap and settled < witness_settle_limit:
+            d, node = heapq.heappop(heap)
+            if d > dist.get(node, _INF):
+                continue
+            if d > max_cost:
+                break
+            settled += 1
+            for nxt, (weight, _) in out_adj[node].items():
+                if nxt == skip or contracted[nxt]:
+                    continue
+                nd = d + weight
+                if nd < dist.get(nxt, _INF):
+                    dist[nxt] = nd
+                    heapq.heappush(heap, (nd, nxt))
+        return dist
+
+    def shortcuts_for(node):
+        incoming = [(u, wl) for u, wl in in_adj[node].items() if not contracted[u]]
+        outgoing = [(w, wl) for w, wl in out_adj[node].items() if not contracted[w]]
+        shortcuts = []
+        if incoming and outgoing:
+            max_out = max(weight for _, (weight, _) in outgoing)
+            for u, (w_in, l_in) in incoming:
+                dist = witness_distances(u, node, w_in + max_out)
+                for w, (w_out, l_out) in outgoing:
+                    if w == u:
+                        continue
+                    cost = w_in + w_out
+                    if dist.get(w, _INF) > cost:
+                        shortcuts.append((u, w, cost, l_in + l_out))
+        return shortcuts, len(incoming) + len(outgoing)
+
+    def priority(node):
+        shortcuts, removed = shortcuts_for(node)
+        return len(shortcuts) - removed + contracted_neighbours[node]
+
+    heap = [(priority(node), node) for node in range(n)]
+    heapq.heapify(heap)
+    order = 0
+    while heap:
+        _, node = heapq.heappop(heap)
+        if contracted[node]:
+            continue
+
+        # Lazy update: re-evaluate and push back if no longer the cheapest
+        current = priority(node)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, node))
+            continue
+
+        shortcuts, _ = shortcuts_for(node)
+        for u, w, cost, length in shortcuts:
+            existing = out_adj[u].get(w)
+            if existing is None or cost < existing[0]:
+                out_adj[u][w] = in_adj[w][u] = (cost, length)
+
+        contracted[node] = True
+        rank[node] = order
+        order += 1
+        for neighbour in set(in_adj[node]) | set(out_adj[node]):
+            contracted_neighbours[neighbour] += 1
+
+    # Split every edge into the upward (forward search) or downward (backward search) graph
+    up = [dict() for _ in range(n)]
+    down = [dict() for _ in range(n)]
+    for u in range(n):
+        for v, weight_length in out_adj[u].items():
+            if rank[u] < rank[v]:
+                up[u][v] = weight_length
+            else:
+                down[v][u] = weight_length
+
+    return ContractionHierarchy(
+        graph.node_lon, graph.node_lat, np.asarray(rank, dtype=np.int32),
+        _to_csr(n, up), _to_csr(n, down),
+    )
+
+
+class ContractionHierarchy:
+    snap_cell_degrees = 0.01
+
+    def __init__(self, node_lon, node_lat, rank, up, down, search_cache_size=4096):
+        self.node_lon = np.asarray(node_lon, dtype=np.float64)
+        self.node_lat = np.asarray(node_lat, dtype=np.float64)
+        self.rank = np.asarray(rank, dtype=np.int32)
+        self.up_arrays = up
+        self.down_arrays = down
+
+        # Plain Python adjacency lists: indexing numpy scalars one by one is much slower
+        self._up = self._adjacency(up)
+        self._down = self._adjacency(down)
+        self._build_snap_index()
+
+        # Upward search spaces only depend on their start node, so the spaces of
+        # hot nodes (airports, stations) are kept and reused across queries
+        self.forward_space = lru_cache(maxsize=search_cache_size)(self._forward_space)
+        self.backward_space = lru_cache(maxsize=search_cache_size)(self._backward_space)
+
+    @property
+    def node_count(self):
+        return len(self.node_lon)
+
+    @staticmethod
+    def _adjacency(csr):
+        offsets, targets, weights, lengths = (array.tolist() for array in csr)
+        edges = list(zip(targets, weights, lengths))
+        return [edges[offsets[node]:offsets[node + 1]] for node in range(len(offsets) - 1)]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['format_version']) != CH_FORMAT_VERSION:
+                raise LocalRoutingError(f"Unsupported contraction hierarchy format in {path}")
+            csr = lambda prefix: tuple(data[f'{prefix}_{part}'] for part in ('offsets', 'targets', 'weights', 'lengths'))
+            return cls(data['node_lon'], data['node_lat'], data['rank'], csr('up'), csr('down'))
+
+    def save(self, path):
+        arrays = {'format_version': np.int32(CH_FORMAT_VERSION),
+                  'node_lon': self.node_lon, 'node_lat': self.node_lat, 'rank': self.rank}
+        for prefix, csr in (('up', self.up_arrays), ('down', self.down_arrays)):
+            for part, array in zip(('offsets', 'targets', 'weights', 'lengths'), csr):
+                arrays[f'{prefix}_{part}'] = array
+
+        # Write next to the target and swap in atomically
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp.npz')
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    # Snapping
+
+    def _build_snap_index(self):
+        cells = {}
+        cell_lon = np.floor(self.node_lon / self.snap_cell_degrees).astype(np.int64)
+        cell_lat = np.floor(self.node_lat / self.snap_cell_degrees).astype(np.int64)
+        for node, key in enumerate(zip(cell_lon.tolist(), cell_lat.tolist())):
+            cells.setdefault(key, []).append(node)
+        self._cells = {key: np.asarray(nodes) for key, nodes in cells.items()}
+
+    def _metres_to(self, nodes, lon, lat):
+        dx = (self.node_lon[nodes] - lon) * _METRES_PER_DEGREE * math.cos(math.radians(lat))
+        dy = (self.node_lat[nodes] - lat) * _METRES_PER_DEGREE
+        return np.hypot(dx, dy)
+
+    def nearest_node(self, lon, lat):
+        """
+        Return (node, distance_m) of the graph node closest to the coordinate.
+        """
+        cx = math.floor(lon / self.snap_cell_degrees)
+        cy = math.floor(lat / self.snap_cell_degrees)
+        candidates = [self._cells[key] for key in
+                      ((cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+                      if key in self._cells]
+        nodes = np.concatenate(candidates) if candidates else np.arange(self.node_count)
+        distances = self._metres_to(nodes, lon, lat)
+        best = int(np.argmin(distances))
+        return int(nodes[best]), float(distances[best])
+
+    # Queries
+
+    @staticmethod
+    def _upward_search(adjacency, stall_adjacency, source):
+        dist = {source: (0.0, 0.0)}
+        heap = [(0.0, source)]
+        settled = {}
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+
+            # Stall-on-demand: a higher ranked neighbour already reaches this node
+            # cheaper, so no shortest path continues upward through it
+            if any(dist.get(other, (_INF,))[0] + weight < d for other, weight, _ in stall_adjacency[node]):
+                settled[node] = None
+                continue
+
+            length = dist[node][1]
+            settled[node] = (d, length)
+            for nxt, weight, edge_length in adjacency[node]:
+                nd = d + weight
+                if nd < dist.get(nxt, (_INF,))[0] and nxt not in settled:
+                    dist[nxt] = (nd, length + edge_length)
+                    heapq.heappush(heap, (nd, nxt))
+        return {node: value for node, value in settled.items() if value is not None}
+
+    def _forward_space(self, node):
+        return self._upward_search(self._up, self._down, node)
+
+    def _backward_space(self, node):
+        return self._upward_search(self._down, self._up, node)
+
+    @staticmethod
+    def _meet(forward, backward):
+        if len(backward) < len(forward):
+            forward, backward = backward, forward
+        best = (_INF, _INF)
+        for node, (d1, l1) in forward.items():
+            other = backward.get(node)
+            if other is not None and d1 + other[0] < best[0]:
+                best = (d1 + other[0], l1 + other[1])
+        return best
+
+    def route(self, source, target):
+        """
+        Return (duration_s, distance_m) of the fastest path between two nodes.
+        """
+        if source == target:
+            return 0.0, 0.0
+        return self._meet(self.forward_space(source), self.backward_space(target))
+
+    def route_pairs(self, sources, targets):
+        """
+        Route many node pairs, running each distinct source/target search once.
+        Returns (durations, distances) arrays, inf where no path exists.
+        """
+        forward_cache, backward_cache = {}, {}
+        durations = np.full(len(sources), np.inf)
+        distances = np.full(len(sources), np.inf)
+        for i, (source, target) in enumerate(zip(sources, targets)):
+            if source == target:
+                durations[i] = distances[i] = 0.0
+                continue
+            forward = forward_cache.get(source)
+            if forward is None:
+                forward = forward_cache[source] = self.forward_space(source)
+            backward = backward_cache.get(target)
+            if backward is None:
+                backward = backward_cache[target] = self.backward_space(target)
+            durations[i], distances[i] = self._meet(forward, backward)
+        return durations, distances
+
+
+class LocalRoutingEngine:
+    """
+    Answers [lon, lat] coordinate queries against a contraction hierarchy.
+    """
+
+    def __init__(self, hierarchy, max_snap_metres=500):
+        self.hierarchy = hierarchy
+        self.max_snap_metres = max_snap_metres
+
+    def snap(self, coordinate):
+        node, metres = self.hierarchy.nearest_node(float(coordinate[0]), float(coordinate[1]))
+        if metres > self.max_snap_metres:
+            raise LocalRoutingError("Coordinate is outside the local road graph")
+        return node
+
+    def route_metrics(self, origin, destination):
+        """
+        Return (distance_m, duration_s) between two coordinates.
+        """
+        duration, distance = self.hierarchy.route(self.snap(origin), self.snap(destination))
+        if math.isinf(duration):
+            raise LocalRoutingError("No route found between the given coordinates")
+        return distance, duration
+
+    def route_metrics_batch(self, pairs):
+        """
+        Return (distances_m, durations_s, errors) for (origin, destination) pairs.
+        """
+        errors = {}
+        snapped = {}
+        sources, targets, routable = [], [], []
+        for index, (origin, destination) in enumerate(pairs):
+            try:
+                for coordinate in (origin, destination):
+                    if coordinate not in snapped:
+                        snapped[coordinate] = self.snap(coordinate)
+            except LocalRoutingError as e:
+                errors[index] = str(e)
+                continue
+            sources.append(snapped[origin])
+            targets.append(snapped[destination])
+            routable.append(index)
+
+        distances = np.full(len(pairs), np.nan)
+        durations = np.full(len(pairs), np.nan)
+        pair_durations, pair_distances = self.hierarchy.route_pairs(sources, targets)
+        distances[routable] = pair_distances
+        durations[routable] = pair_durations
+
+        for index in routable:
+            if np.isinf(durations[index]):
+                errors[index] = "No route found between the given coordinates"
+                distances[index] = durations[index] = np.nan
+        return distances, durations, errors
+
+
+def load_hierarchy(graph_path, ch_path):
+    """
+    Load the contraction hierarchy persisted by `manage.py build_routing_graph`.
+    Never builds one: contracting a city graph takes minutes, far too long for
+    the request that would trigger it.
+    """
+    graph_path, ch_path = Path(graph_path), Path(ch_path)
+    if not ch_path.exists():
+        raise LocalRoutingError(f"Contraction hierarchy not found: {ch_path}, "
+                                f"run `manage.py build_routing_graph` first")
+    if graph_path.exists() and ch_path.stat().st_mtime < graph_path.stat().st_mtime:
+        raise LocalRoutingError(f"Contraction hierarchy {ch_path} is older than {graph_path}, "
+                                f"run `manage.py build_routing_graph` again")
+    return ContractionHierarchy.load(ch_path)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_local_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                hierarchy = load_hierarchy(settings.LOCAL_ROUTING_GRAPH, settings.LOCAL_ROUTING_CH)
+                _engine = LocalRoutingEngine(hierarchy, settings.LOCAL_ROUTING_MAX_SNAP_METRES)
+    return _engine
+
+
+def set_local_engine(engine):
+    global _engine
+    with _engine_lock:
+        _engine = engine
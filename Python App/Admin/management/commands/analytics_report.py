@@ -0,0 +1,31 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from Admin.analytics import analytics_report
+from Admin.snapshot import to_epoch_us
+
+
+class Command(BaseCommand):
+    help = "Revenue by hour, driver earnings percentiles and payment method mix from the analytics snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshot', default=settings.ANALYTICS_SNAPSHOT_DIR, help="Snapshot directory")
+        parser.add_argument('--start', help="Only payments created at or after this ISO datetime")
+        parser.add_argument('--end', help="Only payments created before this ISO datetime")
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                moment = parse_datetime(options[name])
+                if moment is None:
+                    raise CommandError(f"Invalid --{name}: {options[name]}")
+                bounds[name] = to_epoch_us(moment)
+        try:
+            report = analytics_report(options['snapshot'], **bounds)
+        except FileNotFoundError as e:
+            raise CommandError(f"{e} (run build_analytics_snapshot first)")
+        self.stdout.write(json.dumps(report, indent=2, default=str))
@@ -0,0 +1,49 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from Admin.earnings import rebuild_rollups
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the earnings rollups from successful payments, one UTC day per "
+            "transaction (safe to re-run; each day is replaced, not added to)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day (YYYY-MM-DD), default the oldest successful payment")
+        parser.add_argument('--end', help="Last day, inclusive (YYYY-MM-DD), default the newest successful payment")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Payments read per database round trip")
+
+    def handle(self, *args, **options):
+        bounds = Payment.objects.filter(status='SUCCESS').aggregate(first=Min('created_at'), last=Max('created_at'))
+        if bounds['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write("No successful payments to roll up")
+            return
+
+        start = self.parse_day(options['start']) if options['start'] else \
+            bounds['first'].astimezone(dt_timezone.utc).date()
+        end = self.parse_day(options['end']) if options['end'] else \
+            bounds['last'].astimezone(dt_timezone.utc).date()
+        if start > end:
+            raise CommandError("--start must not be after --end")
+
+        started = timezone.now()
+        days = total = 0
+        for day, count in rebuild_rollups(start, end + timedelta(days=1), options['chunk_size']):
+            days += 1
+            total += count
+            if count:
+                self.stdout.write(f"{day}: {count} payments")
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {days} days from {total} payments in {elapsed:.1f}s"))
+
+    @staticmethod
+    def parse_day(value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        return day
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import razorpay
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from Admin.benchmarks import benchmark_database, fake_upstream, summarize_latencies
+from Admin.http_client import reset_clients
+from Admin.route_cache import reset_route_cache
+
+
+# Sync view (WSGI) and async twin (ASGI) for each benchmarked endpoint
+ENDPOINTS = {
+    'fare': ('/analysis/fare-cal', '/analysis/fare-cal-async'),
+    'order': ('/payments/create-order/', '/payments/create-order-async/'),
+}
+
+
+class Command(BaseCommand):
+    help = ("Compare WSGI and ASGI throughput of the network-bound views against "
+            "local stand-ins for ORS and Razorpay")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help="In-flight requests on the ASGI event loop")
+        parser.add_argument('--wsgi-threads', type=int, default=8,
+                            help="WSGI worker threads (e.g. gunicorn workers x threads)")
+        parser.add_argument('--latency', type=float, default=0.1,
+                            help="Seconds the fake upstream waits before answering")
+        parser.add_argument('--endpoint', choices=[*ENDPOINTS, 'all'], default='all')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        endpoints = list(ENDPOINTS) if options['endpoint'] == 'all' else [options['endpoint']]
+        rng = random.Random(options['seed'])
+
+        with fake_upstream(options['latency']) as upstream, benchmark_database():
+            from payments import views as payment_views
+            from wallet.models import Wallet
+
+            driver_id = uuid.uuid4()
+            Wallet.objects.create(driver_id=driver_id)
+            payloads = {
+                'fare': lambda: {"cordinates": [
+                    [72.8 + rng.random() * 0.2, 19.0 + rng.random() * 0.2],
+                    [72.8 + rng.random() * 0.2, 19.0 + rng.random() * 0.2],
+                ]},
+                'order': lambda: {
+                    "ride_id": str(uuid.uuid4()),
+                    "rider_id": str(uuid.uuid4()),
+                    "driver_id": str(driver_id),
+                    "amount": 100,
+                    "payment_method": "CARD",
+                },
+            }
+
+            bench_settings = override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                ORS_BASE_URL=upstream.base_url,
+                RAZORPAY_API_BASE=upstream.base_url,
+                ROUTING_BACKEND='ors',
+                ROUTE_CACHE={'ENABLED': False},
+                ZONE_MATRIX_ENABLED=False,
+            )
+            with bench_settings, \
+                    mock.patch.dict(os.environ, {'API_KEY': 'bench'}), \
+                    mock.patch.multiple(
+                        payment_views,
+                        RAZORPAY_KEY_ID='rzp_bench',
+                        RAZORPAY_KEY_SECRET='bench',
+                        razorpay_client=razorpay.Client(auth=('rzp_bench', 'bench'), base_url=upstream.base_url)):
+                reset_route_cache()
+                reset_clients()
+                results = {
+                    "requests": options['requests'],
+                    "upstream_latency_ms": options['latency'] * 1000,
+                    "wsgi_threads": options['wsgi_threads'],
+                    "asgi_concurrency": options['concurrency'],
+                }
+                for endpoint in endpoints:
+                    sync_path, async_path = ENDPOINTS[endpoint]
+                    bodies = [payloads[endpoint]() for _ in range(options['requests'])]
+                    results[endpoint] = {
+                        "wsgi": self.run_wsgi(sync_path, bodies, options['wsgi_threads']),
+                        "asgi": asyncio.run(self.run_asgi(async_path, bodies, options['concurrency'])),
+                    }
+                reset_clients()
+                reset_route_cache()
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def summarize(samples, statuses, elapsed):
+        return {
+            "requests_per_second": round(len(samples) / elapsed, 1),
+            "elapsed_s": round(elapsed, 3),
+            "statuses": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+            "latency": summarize_latencies(samples),
+        }
+
+    def run_wsgi(self, path, bodies, threads):
+        local = threading.local()
+        samples, statuses = [], []
+
+        def call(body):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            started = time.perf_counter()
+            response = client.post(path, data=body, content_type='application/json')
+            samples.append(time.perf_counter() - started)
+            statuses.append(response.status_code)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(call, bodies))
+        return self.summarize(samples, statuses, time.perf_counter() - started)
+
+    async def run_asgi(self, path, bodies, concurrency):
+        client = AsyncClient()
+        gate = asyncio.Semaphore(concurrency)
+        samples, statuses = [], []
+
+        async def call(body):
+            async with gate:
+                started = time.perf_counter()
+                response = await client.post(path, data=body, content_type='application/json')
+                samples.append(time.perf_counter() - started)
+                statuses.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call(body) for body in bodies))
+        return self.summarize(samples, statuses, time.perf_counter() - started)
@@ -0,0 +1,79 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from Admin.benchmarks import benchmark_database, summarize_latencies
+from Admin.models import Admin
+from Admin.tokens import ACCESS, decode_token, issue_tokens, reset_tokens, verify_token, verified_tokens
+
+
+class Command(BaseCommand):
+    help = ("Measure what authenticating an admin request costs: check_password (logging in again per call) "
+            "against verifying a signed access token, cold and from the verified-token LRU, alone and end to "
+            "end through an admin-only endpoint")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000, help="Token verifications per path")
+        parser.add_argument('--passwords', type=int, default=20, help="check_password calls (slow on purpose)")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per end-to-end path")
+
+    def handle(self, *args, **options):
+        results = {"options": {key: options[key] for key in ('iterations', 'passwords', 'requests')}}
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+            admin = Admin.objects.create(name="Bench Admin", email="bench-admin@example.com", phone="9999999999",
+                                         password=make_password("bench-password"))
+            reset_tokens()
+            results["per_call"] = self.per_call(admin, options)
+            results["per_request"] = self.per_request(admin, options)
+        for name, stats in {**results["per_call"], **results["per_request"]}.items():
+            self.stderr.write(f"{name}: {stats['mean_ms']} ms mean, {stats['p99_ms']} ms p99")
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def timed(count, run):
+        samples = []
+        for i in range(count):
+            started = time.perf_counter()
+            run(i)
+            samples.append(time.perf_counter() - started)
+        return summarize_latencies(samples)
+
+    def per_call(self, admin, options):
+        tokens = [issue_tokens(admin)["access"] for _ in range(options['iterations'])]
+        verify_token(tokens[0], ACCESS)  # first revocation list sync, not part of any path
+
+        def cold(i):
+            verified_tokens.discard(tokens[i])
+            verify_token(tokens[i], ACCESS)
+
+        return {
+            "check_password": self.timed(options['passwords'], lambda i: check_password("bench-password",
+                                                                                          admin.password)),
+            "token_decode": self.timed(options['iterations'], lambda i: decode_token(tokens[i])),
+            "token_verify_cold": self.timed(options['iterations'], cold),
+            "token_verify_cached": self.timed(options['iterations'], lambda i: verify_token(tokens[0], ACCESS)),
+        }
+
+    def per_request(self, admin, options):
+        url = reverse('wallet-cache-stats')
+        login = {"email": admin.email, "password": "bench-password"}
+        authorization = {"Authorization": f"Bearer {issue_tokens(admin)['access']}"}
+        client = Client()
+
+        def login_then_call(i):
+            # What the JS backend did before tokens: the password is checked on every call
+            client.post(reverse('login-admin'), data=login, content_type='application/json')
+            client.get(url)
+
+        with override_settings(ADMIN_TOKENS={**settings.ADMIN_TOKENS, 'REQUIRED': False}):
+            no_auth = self.timed(options['requests'], lambda i: client.get(url))
+        return {
+            "no_auth": no_auth,
+            "login_per_call": self.timed(min(options['requests'], options['passwords']), login_then_call),
+            "bearer_token": self.timed(options['requests'], lambda i: client.get(url, headers=authorization)),
+        }
@@ -0,0 +1,146 @@
+import contextlib
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+
+from Admin.benchmarks import benchmark_database, summarize_latencies
+from RideHailingApp.db_profiles import PROFILES, database_settings
+from payments.models import Payment
+from wallet.models import Wallet
+
+
+@contextlib.contextmanager
+def database_profile(config):
+    # In place: worker threads build their connections from this same dict
+    settings_dict = connections['default'].settings_dict
+    saved = dict(settings_dict)
+    connections.close_all()
+    settings_dict.update({'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False,
+                          **{key: value for key, value in config.items() if key != 'NAME'}})
+    try:
+        yield
+    finally:
+        connections.close_all()
+        settings_dict.clear()
+        settings_dict.update(saved)
+
+
+class Command(BaseCommand):
+    help = ("Post concurrent cash payments (payment row, wallet debit, ledger entry in one transaction) "
+            "through the HTTP stack to a throwaway database under each DB_PROFILE, closing connections "
+            "between requests as the server does, and report payments/sec, latency, failed writes "
+            "('database is locked') and connections opened")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=['sqlite-legacy', 'sqlite'], choices=PROFILES,
+                            help="Profiles of another engine than the configured one are skipped")
+        parser.add_argument('--payments', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=16, help="Concurrent client threads")
+        parser.add_argument('--wallets', type=int, default=50, help="Drivers the payments are spread over")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        configured = connections['default'].settings_dict
+        results = {"options": {key: options[key] for key in ('payments', 'workers', 'wallets', 'seed')},
+                   "profiles": {}}
+        for profile in options['profiles']:
+            try:
+                config = database_settings(profile, sqlite_name=configured['NAME'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            if config['ENGINE'] != configured['ENGINE']:
+                results["profiles"][profile] = {"skipped": f"run with DB_PROFILE={profile} to benchmark it"}
+                continue
+            caches['default'].clear()
+            with database_profile(config), benchmark_database(), \
+                    override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                results["profiles"][profile] = self.run(options)
+            run = results["profiles"][profile]
+            self.stderr.write(f"{profile}: {run['payments_per_second']} payments/s, "
+                              f"{run['failed']} failed, {run['connections_opened']} connections")
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def run(options):
+        rng = random.Random(options['seed'])
+        wallets = Wallet.objects.bulk_create([Wallet(driver_id=uuid.uuid4(), actual_balance=Decimal("1000.00"))
+                                              for _ in range(options['wallets'])])
+        pending = queue.Queue()
+        for _ in range(options['payments']):
+            pending.put(json.dumps({"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                                    "driver_id": str(rng.choice(wallets).driver_id), "amount": "150.00"}))
+        connections.close_all()
+
+        samples, statuses, errors = [], {}, {}
+        opened = []
+        lock = threading.Lock()
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(1)
+
+        def worker():
+            client = Client()
+            try:
+                while True:
+                    try:
+                        body = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    started = time.perf_counter()
+                    try:
+                        response = client.post('/payments/cash-payment/', data=body,
+                                               content_type='application/json')
+                        code, content = response.status_code, response.content
+                    except Exception as e:
+                        code, content = 'exception', f"{type(e).__name__}: {e}".encode()
+                    # What request_finished does after every request (the test client skips it)
+                    close_old_connections()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        samples.append(elapsed)
+                        statuses[str(code)] = statuses.get(str(code), 0) + 1
+                        if code == 'exception' or code >= 400:
+                            message = content[:200].decode(errors='replace')
+                            errors[message] = errors.get(message, 0) + 1
+            finally:
+                connections.close_all()
+
+        connection_created.connect(count_connection)
+        try:
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count_connection)
+
+        recorded = Payment.objects.count()
+        failed = sum(errors.values())
+        return {
+            "vendor": connections['default'].vendor,
+            "payments": options['payments'],
+            "seconds": round(elapsed, 3),
+            "payments_per_second": round(recorded / elapsed, 1),
+            "statuses": statuses,
+            "failed": failed,
+            "locked": sum(count for message, count in errors.items() if "locked" in message),
+            "error_samples": dict(sorted(errors.items(), key=lambda item: -item[1])[:3]),
+            "latency": summarize_latencies(samples),
+            "connections_opened": len(opened),
+            # Every accepted payment, and only those, was written
+            "consistent": recorded == statuses.get('201', 0),
+        }
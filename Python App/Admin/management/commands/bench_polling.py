@@ -0,0 +1,114 @@
+import json
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from Admin.benchmarks import benchmark_database
+from Admin.models import Admin
+from Admin.tokens import auth_header
+from RideHailingApp.query_plans import seed_dataset
+from payments.models import Payment
+
+MODES = {
+    # name: (send validators back, Accept-Encoding)
+    "plain": (False, ""),
+    "conditional": (True, ""),
+    "conditional_gzip": (True, "gzip, deflate, br"),
+}
+
+
+class Command(BaseCommand):
+    help = ("Replay a polling workload (drivers polling their wallet, the dashboard reloading completed "
+            "payments, a few rides landing between rounds) without and with conditional GET and gzip, "
+            "and report response bytes and server CPU per request")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=1000)
+        parser.add_argument('--drivers', type=int, default=200, help="Drivers polling their wallet")
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--change-rate', type=float, default=0.05,
+                            help="Share of polling drivers paid for a ride each time rides land")
+        parser.add_argument('--change-every', type=int, default=3,
+                            help="Rounds between two batches of rides (clients poll faster than data changes)")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        results = {"vendor": connection.vendor, "options": {key: options[key] for key in (
+            'wallets', 'drivers', 'rounds', 'change_rate', 'change_every', 'seed')}, "modes": {}}
+        for mode in MODES:
+            with benchmark_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+                results["modes"][mode] = self.run(mode, options)
+            total = results["modes"][mode]["total"]
+            self.stderr.write(f"{mode}: {total['bytes_per_request']} B/request, "
+                              f"{total['cpu_ms_per_request']} ms CPU/request")
+
+        plain = results["modes"]["plain"]
+        results["reduction"] = {
+            mode: {
+                endpoint: {
+                    "bytes": round(1 - stats["bytes"] / plain[endpoint]["bytes"], 4),
+                    "cpu": round(1 - stats["cpu_seconds"] / plain[endpoint]["cpu_seconds"], 4),
+                }
+                for endpoint, stats in endpoints.items()
+            }
+            for mode, endpoints in results["modes"].items() if mode != "plain"
+        }
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def run(mode, options):
+        send_validators, accept_encoding = MODES[mode]
+        caches['default'].clear()
+        rng = random.Random(options['seed'])
+        wallets = [wallet for wallet in seed_dataset(wallets=options['wallets'], withdraws_per_wallet=0,
+                                                     seed=options['seed']) if wallet.is_active]
+        pollers = rng.sample(wallets, min(options['drivers'], len(wallets)))
+        urls = [('wallet', reverse('wallet-operations', args=[wallet.driver_id])) for wallet in pollers]
+        urls.append(('completed_payments', reverse('completed_payments')))
+
+        client = Client()
+        # The completed payments list is admin-only
+        authorization = auth_header(Admin(name="Bench Admin", email="bench-admin@example.com"))
+        etags = {}
+        stats = {endpoint: {"requests": 0, "statuses": {}, "bytes": 0, "cpu_seconds": 0.0}
+                 for endpoint in ('wallet', 'completed_payments', 'total')}
+        for round_number in range(options['rounds']):
+            for endpoint, url in urls:
+                headers = {}
+                if send_validators and url in etags:
+                    headers['HTTP_IF_NONE_MATCH'] = etags[url]
+                if accept_encoding:
+                    headers['HTTP_ACCEPT_ENCODING'] = accept_encoding
+                started = time.process_time()
+                response = client.get(url, headers=authorization if endpoint == 'completed_payments' else None,
+                                      **headers)
+                cpu = time.process_time() - started
+                for row in (stats[endpoint], stats['total']):
+                    row["requests"] += 1
+                    row["bytes"] += len(response.content)
+                    row["cpu_seconds"] += cpu
+                    row["statuses"][str(response.status_code)] = row["statuses"].get(str(response.status_code), 0) + 1
+                if response.has_header('ETag'):
+                    etags[url] = response['ETag']
+
+            if (round_number + 1) % options['change_every']:
+                continue
+            # Rides paid since the last batch
+            for wallet in rng.sample(pollers, int(len(pollers) * options['change_rate'])):
+                Payment.objects.create(
+                    wallet=wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(), driver_id=wallet.driver_id,
+                    amount=Decimal(rng.randint(50, 900)), payment_method='CASH', status='SUCCESS',
+                ).process_wallet_update()
+
+        for row in stats.values():
+            row["bytes_per_request"] = round(row["bytes"] / row["requests"], 1)
+            row["cpu_ms_per_request"] = round(row["cpu_seconds"] * 1000 / row["requests"], 3)
+            row["cpu_seconds"] = round(row["cpu_seconds"], 3)
+        return stats
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Admin.benchmarks import summarize_latencies
+from Admin.local_routing import LocalRoutingError, get_local_engine
+from Admin.route_cache import reset_route_cache
+from Admin.routing import RoutingError, get_ors_route_metrics
+
+
+class Command(BaseCommand):
+    help = "Benchmark route metric lookups on the local routing engine and ORS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=500)
+        parser.add_argument('--ors-pairs', type=int, default=20,
+                            help="Pairs sent to ORS (needs API_KEY, counts against the quota)")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        try:
+            engine = get_local_engine()
+        except LocalRoutingError as e:
+            raise CommandError(str(e))
+
+        rng = random.Random(options['seed'])
+        hierarchy = engine.hierarchy
+        nodes = [rng.randrange(hierarchy.node_count) for _ in range(options['pairs'] * 2)]
+        coordinate = lambda n: (float(hierarchy.node_lon[n]), float(hierarchy.node_lat[n]))
+        pairs = [(coordinate(a), coordinate(b)) for a, b in zip(nodes[::2], nodes[1::2])]
+
+        results = {"nodes": hierarchy.node_count}
+        hierarchy.forward_space.cache_clear()
+        hierarchy.backward_space.cache_clear()
+
+        samples = []
+        for origin, destination in pairs:
+            started = time.perf_counter()
+            try:
+                engine.route_metrics(origin, destination)
+            except LocalRoutingError:
+                pass
+            samples.append(time.perf_counter() - started)
+        results["local_single"] = summarize_latencies(samples)
+
+        hierarchy.forward_space.cache_clear()
+        hierarchy.backward_space.cache_clear()
+        started = time.perf_counter()
+        engine.route_metrics_batch(pairs)
+        elapsed = time.perf_counter() - started
+        results["local_batch"] = {"pairs": len(pairs), "pairs_per_second": round(len(pairs) / elapsed, 1)}
+
+        # Hot pairs: the same hotspots quoted again reuse cached search spaces
+        samples = []
+        for origin, destination in pairs[:50] * 10:
+            started = time.perf_counter()
+            try:
+                engine.route_metrics(origin, destination)
+            except LocalRoutingError:
+                pass
+            samples.append(time.perf_counter() - started)
+        results["local_hot_pairs"] = summarize_latencies(samples)
+
+        if options['ors_pairs'] and os.getenv('API_KEY'):
+            reset_route_cache()
+            samples = []
+            for origin, destination in pairs[:options['ors_pairs']]:
+                started = time.perf_counter()
+                try:
+                    get_ors_route_metrics(list(origin), list(destination))
+                except RoutingError:
+                    pass
+                samples.append(time.perf_counter() - started)
+            results["ors_single"] = summarize_latencies(samples)
+
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,68 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from Admin.benchmarks import benchmark_database
+from RideHailingApp.fast_rows import FastJSONRenderer, dumps
+from RideHailingApp.query_plans import seed_dataset
+from payments.models import Payment
+from payments.serializers import PaymentSerializer, payment_rows
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway database with payments and compare rows/sec of the PaymentSerializer + "
+            "JSONRenderer read path against values_list() rows + FastJSONRenderer, as a JSON array and "
+            "as NDJSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per path, the best one is reported")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed_dataset(wallets=max(1, options['payments'] // 5), payments_per_wallet=5, withdraws_per_wallet=0,
+                         seed=options['seed'])
+            queryset = Payment.objects.order_by('-created_at', '-payment_id')
+            rows = queryset.count()
+
+            def serializer_array():
+                return JSONRenderer().render(PaymentSerializer(queryset, many=True).data)
+
+            def fast_array():
+                return FastJSONRenderer().render(payment_rows.rows(queryset))
+
+            def serializer_ndjson():
+                encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+                return "".join(encoder.encode(PaymentSerializer(obj).data) + "\n"
+                               for obj in queryset.iterator(chunk_size=2000)).encode()
+
+            def fast_ndjson():
+                return b"".join(dumps(row) + b"\n" for chunk in payment_rows.iter_chunks(queryset) for row in chunk)
+
+            results = {"vendor": connection.vendor, "rows": rows, "paths": {}}
+            outputs = {}
+            for name, run in (("serializer_array", serializer_array), ("fast_array", fast_array),
+                              ("serializer_ndjson", serializer_ndjson), ("fast_ndjson", fast_ndjson)):
+                best = None
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    outputs[name] = run()
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                results["paths"][name] = {"seconds": round(best, 3), "rows_per_second": round(rows / best, 1),
+                                          "bytes": len(outputs[name])}
+                self.stderr.write(f"{name}: {results['paths'][name]['rows_per_second']} rows/s")
+
+            paths = results["paths"]
+            results["speedup"] = {
+                "array": round(paths["fast_array"]["rows_per_second"] / paths["serializer_array"]["rows_per_second"], 2),
+                "ndjson": round(paths["fast_ndjson"]["rows_per_second"] / paths["serializer_ndjson"]["rows_per_second"], 2),
+            }
+            results["identical"] = (outputs["serializer_array"] == outputs["fast_array"]
+                                    and outputs["serializer_ndjson"] == outputs["fast_ndjson"])
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,102 @@
+import json
+import os
+import subprocess
+from unittest import mock
+
+import razorpay
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from Admin.bench_suite import KEY_ID, KEY_SECRET, bench_settings_overrides, build_scenarios, compare_results, \
+    run_scenario, seed
+from Admin.benchmarks import benchmark_database, fake_upstream
+from Admin.http_client import reset_clients
+from Admin.route_cache import reset_route_cache
+from RideHailingApp.metrics import instrument_session
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway database, drive every payments, wallet and analysis route with concurrent "
+            "clients against local ORS/Razorpay stand-ins and report throughput, latency percentiles and "
+            "queries per request as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=2000)
+        parser.add_argument('--payments-per-wallet', type=int, default=5)
+        parser.add_argument('--withdrawals-per-wallet', type=int, default=1)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per route")
+        parser.add_argument('--concurrency', type=int, default=8, help="Client threads per route")
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help="Seconds the fake upstream waits before answering")
+        parser.add_argument('--only', action='append', default=[],
+                            help="Run scenarios whose name starts with this prefix (repeatable)")
+        parser.add_argument('--output', help="Write the JSON results to this file")
+        parser.add_argument('--compare', help="Earlier results file to check for regressions")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative p95/throughput change before it counts as a regression")
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--no-metrics', action='store_true',
+                            help="Run without InstrumentationMiddleware, to measure its overhead")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        with fake_upstream(options['latency']) as upstream, benchmark_database():
+            from payments import views as payment_views
+
+            razorpay_client = razorpay.Client(auth=(KEY_ID, KEY_SECRET), base_url=upstream.base_url)
+            instrument_session(razorpay_client.session, 'razorpay')
+            with override_settings(**bench_settings_overrides(upstream.base_url, not options['no_metrics'])), \
+                    mock.patch.dict(os.environ, {'API_KEY': 'bench'}), \
+                    mock.patch.multiple(
+                        payment_views,
+                        RAZORPAY_KEY_ID=KEY_ID,
+                        RAZORPAY_KEY_SECRET=KEY_SECRET,
+                        razorpay_client=razorpay_client):
+                reset_route_cache()
+                reset_clients()
+                data = seed(options['wallets'], options['payments_per_wallet'],
+                            options['withdrawals_per_wallet'], options['seed'])
+                scenarios = [scenario for scenario in build_scenarios(data)
+                             if not options['only'] or scenario.name.startswith(tuple(options['only']))]
+                if not scenarios:
+                    raise CommandError(f"No scenario matches {options['only']}")
+
+                results = {
+                    "commit": _git_commit(),
+                    "database": connection.vendor,
+                    "options": {key: options[key] for key in (
+                        'wallets', 'payments_per_wallet', 'withdrawals_per_wallet', 'requests',
+                        'concurrency', 'latency', 'seed', 'no_metrics')},
+                    "scenarios": {},
+                }
+                for scenario in scenarios:
+                    results["scenarios"][scenario.name] = run_scenario(
+                        scenario, options['requests'], options['concurrency'])
+                    self.stderr.write(f"{scenario.name}: "
+                                      f"{results['scenarios'][scenario.name]['requests_per_second']} req/s")
+                reset_clients()
+                reset_route_cache()
+
+        if baseline is not None:
+            results["regressions"] = compare_results(baseline, results, options['tolerance'], options['tolerance'])
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+        if results.get("regressions"):
+            raise CommandError(f"{len(results['regressions'])} regression(s) against {options['compare']}")
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Admin.snapshot import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = ("Append payments and wallets changed since the last run to the columnar analytics "
+            "snapshot (run from cron; --full rebuilds it from scratch)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.ANALYTICS_SNAPSHOT_DIR, help="Snapshot directory")
+        parser.add_argument('--full', action='store_true', help="Rewrite the snapshot, dropping superseded row versions")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows read and appended per batch")
+        parser.add_argument('--lag', type=int, default=None,
+                            help="Skip rows updated in the last N seconds (default ANALYTICS_SNAPSHOT_LAG)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        appended = refresh_snapshot(options['output'], full=options['full'],
+                                    chunk_size=options['chunk_size'], lag=options['lag'])
+        summary = ", ".join(f"{count} {table}" for table, count in appended.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Appended {summary} in {time.perf_counter() - started:.1f}s: {options['output']}"))
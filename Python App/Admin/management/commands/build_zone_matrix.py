@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Admin.routing import RoutingError, calculate_fares, get_route_metrics_batch, routing_backend
+from Admin.zone_matrix import current_fare_rules, load_zones, write_zone_matrix
+
+
+class Command(BaseCommand):
+    help = "Precompute the zone-to-zone distance/duration/fare matrix served by the fare endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zones', default=settings.ZONE_DEFINITIONS, help="Zones JSON file")
+        parser.add_argument('--output', default=settings.ZONE_MATRIX_INDEX, help="Zone matrix index file")
+
+    def handle(self, *args, **options):
+        try:
+            zones = load_zones(options['zones'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read zones: {e}")
+        if len(zones) < 2:
+            raise CommandError("At least two zones are needed")
+
+        started = time.perf_counter()
+        count = len(zones)
+        centroids = [(float(zone['lon']), float(zone['lat'])) for zone in zones]
+        cells = [(i, j) for i in range(count) for j in range(count) if i != j]
+
+        # Routed with whichever backend the fare endpoints use. Never store the
+        # degraded-ORS estimate: it would be served as a routed distance until
+        # the next rebuild, an unresolved (NaN) cell goes to live routing instead
+        try:
+            pair_distances, pair_durations, errors = get_route_metrics_batch(
+                [(centroids[i], centroids[j]) for i, j in cells], estimate=False)
+        except RoutingError as e:
+            raise CommandError(f"Routing failed: {e}")
+
+        distances = np.zeros((count, count), dtype=np.float64)
+        durations = np.zeros((count, count), dtype=np.float64)
+        rows, cols = np.array(cells).T
+        distances[rows, cols] = pair_distances
+        durations[rows, cols] = pair_durations
+        fares = calculate_fares(distances)
+
+        matrix_path = write_zone_matrix(
+            options['output'], zones, distances, durations, fares,
+            metadata={
+                "generated_at": time.time(),
+                "routing_backend": routing_backend(),
+                "fare_rules": current_fare_rules(),
+                "unresolved_pairs": len(errors),
+            },
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {count}x{count} zone matrix in {time.perf_counter() - started:.1f}s "
+            f"({len(errors)} unresolved pairs): {matrix_path}"
+        ))
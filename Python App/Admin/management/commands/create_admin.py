@@ -0,0 +1,37 @@
+import getpass
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Admin.serializers import AdminSerializer
+
+
+class Command(BaseCommand):
+    help = ("Create an admin account. /analysis/register/ only takes requests from a logged-in admin, "
+            "so the first admin is created here")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', required=True)
+        parser.add_argument('--name', required=True)
+        parser.add_argument('--phone', required=True)
+        parser.add_argument('--role', default='Admin')
+        parser.add_argument('--no-input', action='store_true',
+                            help="Read the password from ADMIN_PASSWORD instead of prompting")
+
+    def handle(self, *args, **options):
+        if options['no_input']:
+            password = os.getenv('ADMIN_PASSWORD')
+            if not password:
+                raise CommandError("ADMIN_PASSWORD is not set")
+        else:
+            password = getpass.getpass("Password: ")
+            if password != getpass.getpass("Password (again): "):
+                raise CommandError("Passwords do not match")
+
+        serializer = AdminSerializer(data={"email": options['email'], "name": options['name'],
+                                           "phone": options['phone'], "role": options['role'],
+                                           "password": password})
+        if not serializer.is_valid():
+            raise CommandError(f"Invalid admin: {serializer.errors}")
+        admin = serializer.save()
+        self.stdout.write(self.style.SUCCESS(f"Admin {admin.email} created"))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from RideHailingApp.db_router import sync_sqlite_replica
+
+
+class Command(BaseCommand):
+    help = ("Copy the SQLite primary over the SQLite replicas in DATABASE_REPLICAS, standing in for "
+            "replication when running with read replicas locally (run it again to let them catch up)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep copying every this many seconds, i.e. simulate replication lag")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, set DB_REPLICAS")
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                try:
+                    sync_sqlite_replica(alias)
+                except ValueError as e:
+                    raise CommandError(str(e))
+                self.stdout.write(f"{alias} synced")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
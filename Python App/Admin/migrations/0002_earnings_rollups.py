@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverEarningsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('HOUR', 'Hour'), ('DAY', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('payment_method', models.CharField(max_length=10)),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('gross_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('platform_fee', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('net_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('driver_id', models.UUIDField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket'], name='Admin_drive_granula_374b1a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('driver_id', 'granularity', 'bucket', 'payment_method'), name='unique_driver_earnings_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlatformEarningsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('HOUR', 'Hour'), ('DAY', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('payment_method', models.CharField(max_length=10)),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('gross_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('platform_fee', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('net_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'payment_method'), name='unique_platform_earnings_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0003_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='platformearningsrollup',
+            name='unique_platform_earnings_bucket',
+        ),
+        migrations.AddField(
+            model_name='platformearningsrollup',
+            name='stripe',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='platformearningsrollup',
+            constraint=models.UniqueConstraint(fields=('granularity', 'bucket', 'payment_method', 'stripe'), name='unique_platform_earnings_bucket'),
+        ),
+    ]
@@ -13,3 +13,68 @@ class Admin(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.email})"
+
+
+# Earnings Rollups (maintained by Admin/earnings.py)
+class EarningsRollup(models.Model):
+    GRANULARITY_CHOICES = [
+        ('HOUR', 'Hour'),
+        ('DAY', 'Day'),
+    ]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()  # start of the UTC hour/day
+    payment_method = models.CharField(max_length=10)
+    payment_count = models.PositiveIntegerField(default=0)
+    gross_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    platform_fee = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+# Per Driver Earnings Per Hour/Day And Payment Method
+class DriverEarningsRollup(EarningsRollup):
+    driver_id = models.UUIDField()
+
+    class Meta:
+        indexes = [
+            # Top drivers over a range, and the backfill's delete by day
+            models.Index(fields=["granularity", "bucket"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["driver_id", "granularity", "bucket", "payment_method"], name="unique_driver_earnings_bucket"),
+        ]
+
+    def __str__(self):
+        return f"DriverEarnings({self.driver_id}) - {self.granularity} {self.bucket:%Y-%m-%d %H:00} {self.payment_method}"
+
+
+# Platform-Wide Earnings Per Hour/Day And Payment Method, split over stripes
+# so concurrent payments don't all update one row (readers sum the stripes)
+class PlatformEarningsRollup(EarningsRollup):
+    stripe = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["granularity", "bucket", "payment_method", "stripe"], name="unique_platform_earnings_bucket"),
+        ]
+
+    def __str__(self):
+        return (f"PlatformEarnings - {self.granularity} {self.bucket:%Y-%m-%d %H:00} {self.payment_method} "
+                f"#{self.stripe}")
+
+
+# Revoked Admin Tokens (see Admin/tokens.py), kept until the token expires
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=32, primary_key=True)
+    admin_id = models.UUIDField()
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"RevokedToken({self.jti}) - {self.admin_id}"
@@ -0,0 +1,278 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# Route Metrics Cache
+#
+# Fare quotes are dominated by a handful of pickup/drop hotspots, so the ORS
+# matrix result for a pair of points is cached under a key built from both
+# coordinates snapped to a grid. Two snapping modes are supported:
+#   - "geohash": the coordinate is encoded as a geohash of GEOHASH_PRECISION chars
+#   - "metres":  the coordinate is rounded to a square grid of GRID_METRES cells
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+_METRES_PER_DEGREE = 111_320.0
+
+
+def geohash(lat, lon, precision):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_GEOHASH_ALPHABET[ch])
+            bit, ch = 0, 0
+    return "".join(chars)
+
+
+def snap_coordinate(coordinate, mode="geohash", precision=7, grid_metres=100):
+    """
+    Snap an ORS style [lon, lat] coordinate to a grid cell id.
+    """
+    lon, lat = float(coordinate[0]), float(coordinate[1])
+
+    if mode == "geohash":
+        return geohash(lat, lon, precision)
+
+    if mode == "metres":
+        lat_step = grid_metres / _METRES_PER_DEGREE
+        lat_cell = math.floor(lat / lat_step)
+        # Longitude cells shrink towards the poles, scale them on the cell row
+        # so that every cell in the same row has the same width in metres
+        row_lat = (lat_cell + 0.5) * lat_step
+        lon_step = grid_metres / (_METRES_PER_DEGREE * max(math.cos(math.radians(row_lat)), 1e-6))
+        lon_cell = math.floor(lon / lon_step)
+        return f"{lat_cell}:{lon_cell}"
+
+    raise ValueError(f"Unknown route cache snapping mode: {mode}")
+
+
+class RouteCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def incr(self, counter, value=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# In-process LRU with TTL and a size cap (per worker)
+class InProcessRouteCache:
+    def __init__(self, max_entries=10_000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = RouteCacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats.incr("hits")
+                    return value
+                del self._entries[key]
+                self.stats.incr("expirations")
+        self.stats.incr("misses")
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self.stats.incr("sets")
+        if evicted:
+            self.stats.incr("evictions", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # In-memory lookups never block, the async API is for parity with DjangoRouteCache
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared cache through Django's cache framework (e.g. Redis across workers).
+# Size cap and eviction are delegated to the configured cache backend.
+class DjangoRouteCache:
+    key_prefix = "route-metrics"
+
+    def __init__(self, alias="default", ttl=3600):
+        self.alias = alias
+        self.ttl = ttl
+        self.stats = RouteCacheStats()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        return f"{self.key_prefix}:{key}"
+
+    def get(self, key):
+        value = self.cache.get(self._key(key))
+        self.stats.incr("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, timeout=self.ttl)
+        self.stats.incr("sets")
+
+    async def aget(self, key):
+        value = await self.cache.aget(self._key(key))
+        self.stats.incr("hits" if value is not None else "misses")
+        return value
+
+    async def aset(self, key, value):
+        await self.cache.aset(self._key(key), value, timeout=self.ttl)
+        self.stats.incr("sets")
+
+    def clear(self):
+        self.cache.clear()
+
+
+class RouteMetricsCache:
+    """
+    Route metrics cache keyed on snapped (origin, destination) pairs.
+    Values are (distance_m, duration_s) tuples.
+    """
+
+    def __init__(self, backend, mode="geohash", precision=7, grid_metres=100):
+        self.backend = backend
+        self.mode = mode
+        self.precision = precision
+        self.grid_metres = grid_metres
+
+    @property
+    def stats(self):
+        return self.backend.stats
+
+    def make_key(self, origin, destination):
+        snap = lambda c: snap_coordinate(c, self.mode, self.precision, self.grid_metres)
+        return f"{self.mode}:{snap(origin)}>{snap(destination)}"
+
+    def get(self, origin, destination):
+        value = self.backend.get(self.make_key(origin, destination))
+        return tuple(value) if value is not None else None
+
+    def set(self, origin, destination, distance_m, duration_s):
+        self.backend.set(self.make_key(origin, destination), (distance_m, duration_s))
+
+    async def aget(self, origin, destination):
+        value = await self.backend.aget(self.make_key(origin, destination))
+        return tuple(value) if value is not None else None
+
+    async def aset(self, origin, destination, distance_m, duration_s):
+        await self.backend.aset(self.make_key(origin, destination), (distance_m, duration_s))
+
+    def clear(self):
+        self.backend.clear()
+
+
+class NullRouteCache:
+    stats = RouteCacheStats()
+
+    def get(self, origin, destination):
+        return None
+
+    def set(self, origin, destination, distance_m, duration_s):
+        pass
+
+    async def aget(self, origin, destination):
+        return None
+
+    async def aset(self, origin, destination, distance_m, duration_s):
+        pass
+
+    def clear(self):
+        pass
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def build_route_cache(config):
+    if not config.get("ENABLED", True):
+        return NullRouteCache()
+
+    backend_name = config.get("BACKEND", "inprocess")
+    ttl = int(config.get("TTL", 3600))
+    if backend_name == "inprocess":
+        backend = InProcessRouteCache(max_entries=int(config.get("MAX_ENTRIES", 10_000)), ttl=ttl)
+    elif backend_name == "django":
+        backend = DjangoRouteCache(alias=config.get("CACHE_ALIAS", "default"), ttl=ttl)
+    else:
+        raise ValueError(f"Unknown route cache backend: {backend_name}")
+
+    return RouteMetricsCache(
+        backend,
+        mode=config.get("SNAP_MODE", "geohash"),
+        precision=int(config.get("GEOHASH_PRECISION", 7)),
+        grid_metres=float(config.get("GRID_METRES", 100)),
+    )
+
+
+def get_route_cache():
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = build_route_cache(getattr(settings, "ROUTE_CACHE", {}))
+    return _route_cache
+
+
+def reset_route_cache():
+    global _route_cache
+    with _route_cache_lock:
+        _route_cache = None
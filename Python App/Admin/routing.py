@@ -0,0 +1,361 @@
+import logging
+import os
+
+import httpx
+import numpy as np
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .http_client import CircuitOpenError, get_async_client, get_client
+from .local_routing import LocalRoutingError, get_local_engine
+from .route_cache import get_route_cache
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6_371_000
+
+
+# Fare constants
+BASE_FARE = 50
+PER_KM_RATE = 10
+
+
+class RoutingError(Exception):
+    """
+    Raised when route metrics cannot be fetched. Carries the response payload
+    and status code the API view should return. ``degraded`` marks upstream
+    failures (open breaker, timeouts, 429/5xx) as opposed to bad requests.
+    """
+
+    def __init__(self, payload, status_code, degraded=False):
+        super().__init__(payload.get("error"))
+        self.payload = payload
+        self.status_code = status_code
+        self.degraded = degraded
+
+
+def calculate_fare(distance_m):
+    distance_km = distance_m / 1000
+    return BASE_FARE + (distance_km * PER_KM_RATE)
+
+
+def calculate_fares(distances_m):
+    # Vectorized calculate_fare over an array of distances (NaN stays NaN)
+    return BASE_FARE + (np.asarray(distances_m, dtype=np.float64) / 1000) * PER_KM_RATE
+
+
+def ors_matrix_request(locations, sources=None, destinations=None):
+    # Get API key
+    api_key = os.getenv('API_KEY')
+    if not api_key:
+        raise RoutingError({"error": "Your API Key is missing, please check API configuration"}, 500)
+
+    # OpenRouteService matrix endpoint (for distance & duration)
+    url = f"{settings.ORS_BASE_URL}/v2/matrix/driving-car"
+    headers = {
+        "Authorization": api_key,
+        "Content-Type": "application/json"
+    }
+    body = {
+        "locations": locations,
+        "metrics": ["distance", "duration"]
+    }
+    if sources is not None:
+        body["sources"] = sources
+    if destinations is not None:
+        body["destinations"] = destinations
+    return url, body, headers
+
+
+def ors_matrix_response(res):
+    if res.status_code != 200:
+        raise RoutingError({
+            "error": "Failed to fetch routes",
+            "details": res.text,
+            "status_code": res.status_code
+        }, res.status_code, degraded=res.status_code == 429 or res.status_code >= 500)
+
+    return res.json()
+
+
+def fetch_ors_matrix(locations, sources=None, destinations=None):
+    url, body, headers = ors_matrix_request(locations, sources, destinations)
+    try:
+        res = get_client('ors').post(url, json=body, headers=headers)
+    except CircuitOpenError:
+        raise RoutingError({"error": "Routing service temporarily unavailable"}, 503, degraded=True)
+    except requests.RequestException as e:
+        raise RoutingError({"error": "Failed to fetch routes", "details": str(e)}, 504, degraded=True)
+    return ors_matrix_response(res)
+
+
+async def afetch_ors_matrix(locations, sources=None, destinations=None):
+    url, body, headers = ors_matrix_request(locations, sources, destinations)
+    try:
+        res = await get_async_client('ors').post(url, json=body, headers=headers)
+    except CircuitOpenError:
+        raise RoutingError({"error": "Routing service temporarily unavailable"}, 503, degraded=True)
+    except httpx.HTTPError as e:
+        raise RoutingError({"error": "Failed to fetch routes", "details": str(e)}, 504, degraded=True)
+    return ors_matrix_response(res)
+
+
+# Routing backends, selected by settings.ROUTING_BACKEND
+ROUTING_BACKENDS = ('ors', 'local', 'local-then-ors')
+
+
+def routing_backend():
+    backend = settings.ROUTING_BACKEND
+    if backend not in ROUTING_BACKENDS:
+        raise ImproperlyConfigured(f"ROUTING_BACKEND must be one of {', '.join(ROUTING_BACKENDS)}")
+    return backend
+
+
+def local_engine(backend):
+    """
+    The local routing engine when ``backend`` uses it, else None. Without a
+    usable graph the 'local' backend answers 503 (the pair is not at fault)
+    and 'local-then-ors' goes to ORS.
+    """
+    if backend not in ('local', 'local-then-ors'):
+        return None
+    try:
+        return get_local_engine()
+    except LocalRoutingError as e:
+        if backend == 'local':
+            raise RoutingError({"error": str(e)}, 503)
+        return None
+
+
+def get_route_metrics(origin, destination):
+    """
+    Return (distance_m, duration_s) between two [lon, lat] coordinates using
+    the configured routing backend.
+    """
+    backend = routing_backend()
+    engine = local_engine(backend)
+    if engine is not None:
+        try:
+            return engine.route_metrics(origin, destination)
+        except LocalRoutingError as e:
+            if backend == 'local':
+                raise RoutingError({"error": str(e)}, 422)
+    return get_ors_route_metrics(origin, destination)
+
+
+async def aget_route_metrics(origin, destination):
+    """
+    Async get_route_metrics for ASGI views. The local backend is CPU-bound
+    and answers in about a millisecond, so it runs inline.
+    """
+    backend = routing_backend()
+    engine = local_engine(backend)
+    if engine is not None:
+        try:
+            return engine.route_metrics(origin, destination)
+        except LocalRoutingError as e:
+            if backend == 'local':
+                raise RoutingError({"error": str(e)}, 422)
+    return await aget_ors_route_metrics(origin, destination)
+
+
+def get_ors_route_metrics(origin, destination):
+    """
+    Return (distance_m, duration_s) from ORS, served from the route metrics
+    cache when the snapped pair was seen before.
+    """
+    cache = get_route_cache()
+    cached = cache.get(origin, destination)
+    if cached is not None:
+        return cached
+
+    try:
+        data = fetch_ors_matrix([origin, destination])
+    except RoutingError as e:
+        return fallback_route_metrics(e, origin, destination)
+    distance_m = data['distances'][0][1]
+    duration_s = data['durations'][0][1]
+
+    # ORS returns null for unroutable pairs, never cache those
+    if distance_m is not None and duration_s is not None:
+        cache.set(origin, destination, distance_m, duration_s)
+    return distance_m, duration_s
+
+
+async def aget_ors_route_metrics(origin, destination):
+    cache = get_route_cache()
+    cached = await cache.aget(origin, destination)
+    if cached is not None:
+        return cached
+
+    try:
+        data = await afetch_ors_matrix([origin, destination])
+    except RoutingError as e:
+        return fallback_route_metrics(e, origin, destination)
+    distance_m = data['distances'][0][1]
+    duration_s = data['durations'][0][1]
+
+    if distance_m is not None and duration_s is not None:
+        await cache.aset(origin, destination, distance_m, duration_s)
+    return distance_m, duration_s
+
+
+def fallback_route_metrics(error, origin, destination):
+    # Re-raise unless ORS is degraded and the local estimate is enabled
+    if not (error.degraded and settings.ORS_FALLBACK_ESTIMATE):
+        raise error
+    logger.warning("ORS unavailable (%s), serving a local fare estimate", error)
+    distances, durations = estimate_route_metrics([tuple(origin)], [tuple(destination)])
+    return float(distances[0]), float(durations[0])
+
+
+def estimate_route_metrics(origins, destinations):
+    """
+    Local fallback used while ORS is degraded: great-circle distance scaled by
+    a road detour factor and a flat average speed. Never cached.
+    """
+    origins = np.radians(np.asarray(origins, dtype=np.float64))
+    destinations = np.radians(np.asarray(destinations, dtype=np.float64))
+    dlon = destinations[:, 0] - origins[:, 0]
+    dlat = destinations[:, 1] - origins[:, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(origins[:, 1]) * np.cos(destinations[:, 1]) * np.sin(dlon / 2) ** 2
+    distances = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a)) * settings.ORS_FALLBACK_DETOUR_FACTOR
+    durations = distances / (settings.ORS_FALLBACK_SPEED_KMPH / 3.6)
+    return distances, durations
+
+
+def plan_matrix_requests(pairs, max_elements):
+    """
+    Group (origin, destination) coordinate pairs into as few ORS matrix
+    requests as possible, keeping sources x destinations <= max_elements.
+
+    Returns a list of (origins, destinations, pair_indexes) where origins and
+    destinations are lists of unique coordinate tuples.
+    """
+    by_origin = {}
+    for index, (origin, destination) in enumerate(pairs):
+        by_origin.setdefault(origin, []).append((destination, index))
+
+    groups = []
+    origins, destinations, indexes = [], {}, []
+
+    def flush():
+        if origins:
+            groups.append((list(origins), list(destinations), list(indexes)))
+        origins.clear()
+        destinations.clear()
+        indexes.clear()
+
+    for origin, targets in by_origin.items():
+        # A single origin with too many destinations is split on its own
+        if len(targets) > max_elements:
+            flush()
+            for start in range(0, len(targets), max_elements):
+                chunk = targets[start:start + max_elements]
+                groups.append(([origin], list(dict.fromkeys(d for d, _ in chunk)), [i for _, i in chunk]))
+            continue
+
+        merged = dict(destinations)
+        merged.update(dict.fromkeys(d for d, _ in targets))
+        if (len(origins) + 1) * len(merged) > max_elements:
+            flush()
+            merged = dict.fromkeys(d for d, _ in targets)
+
+        origins.append(origin)
+        destinations.clear()
+        destinations.update(merged)
+        indexes.extend(i for _, i in targets)
+    flush()
+
+    return groups
+
+
+def get_route_metrics_batch(pairs, estimate=True):
+    """
+    Resolve many (origin, destination) coordinate tuple pairs at once with the
+    configured routing backend.
+
+    Returns (distances_m, durations_s, errors): two float arrays in input order
+    (NaN where unresolved) and a dict of pair index -> error message. With
+    ``estimate=False`` pairs ORS could not route while degraded are left
+    unresolved instead of getting the local estimate.
+    """
+    backend = routing_backend()
+    if backend == 'ors':
+        return get_ors_route_metrics_batch(pairs, estimate)
+
+    try:
+        distances, durations, errors = get_local_engine().route_metrics_batch(pairs)
+    except LocalRoutingError as e:
+        if backend == 'local':
+            raise RoutingError({"error": str(e)}, 503)
+        return get_ors_route_metrics_batch(pairs, estimate)
+
+    if backend == 'local-then-ors' and errors:
+        retry = sorted(errors)
+        ors_distances, ors_durations, ors_errors = get_ors_route_metrics_batch([pairs[i] for i in retry], estimate)
+        distances[retry] = ors_distances
+        durations[retry] = ors_durations
+        errors = {retry[position]: message for position, message in ors_errors.items()}
+    return distances, durations, errors
+
+
+def get_ors_route_metrics_batch(pairs, estimate=True):
+    cache = get_route_cache()
+    count = len(pairs)
+    distances = np.full(count, np.nan)
+    durations = np.full(count, np.nan)
+    errors = {}
+
+    misses = []
+    for index, (origin, destination) in enumerate(pairs):
+        cached = cache.get(list(origin), list(destination))
+        if cached is not None:
+            distances[index], durations[index] = cached
+        else:
+            misses.append(index)
+
+    max_elements = settings.ORS_MATRIX_MAX_ELEMENTS
+    missed_pairs = [pairs[i] for i in misses]
+    for origins, destinations, group_indexes in plan_matrix_requests(missed_pairs, max_elements):
+        locations = [list(c) for c in origins] + [list(c) for c in destinations]
+        try:
+            data = fetch_ors_matrix(
+                locations,
+                sources=list(range(len(origins))),
+                destinations=list(range(len(origins), len(locations))),
+            )
+        except RoutingError as e:
+            targets = [pairs[misses[i]] for i in group_indexes]
+            if estimate and e.degraded and settings.ORS_FALLBACK_ESTIMATE:
+                estimated = estimate_route_metrics([o for o, _ in targets], [d for _, d in targets])
+                positions = [misses[i] for i in group_indexes]
+                distances[positions], durations[positions] = estimated
+            else:
+                for i in group_indexes:
+                    errors[misses[i]] = e.payload["error"]
+            continue
+
+        # Matrix cells come back as [source][destination], null when unroutable
+        matrix_distances = np.array(data['distances'], dtype=np.float64)
+        matrix_durations = np.array(data['durations'], dtype=np.float64)
+        origin_pos = {c: n for n, c in enumerate(origins)}
+        destination_pos = {c: n for n, c in enumerate(destinations)}
+
+        group_indexes = np.asarray(group_indexes)
+        rows = np.array([origin_pos[missed_pairs[i][0]] for i in group_indexes])
+        cols = np.array([destination_pos[missed_pairs[i][1]] for i in group_indexes])
+        targets = np.asarray(misses)[group_indexes]
+        distances[targets] = matrix_distances[rows, cols]
+        durations[targets] = matrix_durations[rows, cols]
+
+        for target in targets.tolist():
+            if np.isnan(distances[target]) or np.isnan(durations[target]):
+                errors[target] = "No route found between the given coordinates"
+            else:
+                origin, destination = pairs[target]
+                cache.set(list(origin), list(destination), float(distances[target]), float(durations[target]))
+
+    return distances, durations, errors
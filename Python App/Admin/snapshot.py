@@ -0,0 +1,374 @@
+import json
+import os
+import time
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from payments.models import Payment
+from wallet.models import Wallet
+
+
+# Columnar Analytics Snapshot
+#
+# `manage.py build_analytics_snapshot` exports Payment and Wallet rows into one
+# raw little-endian file per column, described by a manifest:
+#   manifest.json                 row counts, dtypes, dictionary sizes, watermarks
+#   payments.<column>.bin         amounts as int64 paise, timestamps as int64 epoch
+#   wallets.<column>.bin          microseconds (UTC), choices as uint8 codes
+#   dict.<name>.bin               uint64[N, 2] (high, low) halves of each UUID;
+#                                 UUID columns hold int32 codes into these
+#
+# Readers np.memmap the files and only trust the first `rows` of each (from
+# the manifest), so an interrupted refresh is invisible and simply truncated
+# by the next one. Refreshes append every row whose updated_at is past the
+# table's (updated_at, pk) watermark: a changed row is appended again and the
+# newest version of each pk wins when the snapshot is read. `--full` rewrites
+# the snapshot and drops the superseded versions.
+#
+# Wallet balances are exported as the row plus its unfolded WalletStripe sums,
+# and a wallet's updated_at is the latest of the row's and its stripes', so a
+# striped credit re-exports the wallet without waiting for compaction.
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+DICTIONARIES = ('payment_id', 'wallet_id', 'driver_id', 'rider_id')
+
+
+def _choices(model, field):
+    return [value for value, _ in model._meta.get_field(field).choices]
+
+
+def _wallets():
+    balance = DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(Decimal('0.00'), output_field=balance)
+    return Wallet.objects.annotate(
+        striped_total=F('total_balance') + Coalesce(Sum('stripes__total_balance'), zero, output_field=balance),
+        striped_actual=F('actual_balance') + Coalesce(Sum('stripes__actual_balance'), zero, output_field=balance),
+        changed_at=Greatest('updated_at', Coalesce(Max('stripes__updated_at'), 'updated_at')),
+    )
+
+
+# (column, kind) per table; column is the model field it is read from unless
+# the table maps it to an annotation of its queryset in 'sources'
+TABLES = {
+    'payments': {
+        'model': Payment,
+        'pk': 'payment_id',
+        'columns': [
+            ('payment_id', 'uuid'),
+            ('wallet_id', 'uuid'),
+            ('driver_id', 'uuid'),
+            ('rider_id', 'uuid'),
+            ('amount', 'paise'),
+            ('payment_method', 'choice'),
+            ('status', 'choice'),
+            ('created_at', 'timestamp'),
+            ('updated_at', 'timestamp'),
+        ],
+    },
+    'wallets': {
+        'model': Wallet,
+        'queryset': _wallets,
+        'sources': {'total_balance': 'striped_total', 'actual_balance': 'striped_actual', 'updated_at': 'changed_at'},
+        'pk': 'wallet_id',
+        'columns': [
+            ('wallet_id', 'uuid'),
+            ('driver_id', 'uuid'),
+            ('total_balance', 'paise'),
+            ('actual_balance', 'paise'),
+            ('a_deduct', 'paise'),
+            ('is_active', 'bool'),
+            ('created_at', 'timestamp'),
+            ('updated_at', 'timestamp'),
+        ],
+    },
+}
+
+KIND_DTYPES = {
+    'uuid': '<i4',
+    'paise': '<i8',
+    'timestamp': '<i8',
+    'choice': 'u1',
+    'bool': 'u1',
+}
+
+
+EPOCH = timezone.datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch_us(moment):
+    # Exact integer arithmetic, float timestamps lose microseconds
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return (moment - EPOCH) // MICROSECOND
+
+
+def from_epoch_us(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def _memmap(path, dtype, shape):
+    # np.memmap cannot map an empty file
+    if not shape[0]:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+class UUIDDictionary:
+    """
+    Append-only UUID -> int32 code mapping, stored as (high, low) uint64
+    pairs so it can be memory-mapped and searched with NumPy.
+    """
+
+    def __init__(self, path, size):
+        self.path = Path(path)
+        self.values = _memmap(self.path, '<u8', (size, 2))
+        self.pending = []
+        self._pending_codes = {}
+        self._order = None
+
+    def __len__(self):
+        return len(self.values) + len(self.pending)
+
+    def _lookup_existing(self, halves):
+        # Codes of already stored UUIDs, -1 for new ones (vectorized searchsorted)
+        if not len(self.values):
+            return np.full(len(halves), -1, dtype=np.int64)
+        if self._order is None:
+            self._order = np.lexsort((self.values[:, 1], self.values[:, 0]))
+            self._sorted = np.asarray(self.values)[self._order]
+        start = np.searchsorted(self._sorted[:, 0], halves[:, 0], side='left')
+        end = np.searchsorted(self._sorted[:, 0], halves[:, 0], side='right')
+        codes = np.full(len(halves), -1, dtype=np.int64)
+        for i in np.nonzero(end > start)[0]:
+            # Usually one candidate; more only when two UUIDs share the high half
+            lows = self._sorted[start[i]:end[i], 1]
+            match = np.nonzero(lows == halves[i, 1])[0]
+            if len(match):
+                codes[i] = self._order[start[i] + match[0]]
+        return codes
+
+    def encode(self, values):
+        ints = [value.int for value in values]
+        halves = np.array([(v >> 64, v & 0xFFFFFFFFFFFFFFFF) for v in ints], dtype=np.uint64).reshape(-1, 2)
+        codes = self._lookup_existing(halves)
+        for i in np.nonzero(codes < 0)[0]:
+            key = ints[i]
+            if key not in self._pending_codes:
+                self._pending_codes[key] = len(self)
+                self.pending.append(halves[i])
+            codes[i] = self._pending_codes[key]
+        return codes.astype(np.int32)
+
+    def flush(self):
+        if self.pending:
+            with open(self.path, 'ab') as f:
+                f.write(np.asarray(self.pending, dtype='<u8').tobytes())
+        return len(self)
+
+    def decode(self, codes):
+        pairs = np.asarray(self.values)[np.asarray(codes)]
+        return [uuid.UUID(int=(int(high) << 64) | int(low)) for high, low in pairs]
+
+
+def _read_manifest(directory):
+    try:
+        with open(Path(directory) / MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')}")
+    return manifest
+
+
+def _write_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _empty_manifest():
+    return {
+        'format': FORMAT_VERSION,
+        'dictionaries': {name: 0 for name in DICTIONARIES},
+        'tables': {
+            name: {
+                'rows': 0,
+                'watermark': None,
+                'columns': {
+                    column: {'dtype': KIND_DTYPES[kind], 'kind': kind,
+                             **({'choices': _choices(table['model'], column)} if kind == 'choice' else {})}
+                    for column, kind in table['columns']
+                },
+            }
+            for name, table in TABLES.items()
+        },
+    }
+
+
+def _truncate(path, size):
+    # Drop bytes written by an append that never reached the manifest
+    if path.exists() and path.stat().st_size != size:
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+    elif not path.exists():
+        path.touch()
+
+
+def _encode_column(kind, values, dictionary=None, choices=None):
+    if kind == 'uuid':
+        return dictionary.encode(values)
+    if kind == 'paise':
+        return np.array([int(value * 100) for value in values], dtype='<i8')
+    if kind == 'timestamp':
+        return np.array([to_epoch_us(value) for value in values], dtype='<i8')
+    if kind == 'choice':
+        index = {choice: code for code, choice in enumerate(choices)}
+        return np.array([index[value] for value in values], dtype='u1')
+    return np.array(values, dtype='u1')
+
+
+def refresh_snapshot(directory=None, full=False, chunk_size=5000, lag=None):
+    """
+    Bring the snapshot up to date. Returns {table: rows appended}. Rows
+    updated within the last ``lag`` seconds are left for the next refresh,
+    so transactions still in flight at the watermark are not skipped.
+    """
+    directory = Path(directory or settings.ANALYTICS_SNAPSHOT_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    lag = settings.ANALYTICS_SNAPSHOT_LAG if lag is None else lag
+
+    manifest = None if full else _read_manifest(directory)
+    if manifest is None:
+        # Manifest first, readers must not pair it with the new files
+        (directory / MANIFEST).unlink(missing_ok=True)
+        for path in directory.glob('*.bin'):
+            path.unlink()
+        manifest = _empty_manifest()
+
+    dictionaries = {}
+    for name in DICTIONARIES:
+        path = directory / f'dict.{name}.bin'
+        _truncate(path, manifest['dictionaries'][name] * 16)
+        dictionaries[name] = UUIDDictionary(path, manifest['dictionaries'][name])
+
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    appended = {}
+    for name, table in TABLES.items():
+        state = manifest['tables'][name]
+        columns = table['columns']
+        paths = {column: directory / f'{name}.{column}.bin' for column, _ in columns}
+        for column, kind in columns:
+            _truncate(paths[column], state['rows'] * np.dtype(KIND_DTYPES[kind]).itemsize)
+
+        sources = table.get('sources', {})
+        changed = sources.get('updated_at', 'updated_at')
+        rows = table['queryset']() if 'queryset' in table else table['model'].objects.all()
+        rows = rows.filter(**{f'{changed}__lte': cutoff})
+        if state['watermark']:
+            updated_at = from_epoch_us(state['watermark']['updated_at'])
+            pk = uuid.UUID(state['watermark']['pk'])
+            rows = rows.filter(Q(**{f'{changed}__gt': updated_at}) | Q(**{changed: updated_at}, pk__gt=pk))
+        rows = rows.order_by(changed, 'pk').values_list(*(sources.get(column, column) for column, _ in columns))
+
+        names = [column for column, _ in columns]
+        updated_at_position, pk_position = names.index('updated_at'), names.index(table['pk'])
+        count = 0
+        chunk = []
+        iterator = rows.iterator(chunk_size=chunk_size)
+        while True:
+            chunk.clear()
+            for row in iterator:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    break
+            if not chunk:
+                break
+            for position, (column, kind) in enumerate(columns):
+                values = [row[position] for row in chunk]
+                array = _encode_column(kind, values, dictionaries.get(column), state['columns'][column].get('choices'))
+                with open(paths[column], 'ab') as f:
+                    f.write(array.tobytes())
+            count += len(chunk)
+            last = chunk[-1]
+            state['watermark'] = {'updated_at': to_epoch_us(last[updated_at_position]), 'pk': str(last[pk_position])}
+            if len(chunk) < chunk_size:
+                break
+
+        state['rows'] += count
+        appended[name] = count
+
+    # Dictionaries first: the manifest must never point past their end
+    for name, dictionary in dictionaries.items():
+        manifest['dictionaries'][name] = dictionary.flush()
+    manifest['generated_at'] = time.time()
+    _write_manifest(directory, manifest)
+    return appended
+
+
+class AnalyticsSnapshot:
+    """
+    Read-only view of a snapshot: every column memory-mapped, with
+    table(name) returning only the newest version of each row.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or settings.ANALYTICS_SNAPSHOT_DIR)
+        manifest = _read_manifest(self.directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No analytics snapshot in {self.directory}")
+        self.manifest = manifest
+        self.generated_at = manifest.get('generated_at')
+        self.dictionaries = {
+            name: UUIDDictionary(self.directory / f'dict.{name}.bin', size)
+            for name, size in manifest['dictionaries'].items()
+        }
+        self._latest = {}
+
+    def columns(self, name):
+        state = self.manifest['tables'][name]
+        return {
+            column: _memmap(self.directory / f'{name}.{column}.bin', spec['dtype'], (state['rows'],))
+            for column, spec in state['columns'].items()
+        }
+
+    def table(self, name):
+        """
+        Newest version of each row as {column: ndarray}. Versions are
+        appended in updated_at order, so the last one per pk wins.
+        """
+        if name not in self._latest:
+            columns = self.columns(name)
+            pk = columns[TABLES[name]['pk']]
+            _, last = np.unique(pk[::-1], return_index=True)
+            keep = np.sort(len(pk) - 1 - last)
+            self._latest[name] = {column: np.asarray(values)[keep] for column, values in columns.items()}
+        return self._latest[name]
+
+    def choices(self, name, column):
+        return self.manifest['tables'][name]['columns'][column]['choices']
+
+    def choice_code(self, name, column, value):
+        return self.choices(name, column).index(value)
+
+    def decode(self, dictionary, codes):
+        return self.dictionaries[dictionary].decode(codes)
+
+    def to_dataframe(self, name):
+        # Optional, pandas is not a dependency of the app
+        import pandas as pd
+        return pd.DataFrame(self.table(name))
@@ -1,3 +1,989 @@
-from django.test import TestCase
+from django.test import TestCase, Client, AsyncClient, override_settings
+from django.urls import reverse
+from django.db.models import Sum
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
+import os
+import time
 
-# Create your tests here.
+import httpx
+import requests
+
+from .route_cache import InProcessRouteCache, RouteMetricsCache, snap_coordinate, reset_route_cache
+from .routing import plan_matrix_requests
+from .http_client import CircuitBreaker, get_async_client, get_client, reset_clients
+from .local_routing import (
+    RoadGraph, ContractionHierarchy, LocalRoutingEngine, LocalRoutingError, build_contraction_hierarchy,
+    get_local_engine, set_local_engine,
+)
+from .zone_matrix import reset_zone_matrix_store, get_zone_matrix_store
+from django.core.management import call_command
+from io import StringIO
+import base64
+import heapq
+import json
+import random
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from .models import DriverEarningsRollup, PlatformEarningsRollup
+from .earnings import record_payment_rollups
+from .snapshot import AnalyticsSnapshot, refresh_snapshot, to_epoch_us
+from .analytics import driver_percentiles, payment_method_mix, revenue_by_hour, wallet_balance_percentiles
+from asgiref.sync import sync_to_async
+from .bench_suite import build_scenarios, compare_results, seed
+from RideHailingApp.metrics import reset_metrics
+from RideHailingApp.db_profiles import database_settings
+from .models import Admin
+from .tokens import TokenError, VerifiedTokens, auth_header, issue_tokens, reset_tokens, revocations, verify_token
+import numpy as np
+
+
+def ors_response(distance_m, duration_s):
+    res = MagicMock()
+    res.status_code = 200
+    res.json.return_value = {
+        "distances": [[0, distance_m], [distance_m, 0]],
+        "durations": [[0, duration_s], [duration_s, 0]],
+    }
+    return res
+
+
+def ors_matrix_side_effect(method, url, json=None, **kwargs):
+    # Fake ORS matrix: distance is 1km per whole degree of longitude difference
+    locations = json["locations"]
+    sources = json.get("sources", range(len(locations)))
+    destinations = json.get("destinations", range(len(locations)))
+    distances = [[abs(locations[s][0] - locations[d][0]) * 1000 for d in destinations] for s in sources]
+    res = MagicMock(status_code=200)
+    res.json.return_value = {"distances": distances, "durations": [[v / 10 for v in row] for row in distances]}
+    return res
+
+
+def admin_client():
+    return Client(headers=auth_header(Admin(name="Test Admin", email="admin@example.com")))
+
+
+class RouteCacheTests(TestCase):
+    def test_nearby_points_snap_to_same_cell(self):
+        airport = [72.8656, 19.0896]
+        nearby = [72.86562, 19.08962]
+        self.assertEqual(snap_coordinate(airport, "geohash", 7), snap_coordinate(nearby, "geohash", 7))
+        self.assertEqual(snap_coordinate(airport, "metres", grid_metres=200),
+                         snap_coordinate(nearby, "metres", grid_metres=200))
+
+    def test_lru_eviction_and_size_cap(self):
+        cache = RouteMetricsCache(InProcessRouteCache(max_entries=2, ttl=60))
+        cache.set([72.0, 19.0], [72.1, 19.1], 1000, 60)
+        cache.set([73.0, 19.0], [73.1, 19.1], 2000, 120)
+        cache.get([72.0, 19.0], [72.1, 19.1])  # mark first pair as recently used
+        cache.set([74.0, 19.0], [74.1, 19.1], 3000, 180)
+
+        self.assertEqual(cache.get([72.0, 19.0], [72.1, 19.1]), (1000, 60))
+        self.assertIsNone(cache.get([73.0, 19.0], [73.1, 19.1]))
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_ttl_expiry(self):
+        cache = RouteMetricsCache(InProcessRouteCache(max_entries=10, ttl=0))
+        cache.set([72.0, 19.0], [72.1, 19.1], 1000, 60)
+        time.sleep(0.001)
+        self.assertIsNone(cache.get([72.0, 19.0], [72.1, 19.1]))
+        self.assertEqual(cache.stats.expirations, 1)
+
+
+@patch.dict(os.environ, {"API_KEY": "test-key"})
+class FareCalculationCacheTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        reset_route_cache()
+        reset_clients()
+        self.addCleanup(reset_route_cache)
+        self.addCleanup(reset_clients)
+        self.payload = {"cordinates": [[72.8656, 19.0896], [72.8258, 18.9220]]}
+
+    @patch('Admin.http_client.requests.Session.request')
+    def test_repeated_quote_is_served_from_cache(self, mock_post):
+        mock_post.return_value = ors_response(25000, 3000)
+
+        first = self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        second = self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first.json()["fare_estimate"], 300.0)
+        self.assertEqual(mock_post.call_count, 1)
+
+        stats = self.client.get(reverse('fare-cal-cache-stats')).json()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    @override_settings(ROUTE_CACHE={"ENABLED": False})
+    @patch('Admin.http_client.requests.Session.request')
+    def test_cache_can_be_disabled(self, mock_post):
+        mock_post.return_value = ors_response(25000, 3000)
+        self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('Admin.http_client.requests.Session.request')
+    def test_ors_failure_is_not_cached(self, mock_post):
+        failed = MagicMock(status_code=429, text="Quota exceeded")
+        mock_post.return_value = failed
+        response = self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()["error"], "Failed to fetch routes")
+
+        mock_post.return_value = ors_response(25000, 3000)
+        response = self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+class MatrixPlanningTests(TestCase):
+    def test_groups_respect_matrix_limit(self):
+        pairs = [((float(o), 0.0), (float(d), 1.0)) for o in range(10) for d in range(10, 20)]
+        groups = plan_matrix_requests(pairs, max_elements=40)
+
+        covered = sorted(i for _, _, indexes in groups for i in indexes)
+        self.assertEqual(covered, list(range(len(pairs))))
+        for origins, destinations, _ in groups:
+            self.assertLessEqual(len(origins) * len(destinations), 40)
+        self.assertEqual(len(groups), 3)
+
+    def test_single_origin_with_many_destinations_is_split(self):
+        pairs = [((0.0, 0.0), (float(d), 1.0)) for d in range(25)]
+        groups = plan_matrix_requests(pairs, max_elements=10)
+        self.assertEqual([len(destinations) for _, destinations, _ in groups], [10, 10, 5])
+
+
+@patch.dict(os.environ, {"API_KEY": "test-key"})
+class FareBatchCalculationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        reset_route_cache()
+        reset_clients()
+        self.addCleanup(reset_route_cache)
+        self.addCleanup(reset_clients)
+
+    @patch('Admin.http_client.requests.Session.request', side_effect=ors_matrix_side_effect)
+    def test_batch_uses_single_matrix_call_and_preserves_order(self, mock_post):
+        pairs = [{"origin": [72.0, 19.0], "destination": [72.0 + n, 19.5]} for n in range(1, 6)]
+        pairs.insert(2, {"origin": [72.0, 19.0], "destination": [500, 19.5]})
+
+        response = self.client.post(reverse('fare-cal-batch'), data={"pairs": pairs}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_post.call_count, 1)
+
+        body = response.json()
+        self.assertEqual(body["errors"], 1)
+        self.assertEqual([r["index"] for r in body["results"]], list(range(6)))
+        self.assertIn("error", body["results"][2])
+        self.assertEqual(body["results"][0]["fare_estimate"], 60.0)
+        self.assertEqual(body["results"][5]["distance_km"], 5.0)
+
+    @patch('Admin.http_client.requests.Session.request')
+    def test_failed_matrix_call_is_reported_per_pair(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=503, text="Unavailable")
+        pairs = [{"origin": [72.0, 19.0], "destination": [73.0, 19.5]}]
+        response = self.client.post(reverse('fare-cal-batch'), data={"pairs": pairs}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["error"], "Failed to fetch routes")
+
+
+class CircuitBreakerTests(TestCase):
+    def test_opens_after_threshold_and_half_opens_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.01)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow_request())   # single trial request
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+@patch.dict(os.environ, {"API_KEY": "test-key"})
+@override_settings(OUTBOUND_HTTP={"ors": {"BREAKER_FAILURE_THRESHOLD": 2, "BREAKER_RECOVERY_TIMEOUT": 60}})
+class OutboundClientTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        reset_route_cache()
+        reset_clients()
+        self.addCleanup(reset_route_cache)
+        self.addCleanup(reset_clients)
+        self.payload = {"cordinates": [[72.8656, 19.0896], [72.8258, 18.9220]]}
+
+    @patch('Admin.http_client.requests.Session.request')
+    def test_requests_use_timeouts_and_breaker_fails_fast(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=503, text="Unavailable")
+        for _ in range(2):
+            self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], (3.05, 10))
+
+        response = self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_request.call_count, 2)
+
+        metrics = self.client.get(reverse('outbound-metrics')).json()
+        self.assertEqual(metrics["ors"]["breaker"]["state"], "open")
+        self.assertEqual(metrics["ors"]["breaker"]["rejected"], 1)
+
+    def test_retry_waits_are_capped(self):
+        retry = get_client('ors').adapter.max_retries
+        self.assertEqual(retry.backoff_max, 10)
+        # A Retry-After of hours would otherwise park the worker thread
+        self.assertEqual(retry.parse_retry_after("21600"), 10)
+        self.assertEqual(retry.increment('POST', '/matrix').parse_retry_after("21600"), 10)
+        self.assertEqual(retry.parse_retry_after("2"), 2)
+
+    @patch('Admin.http_client.requests.Session.request')
+    def test_uncounted_errors_release_the_half_open_trial(self, mock_request):
+        breaker = get_client('ors').breaker
+        breaker.state, breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - 120
+        mock_request.side_effect = ValueError("bad header")
+        with self.assertRaises(ValueError):
+            get_client('ors').get("https://ors.invalid/health")
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+    @patch('Admin.http_client.httpx.AsyncClient.request', new_callable=AsyncMock)
+    async def test_cancelled_trial_is_released(self, mock_request):
+        breaker = get_client('ors').breaker
+        breaker.state, breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - 120
+        mock_request.side_effect = asyncio.CancelledError()
+        with self.assertRaises(asyncio.CancelledError):
+            await get_async_client('ors').get("https://ors.invalid/health")
+        self.assertTrue(breaker.allow_request())
+
+    @override_settings(ORS_FALLBACK_ESTIMATE=True)
+    @patch('Admin.http_client.requests.Session.request')
+    def test_local_estimate_while_ors_is_degraded(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("connection refused")
+        response = self.client.post(reverse('fare-cal'), data=self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()["distance_km"], 18)
+
+
+@patch.dict(os.environ, {"API_KEY": "test-key"})
+@override_settings(OUTBOUND_HTTP={"ors": {"RETRIES": 0, "BREAKER_FAILURE_THRESHOLD": 2}})
+class FareCalculationAsyncTests(TestCase):
+    def setUp(self):
+        reset_route_cache()
+        reset_clients()
+        self.addCleanup(reset_route_cache)
+        self.addCleanup(reset_clients)
+        self.payload = {"cordinates": [[72.8656, 19.0896], [72.8258, 18.9220]]}
+
+    @patch('Admin.http_client.httpx.AsyncClient.request', new_callable=AsyncMock)
+    async def test_async_quote_matches_sync_shape_and_uses_cache(self, mock_request):
+        mock_request.return_value = httpx.Response(200, json={
+            "distances": [[0, 12500], [12500, 0]], "durations": [[0, 1800], [1800, 0]]})
+        for _ in range(2):
+            response = await self.async_client.post(
+                reverse('fare-cal-async'), data=self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"distance_km": 12.5, "duration_minutes": 30.0, "fare_estimate": 175.0})
+        self.assertEqual(mock_request.call_count, 1)
+
+    @patch('Admin.http_client.httpx.AsyncClient.request', new_callable=AsyncMock)
+    async def test_async_failures_trip_the_shared_breaker(self, mock_request):
+        mock_request.return_value = httpx.Response(503, text="Unavailable")
+        for _ in range(3):
+            response = await self.async_client.post(
+                reverse('fare-cal-async'), data=self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(get_client('ors').breaker.state, "open")
+
+    async def test_rejects_bad_payload(self):
+        response = await self.async_client.post(
+            reverse('fare-cal-async'), data={"cordinates": []}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+def grid_graph(size=8, spacing=0.005, seed=3):
+    # Two-way grid road network near (72.8, 19.0) with random speeds
+    rng = random.Random(seed)
+    lon, lat, edges = [], [], []
+    for row in range(size):
+        for col in range(size):
+            lon.append(72.8 + col * spacing)
+            lat.append(19.0 + row * spacing)
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col
+            for other in ((node + 1) if col + 1 < size else None, (node + size) if row + 1 < size else None):
+                if other is not None:
+                    length = spacing * 111_320
+                    duration = length / rng.uniform(5, 15)
+                    edges.append((node, other, length, duration))
+                    edges.append((other, node, length, duration))
+    return RoadGraph(lon, lat, [e[0] for e in edges], [e[1] for e in edges],
+                     [e[2] for e in edges], [e[3] for e in edges])
+
+
+def dijkstra(graph, source, target):
+    adjacency = {}
+    for u, v, w in zip(graph.edge_from.tolist(), graph.edge_to.tolist(), graph.edge_duration.tolist()):
+        adjacency.setdefault(u, []).append((v, w))
+    dist, heap = {source: 0.0}, [(0.0, source)]
+    while heap:
+        d, node = heapq.heappop(heap)
+        if node == target:
+            return d
+        if d > dist[node]:
+            continue
+        for nxt, w in adjacency.get(node, []):
+            if d + w < dist.get(nxt, float("inf")):
+                dist[nxt] = d + w
+                heapq.heappush(heap, (d + w, nxt))
+    return float("inf")
+
+
+class LocalRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.graph = grid_graph()
+        cls.hierarchy = build_contraction_hierarchy(cls.graph)
+
+    def test_hierarchy_matches_dijkstra(self):
+        rng = random.Random(11)
+        for _ in range(40):
+            source, target = rng.randrange(64), rng.randrange(64)
+            duration, _ = self.hierarchy.route(source, target)
+            self.assertAlmostEqual(duration, dijkstra(self.graph, source, target), places=3)
+
+    def test_hierarchy_round_trips_through_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.ch.npz")
+            self.hierarchy.save(path)
+            loaded = ContractionHierarchy.load(path)
+        self.assertEqual(loaded.route(0, 63), self.hierarchy.route(0, 63))
+
+    def test_engine_only_loads_a_prebuilt_hierarchy(self):
+        set_local_engine(None)
+        self.addCleanup(set_local_engine, None)
+        with tempfile.TemporaryDirectory() as tmp:
+            graph_path, ch_path = os.path.join(tmp, "graph.npz"), os.path.join(tmp, "graph.ch.npz")
+            self.graph.save(graph_path)
+            with override_settings(LOCAL_ROUTING_GRAPH=graph_path, LOCAL_ROUTING_CH=ch_path):
+                # Contracting in the request path would stall it for minutes on a real graph
+                with self.assertRaisesMessage(LocalRoutingError, "build_routing_graph"):
+                    get_local_engine()
+                self.assertFalse(os.path.exists(ch_path))
+
+                call_command('build_routing_graph', stdout=StringIO())
+                self.assertEqual(get_local_engine().hierarchy.route(0, 63), self.hierarchy.route(0, 63))
+
+                set_local_engine(None)
+                os.utime(graph_path, (time.time() + 60, time.time() + 60))
+                with self.assertRaisesMessage(LocalRoutingError, "older than"):
+                    get_local_engine()
+
+    @override_settings(ROUTING_BACKEND="local")
+    @patch('Admin.http_client.requests.Session.request')
+    def test_fare_calculation_on_local_backend(self, mock_request):
+        set_local_engine(LocalRoutingEngine(self.hierarchy))
+        self.addCleanup(set_local_engine, None)
+
+        payload = {"cordinates": [[72.8, 19.0], [72.8 + 7 * 0.005, 19.0]]}
+        response = self.client.post(reverse('fare-cal'), data=payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.json()["distance_km"], 3.89)
+        mock_request.assert_not_called()
+
+    @override_settings(ROUTING_BACKEND="local")
+    def test_missing_graph_is_unavailable_not_unprocessable(self):
+        set_local_engine(None)
+        self.addCleanup(set_local_engine, None)
+        payload = {"cordinates": [[72.8, 19.0], [72.81, 19.01]]}
+        pairs = [{"origin": [72.8, 19.0], "destination": [72.81, 19.01]}]
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(LOCAL_ROUTING_GRAPH=os.path.join(tmp, "missing.npz"),
+                                  LOCAL_ROUTING_CH=os.path.join(tmp, "missing.ch.npz")):
+            response = self.client.post(reverse('fare-cal'), data=payload, content_type='application/json')
+            self.assertEqual(response.status_code, 503)
+            response = self.client.post(reverse('fare-cal-batch'), data={"pairs": pairs},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("error", response.json())
+
+        # A pair the graph cannot route is still the request's fault
+        set_local_engine(LocalRoutingEngine(self.hierarchy))
+        response = self.client.post(reverse('fare-cal'), data={"cordinates": [[75.0, 19.0], [77.0, 19.0]]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(ROUTING_BACKEND="local-then-ors")
+    @patch.dict(os.environ, {"API_KEY": "test-key"})
+    @patch('Admin.http_client.requests.Session.request', side_effect=ors_matrix_side_effect)
+    def test_off_graph_pairs_fall_back_to_ors(self, mock_request):
+        set_local_engine(LocalRoutingEngine(self.hierarchy))
+        self.addCleanup(set_local_engine, None)
+        reset_route_cache()
+        reset_clients()
+
+        pairs = [
+            {"origin": [72.8, 19.0], "destination": [72.81, 19.01]},
+            {"origin": [75.0, 19.0], "destination": [77.0, 19.0]},
+        ]
+        response = self.client.post(reverse('fare-cal-batch'), data={"pairs": pairs}, content_type='application/json')
+        results = response.json()["results"]
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(results[1]["distance_km"], 2.0)
+        self.assertNotIn("error", results[0])
+
+
+class ZoneMatrixTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.hierarchy = build_contraction_hierarchy(grid_graph())
+
+    def setUp(self):
+        self.client = Client()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.zones_path = os.path.join(self.tmp.name, "zones.json")
+        self.index_path = os.path.join(self.tmp.name, "zone_matrix.json")
+        with open(self.zones_path, "w") as f:
+            json.dump([
+                {"id": "airport", "lon": 72.8, "lat": 19.0, "radius_m": 300},
+                {"id": "station", "lon": 72.835, "lat": 19.0, "radius_m": 300},
+                {"id": "mall", "lon": 72.835, "lat": 19.035, "radius_m": 300},
+            ], f)
+
+        set_local_engine(LocalRoutingEngine(self.hierarchy))
+        self.addCleanup(set_local_engine, None)
+        reset_zone_matrix_store()
+        self.addCleanup(reset_zone_matrix_store)
+        overrides = override_settings(ROUTING_BACKEND="local", ZONE_MATRIX_INDEX=self.index_path,
+                                      ZONE_DEFINITIONS=self.zones_path, ZONE_MATRIX_CHECK_INTERVAL=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def quote(self, origin, destination):
+        payload = {"cordinates": [origin, destination]}
+        return self.client.post(reverse('fare-cal'), data=payload, content_type='application/json')
+
+    def test_zone_pairs_are_answered_from_the_matrix(self):
+        live = self.quote([72.8, 19.0], [72.835, 19.0]).json()
+        call_command("build_zone_matrix", stdout=StringIO())
+
+        with patch('Admin.views.get_route_metrics') as mock_route:
+            cached = self.quote([72.8005, 19.0005], [72.835, 19.0]).json()
+            mock_route.assert_not_called()
+            self.assertAlmostEqual(cached["distance_km"], live["distance_km"], places=1)
+
+            # Off-grid destination falls back to live routing
+            mock_route.return_value = (1000, 60)
+            self.quote([72.8, 19.0], [72.82, 19.02])
+            mock_route.assert_called_once()
+
+        self.assertEqual(get_zone_matrix_store().stats()["hits"], 1)
+
+    @patch.dict(os.environ, {"API_KEY": "test-key"})
+    @override_settings(ROUTING_BACKEND="ors", ORS_FALLBACK_ESTIMATE=True)
+    @patch('Admin.http_client.requests.Session.request')
+    def test_degraded_estimates_are_not_stored(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("connection refused")
+        reset_route_cache()
+        reset_clients()
+        self.addCleanup(reset_clients)
+        out = StringIO()
+        call_command("build_zone_matrix", stdout=out)
+        self.assertIn("(6 unresolved pairs)", out.getvalue())
+        # Unresolved cells send the quote to live routing, which may still estimate it
+        self.assertIsNone(get_zone_matrix_store().lookup([72.8, 19.0], [72.835, 19.0]))
+
+    def test_stale_matrix_is_ignored(self):
+        call_command("build_zone_matrix", stdout=StringIO())
+        with override_settings(ZONE_MATRIX_MAX_AGE=1):
+            reset_zone_matrix_store()
+            with patch('Admin.zone_matrix.time.time', return_value=time.time() + 10):
+                self.assertIsNone(get_zone_matrix_store().lookup([72.8, 19.0], [72.835, 19.0]))
+
+    def test_rebuild_is_picked_up_by_running_workers(self):
+        call_command("build_zone_matrix", stdout=StringIO())
+        store = get_zone_matrix_store()
+        first = store.matrix.index["matrix_file"]
+
+        call_command("build_zone_matrix", stdout=StringIO())
+        self.assertNotEqual(store.matrix.index["matrix_file"], first)
+        self.assertIsNotNone(store.lookup([72.8, 19.0], [72.835, 19.035]))
+
+
+class EarningsRollupTests(TestCase):
+    def setUp(self):
+        from wallet.models import Wallet
+        self.client = admin_client()
+        self.driver_id = uuid.uuid4()
+        self.wallet = Wallet.objects.create(driver_id=self.driver_id)
+
+    def pay(self, amount, method="CARD", driver_id=None):
+        from payments.models import Payment
+        payment = Payment.objects.create(
+            wallet=self.wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(),
+            driver_id=driver_id or self.driver_id, amount=Decimal(amount),
+            payment_method=method, status="SUCCESS")
+        payment.process_wallet_update()
+        return payment
+
+    def rollup_rows(self):
+        return sorted(
+            (model.__name__, row) for model in (PlatformEarningsRollup, DriverEarningsRollup)
+            for row in model.objects.values_list(
+                "granularity", "bucket", "payment_method", "payment_count", "gross_amount", "platform_fee", "net_amount"))
+
+    def test_payments_are_rolled_up_with_the_ledger_fee(self):
+        self.pay("100.00")
+        self.pay("33.33")
+        self.pay("200.00", method="CASH")
+
+        card_day = PlatformEarningsRollup.objects.filter(granularity="DAY", payment_method="CARD").aggregate(
+            count=Sum("payment_count"), gross=Sum("gross_amount"), fee=Sum("platform_fee"), net=Sum("net_amount"))
+        self.assertEqual(card_day["count"], 2)
+        self.assertEqual(Decimal(card_day["gross"]).quantize(Decimal("0.01")), Decimal("133.33"))
+        # 5.00 + 1.66, rounded per payment like the ledger
+        self.assertEqual(Decimal(card_day["fee"]).quantize(Decimal("0.01")), Decimal("6.66"))
+        self.assertEqual(Decimal(card_day["net"]).quantize(Decimal("0.01")), Decimal("126.67"))
+        self.assertEqual(DriverEarningsRollup.objects.filter(driver_id=self.driver_id, granularity="HOUR").count(), 2)
+
+        body = self.client.get(reverse('earnings')).json()
+        self.assertEqual(body["totals"]["payment_count"], 3)
+        self.assertEqual(body["totals"]["platform_fee"], "16.66")
+        self.assertEqual(body["by_payment_method"]["CASH"]["gross_amount"], "200.00")
+        self.assertEqual(len(body["series"]), 1)
+
+    @override_settings(EARNINGS_PLATFORM_STRIPES=16)
+    def test_platform_buckets_are_striped_by_payment(self):
+        payments = [self.pay("10.00") for _ in range(20)]
+        rows = PlatformEarningsRollup.objects.filter(granularity="HOUR")
+        self.assertEqual(set(rows.values_list("stripe", flat=True)),
+                         {payment.payment_id.int % 16 for payment in payments})
+        self.assertEqual(sum(rows.values_list("payment_count", flat=True)), 20)
+
+        with override_settings(EARNINGS_PLATFORM_STRIPES=1):
+            self.pay("10.00", method="UPI")
+        upi_day = PlatformEarningsRollup.objects.get(granularity="DAY", payment_method="UPI")
+        self.assertEqual((upi_day.stripe, upi_day.payment_count), (0, 1))
+
+    def test_driver_and_top_driver_endpoints(self):
+        other = uuid.uuid4()
+        self.pay("100.00")
+        self.pay("300.00", driver_id=other)
+
+        body = self.client.get(reverse('earnings-driver', args=[self.driver_id]), {"granularity": "hour"}).json()
+        self.assertEqual(body["granularity"], "hour")
+        self.assertEqual(body["totals"]["net_amount"], "95.00")
+
+        drivers = self.client.get(reverse('earnings-top-drivers')).json()["drivers"]
+        self.assertEqual([d["driver_id"] for d in drivers], [str(other), str(self.driver_id)])
+
+    def test_invalid_range_is_rejected(self):
+        response = self.client.get(reverse('earnings'), {"start": "2025-02-01", "end": "2025-01-01"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('earnings'), {"granularity": "hour", "start": "2025-01-01", "end": "2025-03-01"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_backfill_rebuilds_the_incremental_rollups(self):
+        from payments.models import Payment
+        self.pay("100.00")
+        self.pay("45.50", method="UPI")
+        self.pay("80.00", method="CASH")
+        # A payment on an earlier day
+        old = Payment.objects.create(
+            wallet=self.wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(), driver_id=self.driver_id,
+            amount=Decimal("10.00"), payment_method="CARD", status="SUCCESS")
+        Payment.objects.filter(pk=old.pk).update(created_at=old.created_at - timedelta(days=3))
+        old.refresh_from_db()
+        record_payment_rollups(old)
+        expected = self.rollup_rows()
+
+        PlatformEarningsRollup.objects.all().delete()
+        DriverEarningsRollup.objects.all().delete()
+        call_command('backfill_earnings', chunk_size=2, stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), expected)
+
+        # Re-running replaces instead of adding
+        call_command('backfill_earnings', chunk_size=2, stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), expected)
+
+
+class AnalyticsSnapshotTests(TestCase):
+    def setUp(self):
+        from wallet.models import Wallet
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.wallets = [Wallet.objects.create(driver_id=uuid.uuid4()) for _ in range(3)]
+
+    def pay(self, wallet, amount, method="CARD", status="SUCCESS"):
+        from payments.models import Payment
+        return Payment.objects.create(
+            wallet=wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(), driver_id=wallet.driver_id,
+            amount=Decimal(amount), payment_method=method, status=status)
+
+    def refresh(self, **kwargs):
+        return refresh_snapshot(self.directory, lag=0, chunk_size=2, **kwargs)
+
+    def test_columns_are_encoded_and_memory_mapped(self):
+        payment = self.pay(self.wallets[0], "123.45", method="UPI")
+        self.assertEqual(self.refresh(), {"payments": 1, "wallets": 3})
+
+        snapshot = AnalyticsSnapshot(self.directory)
+        columns = snapshot.columns('payments')
+        self.assertIsInstance(columns['amount'], np.memmap)
+        self.assertEqual(columns['amount'].dtype, np.dtype('<i8'))
+        self.assertEqual(int(columns['amount'][0]), 12345)
+        self.assertEqual(snapshot.choices('payments', 'payment_method')[columns['payment_method'][0]], "UPI")
+        self.assertEqual(snapshot.decode('payment_id', columns['payment_id']), [payment.payment_id])
+        self.assertEqual(int(columns['created_at'][0]), to_epoch_us(payment.created_at))
+        # Payments and wallets share the driver dictionary
+        wallets = snapshot.table('wallets')
+        self.assertIn(columns['driver_id'][0], wallets['driver_id'])
+
+    def test_refresh_appends_only_changed_rows(self):
+        pending = self.pay(self.wallets[0], "100.00", status="PENDING")
+        self.pay(self.wallets[1], "50.00")
+        self.refresh()
+        self.assertEqual(self.refresh(), {"payments": 0, "wallets": 0})
+
+        pending.status = "SUCCESS"
+        pending.save(update_fields=["status", "updated_at"])
+        self.pay(self.wallets[2], "30.00", method="CASH")
+        self.assertEqual(self.refresh(), {"payments": 2, "wallets": 0})
+
+        snapshot = AnalyticsSnapshot(self.directory)
+        self.assertEqual(len(snapshot.columns('payments')['payment_id']), 4)
+        payments = snapshot.table('payments')
+        self.assertEqual(len(payments['payment_id']), 3)
+        self.assertTrue((payments['status'] == snapshot.choice_code('payments', 'status', 'SUCCESS')).all())
+
+        # A full rebuild keeps only the newest versions
+        self.assertEqual(self.refresh(full=True)["payments"], 3)
+
+    def test_striped_credits_are_exported_with_the_wallet(self):
+        from django.utils import timezone
+        from wallet.models import WalletStripe
+        from wallet.stripes import set_stripe_count
+        set_stripe_count(self.wallets[0].wallet_id, 2)
+        self.refresh()
+
+        # A striped credit touches only the stripe row, never the wallet row
+        WalletStripe.objects.filter(wallet=self.wallets[0], stripe=1).update(
+            total_balance=Decimal("40.00"), actual_balance=Decimal("38.00"), updated_at=timezone.now())
+        self.assertEqual(self.refresh()["wallets"], 1)
+
+        snapshot = AnalyticsSnapshot(self.directory)
+        wallets = snapshot.table('wallets')
+        self.assertEqual(sorted(wallets['actual_balance'].tolist()), [0, 0, 3800])
+        self.assertEqual(sorted(wallets['total_balance'].tolist()), [0, 0, 4000])
+        self.assertEqual(wallet_balance_percentiles(snapshot, percentiles=(100,))["percentiles"]["p100"], "38.00")
+
+    def test_analytics_match_the_orm(self):
+        self.pay(self.wallets[0], "100.00")
+        self.pay(self.wallets[0], "33.33", method="CASH")
+        self.pay(self.wallets[1], "250.00", method="UPI")
+        self.pay(self.wallets[2], "80.00", status="FAILED")
+        self.refresh()
+        snapshot = AnalyticsSnapshot(self.directory)
+
+        hours = revenue_by_hour(snapshot)
+        self.assertEqual(sum(row["payment_count"] for row in hours), 3)
+        self.assertEqual(sum(Decimal(row["gross_amount"]) for row in hours), Decimal("383.33"))
+        # 5.00 + 1.66 + 12.50
+        self.assertEqual(sum(Decimal(row["platform_fee"]) for row in hours), Decimal("19.16"))
+
+        mix = payment_method_mix(snapshot)
+        self.assertEqual(mix["CASH"]["gross_amount"], "33.33")
+        self.assertEqual(mix["CARD"]["payment_count"], 1)
+
+        earnings = driver_percentiles(snapshot, percentiles=(50, 100))
+        self.assertEqual(earnings["drivers"], 2)
+        self.assertEqual(earnings["percentiles"]["p100"], "250.00")
+        self.assertEqual(earnings["top"][0]["driver_id"], str(self.wallets[1].driver_id))
+        self.assertEqual(earnings["top"][1]["gross_amount"], "133.33")
+
+        out = StringIO()
+        call_command('analytics_report', snapshot=self.directory, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())["wallet_balances"]["wallets"], 3)
+
+
+class BenchSuiteTests(TestCase):
+    def test_every_route_has_a_scenario(self):
+        from django.urls import get_resolver, resolve
+        scenarios = build_scenarios(seed(5, 1, 1))
+        covered = set()
+        for scenario in scenarios:
+            if scenario.setup:
+                scenario.setup(1)
+            path, _ = scenario.request(0)
+            covered.add(resolve(path.split('?')[0]).url_name)
+
+        expected = set()
+        for prefix in ('payments/', 'wallet/', 'analysis/'):
+            app_resolver = next(pattern for pattern in get_resolver().url_patterns if str(pattern.pattern) == prefix)
+            expected.update(pattern.name for pattern in app_resolver.url_patterns)
+        self.assertEqual(expected - covered, set())
+
+    def test_compare_results_flags_regressions(self):
+        def result(p95, rps, queries, errors=0):
+            return {"scenarios": {"wallet.get": {
+                "latency": {"p95_ms": p95}, "requests_per_second": rps,
+                "queries_per_request": {"mean": queries}, "errors": errors,
+            }}}
+
+        baseline = result(10.0, 100.0, 1.0)
+        self.assertEqual(compare_results(baseline, result(12.0, 90.0, 1.0)), [])
+        regressions = compare_results(baseline, result(20.0, 50.0, 2.0, errors=3))
+        self.assertEqual({r["metric"] for r in regressions},
+                         {"p95_ms", "requests_per_second", "queries_per_request", "errors"})
+        # Scenarios missing from the baseline are new, not regressions
+        self.assertEqual(compare_results({"scenarios": {}}, result(20.0, 50.0, 2.0)), [])
+
+
+@override_settings(METRICS_SCRAPE_TOKEN="scrape-token", METRICS_ALLOWED_IPS=[], WALLET_CACHE={'ENABLED': True})
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from wallet.models import Wallet
+        caches['default'].clear()
+        reset_metrics()
+        reset_clients()
+        self.addCleanup(reset_clients)
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), headers={"Authorization": "Bearer scrape-token"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_are_recorded_by_route_pattern(self):
+        for _ in range(2):
+            self.client.get(f'/wallet/driver-wallet/{self.wallet.driver_id}/')
+        self.client.get(f'/wallet/driver-wallet/{uuid.uuid4()}/')
+        body = self.scrape()
+
+        route = 'route="/wallet/driver-wallet/<uuid:driver_id>/"'
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",{route},status="200"}} 2', body)
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",{route},status="404"}} 1', body)
+        self.assertIn(f'http_request_duration_seconds_bucket{{method="GET",{route},status="200",le="+Inf"}} 2',
+                      body)
+        # One query per lookup, the repeated one is served by the wallet cache
+        self.assertIn(f'http_request_db_queries_sum{{method="GET",{route}}} 2', body)
+        self.assertIn(f'http_request_db_queries_bucket{{method="GET",{route},le="0"}} 1', body)
+        self.assertIn(f'http_response_size_bytes_count{{method="GET",{route}}} 3', body)
+        self.assertNotIn(str(self.wallet.driver_id), body)
+
+    async def test_async_requests_count_their_queries(self):
+        response = await AsyncClient().get(f'/wallet/driver-wallet/{self.wallet.driver_id}/')
+        self.assertEqual(response.status_code, 200)
+        body = await sync_to_async(self.scrape)()
+        self.assertIn('http_request_db_queries_sum{method="GET",route="/wallet/driver-wallet/<uuid:driver_id>/"} 1',
+                      body)
+
+    @patch.dict(os.environ, {"API_KEY": "test-key"})
+    @override_settings(ROUTE_CACHE={'ENABLED': False}, ZONE_MATRIX_ENABLED=False,
+                       OUTBOUND_HTTP={"ors": {"RETRIES": 0}})
+    @patch('Admin.http_client.requests.Session.request')
+    def test_outbound_calls_are_recorded(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=503, text="Unavailable")
+        self.client.post(reverse('fare-cal'), data={"cordinates": [[72.86, 19.08], [72.82, 18.92]]},
+                         content_type='application/json')
+        self.assertIn('outbound_request_duration_seconds_count{upstream="ors",status="503"} 1', self.scrape())
+
+    def test_scrapes_need_the_token_or_an_allowed_address(self):
+        for headers in ({}, {"Authorization": "Bearer wrong"}, auth_header(Admin(email="admin@example.com"))):
+            response = self.client.get(reverse('metrics'), headers=headers)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        with override_settings(METRICS_SCRAPE_TOKEN=""):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(f'/wallet/driver-wallet/{self.wallet.driver_id}/')
+        self.assertNotIn('route="/wallet/', self.scrape())
+
+
+# As deployed once the JS backend sends tokens (off by default until then)
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   ADMIN_TOKENS={'REQUIRED': True})
+class AdminTokenTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.hashers import make_password
+        reset_tokens()
+        self.addCleanup(reset_tokens)
+        self.admin = Admin.objects.create(name="Admin", email="admin@example.com", phone="9999999999",
+                                          password=make_password("secret-password"))
+        self.detail_url = reverse('get-update-admin', args=[self.admin.email])
+
+    def login(self):
+        response = self.client.post(reverse('login-admin'), data={"email": self.admin.email,
+                                                                   "password": "secret-password"},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_login_issues_tokens_that_open_admin_endpoints(self):
+        body = self.login()
+        self.assertEqual(body["admin"]["email"], self.admin.email)
+        self.assertEqual(body["token_type"], "Bearer")
+        self.assertEqual(self.client.get(self.detail_url).status_code, 401)
+        response = self.client.get(self.detail_url, headers={"Authorization": f"Bearer {body['access']}"})
+        self.assertEqual(response.status_code, 200)
+        # Refresh tokens only refresh
+        response = self.client.get(self.detail_url, headers={"Authorization": f"Bearer {body['refresh']}"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stats_and_earnings_routes_need_a_token(self):
+        for url in (reverse('fare-cal-cache-stats'), reverse('outbound-metrics'), reverse('earnings'),
+                    reverse('earnings-top-drivers'), reverse('earnings-driver', args=[uuid.uuid4()])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 401, url)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+            self.assertEqual(self.client.get(url, headers=auth_header(self.admin)).status_code, 200, url)
+
+    def test_tampered_and_expired_tokens_are_rejected(self):
+        access = issue_tokens(self.admin)["access"]
+        payload, signature = access.split('.')
+        forged = json.loads(base64.urlsafe_b64decode(payload + '==='))
+        forged["role"] = "SuperAdmin"
+        forged = base64.urlsafe_b64encode(json.dumps(forged).encode()).rstrip(b'=').decode()
+        for token in (f"{forged}.{signature}", "not-a-token", access + "x"):
+            response = self.client.get(self.detail_url, headers={"Authorization": f"Bearer {token}"})
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+        with override_settings(ADMIN_TOKENS={'ACCESS_TTL': -1}):
+            expired = issue_tokens(self.admin)["access"]
+        with self.assertRaisesMessage(TokenError, "expired"):
+            verify_token(expired)
+
+    def test_verified_tokens_skip_the_signature_check(self):
+        access = issue_tokens(self.admin)["access"]
+        verify_token(access)
+        with patch('Admin.tokens.decode_token') as decode:
+            self.assertEqual(verify_token(access)["email"], self.admin.email)
+        decode.assert_not_called()
+
+        cache = VerifiedTokens(max_entries=2)
+        for token in ("a", "b", "c"):
+            cache.set(token, {"sub": token})
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 2)
+
+    def test_refresh_rotates_the_pair(self):
+        body = self.login()
+        response = self.client.post(reverse('token-refresh'), data={"refresh": body["refresh"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()["access"], body["access"])
+        # A refresh token works once
+        response = self.client.post(reverse('token-refresh'), data={"refresh": body["refresh"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_logout_revokes_in_every_worker(self):
+        body = self.login()
+        other_worker = {"Authorization": f"Bearer {body['access']}"}
+        self.assertEqual(self.client.get(self.detail_url, headers=other_worker).status_code, 200)
+        # Another worker revokes the token, this one only learns from the table
+        response = self.client.post(reverse('logout-admin'), data={"refresh": body["refresh"]},
+                                    content_type='application/json', headers=other_worker)
+        self.assertEqual(response.status_code, 200)
+        revocations.reset()
+        self.assertEqual(self.client.get(self.detail_url, headers=other_worker).status_code, 401)
+        response = self.client.post(reverse('token-refresh'), data={"refresh": body["refresh"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_registering_takes_an_admin(self):
+        new_admin = {"name": "Second", "email": "second@example.com", "phone": "8888888888",
+                     "password": "another-password"}
+        response = self.client.post(reverse('register-admin'), data=new_admin, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Admin.objects.filter(email="second@example.com").exists())
+        response = self.client.post(reverse('register-admin'), data=new_admin, content_type='application/json',
+                                    headers=auth_header(self.admin))
+        self.assertEqual(response.status_code, 201)
+
+    @patch.dict(os.environ, {"ADMIN_PASSWORD": "first-password"})
+    def test_create_admin_command(self):
+        out = StringIO()
+        call_command('create_admin', '--email', 'first@example.com', '--name', 'First', '--phone', '7777777777',
+                     '--no-input', stdout=out)
+        self.assertIn("first@example.com created", out.getvalue())
+        response = self.client.post(reverse('login-admin'), data={"email": "first@example.com",
+                                                                   "password": "first-password"},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_driver_routes_stay_open(self):
+        from wallet.models import Wallet
+        wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        self.assertEqual(self.client.get(reverse('wallet-operations', args=[wallet.driver_id])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('get-all-wallet')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('completed_payments_by_id', args=[wallet.wallet_id])).status_code,
+                         200)
+        self.assertEqual(self.client.get(reverse('completed_payments')).status_code, 401)
+        response = self.client.get(reverse('get-all-wallet'), headers=auth_header(self.admin))
+        self.assertEqual(response.status_code, 200)
+        with override_settings(ADMIN_TOKENS={'REQUIRED': False}):
+            self.assertEqual(self.client.get(reverse('get-all-wallet')).status_code, 200)
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_profile_is_applied_on_connect(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        config = database_settings('sqlite', sqlite_name=os.path.join(directory, 'profile.sqlite3'))
+        self.assertGreater(config['CONN_MAX_AGE'], 0)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+        from django.db import connections
+        connection = DatabaseWrapper({**connections['default'].settings_dict, **config}, 'profile')
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                cursor.execute(f"PRAGMA {pragma}")
+                pragmas[pragma] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 20000,
+                                   "mmap_size": 256 * 1024 * 1024})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_postgres_pooling(self):
+        with patch.dict(os.environ, {"DB_POOL": "psycopg", "DB_STATEMENT_TIMEOUT_MS": "5000"}), \
+                patch('RideHailingApp.db_profiles.find_spec', return_value=object()):
+            config = database_settings('postgres', sqlite_name='unused')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool']['max_size'], 20)
+        self.assertIn("statement_timeout=5000", config['OPTIONS']['options'])
+
+        with patch.dict(os.environ, {"DB_POOL": "pgbouncer"}):
+            config = database_settings('postgres', sqlite_name='unused', replica='replica.internal')
+        self.assertEqual(config['HOST'], 'replica.internal')
+        self.assertTrue(config['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('options', config['OPTIONS'])
+
+        with self.assertRaises(ValueError):
+            database_settings('mysql', sqlite_name='unused')
+
+    def test_psycopg_pool_needs_psycopg3(self):
+        # psycopg2 alone would only fail at the first connection, on the unknown 'pool' option
+        installed = {'psycopg': object()}
+        with patch.dict(os.environ, {"DB_POOL": "psycopg"}), \
+                patch('RideHailingApp.db_profiles.find_spec', side_effect=installed.get):
+            with self.assertRaisesMessage(ValueError, "missing: psycopg_pool"):
+                database_settings('postgres', sqlite_name='unused')
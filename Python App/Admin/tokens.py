@@ -0,0 +1,252 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+
+
+# Admin Access Tokens
+#
+# Logging in runs check_password (PBKDF2, slow on purpose) once and hands out
+# two HMAC-SHA256 signed tokens instead of a session:
+#   access   short-lived (ACCESS_TTL), sent as `Authorization: Bearer <token>`
+#            to the admin endpoints (Admin.authentication)
+#   refresh  long-lived (REFRESH_TTL), traded at /analysis/token/refresh/ for
+#            a new pair; each refresh token works once (rotation)
+# A token is base64url(JSON claims) + "." + base64url(signature), so checking
+# one is a hash and a JSON parse, no database. Tokens verified recently sit in
+# a per-worker LRU (CACHE_SIZE), a repeat costs a dict lookup plus the expiry
+# and revocation checks, which are never cached.
+#
+# Revocation (logout, used refresh tokens) writes an Admin.RevokedToken row and
+# updates this worker's revoked set at once; other workers pull rows revoked
+# since their last look every REVOCATION_SYNC_INTERVAL seconds, so a revoked
+# access token dies everywhere within that interval (and by ACCESS_TTL anyway).
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+REVOCATION_OVERLAP = 30
+
+
+class TokenError(Exception):
+    pass
+
+
+def _config():
+    return getattr(settings, 'ADMIN_TOKENS', {})
+
+
+@lru_cache(maxsize=4)
+def _signing_key(secret):
+    # Never sign with SECRET_KEY itself, tokens get a key of their own
+    return hashlib.sha256(b'Admin.tokens:' + secret.encode()).digest()
+
+
+def _key():
+    return _signing_key(_config().get('SECRET') or settings.SECRET_KEY)
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload):
+    return hmac.new(_key(), payload.encode(), hashlib.sha256).digest()
+
+
+def make_token(claims):
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f"{payload}.{_b64encode(_sign(payload))}"
+
+
+def decode_token(token):
+    """
+    Claims of a token with a valid signature; expiry, type and revocation
+    are the caller's business (verify_token).
+    """
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload)):
+            raise TokenError("Invalid token")
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise TokenError("Invalid token")
+    if not isinstance(claims, dict) or not {'sub', 'typ', 'exp', 'jti'} <= claims.keys():
+        raise TokenError("Invalid token")
+    return claims
+
+
+def issue_tokens(admin):
+    """
+    New access + refresh pair for an Admin, as returned by the login and
+    refresh endpoints.
+    """
+    config = _config()
+    now = int(time.time())
+    access_ttl = config.get('ACCESS_TTL', 900)
+    base = {"sub": str(admin.admin_id), "email": admin.email, "role": admin.role}
+    return {
+        "token_type": "Bearer",
+        "access": make_token({**base, "typ": ACCESS, "exp": now + access_ttl, "jti": uuid.uuid4().hex}),
+        "refresh": make_token({**base, "typ": REFRESH, "exp": now + config.get('REFRESH_TTL', 7 * 24 * 3600),
+                               "jti": uuid.uuid4().hex}),
+        "expires_in": access_ttl,
+    }
+
+
+class VerifiedTokens:
+    """
+    LRU of token -> claims for tokens whose signature was checked.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is not None:
+                self._entries.move_to_end(token)
+            return claims
+
+    def set(self, token, claims):
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RevocationList:
+    """
+    jti -> expiry of revoked tokens not yet expired, kept in step with the
+    RevokedToken table.
+    """
+
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._synced_at = None    # monotonic time of the last sync
+        self._watermark = None    # newest revoked_at seen
+
+    def revoke(self, claims):
+        from .models import RevokedToken
+
+        expires_at = datetime.fromtimestamp(claims['exp'], tz=dt_timezone.utc)
+        # Rows of tokens that expired since are no longer needed
+        RevokedToken.objects.filter(expires_at__lte=datetime.now(tz=dt_timezone.utc)).delete()
+        _, created = RevokedToken.objects.get_or_create(jti=claims['jti'], defaults={
+            "admin_id": claims['sub'], "expires_at": expires_at})
+        with self._lock:
+            self._revoked[claims['jti']] = claims['exp']
+        return created
+
+    def sync(self):
+        from .models import RevokedToken
+
+        now = time.time()
+        rows = RevokedToken.objects.filter(expires_at__gt=datetime.fromtimestamp(now, tz=dt_timezone.utc))
+        if self._watermark is not None:
+            # With some overlap, for rows other workers committed a little late
+            rows = rows.filter(revoked_at__gte=self._watermark - timedelta(seconds=REVOCATION_OVERLAP))
+        rows = list(rows.values_list('jti', 'expires_at', 'revoked_at'))
+        with self._lock:
+            for jti, expires_at, revoked_at in rows:
+                self._revoked[jti] = expires_at.timestamp()
+                if self._watermark is None or revoked_at > self._watermark:
+                    self._watermark = revoked_at
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+            self._synced_at = time.monotonic()
+
+    def is_revoked(self, jti):
+        interval = _config().get('REVOCATION_SYNC_INTERVAL', 5)
+        if self._synced_at is None or time.monotonic() - self._synced_at >= interval:
+            self.sync()
+        return jti in self._revoked
+
+    def reset(self):
+        with self._lock:
+            self._revoked.clear()
+            self._synced_at = None
+            self._watermark = None
+
+
+verified_tokens = VerifiedTokens(_config().get('CACHE_SIZE', 1024))
+revocations = RevocationList()
+
+
+def verify_token(token, token_type=ACCESS):
+    """
+    Claims of a valid, unexpired, unrevoked token of ``token_type``;
+    TokenError otherwise.
+    """
+    claims = verified_tokens.get(token)
+    if claims is None:
+        claims = decode_token(token)
+        verified_tokens.set(token, claims)
+    if claims['typ'] != token_type:
+        raise TokenError("Wrong token type")
+    if claims['exp'] <= time.time():
+        verified_tokens.discard(token)
+        raise TokenError("Token has expired")
+    if revocations.is_revoked(claims['jti']):
+        raise TokenError("Token has been revoked")
+    return claims
+
+
+def revoke_token(token):
+    """
+    Revoke a token with a valid signature (expired or not); returns its claims.
+    """
+    claims = decode_token(token)
+    revocations.revoke(claims)
+    verified_tokens.discard(token)
+    return claims
+
+
+def spend_refresh_token(token):
+    """
+    Claims of a valid refresh token, revoked on the way so it refreshes once;
+    of two concurrent refreshes with the same token only one gets through.
+    """
+    claims = verify_token(token, REFRESH)
+    if not revocations.revoke(claims):
+        raise TokenError("Token has been revoked")
+    verified_tokens.discard(token)
+    return claims
+
+
+def reset_tokens():
+    verified_tokens.clear()
+    revocations.reset()
+
+
+def auth_header(admin):
+    # Authorization header with a fresh access token, for tests and benchmarks;
+    # ``admin`` may be unsaved, verification never reads the Admin table
+    return {"Authorization": f"Bearer {issue_tokens(admin)['access']}"}
@@ -1,7 +1,7 @@
 
 from django.urls import path
 
-from .views import FareCalculation, RegisterAdminView, LoginAdminView, AdminDetailView
+from .views import FareCalculation, FareCalculationAsync, FareBatchCalculation, RouteCacheStatsView, OutboundMetricsView, MetricsView, EarningsView, DriverEarningsView, TopDriversEarningsView, RegisterAdminView, LoginAdminView, RefreshTokenView, LogoutAdminView, AdminDetailView
 
 
 
@@ -10,11 +10,35 @@ urlpatterns = [
     # Fare Calculation Url
     path('fare-cal',FareCalculation,name='fare-cal'),
 
+    # Async Fare Calculation Url (ASGI)
+    path('fare-cal-async',FareCalculationAsync,name='fare-cal-async'),
+
+    # Batch Fare Calculation Url
+    path('fare-cal/batch',FareBatchCalculation,name='fare-cal-batch'),
+
+    # Route Metrics Cache Counters Url
+    path('fare-cal/cache-stats',RouteCacheStatsView,name='fare-cal-cache-stats'),
+
+    # Outbound HTTP Metrics Url
+    path('outbound-metrics',OutboundMetricsView,name='outbound-metrics'),
+
+    # Prometheus Metrics Url
+    path('metrics',MetricsView,name='metrics'),
+
+    # Earnings Rollup Urls
+    path('earnings/', EarningsView, name='earnings'),
+    path('earnings/drivers/', TopDriversEarningsView, name='earnings-top-drivers'),
+    path('earnings/drivers/<uuid:driver_id>/', DriverEarningsView, name='earnings-driver'),
+
     # Register Admin Url
     path('register/', RegisterAdminView.as_view(), name='register-admin'),
     
     # Admin Login url
     path('login/', LoginAdminView.as_view(), name='login-admin'),
+
+    # Admin Token Refresh / Logout Urls
+    path('token/refresh/', RefreshTokenView.as_view(), name='token-refresh'),
+    path('logout/', LogoutAdminView.as_view(), name='logout-admin'),
     
     # Admin Update Url
     path('admin/<str:email>/', AdminDetailView.as_view(), name='get-update-admin'),
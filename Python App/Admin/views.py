@@ -1,6 +1,5 @@
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
-import requests
 import os
 from dotenv import load_dotenv
 
@@ -10,15 +9,32 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from .models import Admin
 from .serializers import AdminSerializer, AdminLoginSerializer,AdminUpdateSerializer 
+from .authentication import ADMIN_AUTHENTICATION, ADMIN_PERMISSIONS, scrape_allowed
+from .tokens import TokenError, issue_tokens, revoke_token, spend_refresh_token
 from rest_framework.permissions import AllowAny 
+from .routing import RoutingError, aget_route_metrics, calculate_fare, calculate_fares, get_route_metrics, get_route_metrics_batch
+from django.conf import settings
+import numpy as np
+from .route_cache import get_route_cache
+from .http_client import all_client_metrics
+from .zone_matrix import get_zone_matrix_store
+from .earnings import earnings_summary, parse_range, top_drivers
+import json
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from RideHailingApp.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_prometheus
+from RideHailingApp.db_router import replica_reads
 
 load_dotenv()
  
 
-# Register Admin
+# Register Admin (by another admin; the first one comes from `manage.py create_admin`)
 class RegisterAdminView(generics.CreateAPIView):
     queryset = Admin.objects.all()
     serializer_class = AdminSerializer
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
 
 
 # Login Admin
@@ -27,18 +43,58 @@ class LoginAdminView(APIView):
         serializer = AdminLoginSerializer(data=request.data)
         if serializer.is_valid():
             admin = serializer.validated_data
+            # The password is checked here only, later calls send the access token
             return Response({
                 "message": "Login successful",
-                "admin": AdminSerializer(admin).data
+                "admin": AdminSerializer(admin).data,
+                **issue_tokens(admin),
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Refresh Admin Tokens (the refresh token is spent, a new pair is issued)
+class RefreshTokenView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        token = request.data.get('refresh')
+        if not token:
+            return Response({"error": "refresh is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            claims = spend_refresh_token(token)
+        except TokenError as e:
+            return Response({"error": str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        admin = Admin.objects.filter(admin_id=claims['sub']).first()
+        if admin is None:
+            return Response({"error": "Admin not found"}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(issue_tokens(admin), status=status.HTTP_200_OK)
+
+
+# Logout Admin (revokes the access token and, if sent, the refresh token)
+class LogoutAdminView(APIView):
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
+
+    def post(self, request):
+        if request.auth:
+            revoke_token(request.auth)
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                revoke_token(refresh)
+            except TokenError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Logged out"}, status=status.HTTP_200_OK)
+
+
 # Admin Update View 
 class AdminDetailView(generics.RetrieveUpdateAPIView):
     queryset = Admin.objects.all()
     serializer_class = AdminUpdateSerializer
     lookup_field = 'email'
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
 
 
  
@@ -54,44 +110,17 @@ def FareCalculation(request):
         if not cordinates or len(cordinates) < 2:
             return Response({"error": "Please provide two coordinates: location1 and location2"}, status=400)
 
-        # Get API key
-        API_KEY = os.getenv('API_KEY')
-        if not API_KEY:
-            return Response({"error": "Your API Key is missing, please check API configuration"}, status=500)
-
-        # OpenRouteService matrix endpoint (for distance & duration)
-        url = "https://api.openrouteservice.org/v2/matrix/driving-car"
-        headers = {
-            "Authorization": API_KEY,
-            "Content-Type": "application/json"
-        }
-        body = {
-            "locations": cordinates,
-            "metrics": ["distance", "duration"]
-        }
-
-     
-        res = requests.post(url, json=body, headers=headers)
-       
-        # Check response
-        if res.status_code != 200:
-            return Response({
-                "error": "Failed to fetch routes",
-                "details": res.text,
-                "status_code": res.status_code
-            }, status=res.status_code)
-
-        data = res.json()
-
-        # Extract distance and duration
-        distance_m = data['distances'][0][1]  
-        duration_s = data['durations'][0][1]
+        # Distance & duration, from the zone matrix or the routing backend
+        zone_store = get_zone_matrix_store()
+        metrics = zone_store.lookup(cordinates[0], cordinates[1]) if zone_store else None
+        try:
+            distance_m, duration_s = metrics or get_route_metrics(cordinates[0], cordinates[1])
+        except RoutingError as e:
+            return Response(e.payload, status=e.status_code)
 
         # Fare calculation
-        base_fare = 50      
-        per_km_rate = 10    
         distance_km = distance_m / 1000
-        fare = base_fare + (distance_km * per_km_rate)
+        fare = calculate_fare(distance_m)
 
         return Response({
             "distance_km": round(distance_km, 2),
@@ -102,3 +131,188 @@ def FareCalculation(request):
 
     except Exception as e:
         return Response({"error": "Internal server error", "details": str(e)}, status=500)
+
+
+# Async Fare Calculation (ASGI): ORS through the non-blocking httpx client
+@csrf_exempt
+@require_POST
+async def FareCalculationAsync(request):
+
+    try:
+        try:
+            cordinates = json.loads(request.body or b'{}').get('cordinates')
+        except (ValueError, AttributeError):
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+        if not cordinates or len(cordinates) < 2:
+            return JsonResponse({"error": "Please provide two coordinates: location1 and location2"}, status=400)
+
+        zone_store = get_zone_matrix_store()
+        metrics = zone_store.lookup(cordinates[0], cordinates[1]) if zone_store else None
+        try:
+            distance_m, duration_s = metrics or await aget_route_metrics(cordinates[0], cordinates[1])
+        except RoutingError as e:
+            return JsonResponse(e.payload, status=e.status_code)
+
+        distance_km = distance_m / 1000
+        fare = calculate_fare(distance_m)
+
+        return JsonResponse({
+            "distance_km": round(distance_km, 2),
+            "duration_minutes": round(duration_s / 60, 2),
+            "fare_estimate": round(fare, 2),
+        })
+
+    except Exception as e:
+        return JsonResponse({"error": "Internal server error", "details": str(e)}, status=500)
+
+
+def parse_coordinate(value):
+    # ORS order: [longitude, latitude]
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError("Coordinate must be a [longitude, latitude] pair")
+    lon, lat = float(value[0]), float(value[1])
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError("Coordinate out of range")
+    return (lon, lat)
+
+
+# Batch Fare Calculation
+@api_view(['POST'])
+def FareBatchCalculation(request):
+    pairs = request.data.get('pairs')
+    if not isinstance(pairs, list) or not pairs:
+        return Response({"error": "Please provide a non-empty list of pairs with origin and destination"}, status=400)
+    if len(pairs) > settings.FARE_BATCH_MAX_PAIRS:
+        return Response({"error": f"A batch can contain at most {settings.FARE_BATCH_MAX_PAIRS} pairs"}, status=400)
+
+    try:
+        # Validate every pair, invalid ones are reported without failing the batch
+        valid_pairs, valid_indexes, errors = [], [], {}
+        for index, pair in enumerate(pairs):
+            try:
+                if not isinstance(pair, dict):
+                    raise ValueError("Pair must be an object with origin and destination")
+                valid_pairs.append((parse_coordinate(pair.get('origin')), parse_coordinate(pair.get('destination'))))
+                valid_indexes.append(index)
+            except (TypeError, ValueError) as e:
+                errors[index] = str(e)
+
+        distances = np.full(len(pairs), np.nan)
+        durations = np.full(len(pairs), np.nan)
+
+        # Pairs between two known zones are answered from the zone matrix
+        zone_store = get_zone_matrix_store()
+        if zone_store:
+            remaining_pairs, remaining_indexes = [], []
+            for index, pair in zip(valid_indexes, valid_pairs):
+                metrics = zone_store.lookup(*pair)
+                if metrics is None:
+                    remaining_pairs.append(pair)
+                    remaining_indexes.append(index)
+                else:
+                    distances[index], durations[index] = metrics
+            valid_pairs, valid_indexes = remaining_pairs, remaining_indexes
+
+        if valid_pairs:
+            try:
+                batch_distances, batch_durations, batch_errors = get_route_metrics_batch(valid_pairs)
+            except RoutingError as e:
+                return Response(e.payload, status=e.status_code)
+            distances[valid_indexes] = batch_distances
+            durations[valid_indexes] = batch_durations
+            for position, message in batch_errors.items():
+                errors[valid_indexes[position]] = message
+
+        # Pricing for the whole batch at once
+        distances_km = np.round(distances / 1000, 2).tolist()
+        durations_minutes = np.round(durations / 60, 2).tolist()
+        fares = np.round(calculate_fares(distances), 2).tolist()
+
+        results = []
+        for index in range(len(pairs)):
+            if index in errors:
+                results.append({"index": index, "error": errors[index]})
+            else:
+                results.append({
+                    "index": index,
+                    "distance_km": distances_km[index],
+                    "duration_minutes": durations_minutes[index],
+                    "fare_estimate": fares[index],
+                })
+
+        return Response({"count": len(pairs), "errors": len(errors), "results": results})
+
+    except Exception as e:
+        return Response({"error": "Internal server error", "details": str(e)}, status=500)
+
+
+# Route Cache Stats
+@api_view(['GET'])
+@authentication_classes(ADMIN_AUTHENTICATION)
+@permission_classes(ADMIN_PERMISSIONS)
+def RouteCacheStatsView(request):
+    zone_store = get_zone_matrix_store()
+    return Response({
+        **get_route_cache().stats.as_dict(),
+        "zone_matrix": zone_store.stats() if zone_store else {"loaded": False},
+    })
+
+
+# Outbound HTTP Pool And Circuit Breaker State
+@api_view(['GET'])
+@authentication_classes(ADMIN_AUTHENTICATION)
+@permission_classes(ADMIN_PERMISSIONS)
+def OutboundMetricsView(request):
+    return Response(all_client_metrics())
+
+
+# Request, DB And Outbound Histograms (Prometheus text format)
+@require_GET
+def MetricsView(request):
+    if not scrape_allowed(request):
+        if not settings.METRICS_SCRAPE_TOKEN:
+            return JsonResponse({"error": "Metrics are not exposed to this address"}, status=403)
+        response = JsonResponse({"error": "Scrape token required"}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_prometheus(), content_type=METRICS_CONTENT_TYPE)
+
+
+# Earnings From The Rollups (platform-wide)
+@replica_reads
+@api_view(['GET'])
+@authentication_classes(ADMIN_AUTHENTICATION)
+@permission_classes(ADMIN_PERMISSIONS)
+def EarningsView(request):
+    try:
+        start, end, granularity = parse_range(request.query_params)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(earnings_summary(start, end, granularity))
+
+
+# Earnings Of One Driver
+@replica_reads
+@api_view(['GET'])
+@authentication_classes(ADMIN_AUTHENTICATION)
+@permission_classes(ADMIN_PERMISSIONS)
+def DriverEarningsView(request, driver_id):
+    try:
+        start, end, granularity = parse_range(request.query_params)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"driver_id": str(driver_id), **earnings_summary(start, end, granularity, driver_id=driver_id)})
+
+
+# Top Earning Drivers
+@replica_reads
+@api_view(['GET'])
+@authentication_classes(ADMIN_AUTHENTICATION)
+@permission_classes(ADMIN_PERMISSIONS)
+def TopDriversEarningsView(request):
+    try:
+        start, end, _ = parse_range({**request.query_params.dict(), "granularity": "day"})
+        limit = max(1, min(int(request.query_params.get('limit', 50)), 500))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"start": start, "end": end, "drivers": top_drivers(start, end, limit)})
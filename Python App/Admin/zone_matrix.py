@@ -0,0 +1,231 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .routing import BASE_FARE, PER_KM_RATE
+
+
+logger = logging.getLogger(__name__)
+
+
+# Zone-to-zone Fare Matrix
+#
+# `manage.py build_zone_matrix` precomputes distance/duration/fare between
+# every pair of city zones and writes:
+#   zone_matrix-<timestamp>.npy  float32[3, Z, Z] (distance_m, duration_s, fare), NaN if unroutable
+#   zone_matrix.json             the index: zones, matrix file name, generation metadata
+#
+# Workers open the .npy with mmap_mode='r', so the matrix lives once in the
+# OS page cache and is shared by every Gunicorn worker. A rebuild writes a new
+# matrix file and then atomically replaces the index, which workers notice on
+# their next periodic stat() and remap.
+
+MATRIX_LAYERS = ('distance_m', 'duration_s', 'fare')
+_METRES_PER_DEGREE = 111_320.0
+
+
+def current_fare_rules():
+    return {"base_fare": BASE_FARE, "per_km_rate": PER_KM_RATE}
+
+
+def load_zones(path):
+    """
+    Zones file: JSON list of {"id", "lon", "lat", "radius_m"} objects.
+    """
+    with open(path) as f:
+        zones = json.load(f)
+    for zone in zones:
+        missing = {'id', 'lon', 'lat', 'radius_m'} - set(zone)
+        if missing:
+            raise ValueError(f"Zone {zone.get('id')} is missing {', '.join(sorted(missing))}")
+    return zones
+
+
+def write_zone_matrix(index_path, zones, distances, durations, fares, metadata, keep=2):
+    """
+    Write a new matrix file next to the index and atomically swap the index to it.
+    Only the newest ``keep`` matrix files are kept on disk.
+    """
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    stem = index_path.stem
+    matrix_name = f"{stem}-{time.time_ns()}.npy"
+
+    count = len(zones)
+    matrix = np.lib.format.open_memmap(
+        index_path.parent / matrix_name, mode='w+', dtype=np.float32, shape=(len(MATRIX_LAYERS), count, count))
+    matrix[0] = distances
+    matrix[1] = durations
+    matrix[2] = fares
+    matrix.flush()
+    del matrix
+
+    index = {
+        "matrix_file": matrix_name,
+        "layers": list(MATRIX_LAYERS),
+        "zones": [{key: zone[key] for key in ('id', 'lon', 'lat', 'radius_m')} for zone in zones],
+        **metadata,
+    }
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+
+    # Old matrices can still be mapped by workers that have not reloaded yet,
+    # unlinking keeps their mapping valid until they drop it
+    old = sorted(index_path.parent.glob(f"{stem}-*.npy"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in old[keep:]:
+        path.unlink(missing_ok=True)
+
+    return index_path.parent / matrix_name
+
+
+class ZoneFareMatrix:
+    def __init__(self, index_path):
+        self.index_path = Path(index_path)
+        with open(self.index_path) as f:
+            self.index = json.load(f)
+
+        self.matrix = np.load(self.index_path.parent / self.index["matrix_file"], mmap_mode='r')
+        zones = self.index["zones"]
+        self.zone_ids = [zone["id"] for zone in zones]
+        self.lon = np.array([zone["lon"] for zone in zones], dtype=np.float64)
+        self.lat = np.array([zone["lat"] for zone in zones], dtype=np.float64)
+        self.radius = np.array([zone["radius_m"] for zone in zones], dtype=np.float64)
+        self.generated_at = float(self.index.get("generated_at", 0))
+
+    def stale_reason(self, max_age):
+        if max_age and time.time() - self.generated_at > max_age:
+            return "older than ZONE_MATRIX_MAX_AGE"
+        if self.index.get("fare_rules") != current_fare_rules():
+            return "built with different fare rules"
+        return None
+
+    def zone_of(self, coordinate):
+        lon, lat = float(coordinate[0]), float(coordinate[1])
+        dx = (self.lon - lon) * _METRES_PER_DEGREE * math.cos(math.radians(lat))
+        dy = (self.lat - lat) * _METRES_PER_DEGREE
+        distances = np.hypot(dx, dy)
+        zone = int(np.argmin(distances))
+        return zone if distances[zone] <= self.radius[zone] else None
+
+    def lookup(self, origin, destination):
+        """
+        Return (distance_m, duration_s) for a pair of coordinates in two
+        different zones, or None when the pair is off-grid.
+        """
+        source = self.zone_of(origin)
+        target = self.zone_of(destination)
+        # Trips within one zone are too short to price from zone centroids
+        if source is None or target is None or source == target:
+            return None
+        distance = float(self.matrix[0, source, target])
+        duration = float(self.matrix[1, source, target])
+        if math.isnan(distance) or math.isnan(duration):
+            return None
+        return distance, duration
+
+
+class ZoneMatrixStore:
+    """
+    Per-process handle on the current matrix, re-checking the index file at
+    most every ``check_interval`` seconds and remapping when it was swapped.
+    """
+
+    def __init__(self, index_path, max_age, check_interval):
+        self.index_path = Path(index_path)
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                stat = self.index_path.stat()
+            except FileNotFoundError:
+                self._matrix, self._signature = None, None
+                return
+            signature = (stat.st_ino, stat.st_mtime_ns)
+            if signature == self._signature:
+                return
+
+            try:
+                matrix = ZoneFareMatrix(self.index_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Could not load zone matrix %s: %s", self.index_path, e)
+                return
+            reason = matrix.stale_reason(self.max_age)
+            if reason:
+                logger.warning("Ignoring zone matrix %s: %s", self.index_path, reason)
+                matrix = None
+            self._matrix, self._signature = matrix, signature
+
+    @property
+    def matrix(self):
+        self._refresh()
+        matrix = self._matrix
+        # Staleness also has to be noticed while the file does not change
+        if matrix is not None and self.max_age and time.time() - matrix.generated_at > self.max_age:
+            return None
+        return matrix
+
+    def lookup(self, origin, destination):
+        matrix = self.matrix
+        result = matrix.lookup(origin, destination) if matrix is not None else None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def stats(self):
+        matrix = self._matrix
+        return {
+            "loaded": matrix is not None,
+            "zones": len(matrix.zone_ids) if matrix is not None else 0,
+            "generated_at": matrix.generated_at if matrix is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_zone_matrix_store():
+    global _store
+    if not settings.ZONE_MATRIX_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ZoneMatrixStore(
+                    settings.ZONE_MATRIX_INDEX, settings.ZONE_MATRIX_MAX_AGE, settings.ZONE_MATRIX_CHECK_INTERVAL)
+    return _store
+
+
+def reset_zone_matrix_store():
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,47 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+# Conditional GET for polled read endpoints
+#
+# The driver app polls its wallet and the admin dashboard reloads the
+# completed payments list, mostly to find nothing changed. Those views pass
+# a cheap validator, the newest updated_at in the response's scope, read
+# from an index or the wallet cache entry before anything is rendered:
+#   - ETag: the validator in microseconds plus a digest of the full URL and
+#     the negotiated renderer, so every page / format gets its own tag
+#   - Last-Modified: the validator, for clients that only send
+#     If-Modified-Since (second resolution, ETag is preferred)
+# A matching If-None-Match / If-Modified-Since gets a bodiless 304.
+# Responses are marked `private, no-cache`: clients keep them but revalidate
+# on every poll. GZip/Brotli (payments.middleware.CompressionMiddleware)
+# weakens the ETag, which still matches on GET.
+
+
+def make_etag(request, modified):
+    renderer = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+    digest = hashlib.blake2b(f"{request.get_full_path()}|{renderer}".encode(), digest_size=8).hexdigest()
+    return f'"{int(modified.timestamp() * 1_000_000):x}-{digest}"'
+
+
+def conditional_response(request, modified, respond):
+    """
+    304 when the client's copy is still current, respond() otherwise; both
+    carry ETag / Last-Modified. ``modified`` None (nothing in scope yet)
+    skips the validators.
+    """
+    if modified is None:
+        return respond()
+    etag = make_etag(request, modified)
+    last_modified = int(modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+        if response.status_code != 200:
+            return response
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,126 @@
+import os
+from importlib.util import find_spec
+
+
+# Database profiles (settings.DATABASES, selected by DB_PROFILE)
+#
+#   sqlite         default. Persistent, health-checked connections, and on
+#                  every new connection:
+#                    journal_mode=WAL      readers no longer block the writer
+#                    synchronous=NORMAL    fsync at checkpoints, not per commit
+#                                          (safe with WAL, a power cut can only
+#                                          lose the last commits)
+#                    busy_timeout          writers queue instead of failing
+#                                          with "database is locked"
+#                    mmap_size, cache_size reads served from memory
+#                  Transactions BEGIN IMMEDIATE, so two writers that both read
+#                  first never deadlock on the lock upgrade, which SQLite
+#                  reports as "database is locked" without waiting at all.
+#   sqlite-legacy  Django's SQLite defaults, what this project ran before;
+#                  kept for `manage.py bench_db_profiles` comparisons.
+#   postgres       DB_NAME/DB_USER/DB_PASSWORD/DB_HOST/DB_PORT, statement and
+#                  idle-in-transaction timeouts, pooled per DB_POOL:
+#                    none       persistent connections (CONN_MAX_AGE)
+#                    psycopg    psycopg_pool in each worker; needs psycopg 3
+#                               (psycopg[binary,pool]), psycopg2 has no pool
+#                    pgbouncer  a transaction-mode PgBouncer in front: no
+#                               server-side cursors or startup options, set
+#                               the timeouts on the role instead
+#                               (ALTER ROLE ... SET statement_timeout = ...)
+
+PROFILES = ('sqlite', 'sqlite-legacy', 'postgres')
+POOLS = ('none', 'psycopg', 'pgbouncer')
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+def _persistent():
+    return {
+        'CONN_MAX_AGE': _env_int("DB_CONN_MAX_AGE", 600),
+        'CONN_HEALTH_CHECKS': os.getenv("DB_CONN_HEALTH_CHECKS", "True").lower() == "true",
+    }
+
+
+def sqlite_pragmas():
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={os.getenv('DB_SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"PRAGMA busy_timeout={_env_int('DB_SQLITE_BUSY_TIMEOUT_MS', 20000)}",
+        f"PRAGMA mmap_size={_env_int('DB_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+        # Negative: KiB rather than pages
+        f"PRAGMA cache_size={-_env_int('DB_SQLITE_CACHE_KB', 20000)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def _sqlite(name):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': {
+            'init_command': ";".join(sqlite_pragmas()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+        **_persistent(),
+    }
+
+
+def _sqlite_legacy(name):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+
+
+def _postgres(host=None):
+    pool = os.getenv("DB_POOL", "none")
+    if pool not in POOLS:
+        raise ValueError(f"DB_POOL must be one of {', '.join(POOLS)}, not {pool!r}")
+    options = {'connect_timeout': _env_int("DB_CONNECT_TIMEOUT", 5)}
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('DB_NAME', 'Ride_hailing_app'),
+        'USER': os.getenv('DB_USER', 'postgres'),
+        'PASSWORD': os.getenv('DB_PASSWORD', 'admin'),
+        'HOST': host or os.getenv('DB_HOST', 'localhost'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'OPTIONS': options,
+        **_persistent(),
+    }
+    if pool != 'pgbouncer':
+        options['options'] = (
+            f"-c statement_timeout={_env_int('DB_STATEMENT_TIMEOUT_MS', 15000)} "
+            f"-c idle_in_transaction_session_timeout={_env_int('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000)}")
+    if pool == 'psycopg':
+        # Without them Django would fall back to psycopg2 and fail on the 'pool' option
+        missing = [name for name in ('psycopg', 'psycopg_pool') if find_spec(name) is None]
+        if missing:
+            raise ValueError(f"DB_POOL=psycopg needs psycopg 3 with its pool (pip install 'psycopg[binary,pool]'), "
+                             f"missing: {', '.join(missing)}")
+        # Django hands connections back to the pool, persistent ones are not allowed
+        config['CONN_MAX_AGE'] = 0
+        options['pool'] = {
+            'min_size': _env_int("DB_POOL_MIN_SIZE", 2),
+            'max_size': _env_int("DB_POOL_MAX_SIZE", 20),
+            'timeout': _env_int("DB_POOL_TIMEOUT", 10),
+        }
+    elif pool == 'pgbouncer':
+        # Transaction pooling: a cursor cannot outlive its transaction's server connection
+        config['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return config
+
+
+def database_settings(profile, sqlite_name, replica=None):
+    """
+    DATABASES entry for ``profile``; ``replica`` is a replica's SQLite file
+    or Postgres host, with everything else as for the primary.
+    """
+    if profile == 'sqlite':
+        return _sqlite(replica or sqlite_name)
+    if profile == 'sqlite-legacy':
+        return _sqlite_legacy(replica or sqlite_name)
+    if profile == 'postgres':
+        return _postgres(host=replica)
+    raise ValueError(f"DB_PROFILE must be one of {', '.join(PROFILES)}, not {profile!r}")
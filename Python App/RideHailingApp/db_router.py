@@ -0,0 +1,139 @@
+import contextvars
+import random
+import sqlite3
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Read replicas
+#
+# settings.DATABASE_REPLICAS lists database aliases that replicate 'default'.
+# Reads go to one of them only inside a request to a view marked with
+# @replica_reads (GET/HEAD listing and analytics views, see
+# payments.middleware.ReplicaRoutingMiddleware); everything else, management
+# commands and background threads included, stays on the primary.
+#
+# Within such a request the primary becomes sticky as soon as the request
+# writes: any db_for_write, or a read inside a transaction on 'default', pins
+# the rest of the request there, so nothing written earlier in the request is
+# read back stale from a lagging replica. A request keeps the replica it first
+# read from, so a page and its count come from the same snapshot.
+#
+# Locally, replicas can be SQLite files refreshed from the primary with
+# `manage.py sync_replicas`.
+
+
+class RoutingState:
+    __slots__ = ('replica_allowed', 'pinned', 'alias')
+
+    def __init__(self):
+        self.replica_allowed = False
+        self.pinned = False   # wrote in this request: primary from now on
+        self.alias = None     # replica chosen by the first read
+
+
+current_state = contextvars.ContextVar('db_routing', default=None)
+
+
+@contextmanager
+def request_scope(state=None):
+    """
+    Routing state of one request; reads stay on the primary until
+    allow_replica_reads() is called within it.
+    """
+    state = state or RoutingState()
+    token = current_state.set(state)
+    try:
+        yield state
+    finally:
+        current_state.reset(token)
+
+
+def allow_replica_reads():
+    state = current_state.get()
+    if state is not None and not state.pinned:
+        state.replica_allowed = True
+
+
+def pin_primary():
+    state = current_state.get()
+    if state is not None:
+        state.pinned = True
+
+
+def replica_reads(view=None, *, when=None):
+    """
+    Mark a view (function or class) whose GET/HEAD requests may read from a
+    replica; ``when(request, **view_kwargs)`` narrows it to some of them.
+    """
+    def mark(view):
+        view.read_from_replica = when or True
+        return view
+    return mark(view) if view is not None else mark
+
+
+def view_reads_from_replica(request, view_func, view_kwargs):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    rule = getattr(view_func, 'read_from_replica', None)
+    if rule is None:
+        rule = getattr(getattr(view_func, 'view_class', None), 'read_from_replica', None)
+    if callable(rule):
+        return bool(rule(request, **view_kwargs))
+    return bool(rule)
+
+
+class ReplicaRouter:
+    def _replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', ())
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        state = current_state.get()
+        if not replicas or state is None or not state.replica_allowed:
+            return DEFAULT_DB_ALIAS if replicas else None
+        if state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            state.pinned = True
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            state.alias = random.choice(replicas)
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        replicas = self._replicas()
+        if not replicas:
+            return None
+        pin_primary()
+        # Instances read from a replica are saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in self._replicas():
+            return False
+        return None
+
+
+def sync_sqlite_replica(alias, source=DEFAULT_DB_ALIAS):
+    """
+    Copy the SQLite database ``source`` over the replica ``alias`` (sqlite3
+    backup API), standing in for replication when testing locally.
+    """
+    for name in (source, alias):
+        if connections[name].vendor != 'sqlite':
+            raise ValueError(f"{name} is not a SQLite database")
+    connections[alias].close()
+    connections[source].ensure_connection()
+    target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+    try:
+        connections[source].connection.backup(target)
+    finally:
+        target.close()
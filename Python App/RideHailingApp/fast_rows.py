@@ -0,0 +1,246 @@
+import json
+from decimal import Decimal, getcontext
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models.functions import Cast
+from rest_framework import serializers
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.settings import ISO_8601, api_settings
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback: same bytes, just slower
+    orjson = None
+
+
+# Fast read path for list/detail endpoints
+#
+# A ModelSerializer with many=True builds a model instance per row and runs
+# every field's to_representation through DRF's generic machinery, which is
+# most of the time spent on the wallet, withdrawal and payment lists. A
+# RowEncoder is compiled once from the same serializer:
+#   - the query fetches only the serializer's columns with .values_list(),
+#     UUIDs cast to text so no uuid.UUID is built just to be written out
+#   - each column gets a converter reproducing the DRF field's output
+#     (UUID -> str, Decimal -> quantized string, datetime -> ISO 8601 'Z'),
+#     columns DRF passes through untouched get none
+#   - rows come out as plain dicts of str/bool/int/None, which
+#     FastJSONRenderer hands to orjson
+# The bytes on the wire are the same as the serializer + JSONRenderer ones
+# (RideHailingApp tests compare them); views opt in by setting `row_encoder`
+# and FAST_RENDERER_CLASSES, and FAST_READS_ENABLED=False turns every one of
+# them back to the serializer path.
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.localize or field.normalize_output or field.decimal_places is None or not coerce_to_string:
+        return field.to_representation
+    exponent = Decimal('.1') ** field.decimal_places
+    context = getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, Decimal):
+            value = Decimal(str(value).strip())
+        return f'{value.quantize(exponent, rounding=rounding, context=context):f}'
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if not value or isinstance(value, str) or value.tzinfo is None:
+            return field.to_representation(value)
+        text = value.astimezone(field_timezone).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+def _uuid_text(text):
+    # Backends without a uuid type (SQLite, MySQL) store 32 hex digits
+    if len(text) == 32:
+        return f'{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}'
+    return text
+
+
+def _uuid_column(column):
+    # Read UUIDs as text: building a uuid.UUID per value only to str() it
+    # again is the single biggest cost of a wide list
+    return column, Cast(column, output_field=models.CharField()), _uuid_text
+
+
+def _column(serializer_field, model):
+    """
+    (column name, values_list() argument, converter or None) for one
+    serializer field.
+    """
+    if isinstance(serializer_field, serializers.PrimaryKeyRelatedField):
+        column = model._meta.get_field(serializer_field.source).attname
+        if serializer_field.pk_field is not None:
+            return column, column, serializer_field.pk_field.to_representation
+        # DRF leaves the pk object to the JSON encoder, which writes UUIDs with str()
+        if isinstance(model._meta.get_field(column).target_field, models.UUIDField):
+            return _uuid_column(column)
+        return column, column, None
+    if '.' in serializer_field.source or serializer_field.source == '*':
+        raise ImproperlyConfigured(f"RowEncoder cannot read field source {serializer_field.source!r}")
+    column = serializer_field.source
+    if isinstance(serializer_field, serializers.UUIDField):
+        if serializer_field.uuid_format == 'hex_verbose' and isinstance(model._meta.get_field(column),
+                                                                        models.UUIDField):
+            return _uuid_column(column)
+        return column, column, serializer_field.to_representation
+    if isinstance(serializer_field, serializers.DecimalField):
+        return column, column, _decimal_converter(serializer_field)
+    if isinstance(serializer_field, serializers.DateTimeField):
+        return column, column, _datetime_converter(serializer_field)
+    if isinstance(serializer_field, serializers.ChoiceField):
+        choices = serializer_field.choice_strings_to_values
+        return column, column, lambda value: value if value == '' else choices.get(str(value), value)
+    if isinstance(serializer_field, serializers.JSONField) and serializer_field.binary:
+        return column, column, serializer_field.to_representation
+    if isinstance(serializer_field, (serializers.CharField, serializers.BooleanField, serializers.IntegerField,
+                                     serializers.JSONField)):
+        # The database already hands back str / bool / int / decoded JSON
+        return column, column, None
+    raise ImproperlyConfigured(
+        f"RowEncoder has no converter for {type(serializer_field).__name__} {serializer_field.field_name!r}")
+
+
+class RowEncoder:
+    """
+    Serializes rows of ``serializer_class``'s model without building model
+    instances. Compiled on first use (serializer fields need the app
+    registry); subclasses override adjust() for what a serializer's own
+    to_representation() adds.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._compiled = None
+
+    def _compile(self):
+        if self._compiled is None:
+            model = self.serializer_class.Meta.model
+            names, columns, selects, converters = [], [], [], []
+            for field in self.serializer_class().fields.values():
+                if field.write_only:
+                    continue
+                column, select, converter = _column(field, model)
+                if converter is not None:
+                    converters.append((len(columns), converter))
+                names.append(field.field_name)
+                columns.append(column)
+                selects.append(select)
+            self._compiled = (tuple(names), tuple(selects), tuple(converters),
+                              {column: i for i, column in enumerate(columns)})
+        return self._compiled
+
+    def values_list(self, queryset):
+        return queryset.values_list(*self._compile()[1])
+
+    def index(self, column):
+        # Position of a column in the fetched tuples
+        return self._compile()[3][column]
+
+    def value(self, raw, column):
+        """
+        One column of a fetched tuple as the serializer writes it.
+        """
+        i = self.index(column)
+        value = raw[i]
+        for index, convert in self._compile()[2]:
+            if index == i and value is not None:
+                return convert(value)
+        return value
+
+    def fetch(self, queryset):
+        return list(self.values_list(queryset))
+
+    def adjust(self, raw_rows):
+        return raw_rows
+
+    def encode(self, raw_rows):
+        """
+        Fetched tuples -> list of dicts equal (once rendered) to the
+        serializer's .data for the same rows.
+        """
+        names, _, converters, _ = self._compile()
+        encoded = []
+        for raw in self.adjust(raw_rows):
+            values = list(raw)
+            for i, convert in converters:
+                value = values[i]
+                # Like Serializer.to_representation, None is never converted
+                if value is not None:
+                    values[i] = convert(value)
+            encoded.append(dict(zip(names, values)))
+        return encoded
+
+    def rows(self, queryset):
+        return self.encode(self.fetch(queryset))
+
+    def first(self, queryset):
+        raw = self.values_list(queryset).first()
+        return None if raw is None else self.encode([raw])[0]
+
+    def iter_chunks(self, queryset, chunk_size=2000):
+        # Encoded rows in lists of up to chunk_size, read with a server-side cursor
+        chunk = []
+        for raw in self.values_list(queryset).iterator(chunk_size=chunk_size):
+            chunk.append(raw)
+            if len(chunk) >= chunk_size:
+                yield self.encode(chunk)
+                chunk = []
+        if chunk:
+            yield self.encode(chunk)
+
+
+def dumps(data):
+    """
+    Compact UTF-8 JSON of encoded rows, as DRF's JSONEncoder writes it.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with orjson doing the encoding. Indented output, and data
+    orjson refuses (Decimals, datetimes, lazy strings, non-str keys, ints
+    past 64 bits), go through JSONRenderer, so the bytes never change. orjson writes floats
+    its own way, which is why it is meant for RowEncoder payloads (they
+    carry none).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # DRF writes datetimes its own way, leave them to JSONRenderer
+            ret = orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes U+2028/U+2029 so the output stays a JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+
+FAST_RENDERER_CLASSES = [FastJSONRenderer, BrowsableAPIRenderer]
+
+
+def use_fast_rows(view):
+    # The view opted in (row_encoder) and the fast path is not switched off
+    return settings.FAST_READS_ENABLED and getattr(view, 'row_encoder', None) is not None
@@ -0,0 +1,184 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+
+
+# In-process Metrics (Prometheus text format)
+#
+# payments.middleware.InstrumentationMiddleware times every request and
+# /analysis/metrics renders the totals for a Prometheus scrape. Recording has
+# to stay cheap on the hot path, so:
+#   - each thread adds into its own shard (a plain dict of histogram rows),
+#     no lock is taken per observation; a scrape sums the shards
+#   - histograms are fixed bucket counts, bisect picks the bucket
+#   - DB queries are timed by one execute wrapper installed on every
+#     connection when it opens; it charges the request in the current
+#     context (a ContextVar, so ORM calls made through sync_to_async by the
+#     async views are counted too) and does nothing outside a request
+# Outbound ORS/Razorpay calls are recorded by Admin.http_client and by the
+# response hook instrument_session() puts on the Razorpay SDK session.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name -> (help, label names, bucket bounds)
+HISTOGRAMS = {
+    'http_request_duration_seconds': (
+        "Time spent serving a request, by route", ('method', 'route', 'status'), LATENCY_BUCKETS),
+    'http_response_size_bytes': (
+        "Response body size, by route", ('method', 'route'), SIZE_BUCKETS),
+    'http_request_db_queries': (
+        "Database queries run while serving a request", ('method', 'route'), QUERY_COUNT_BUCKETS),
+    'http_request_db_duration_seconds': (
+        "Time spent in database queries while serving a request", ('method', 'route'), LATENCY_BUCKETS),
+    'outbound_request_duration_seconds': (
+        "Latency of calls to upstream services (ORS, Razorpay)", ('upstream', 'status'), LATENCY_BUCKETS),
+}
+BOUNDS = {name: bounds for name, (_, _, bounds) in HISTOGRAMS.items()}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+def observe(name, labels, value):
+    """
+    Add value to histogram `name`; labels is a tuple in the order of the
+    histogram's label names.
+    """
+    shard = _shard()
+    row = shard.get((name, labels))
+    if row is None:
+        bounds = BOUNDS[name]
+        # One count per bucket, then +Inf, then the running sum
+        row = shard[(name, labels)] = [0] * (len(bounds) + 2)
+    row[bisect_left(BOUNDS[name], value)] += 1
+    row[-1] += value
+
+
+def collect():
+    """
+    {(name, labels): [bucket counts..., +Inf count, sum]} summed over every
+    thread's shard. Counts are per bucket, not cumulative.
+    """
+    with _shards_lock:
+        shards = list(_shards)
+    totals = {}
+    for shard in shards:
+        for key, row in list(shard.items()):
+            total = totals.get(key)
+            if total is None:
+                totals[key] = list(row)
+            else:
+                for i, value in enumerate(row):
+                    total[i] += value
+    return totals
+
+
+def reset_metrics():
+    with _shards_lock:
+        for shard in _shards:
+            shard.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    totals = collect()
+    lines = []
+    for name, (help_text, label_names, bounds) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), row in sorted(totals.items(), key=lambda item: item[0]):
+            if metric != name:
+                continue
+            pairs = list(zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip((*bounds, '+Inf'), row[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_number(bound)
+                lines.append(f"{name}_bucket{_format_labels([*pairs, ('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(pairs)} {_format_number(row[-1])}")
+            lines.append(f"{name}_count{_format_labels(pairs)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# Per-request DB accounting
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+current_request = ContextVar('current_request', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def instrument_connection(connection):
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+def _connection_created(sender, connection, **kwargs):
+    # Fires again on reconnect, instrument_connection() installs once
+    instrument_connection(connection)
+
+
+connection_created.connect(_connection_created, dispatch_uid='ridehailing-metrics-db')
+
+
+# Outbound calls
+
+def observe_outbound(upstream, status, seconds):
+    observe('outbound_request_duration_seconds', (upstream, str(status)), seconds)
+
+
+def instrument_session(session, upstream):
+    """
+    Record every response of a requests.Session (e.g. the Razorpay SDK's)
+    as an outbound call to `upstream`.
+    """
+    def hook(response, *args, **kwargs):
+        observe_outbound(upstream, response.status_code, response.elapsed.total_seconds())
+    session.hooks['response'].append(hook)
+    return session
@@ -0,0 +1,147 @@
+import base64
+import binascii
+import json
+import uuid
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .fast_rows import dumps
+
+
+# Keyset pagination and NDJSON streaming for list endpoints
+#
+# Both are opt-in so existing clients keep getting the full JSON array:
+#   ?limit=100 / ?cursor=<next>   pages of {"next": <cursor or null>, "results": [...]}
+#                                 ordered newest first on (created_at, pk)
+#   ?stream=ndjson                one JSON object per line, streamed from a
+#                                 chunked .iterator() so memory stays flat
+#
+# Cursors are opaque base64 of the last row's (created_at, pk), so each page is
+# one index range scan no matter how deep the client pages.
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def encode_cursor(created_at, pk):
+    raw = json.dumps({"t": created_at.isoformat(), "k": str(pk)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(data["t"])
+        pk = uuid.UUID(data["k"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise NotFound("Invalid cursor")
+    if created_at is None:
+        raise NotFound("Invalid cursor")
+    return created_at, pk
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination on (created_at, pk), newest first.
+    Returns None (no pagination) unless the request asks for a page.
+    """
+    ordering_field = 'created_at'
+    default_limit = 100
+    max_limit = 1000
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def _page_queryset(self, queryset, request):
+        # Newest first from the cursor on, one extra row tells whether there is a next page
+        field = self.ordering_field
+        pk_name = queryset.model._meta.pk.name
+        queryset = queryset.order_by(f'-{field}', f'-{pk_name}')
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(Q(**{f'{field}__lt': created_at}) | Q(**{field: created_at, f'{pk_name}__lt': pk}))
+        limit = self.get_limit(request)
+        return queryset[:limit + 1], limit
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if 'limit' not in params and 'cursor' not in params:
+            return None
+
+        page, limit = self._page_queryset(queryset, request)
+        rows = list(page)
+        last = rows[limit - 1] if len(rows) > limit else None
+        self.next_cursor = encode_cursor(getattr(last, self.ordering_field), last.pk) if last is not None else None
+        return rows[:limit]
+
+    def paginate_rows(self, queryset, request, encoder, view=None):
+        """
+        paginate_queryset() for the fast read path: the page comes back
+        already encoded by ``encoder`` (a RideHailingApp.fast_rows.RowEncoder).
+        """
+        params = request.query_params
+        if 'limit' not in params and 'cursor' not in params:
+            return None
+
+        page, limit = self._page_queryset(queryset, request)
+        rows = encoder.fetch(page)
+        last = rows[limit - 1] if len(rows) > limit else None
+        pk_name = queryset.model._meta.pk.name
+        self.next_cursor = (encode_cursor(last[encoder.index(self.ordering_field)], encoder.value(last, pk_name))
+                            if last is not None else None)
+        return encoder.encode(rows[:limit])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_cursor),
+            ('results', data),
+        ]))
+
+
+def wants_ndjson(request):
+    # Not ?format=, DRF reserves it for renderer selection
+    return request.query_params.get('stream') == 'ndjson'
+
+
+def ndjson_response(queryset, serializer_class, chunk_size=2000, context=None):
+    """
+    Stream ``queryset`` as newline-delimited JSON, serializing row by row
+    while the database cursor is read in ``chunk_size`` batches.
+    """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    pk_name = queryset.model._meta.pk.name
+    queryset = queryset.order_by(f'-{KeysetPagination.ordering_field}', f'-{pk_name}')
+
+    def rows():
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            yield encoder.encode(serializer_class(obj, context=context).data) + '\n'
+
+    return StreamingHttpResponse(rows(), content_type=NDJSON_CONTENT_TYPE)
+
+
+def ndjson_rows_response(queryset, encoder, chunk_size=2000):
+    """
+    ndjson_response() for the fast read path: same lines, written a chunk
+    at a time from ``encoder``'s values_list() rows.
+    """
+    pk_name = queryset.model._meta.pk.name
+    queryset = queryset.order_by(f'-{KeysetPagination.ordering_field}', f'-{pk_name}')
+
+    def chunks():
+        for rows in encoder.iter_chunks(queryset, chunk_size):
+            yield b''.join(dumps(row) + b'\n' for row in rows)
+
+    return StreamingHttpResponse(chunks(), content_type=NDJSON_CONTENT_TYPE)
@@ -0,0 +1,192 @@
+import json
+import random
+import re
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connections
+
+
+# Query-plan regression harness
+#
+# Tests wrap a request in assertIndexedQueries(); every SELECT/UPDATE/DELETE it
+# ran is re-run under EXPLAIN and the block fails when
+#   - a table is read with a full scan (SQLite "SCAN <table>" without an index,
+#     PostgreSQL "Seq Scan"),
+#   - rows are sorted in a temp B-tree / Sort node instead of read in index order,
+#   - the same SELECT runs more than max_repeats times (N+1),
+#   - or more than max_queries statements ran.
+# Plans are only meaningful on a realistic table size, so endpoint tests seed
+# one with seed_dataset() (which also refreshes the planner statistics).
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+
+class CapturedQuery:
+    def __init__(self, sql, params, many):
+        self.sql = sql
+        self.params = params
+        self.many = many
+
+    @property
+    def statement(self):
+        return self.sql.lstrip().split(None, 1)[0].upper() if self.sql.strip() else ''
+
+    def __repr__(self):
+        return f"CapturedQuery({self.sql!r})"
+
+
+@contextmanager
+def capture_queries(using='default'):
+    """
+    Collect (sql, params) of every statement run on ``using`` inside the block.
+    """
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        queries.append(CapturedQuery(sql, params, many))
+        return execute(sql, params, many, context)
+
+    with connections[using].execute_wrapper(wrapper):
+        yield queries
+
+
+def explain(query, using='default'):
+    """
+    Plan lines for one captured query: SQLite EXPLAIN QUERY PLAN details, or
+    one line per node of the PostgreSQL JSON plan.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query.sql, query.params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return list(_postgres_nodes(plan[0]["Plan"]))
+        cursor.execute("EXPLAIN QUERY PLAN " + query.sql, query.params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _postgres_nodes(node):
+    relation = node.get("Relation Name")
+    line = node["Node Type"] + (f" on {relation}" if relation else "")
+    if node.get("Index Name"):
+        line += f" using {node['Index Name']}"
+    yield line
+    for child in node.get("Plans", ()):
+        yield from _postgres_nodes(child)
+
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def plan_problems(plan, allowed_scans=()):
+    """
+    Full scans and temp sorts in a plan. ``allowed_scans`` lists tables that
+    may be read in full (e.g. an endpoint that returns the whole table).
+    """
+    problems = []
+    for line in plan:
+        line = line.strip()
+        scan = SQLITE_FULL_SCAN.match(line)
+        if scan and scan.group(1) not in allowed_scans:
+            problems.append(f"full scan of {scan.group(1)}")
+        elif line.startswith("Seq Scan on ") and line.split()[3] not in allowed_scans:
+            problems.append(f"full scan of {line.split()[3]}")
+        elif line.startswith("USE TEMP B-TREE") or line in ("Sort", "Incremental Sort"):
+            problems.append(f"sort without an index ({line})")
+    return problems
+
+
+def repeated_queries(queries, max_repeats=1):
+    # Same SELECT text run again and again with different params is an N+1
+    counts = Counter(query.sql for query in queries if query.statement == 'SELECT' and not query.many)
+    return {sql: count for sql, count in counts.items() if count > max_repeats}
+
+
+class QueryReport:
+    def __init__(self, queries, using='default', allowed_scans=(), max_repeats=1):
+        self.queries = queries
+        self.plans = []
+        self.problems = []
+        for query in queries:
+            if query.many or query.statement not in EXPLAINED_STATEMENTS:
+                continue
+            plan = explain(query, using)
+            self.plans.append((query, plan))
+            for problem in plan_problems(plan, allowed_scans):
+                self.problems.append(f"{problem}: {query.sql}\n    " + "\n    ".join(plan))
+        for sql, count in repeated_queries(queries, max_repeats).items():
+            self.problems.append(f"query ran {count} times (N+1?): {sql}")
+
+    def __str__(self):
+        return "\n".join(self.problems)
+
+
+class QueryPlanAssertionsMixin:
+    """
+    TestCase mixin:
+
+        with self.assertIndexedQueries(max_queries=2):
+            self.client.get(...)
+    """
+
+    @contextmanager
+    def assertIndexedQueries(self, max_queries=None, max_repeats=1, allowed_scans=(), using='default'):
+        with capture_queries(using) as queries:
+            yield queries
+        report = QueryReport(queries, using=using, allowed_scans=allowed_scans, max_repeats=max_repeats)
+        if report.problems:
+            self.fail(f"{len(report.problems)} query plan problem(s):\n{report}")
+        if max_queries is not None:
+            ran = [query for query in queries if query.statement in EXPLAINED_STATEMENTS + ('INSERT',)]
+            self.assertLessEqual(
+                len(ran), max_queries,
+                f"{len(ran)} queries ran, expected at most {max_queries}:\n" +
+                "\n".join(query.sql for query in ran))
+
+
+def seed_dataset(wallets=2000, payments_per_wallet=5, withdraws_per_wallet=1, seed=7, using='default'):
+    """
+    Bulk-insert a realistic mix of wallets (a few deactivated), payments and
+    withdrawals, then ANALYZE so the planner sees the real table sizes.
+    """
+    from payments.models import Payment
+    from wallet.models import Wallet, Withdraw
+
+    rng = random.Random(seed)
+    wallet_rows = [
+        Wallet(wallet_id=uuid.UUID(int=rng.getrandbits(128)), driver_id=uuid.UUID(int=rng.getrandbits(128)),
+               is_active=rng.random() > 0.05)
+        for _ in range(wallets)
+    ]
+    Wallet.objects.using(using).bulk_create(wallet_rows, batch_size=1000)
+
+    payment_rows, withdraw_rows = [], []
+    for wallet in wallet_rows:
+        for _ in range(payments_per_wallet):
+            payment_rows.append(Payment(
+                payment_id=uuid.UUID(int=rng.getrandbits(128)),
+                wallet=wallet,
+                ride_id=uuid.UUID(int=rng.getrandbits(128)),
+                rider_id=uuid.UUID(int=rng.getrandbits(128)),
+                driver_id=wallet.driver_id,
+                amount=Decimal(rng.randint(50, 900)),
+                payment_method=rng.choice(('CARD', 'UPI', 'CASH')),
+                status=rng.choices(('SUCCESS', 'PENDING', 'FAILED'), weights=(8, 1, 1))[0],
+            ))
+        for _ in range(withdraws_per_wallet):
+            withdraw_rows.append(Withdraw(
+                wallet=wallet, amount=Decimal(rng.randint(10, 500)),
+                status=rng.choices(('COMPLETED', 'REQUESTED', 'FAILED'), weights=(8, 1, 1))[0],
+                account_holder_name="Driver", bank_name="Bank", ifsc_code="IFSC0001", account_number="1234567890",
+            ))
+    Payment.objects.using(using).bulk_create(payment_rows, batch_size=1000)
+    Withdraw.objects.using(using).bulk_create(withdraw_rows, batch_size=1000)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return wallet_rows
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv 
+from corsheaders.defaults import default_headers
+from RideHailingApp.db_profiles import database_settings
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +50,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its latency covers every other middleware
+    'payments.middleware.InstrumentationMiddleware',
+    # Inside it, so response sizes are recorded as sent
+    'payments.middleware.CompressionMiddleware',
+    # Reads of @replica_reads views may go to DATABASE_REPLICAS
+    'payments.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,6 +71,7 @@ MIDDLEWARE = [
 
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 ROOT_URLCONF = 'RideHailingApp.urls'
 
 TEMPLATES = [
@@ -87,26 +96,30 @@ WSGI_APPLICATION = 'RideHailingApp.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 
-    # 'default': {
-    #     'ENGINE': 'django.db.backends.sqlite3',
-    #     'NAME': BASE_DIR / 'db.sqlite3',
-    # }
+# Profiles (RideHailingApp/db_profiles.py): "sqlite" (WAL, busy timeout,
+# persistent connections), "sqlite-legacy" (Django defaults) or "postgres"
+# (DB_NAME/DB_USER/DB_PASSWORD/DB_HOST/DB_PORT, pooled per DB_POOL)
+DB_PROFILE = os.getenv("DB_PROFILE", "sqlite")
 DATABASES = {
-    # 'default': {
-    #     'ENGINE': 'django.db.backends.postgresql',
-    #     'NAME': os.getenv('DB_NAME', 'Ride_hailing_app'),
-    #     'USER': os.getenv('DB_USER', 'postgres'),
-    #     'PASSWORD': os.getenv('DB_PASSWORD', 'admin'),
-    #     'HOST': os.getenv('DB_HOST', 'localhost'),
-    #     'PORT': os.getenv('DB_PORT', '5432'),
-    # }
-    
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_settings(DB_PROFILE, sqlite_name=BASE_DIR / 'db.sqlite3'),
 }
 
+# Read replicas of 'default' (RideHailingApp/db_router.py), comma separated
+# SQLite files or Postgres hosts per DB_PROFILE, e.g. DB_REPLICAS=replica1.sqlite3
+# refreshed from the primary with `manage.py sync_replicas`. GET
+# listing/analytics views read from them; writes, and reads after a write in
+# the same request, stay on 'default'
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(",")), start=1):
+    replica = name.strip() if DB_PROFILE == 'postgres' else BASE_DIR / name.strip()
+    DATABASES[f'replica_{number}'] = {
+        **database_settings(DB_PROFILE, sqlite_name=BASE_DIR / 'db.sqlite3', replica=replica),
+        # Tests read replicated data from the test database itself
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['RideHailingApp.db_router.ReplicaRouter']
+
 
 
 # Password validation
@@ -149,3 +162,199 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Set REDIS_URL to share cached data between workers, otherwise each process
+# keeps its own local-memory cache.
+
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# OpenRouteService
+
+ORS_BASE_URL = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org")
+
+# ORS matrix limit (sources x destinations per request) and the largest batch
+# accepted by the batch fare endpoint
+ORS_MATRIX_MAX_ELEMENTS = int(os.getenv("ORS_MATRIX_MAX_ELEMENTS", "3500"))
+FARE_BATCH_MAX_PAIRS = int(os.getenv("FARE_BATCH_MAX_PAIRS", "1000"))
+
+# Serve a local great-circle estimate instead of failing while ORS is degraded
+ORS_FALLBACK_ESTIMATE = os.getenv("ORS_FALLBACK_ESTIMATE", "False").lower() == "true"
+ORS_FALLBACK_DETOUR_FACTOR = float(os.getenv("ORS_FALLBACK_DETOUR_FACTOR", "1.3"))
+ORS_FALLBACK_SPEED_KMPH = float(os.getenv("ORS_FALLBACK_SPEED_KMPH", "25"))
+
+# Routing backend used for fare quotes:
+#   "ors"            OpenRouteService only
+#   "local"          in-process contraction hierarchy over LOCAL_ROUTING_GRAPH
+#   "local-then-ors" local graph first, ORS for off-graph or unroutable pairs
+# The contraction hierarchy is built from the graph with
+# `manage.py build_routing_graph` and persisted to LOCAL_ROUTING_CH; requests
+# only load it, without one the local backend answers 503.
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "ors")
+LOCAL_ROUTING_GRAPH = os.getenv("LOCAL_ROUTING_GRAPH", str(BASE_DIR / 'data' / 'road_graph.npz'))
+LOCAL_ROUTING_CH = os.getenv("LOCAL_ROUTING_CH", str(BASE_DIR / 'data' / 'road_graph.ch.npz'))
+LOCAL_ROUTING_MAX_SNAP_METRES = float(os.getenv("LOCAL_ROUTING_MAX_SNAP_METRES", "500"))
+
+# Precomputed zone-to-zone fare matrix (`manage.py build_zone_matrix`),
+# memory-mapped by every worker and ignored once older than ZONE_MATRIX_MAX_AGE
+ZONE_MATRIX_ENABLED = os.getenv("ZONE_MATRIX_ENABLED", "True").lower() == "true"
+ZONE_DEFINITIONS = os.getenv("ZONE_DEFINITIONS", str(BASE_DIR / 'data' / 'zones.json'))
+ZONE_MATRIX_INDEX = os.getenv("ZONE_MATRIX_INDEX", str(BASE_DIR / 'data' / 'zone_matrix.json'))
+ZONE_MATRIX_MAX_AGE = int(os.getenv("ZONE_MATRIX_MAX_AGE", str(7 * 24 * 3600)))
+ZONE_MATRIX_CHECK_INTERVAL = float(os.getenv("ZONE_MATRIX_CHECK_INTERVAL", "30"))
+
+# Read-through wallet cache by driver_id (wallet/cache.py), invalidated on
+# commit of every balance write; LOCK_WAIT is how long concurrent misses wait
+# for the request that is loading the entry. Invalidations only reach the
+# cache they are sent to, so it is on by default only with a shared CACHES
+# backend (REDIS_URL): with per-process LocMemCache, writes made by other
+# workers or management commands would stay cached for up to TTL seconds
+WALLET_CACHE = {
+    'ENABLED': os.getenv("WALLET_CACHE_ENABLED", "True" if os.getenv("REDIS_URL") else "False").lower() == "true",
+    'CACHE_ALIAS': os.getenv("WALLET_CACHE_ALIAS", "default"),
+    'TTL': int(os.getenv("WALLET_CACHE_TTL", "300")),
+    'LOCK_TIMEOUT': int(os.getenv("WALLET_CACHE_LOCK_TIMEOUT", "5")),
+    'LOCK_WAIT': float(os.getenv("WALLET_CACHE_LOCK_WAIT", "0.2")),
+}
+
+# Idempotency-Key handling for payment and withdrawal creation
+# (payments/idempotency.py): completed responses are replayed for TTL seconds,
+# duplicates wait up to WAIT seconds for an in-flight request, and a claim
+# older than LOCK_TIMEOUT seconds is treated as abandoned
+IDEMPOTENCY = {
+    'TTL': int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600))),
+    'WAIT': float(os.getenv("IDEMPOTENCY_WAIT", "10")),
+    'LOCK_TIMEOUT': int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60")),
+}
+
+# Columnar payments/wallets snapshot for admin analytics
+# (`manage.py build_analytics_snapshot`); rows updated in the last
+# ANALYTICS_SNAPSHOT_LAG seconds wait for the next refresh
+ANALYTICS_SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR", str(BASE_DIR / 'data' / 'analytics'))
+ANALYTICS_SNAPSHOT_LAG = int(os.getenv("ANALYTICS_SNAPSHOT_LAG", "10"))
+
+# Pooled outbound HTTP clients (see Admin/http_client.py for all options)
+OUTBOUND_HTTP = {
+    'ors': {
+        'POOL_MAXSIZE': int(os.getenv("ORS_POOL_MAXSIZE", "20")),
+        'CONNECT_TIMEOUT': float(os.getenv("ORS_CONNECT_TIMEOUT", "3.05")),
+        'READ_TIMEOUT': float(os.getenv("ORS_READ_TIMEOUT", "10")),
+        'RETRIES': int(os.getenv("ORS_RETRIES", "2")),
+        'BACKOFF_MAX': float(os.getenv("ORS_BACKOFF_MAX", "10")),
+        'MAX_RETRY_AFTER': float(os.getenv("ORS_MAX_RETRY_AFTER", "10")),
+        'BREAKER_FAILURE_THRESHOLD': int(os.getenv("ORS_BREAKER_FAILURE_THRESHOLD", "5")),
+        'BREAKER_RECOVERY_TIMEOUT': float(os.getenv("ORS_BREAKER_RECOVERY_TIMEOUT", "30")),
+    },
+    # Order creation is not idempotent, never retry it
+    'razorpay': {
+        'POOL_MAXSIZE': int(os.getenv("RAZORPAY_POOL_MAXSIZE", "20")),
+        'READ_TIMEOUT': float(os.getenv("RAZORPAY_READ_TIMEOUT", "15")),
+        'RETRIES': 0,
+    },
+}
+
+# Per-route latency, DB and response size histograms served in Prometheus
+# format at /analysis/metrics (RideHailingApp/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+
+# Who may scrape /analysis/metrics: a Prometheus job sending
+# `Authorization: Bearer <METRICS_SCRAPE_TOKEN>`, or a request from one of
+# METRICS_ALLOWED_IPS (comma separated, REMOTE_ADDR as seen by Django). With
+# neither set every scrape is refused.
+METRICS_SCRAPE_TOKEN = os.getenv("METRICS_SCRAPE_TOKEN", "")
+METRICS_ALLOWED_IPS = list(filter(None, os.getenv("METRICS_ALLOWED_IPS", "").split(",")))
+
+# values_list() rows + orjson instead of ModelSerializers on the wallet,
+# withdrawal and payment read endpoints (RideHailingApp/fast_rows.py)
+FAST_READS_ENABLED = os.getenv("FAST_READS_ENABLED", "True").lower() == "true"
+
+# Smallest response body gzipped for clients that accept it
+# (payments.middleware.CompressionMiddleware)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+# Razorpay API base URL, shared by the SDK client and the async order view
+RAZORPAY_API_BASE = os.getenv("RAZORPAY_API_BASE", "https://api.razorpay.com")
+
+# Razorpay webhooks (payments/webhooks.py): secret set in the Razorpay
+# dashboard for /payments/webhook/, and inbox events applied per drain batch
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET", "")
+WEBHOOK_DRAIN_BATCH_SIZE = int(os.getenv("WEBHOOK_DRAIN_BATCH_SIZE", "500"))
+
+# Rides accepted by one POST /payments/cash-payment/bulk/ (payments/bulk.py)
+BULK_CASH_PAYMENT_MAX_ITEMS = int(os.getenv("BULK_CASH_PAYMENT_MAX_ITEMS", "5000"))
+
+# Route metrics cache in front of the ORS matrix call used by fare calculation
+#   BACKEND:    "inprocess" (per worker LRU) or "django" (CACHES[CACHE_ALIAS])
+#   SNAP_MODE:  "geohash" (GEOHASH_PRECISION chars) or "metres" (GRID_METRES cells)
+ROUTE_CACHE = {
+    'ENABLED': os.getenv("ROUTE_CACHE_ENABLED", "True").lower() == "true",
+    'BACKEND': os.getenv("ROUTE_CACHE_BACKEND", "inprocess"),
+    'CACHE_ALIAS': os.getenv("ROUTE_CACHE_ALIAS", "default"),
+    'SNAP_MODE': os.getenv("ROUTE_CACHE_SNAP_MODE", "geohash"),
+    'GEOHASH_PRECISION': int(os.getenv("ROUTE_CACHE_GEOHASH_PRECISION", "7")),
+    'GRID_METRES': float(os.getenv("ROUTE_CACHE_GRID_METRES", "100")),
+    'MAX_ENTRIES': int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "10000")),
+    'TTL': int(os.getenv("ROUTE_CACHE_TTL", "86400")),
+}
+
+# All-wallet bonus jobs (wallet/bonus_jobs.py): wallets credited per chunk,
+# and how long an unfinished job may go untouched before resume_bonus_jobs
+# treats its runner as dead
+BONUS_JOB_CHUNK_SIZE = int(os.getenv("BONUS_JOB_CHUNK_SIZE", "2000"))
+BONUS_JOB_RUN_IN_BACKGROUND = os.getenv("BONUS_JOB_RUN_IN_BACKGROUND", "True").lower() == "true"
+BONUS_JOB_STALE_AFTER = int(os.getenv("BONUS_JOB_STALE_AFTER", "300"))
+
+# Rows each platform-wide earnings bucket is split over (Admin/earnings.py),
+# so concurrent payments don't queue on one rollup row
+EARNINGS_PLATFORM_STRIPES = int(os.getenv("EARNINGS_PLATFORM_STRIPES", "16"))
+
+# Striped wallet balances (wallet/stripes.py): card/UPI credits of wallets
+# given stripes (`manage.py set_wallet_stripes`) skip the wallet row lock;
+# `manage.py compact_wallet_stripes` folds them back every COMPACT_INTERVAL s
+WALLET_STRIPES = {
+    'ENABLED': os.getenv("WALLET_STRIPES_ENABLED", "False").lower() == "true",
+    'DEFAULT_COUNT': int(os.getenv("WALLET_STRIPES_DEFAULT_COUNT", "8")),
+    'COMPACT_INTERVAL': float(os.getenv("WALLET_STRIPES_COMPACT_INTERVAL", "60")),
+}
+
+# Withdrawal payouts (wallet/payouts.py, `manage.py process_payouts`):
+# withdrawals claimed per batch, concurrent provider calls per worker, and
+# how long a PROCESSING payout may go unanswered before it is sent again.
+# PROVIDER has no default, process_payouts refuses to run without one
+# (wallet.payouts.FakePayoutProvider is for tests and local development)
+PAYOUTS = {
+    'PROVIDER': os.getenv("PAYOUT_PROVIDER", ""),
+    'PROVIDER_OPTIONS': {},
+    'BATCH_SIZE': int(os.getenv("PAYOUT_BATCH_SIZE", "100")),
+    'WORKERS': int(os.getenv("PAYOUT_WORKERS", "8")),
+    'STALE_AFTER': int(os.getenv("PAYOUT_STALE_AFTER", "600")),
+}
+
+# Admin access tokens (Admin/tokens.py): HMAC-signed, SECRET defaults to a
+# key derived from SECRET_KEY; TTLs in seconds. REQUIRED=False lets admin
+# endpoints through without a token while clients move over to logging in;
+# it stays off by default until the JS backend (HelperFunction.axiosSendRequest,
+# UserService.AdminRegister) sends Bearer tokens
+ADMIN_TOKENS = {
+    'SECRET': os.getenv("ADMIN_TOKEN_SECRET", ""),
+    'ACCESS_TTL': int(os.getenv("ADMIN_TOKEN_ACCESS_TTL", "900")),
+    'REFRESH_TTL': int(os.getenv("ADMIN_TOKEN_REFRESH_TTL", str(7 * 24 * 3600))),
+    'CACHE_SIZE': int(os.getenv("ADMIN_TOKEN_CACHE_SIZE", "1024")),
+    'REVOCATION_SYNC_INTERVAL': float(os.getenv("ADMIN_TOKEN_REVOCATION_SYNC_INTERVAL", "5")),
+    'REQUIRED': os.getenv("ADMIN_TOKENS_REQUIRED", "False").lower() == "true",
+}
@@ -0,0 +1,102 @@
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from Admin.earnings import record_payments_rollups
+from wallet.ledger import record_payments_by_wallet
+from wallet.models import Wallet
+from .models import Payment
+from .serializers import CashPaymentItemSerializer
+
+
+# Bulk Cash Payments
+#
+# End-of-shift cash reconciliation: every valid ride of an upload becomes a
+# SUCCESS CASH Payment. Instead of one insert plus a ledger posting per ride,
+# the whole upload is one transaction with a fixed number of queries per
+# driver: wallets resolved in one query, payments inserted with bulk_create,
+# fees decided ride by ride with the process_wallet_update rules
+# (wallet.ledger.post_payment) and applied as one balance UPDATE per wallet.
+# Invalid rides are reported per item and do not block the others. Rides are
+# checked for an earlier successful payment only once the upload's wallets are
+# locked, so a concurrent upload of the same rides waits and then sees them.
+
+
+def _wallets_by_driver(driver_ids):
+    # Same choice as Wallet.objects.for_driver(): the active wallet first
+    wallets = {}
+    rows = (Wallet.objects.filter(driver_id__in=driver_ids).order_by('driver_id', '-is_active')
+            .values_list('driver_id', 'wallet_id'))
+    for driver_id, wallet_id in rows:
+        wallets.setdefault(driver_id, wallet_id)
+    return wallets
+
+
+def _lock_wallets(wallet_ids):
+    # Same order as LedgerPosting.for_wallets, which locks them again
+    return list(Wallet.objects.select_for_update().filter(wallet_id__in=wallet_ids).order_by('wallet_id')
+                .values_list('wallet_id', flat=True))
+
+
+def ingest_cash_payments(items):
+    """
+    Validate and record a list of cash rides. Returns one result per item,
+    in input order: {"index", "status": "SUCCESS", "payment_id", ...} or
+    {"index", "status": "FAILED", "errors"}.
+    """
+    results, valid = [None] * len(items), []
+    seen_rides = set()
+    # One serializer for every item; building one per item copies its fields each time
+    serializer = CashPaymentItemSerializer()
+    for index, item in enumerate(items):
+        try:
+            data = serializer.run_validation(item)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "FAILED", "errors": e.detail}
+            continue
+        if data["ride_id"] in seen_rides:
+            results[index] = {"index": index, "status": "FAILED",
+                              "errors": {"ride_id": ["Ride appears more than once in this upload"]}}
+        else:
+            seen_rides.add(data["ride_id"])
+            valid.append((index, data))
+
+    wallets = _wallets_by_driver({data["driver_id"] for _, data in valid})
+    payments = []
+    with transaction.atomic():
+        _lock_wallets(set(wallets.values()))
+        paid_rides = set(Payment.objects.filter(ride_id__in=seen_rides, status='SUCCESS')
+                         .values_list('ride_id', flat=True)) if seen_rides else set()
+
+        for index, data in valid:
+            if data["ride_id"] in paid_rides:
+                results[index] = {"index": index, "status": "FAILED",
+                                  "errors": {"ride_id": ["Ride already has a successful payment"]}}
+            elif data["driver_id"] not in wallets:
+                results[index] = {"index": index, "status": "FAILED",
+                                  "errors": {"driver_id": ["Wallet not found for this driver"]}}
+            else:
+                payments.append((index, Payment(
+                    wallet_id=wallets[data["driver_id"]],
+                    ride_id=data["ride_id"],
+                    rider_id=data["rider_id"],
+                    driver_id=data["driver_id"],
+                    amount=data["amount"],
+                    payment_method="CASH",
+                    status="SUCCESS",
+                )))
+
+        if payments:
+            created = Payment.objects.bulk_create([payment for _, payment in payments], batch_size=500)
+            record_payments_by_wallet(created)
+            record_payments_rollups(created)
+
+    for index, payment in payments:
+        results[index] = {
+            "index": index,
+            "status": payment.status,
+            "payment_id": str(payment.payment_id),
+            "ride_id": str(payment.ride_id),
+            "amount": str(payment.amount),
+        }
+    return results
+
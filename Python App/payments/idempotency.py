@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+
+# Idempotency-Key Handling
+#
+# Clients retrying a POST send the same Idempotency-Key header. The first
+# request claims an IdempotencyRecord (unique per endpoint scope and key) and
+# runs; its 2xx response is stored and replayed to every duplicate until the
+# record expires. Duplicates arriving while the first request is still running
+# wait for it instead of running a second time. Error responses are not kept:
+# the record is released so a retry can try again. Handlers run outside any
+# transaction of ours: create-order calls Razorpay, and on SQLite (BEGIN
+# IMMEDIATE) an open transaction would hold the write lock for the whole call.
+# A process dying between the handler's commit and the stored response leaves
+# the claim IN_PROGRESS; duplicates get 409 until LOCK_TIMEOUT, then run again.
+#
+# A key reused with a different body or path is rejected with 422, and a
+# claim whose process died is taken over once LOCK_TIMEOUT has passed.
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def _config():
+    return getattr(settings, 'IDEMPOTENCY', {})
+
+
+def request_fingerprint(method, path, payload):
+    if hasattr(payload, 'lists'):
+        payload = dict(payload.lists())
+    canonical = json.dumps([method, path, payload], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def try_claim(scope, key, fingerprint):
+    """
+    One attempt to claim ``key``. Returns ("execute", record) when this
+    request should run, ("replay", record) for a stored response, or
+    ("wait", None) while another request holds the key.
+    """
+    config = _config()
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                scope=scope, key=key, fingerprint=fingerprint,
+                locked_until=now + timedelta(seconds=config.get('LOCK_TIMEOUT', 60)),
+                expires_at=now + timedelta(seconds=config.get('TTL', 24 * 3600)),
+            )
+        return "execute", record
+    except IntegrityError:
+        pass
+
+    record = IdempotencyRecord.objects.filter(scope=scope, key=key).first()
+    if record is None:
+        # Released between our insert and read
+        return "wait", None
+    if record.expires_at <= now:
+        IdempotencyRecord.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+        return "wait", None
+    if record.fingerprint != fingerprint:
+        raise IdempotencyConflict("Idempotency-Key was already used with a different request", 422)
+    if record.status == 'COMPLETED':
+        return "replay", record
+    if record.locked_until <= now:
+        # The request holding the key never finished
+        taken = IdempotencyRecord.objects.filter(
+            pk=record.pk, status='IN_PROGRESS', locked_until=record.locked_until,
+        ).update(locked_until=now + timedelta(seconds=config.get('LOCK_TIMEOUT', 60)))
+        if taken:
+            return "execute", record
+    return "wait", None
+
+
+def claim(scope, key, fingerprint):
+    deadline = time.monotonic() + _config().get('WAIT', 10)
+    while True:
+        outcome, record = try_claim(scope, key, fingerprint)
+        if outcome != "wait":
+            return outcome, record
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", 409)
+        time.sleep(POLL_INTERVAL)
+
+
+async def aclaim(scope, key, fingerprint):
+    deadline = time.monotonic() + _config().get('WAIT', 10)
+    while True:
+        outcome, record = await sync_to_async(try_claim)(scope, key, fingerprint)
+        if outcome != "wait":
+            return outcome, record
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", 409)
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def finish(record, status, body):
+    if 200 <= status < 300:
+        IdempotencyRecord.objects.filter(pk=record.pk).update(
+            status='COMPLETED', response_status=status, response_body=body)
+    else:
+        IdempotencyRecord.objects.filter(pk=record.pk).delete()
+
+
+def release(record):
+    IdempotencyRecord.objects.filter(pk=record.pk).delete()
+
+
+def purge_expired_records():
+    return IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def _stored_body(data):
+    # UUIDs, decimals and datetimes the way the response renders them
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def _rest_response(data, status, replayed=False):
+    return Response(data, status=status, headers={REPLAYED_HEADER: 'true'} if replayed else None)
+
+
+def _json_response(data, status, replayed=False):
+    response = JsonResponse(data, status=status, safe=False)
+    if replayed:
+        response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """
+    Honour the Idempotency-Key header on a view's POST handler. Works for
+    DRF APIView handlers and for async django View handlers (JsonResponse).
+    Requests without the header run unchanged.
+    """
+
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @wraps(handler)
+            async def async_wrapper(self, request, *args, **kwargs):
+                key = request.headers.get(IDEMPOTENCY_HEADER)
+                if not key:
+                    return await handler(self, request, *args, **kwargs)
+                if len(key) > MAX_KEY_LENGTH:
+                    return _json_response({"error": "Idempotency-Key is too long"}, 400)
+
+                try:
+                    payload = json.loads(request.body or b'{}')
+                except ValueError:
+                    payload = request.body.decode(errors='replace')
+                try:
+                    outcome, record = await aclaim(scope, key, request_fingerprint(request.method, request.path, payload))
+                except IdempotencyConflict as e:
+                    return _json_response({"error": str(e)}, e.status)
+                if outcome == "replay":
+                    return _json_response(record.response_body, record.response_status, replayed=True)
+
+                try:
+                    response = await handler(self, request, *args, **kwargs)
+                except BaseException:
+                    await sync_to_async(release)(record)
+                    raise
+                body = json.loads(response.content) if 200 <= response.status_code < 300 else None
+                await sync_to_async(finish)(record, response.status_code, body)
+                return response
+
+            return async_wrapper
+
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return handler(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _rest_response({"error": "Idempotency-Key is too long"}, 400)
+
+            try:
+                outcome, record = claim(scope, key, request_fingerprint(request.method, request.path, request.data))
+            except IdempotencyConflict as e:
+                return _rest_response({"error": str(e)}, e.status)
+            if outcome == "replay":
+                return _rest_response(record.response_body, record.response_status, replayed=True)
+
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except BaseException:
+                release(record)
+                raise
+            finish(record, response.status_code, _stored_body(response.data))
+            return response
+
+        return wrapper
+
+    return decorator
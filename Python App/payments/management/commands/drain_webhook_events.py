@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.webhooks import drain_batch
+
+
+class Command(BaseCommand):
+    help = "Apply received Razorpay webhook events to payments and wallets in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Events per transaction (default WEBHOOK_DRAIN_BATCH_SIZE)")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new events")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        totals = {"events": 0, "processed": 0, "ignored": 0, "failed": 0, "payments_credited": 0}
+        while True:
+            counts = drain_batch(options['batch_size'])
+            for key, value in counts.items():
+                totals[key] += value
+            if counts["events"]:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Drained {totals['events']} events: {totals['processed']} processed, {totals['ignored']} ignored, "
+            f"{totals['failed']} failed, {totals['payments_credited']} payments credited"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from payments.idempotency import purge_expired_records
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_records()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency records"))
@@ -1,5 +1,15 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
 from django.utils.deprecation import MiddlewareMixin
 
+from RideHailingApp import db_router, metrics
+
 class CsrfExemptMiddleware(MiddlewareMixin):
     """
     Disable CSRF for specific Razorpay endpoints
@@ -7,9 +17,142 @@ class CsrfExemptMiddleware(MiddlewareMixin):
     EXEMPT_PATHS = [
         '/payments/create-order/',
         '/payments/verify-payment/',
+        '/payments/create-order-async/',
+        '/payments/verify-payment-async/',
+        '/payments/webhook/',
     ]
 
     def process_request(self, request):
         if request.path in self.EXEMPT_PATHS:
             setattr(request, '_dont_enforce_csrf_checks', True)
         return None
+
+
+class InstrumentationMiddleware:
+    """
+    Record latency, DB queries/time and response size of every request by
+    route pattern (RideHailingApp.metrics, scraped from /analysis/metrics).
+    Runs natively in both WSGI and ASGI stacks so async views stay async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    _checked = threading.local()
+
+    def _start(self):
+        # Connections this thread opened before the metrics module was
+        # imported; later ones are instrumented by connection_created
+        if not getattr(self._checked, 'done', False):
+            for connection in connections.all(initialized_only=True):
+                metrics.instrument_connection(connection)
+            self._checked.done = True
+        stats = metrics.RequestStats()
+        return stats, metrics.current_request.set(stats), time.perf_counter()
+
+    @staticmethod
+    def _record(request, response, stats, elapsed):
+        match = request.resolver_match
+        # The pattern, not the path, so ids do not explode the label set
+        route = '/' + match.route if match is not None else 'unmatched'
+        method = request.method
+        labels = (method, route)
+        metrics.observe('http_request_duration_seconds', (method, route, str(response.status_code)), elapsed)
+        metrics.observe('http_request_db_queries', labels, stats.queries)
+        metrics.observe('http_request_db_duration_seconds', labels, stats.db_time)
+        if not response.streaming:
+            metrics.observe('http_response_size_bytes', labels, len(response.content))
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware (Accept-Encoding negotiation, BREACH padding, weak ETags)
+    for bodies of at least COMPRESSION_MIN_BYTES: list bodies shrink several
+    times over, a single wallet is not worth the CPU. Streamed bodies are
+    always compressed.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_BYTES', 1024):
+            return response
+        return super().process_response(request, response)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Scope of RideHailingApp.db_router's per-request state: GET/HEAD requests
+    to @replica_reads views may read from DATABASE_REPLICAS until they
+    write. Streamed bodies are read in the same scope as the view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with db_router.request_scope() as state:
+            response = self.get_response(request)
+        return self._streamed_in_scope(response, state)
+
+    async def __acall__(self, request):
+        with db_router.request_scope() as state:
+            response = await self.get_response(request)
+        return self._streamed_in_scope(response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if db_router.view_reads_from_replica(request, view_func, view_kwargs):
+            db_router.allow_replica_reads()
+        return None
+
+    @staticmethod
+    def _streamed_in_scope(response, state):
+        if not response.streaming or response.is_async or not state.replica_allowed:
+            return response
+        content = iter(response.streaming_content)
+
+        def chunks():
+            while True:
+                with db_router.request_scope(state):
+                    try:
+                        chunk = next(content)
+                    except StopIteration:
+                        return
+                yield chunk
+
+        response.streaming_content = chunks()
+        return response
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['ride_id', 'payment_id'], name='payments_pa_ride_id_f490f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'created_at', 'payment_id'], name='payments_pa_status_241ec5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['wallet', 'status', 'created_at', 'payment_id'], name='payments_pa_wallet__bf4104_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+def backfill_razorpay_order_id(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    payments = Payment.objects.exclude(payment_method='CASH').only('payment_id', 'transaction_meta_data')
+    batch = []
+    for payment in payments.iterator(chunk_size=2000):
+        order_id = (payment.transaction_meta_data or {}).get('id')
+        if isinstance(order_id, str) and order_id.startswith('order_'):
+            payment.razorpay_order_id = order_id
+            batch.append(payment)
+        if len(batch) >= 2000:
+            Payment.objects.bulk_update(batch, ['razorpay_order_id'])
+            batch = []
+    Payment.objects.bulk_update(batch, ['razorpay_order_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='razorpay_order_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=100, unique=True)),
+                ('event_type', models.CharField(max_length=50)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('RECEIVED', 'Received'), ('PROCESSED', 'Processed'), ('IGNORED', 'Ignored'), ('FAILED', 'Failed')], default='RECEIVED', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'received_at'], name='payments_we_status_4e31df_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_razorpay_order_id, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from decimal import Decimal, ROUND_DOWN
 import uuid
 
@@ -33,9 +33,25 @@ class Payment(models.Model):
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHOD_CHOICES)
     status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='PENDING')
     transaction_meta_data = models.JSONField(default=dict, blank=True)
+    # Razorpay order of card/UPI payments, how webhook events find their payment
+    razorpay_order_id = models.CharField(max_length=64, blank=True, default="", db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Payment details by ride; payment_id keeps .first() in index order
+            models.Index(fields=["ride_id", "payment_id"]),
+            # Completed payments, overall and per wallet, in keyset order
+            models.Index(fields=["status", "created_at", "payment_id"]),
+            models.Index(fields=["wallet", "status", "created_at", "payment_id"]),
+            # Incremental analytics snapshot watermark (Admin/snapshot.py), also
+            # the completed payments list's Last-Modified
+            models.Index(fields=["updated_at", "payment_id"]),
+            # Last-Modified of one wallet's completed payments
+            models.Index(fields=["wallet", "updated_at"]),
+        ]
+
     def __str__(self):
         return f"Payment({self.payment_id}) - {self.amount} ({self.status})"
 
@@ -43,37 +59,70 @@ class Payment(models.Model):
     def process_wallet_update(self):
         """
         Update wallet balances and pending deductions after payment success.
-        Decimal-safe calculations for paise/decimal amounts.
+        Decimal-safe calculations for paise/decimal amounts, written as
+        ledger entries plus one atomic wallet UPDATE (see wallet/ledger.py).
+        Earnings rollups for /analysis/earnings/ are updated in the same
+        transaction.
         """
-        from decimal import Decimal, ROUND_DOWN
+        from wallet.ledger import record_payment
+        from Admin.earnings import record_payment_rollups
+
+        with transaction.atomic():
+            balances = record_payment(self)
+            record_payment_rollups(self)
+        # Only mirror onto a wallet instance the caller already holds; a
+        # striped credit does not read the wallet's balances
+        if balances is not None and Payment.wallet.is_cached(self):
+            self.wallet.set_balances(balances)
+
+
+# Idempotency Record (one per Idempotency-Key and endpoint, see payments/idempotency.py)
+class IdempotencyRecord(models.Model):
+    STATUS_CHOICES = [
+        ('IN_PROGRESS', 'In progress'),
+        ('COMPLETED', 'Completed'),
+    ]
 
-        wallet = self.wallet
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IN_PROGRESS')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_until = models.DateTimeField()
+    expires_at = models.DateTimeField()
 
-        # Ensure amount is Decimal
-        amount = Decimal(self.amount).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="unique_idempotency_key_per_scope"),
+        ]
+        indexes = [models.Index(fields=["expires_at"])]
 
-        # Admin fee: 5% of amount
-        admin_fee = (amount * Decimal("0.05")).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+    def __str__(self):
+        return f"IdempotencyRecord({self.scope}:{self.key}) - {self.status}"
 
-        # Net amount after admin fee
-        net_amount = amount - admin_fee
 
-        # Add full amount to total_balance
-        wallet.total_balance += amount
+# Webhook Event (raw Razorpay webhook inbox, drained by payments/webhooks.py)
+class WebhookEvent(models.Model):
+    STATUS_CHOICES = [
+        ('RECEIVED', 'Received'),
+        ('PROCESSED', 'Processed'),
+        ('IGNORED', 'Ignored'),
+        ('FAILED', 'Failed'),
+    ]
 
-        if self.payment_method != 'CASH':
-            wallet.actual_balance += net_amount
-        else:
-            # For cash, deduct admin fee from actual_balance if possible
-            if wallet.actual_balance >= admin_fee:
-                wallet.actual_balance -= admin_fee
-                # send admin_fee to admin
-            else:
-                # Not enough balance, add to pending deduction
-                wallet.a_deduct += admin_fee
+    # X-Razorpay-Event-Id; Razorpay redelivers an event under the same id
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RECEIVED')
+    error = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
 
-        # Save wallet changes
-        wallet.save()
+    class Meta:
+        indexes = [models.Index(fields=["status", "received_at"])]
 
-        # Apply any pending deductions if possible
-        wallet.apply_pending_deduction()
\ No newline at end of file
+    def __str__(self):
+        return f"WebhookEvent({self.event_id}) - {self.event_type} ({self.status})"
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Payment
 from wallet.models import Wallet
+from RideHailingApp.fast_rows import RowEncoder
 
 
 # create a Order SErializer 
@@ -23,6 +24,19 @@ class CreateOrderSerializer(serializers.Serializer):
         return value
 
 
+# One ride of a bulk cash-payment upload
+class CashPaymentItemSerializer(serializers.Serializer):
+    ride_id = serializers.UUIDField()
+    rider_id = serializers.UUIDField()
+    driver_id = serializers.UUIDField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be greater than zero")
+        return value
+
+
 # Varify Payment Serializer 
 class VerifyPaymentSerializer(serializers.Serializer):
     razorpay_order_id = serializers.CharField(min_length=10)
@@ -35,4 +49,8 @@ class VerifyPaymentSerializer(serializers.Serializer):
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ['payment_id', 'wallet', 'ride_id', 'rider_id', 'driver_id', 'amount', 'payment_method', 'status', 'created_at']
\ No newline at end of file
+        fields = ['payment_id', 'wallet', 'ride_id', 'rider_id', 'driver_id', 'amount', 'payment_method', 'status', 'created_at']
+
+
+# values_list() twin of PaymentSerializer for the read endpoints (RideHailingApp/fast_rows.py)
+payment_rows = RowEncoder(PaymentSerializer)
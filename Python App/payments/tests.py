@@ -1,15 +1,40 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
-from unittest.mock import patch
+from django.utils import timezone
+from django.core.cache import caches
+from unittest.mock import patch, AsyncMock
 from decimal import Decimal
 import uuid
-from .models import Payment
+import json
+import httpx
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .models import Payment, IdempotencyRecord, WebhookEvent
+from .idempotency import finish, request_fingerprint, try_claim
+from .webhooks import drain_batch, drain_events
+from wallet.models import WalletLedgerEntry
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from Admin.models import DriverEarningsRollup
+from io import StringIO
+import gzip
+import hashlib
+import hmac
 from wallet.models import Wallet
+from RideHailingApp.query_plans import QueryPlanAssertionsMixin, seed_dataset
+from Admin.models import Admin
+from Admin.tokens import auth_header, revocations
+
+
+# Client for the admin-only endpoints (the admin never has to be saved)
+def admin_client():
+    return Client(headers=auth_header(Admin(name="Test Admin", email="admin@example.com")))
 
 
 class PaymentTestCase(TestCase):
     def setUp(self):
-        self.client = Client()
+        self.client = admin_client()
         self.wallet = Wallet.objects.create(
             wallet_id=uuid.uuid4(),
             driver_id=uuid.uuid4(),
@@ -219,3 +244,620 @@ class SecurityTest(TestCase):
         # Current views allow all, so 200 is expected
         response = self.client.post(reverse('create_order'), data=self.order_payload, content_type='application/json')
         self.assertEqual(response.status_code, 200)
+
+
+class AsyncPaymentViewTests(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(
+            wallet_id=uuid.uuid4(),
+            driver_id=uuid.uuid4(),
+            total_balance=Decimal("100.00"),
+            actual_balance=Decimal("50.00"),
+            a_deduct=Decimal("0.00")
+        )
+        self.order_payload = {
+            "ride_id": str(uuid.uuid4()),
+            "rider_id": str(uuid.uuid4()),
+            "driver_id": str(self.wallet.driver_id),
+            "amount": 100.00,
+            "payment_method": "CARD"
+        }
+
+    @patch('payments.views.acreate_razorpay_order', new_callable=AsyncMock)
+    async def test_create_order_async_success(self, mock_create):
+        mock_create.return_value = {'id': 'order_12345', 'amount': 10000, 'currency': 'INR'}
+        response = await self.async_client.post(
+            reverse('create_order_async'), data=self.order_payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["order_id"], "order_12345")
+        self.assertEqual(mock_create.call_args.args[0]["amount"], 10000)
+        self.assertTrue(await Payment.objects.filter(payment_id=response.json()["payment_id"]).aexists())
+
+    @patch('Admin.http_client.httpx.AsyncClient.request', new_callable=AsyncMock)
+    async def test_create_order_async_razorpay_error(self, mock_request):
+        mock_request.return_value = httpx.Response(400, json={"error": {"description": "Invalid amount"}})
+        response = await self.async_client.post(
+            reverse('create_order_async'), data=self.order_payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Invalid amount")
+        self.assertFalse(await Payment.objects.aexists())
+
+    @patch('payments.views.razorpay_client.utility.verify_payment_signature')
+    async def test_verify_payment_async_updates_wallet(self, mock_verify):
+        payment = await Payment.objects.acreate(
+            wallet=self.wallet,
+            ride_id=uuid.uuid4(),
+            rider_id=uuid.uuid4(),
+            driver_id=self.wallet.driver_id,
+            amount=100,
+            payment_method="CARD",
+            status="PENDING"
+        )
+        response = await self.async_client.post(reverse('verify_payment_async'), data={
+            "razorpay_order_id": "order_12345",
+            "razorpay_payment_id": "payment_12345",
+            "razorpay_signature": "signature_12345",
+            "payment_id": str(payment.payment_id),
+            "ride_id": str(payment.ride_id),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "SUCCESS")
+
+        await self.wallet.arefresh_from_db()
+        self.assertEqual(self.wallet.total_balance, Decimal("200.00"))
+        self.assertEqual(self.wallet.actual_balance, Decimal("145.00"))
+
+
+class CompletedPaymentsPaginationTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(wallet_id=uuid.uuid4(), driver_id=uuid.uuid4())
+        self.payments = [
+            Payment.objects.create(
+                wallet=self.wallet,
+                ride_id=uuid.uuid4(),
+                rider_id=uuid.uuid4(),
+                driver_id=self.wallet.driver_id,
+                amount=100 + i,
+                payment_method="CARD",
+                status="SUCCESS"
+            )
+            for i in range(5)
+        ]
+        # Ties on created_at must still page without gaps or repeats
+        Payment.objects.filter(pk__in=[p.pk for p in self.payments[1:4]]).update(
+            created_at=self.payments[1].created_at)
+
+    def test_unpaginated_list_is_unchanged(self):
+        response = self.client.get(reverse('completed_payments'))
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(len(response.json()), 5)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            body = self.client.get(reverse('completed_payments'), params).json()
+            self.assertLessEqual(len(body["results"]), 2)
+            seen.extend(row["payment_id"] for row in body["results"])
+            cursor = body["next"]
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), {str(p.payment_id) for p in self.payments})
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('completed_payments'), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(reverse('completed_payments_by_id', args=[self.wallet.wallet_id]),
+                                   {"stream": "ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])["wallet"], str(self.wallet.wallet_id))
+
+
+class FastReadPathTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        self.payments = [
+            Payment.objects.create(wallet=self.wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(),
+                                   driver_id=self.wallet.driver_id, amount=amount, payment_method=method,
+                                   status="SUCCESS")
+            for amount, method in ((Decimal("100.5"), "CARD"), (7, "UPI"), (Decimal("0.01"), "CASH"))
+        ]
+
+    def fetch_both(self, url, params=None):
+        # (serializer path, fast path) response bodies
+        bodies = []
+        for enabled in (False, True):
+            with override_settings(FAST_READS_ENABLED=enabled):
+                response = self.client.get(url, params or {})
+            self.assertEqual(response.status_code, 200)
+            bodies.append(b"".join(response.streaming_content) if response.streaming else response.content)
+        return bodies
+
+    def test_completed_payments_are_byte_identical(self):
+        for url in (reverse('completed_payments'), reverse('completed_payments_by_id', args=[self.wallet.wallet_id])):
+            for params in ({}, {"limit": 2}, {"stream": "ndjson"}):
+                slow, fast = self.fetch_both(url, params)
+                self.assertEqual(slow, fast, (url, params))
+        slow, fast = self.fetch_both(reverse('completed_payments'), {"limit": 2})
+        next_page = {"limit": 2, "cursor": json.loads(fast)["next"]}
+        self.assertEqual(*self.fetch_both(reverse('completed_payments'), next_page))
+
+    def test_payment_details_are_byte_identical(self):
+        slow, fast = self.fetch_both(reverse('payment-details', args=[self.payments[0].ride_id]))
+        self.assertEqual(slow, fast)
+        self.assertEqual(json.loads(fast)["amount"], "100.50")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        self.other = Wallet.objects.create(driver_id=uuid.uuid4())
+        for wallet in (self.wallet, self.wallet, self.other):
+            self.add_payment(wallet)
+
+    @staticmethod
+    def add_payment(wallet, status="SUCCESS"):
+        return Payment.objects.create(wallet=wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(),
+                                      driver_id=wallet.driver_id, amount=Decimal("100.00"), payment_method="CARD",
+                                      status=status)
+
+    def test_unchanged_list_is_not_modified(self):
+        url = reverse('completed_payments')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+        self.assertEqual(again["ETag"], first["ETag"])
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+
+        # A pending payment turning SUCCESS joins the list
+        payment = self.add_payment(self.wallet, status="PENDING")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+        etag = self.client.get(url)["ETag"]
+        payment.status = "SUCCESS"
+        payment.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()), 4)
+
+    def test_validators_are_per_scope_and_url(self):
+        url = reverse('completed_payments_by_id', args=[self.wallet.wallet_id])
+        etag = self.client.get(url)["ETag"]
+        self.add_payment(self.other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        page = self.client.get(url, {"limit": 1})
+        self.assertNotEqual(page["ETag"], etag)
+        self.assertEqual(self.client.get(url, {"limit": 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_large_lists_are_gzipped(self):
+        for _ in range(20):
+            self.add_payment(self.wallet)
+        url = reverse('completed_payments')
+        plain = self.client.get(url)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertLess(len(compressed.content), len(plain.content) / 2)
+        # The weakened ETag still validates
+        self.assertTrue(compressed["ETag"].startswith('W/"'))
+        again = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=compressed["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.client.get(reverse('payment-details', args=[self.add_payment(self.wallet).ride_id]),
+                                   HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class PaymentQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.wallets = seed_dataset(wallets=2000)
+        cls.wallet = next(w for w in cls.wallets if w.is_active)
+        cls.payment = Payment.objects.filter(wallet=cls.wallet).first()
+
+    def setUp(self):
+        self.client = admin_client()
+        # Fresh revocation list, the budgets below don't count its refresh
+        revocations.sync()
+        # Measure the database path, not wallet cache hits left by other tests
+        caches['default'].clear()
+
+    def test_payment_details_by_ride(self):
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.get(reverse('payment-details', args=[self.payment.ride_id]))
+        self.assertEqual(response.json()["payment_id"], str(self.payment.payment_id))
+
+    def test_completed_payments_page(self):
+        first = self.client.get(reverse('completed_payments'), {"limit": 50}).json()
+        # Validator (max updated_at) plus the page
+        with self.assertIndexedQueries(max_queries=2):
+            response = self.client.get(reverse('completed_payments'), {"limit": 50, "cursor": first["next"]})
+        self.assertEqual(len(response.json()["results"]), 50)
+
+    def test_completed_payments_for_wallet(self):
+        # Validator (max updated_at) plus the page
+        with self.assertIndexedQueries(max_queries=2):
+            response = self.client.get(reverse('completed_payments_by_id', args=[self.wallet.wallet_id]),
+                                       {"limit": 50})
+        self.assertTrue(all(row["wallet"] == str(self.wallet.wallet_id) for row in response.json()["results"]))
+
+    def test_completed_payments_not_modified(self):
+        url = reverse('completed_payments_by_id', args=[self.wallet.wallet_id])
+        etag = self.client.get(url, {"limit": 50})["ETag"]
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.get(url, {"limit": 50}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        etag = self.client.get(reverse('completed_payments'), {"limit": 50})["ETag"]
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.get(reverse('completed_payments'), {"limit": 50}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_completed_payments_stream(self):
+        # Validator (max updated_at) plus the page
+        with self.assertIndexedQueries(max_queries=2):
+            response = self.client.get(reverse('completed_payments_by_id', args=[self.wallet.wallet_id]),
+                                       {"stream": "ndjson"})
+            b"".join(response.streaming_content)
+
+    def test_cash_payment(self):
+        # Wallet lookup, payment insert, ledger lock/entries/update, and an
+        # update plus insert for each of the four new earnings rollup buckets
+        with self.assertIndexedQueries(max_queries=13):
+            response = self.client.post(reverse('create_cash_payment'), data={
+                "ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                "driver_id": str(self.wallet.driver_id), "amount": "100.00"}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = Client()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("50.00"))
+        self.cash_payload = {
+            "ride_id": str(uuid.uuid4()),
+            "rider_id": str(uuid.uuid4()),
+            "driver_id": str(self.wallet.driver_id),
+            "amount": "100.00",
+        }
+
+    def post_cash(self, payload, key="cash-key-1"):
+        return self.client.post(reverse('create_cash_payment'), data=payload, content_type='application/json',
+                                headers={"Idempotency-Key": key})
+
+    def test_duplicate_cash_payment_is_replayed(self):
+        first = self.post_cash(self.cash_payload)
+        second = self.post_cash(self.cash_payload)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Payment.objects.count(), 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.total_balance, self.wallet.actual_balance), (Decimal("100.00"), Decimal("45.00")))
+
+    def test_key_reused_with_different_body(self):
+        self.post_cash(self.cash_payload)
+        response = self.post_cash({**self.cash_payload, "amount": "200.00"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_failed_request_can_be_retried(self):
+        response = self.post_cash({**self.cash_payload, "driver_id": str(uuid.uuid4())})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        for _ in range(2):
+            self.client.post(reverse('create_cash_payment'), data=self.cash_payload, content_type='application/json')
+        self.assertEqual(Payment.objects.count(), 2)
+
+    @patch('payments.views.razorpay_client.order.create')
+    def test_duplicate_order_creates_one_razorpay_order(self, mock_create):
+        mock_create.return_value = {'id': 'order_12345', 'amount': 10000, 'currency': 'INR'}
+        payload = {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                   "driver_id": str(self.wallet.driver_id), "amount": 100.00, "payment_method": "CARD"}
+        responses = [self.client.post(reverse('create_order'), data=payload, content_type='application/json',
+                                      headers={"Idempotency-Key": "order-key"}) for _ in range(2)]
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(responses[1].status_code, responses[0].status_code)
+        self.assertEqual(responses[1].json(), responses[0].json())
+        self.assertEqual(Payment.objects.count(), 1)
+
+    @patch('payments.views.acreate_razorpay_order', new_callable=AsyncMock)
+    async def test_duplicate_async_order_creates_one_razorpay_order(self, mock_create):
+        mock_create.return_value = {'id': 'order_12345', 'amount': 10000, 'currency': 'INR'}
+        payload = {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                   "driver_id": str(self.wallet.driver_id), "amount": 100.00, "payment_method": "CARD"}
+        responses = [await self.async_client.post(reverse('create_order_async'), data=payload,
+                                                  content_type='application/json',
+                                                  headers={"Idempotency-Key": "async-order-key"})
+                     for _ in range(2)]
+        self.assertEqual(mock_create.await_count, 1)
+        self.assertEqual(responses[1].json(), responses[0].json())
+        self.assertEqual(responses[1]["Idempotent-Replayed"], "true")
+
+    def test_expired_key_runs_again(self):
+        self.post_cash(self.cash_payload)
+        IdempotencyRecord.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.post_cash(self.cash_payload).status_code, 201)
+        self.assertEqual(Payment.objects.count(), 2)
+
+
+class ConcurrentIdempotencyTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("50.00"))
+
+    def test_in_flight_duplicate_waits_for_the_first_request(self):
+        payload = {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                   "driver_id": str(self.wallet.driver_id), "amount": "100.00"}
+        fingerprint = request_fingerprint('POST', reverse('create_cash_payment'), payload)
+        outcome, record = try_claim('cash_payment', 'concurrent-key', fingerprint)
+        self.assertEqual(outcome, "execute")
+
+        def duplicate():
+            return Client().post(reverse('create_cash_payment'), data=payload, content_type='application/json',
+                                 headers={"Idempotency-Key": "concurrent-key"})
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            waiting = pool.submit(duplicate)
+            threading.Event().wait(0.3)
+            # Still waiting on the claim held above
+            self.assertFalse(waiting.done())
+            finish(record, 201, {"payment_id": "first"})
+            response = waiting.result(timeout=5)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"payment_id": "first"})
+        self.assertFalse(Payment.objects.exists())
+
+    @patch('payments.views.razorpay_client.order.create')
+    def test_handler_runs_outside_a_transaction(self, mock_create):
+        # Razorpay is called without holding the database write lock
+        in_transaction = []
+        mock_create.side_effect = lambda order: in_transaction.append(connection.in_atomic_block) or {
+            'id': 'order_12345', 'amount': 10000, 'currency': 'INR'}
+        payload = {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                   "driver_id": str(self.wallet.driver_id), "amount": 100.00, "payment_method": "CARD"}
+        response = Client().post(reverse('create_order'), data=payload, content_type='application/json',
+                                 headers={"Idempotency-Key": "order-key"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(in_transaction, [False])
+        self.assertEqual(IdempotencyRecord.objects.get().status, 'COMPLETED')
+
+    @override_settings(IDEMPOTENCY={'WAIT': 0.2})
+    def test_duplicate_gives_up_waiting(self):
+        payload = {"amount": "100.00"}
+        try_claim('cash_payment', 'held-key', request_fingerprint('POST', reverse('create_cash_payment'), payload))
+        response = Client().post(reverse('create_cash_payment'), data=payload, content_type='application/json',
+                                 headers={"Idempotency-Key": "held-key"})
+        self.assertEqual(response.status_code, 409)
+
+    def test_abandoned_claim_is_taken_over(self):
+        payload = {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                   "driver_id": str(self.wallet.driver_id), "amount": "100.00"}
+        try_claim('cash_payment', 'stale-key', request_fingerprint('POST', reverse('create_cash_payment'), payload))
+        IdempotencyRecord.objects.update(locked_until=timezone.now())
+        response = Client().post(reverse('create_cash_payment'), data=payload, content_type='application/json',
+                                 headers={"Idempotency-Key": "stale-key"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(IdempotencyRecord.objects.get().status, 'COMPLETED')
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET="whsec_test")
+class RazorpayWebhookTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("0.00"))
+        self.other_wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("0.00"))
+
+    def make_payment(self, wallet, order_id, amount="100.00"):
+        return Payment.objects.create(
+            wallet=wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(), driver_id=wallet.driver_id,
+            amount=Decimal(amount), payment_method="UPI", status="PENDING",
+            transaction_meta_data={"id": order_id}, razorpay_order_id=order_id)
+
+    def event(self, event_type, order_id, amount=10000):
+        entity = {"id": f"pay_{order_id}", "order_id": order_id, "amount": amount}
+        return {"event": event_type, "payload": {"payment": {"entity": entity}}}
+
+    def deliver(self, payload, event_id, secret="whsec_test"):
+        body = json.dumps(payload).encode()
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return self.client.post(reverse('razorpay_webhook'), data=body, content_type='application/json',
+                                headers={"X-Razorpay-Signature": signature, "X-Razorpay-Event-Id": event_id})
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.deliver(self.event("payment.captured", "order_1"), "evt_1", secret="wrong")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_redelivered_event_is_stored_once(self):
+        for _ in range(2):
+            response = self.deliver(self.event("payment.captured", "order_1"), "evt_1")
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "duplicate")
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_drain_credits_each_payment_once_per_wallet_batch(self):
+        payments = [self.make_payment(self.wallet, "order_a"), self.make_payment(self.wallet, "order_b"),
+                    self.make_payment(self.other_wallet, "order_c")]
+        self.deliver(self.event("payment.captured", "order_a"), "evt_1")
+        self.deliver({"event": "order.paid", "payload": {
+            "order": {"entity": {"id": "order_a", "amount_paid": 10000}}}}, "evt_2")
+        self.deliver(self.event("payment.captured", "order_b"), "evt_3")
+        self.deliver(self.event("payment.captured", "order_c"), "evt_4")
+
+        counts = drain_batch(batch_size=10)
+        self.assertEqual(counts["processed"], 4)
+        self.assertEqual(counts["payments_credited"], 3)
+        self.wallet.refresh_from_db()
+        self.other_wallet.refresh_from_db()
+        self.assertEqual(self.wallet.actual_balance, Decimal("190.00"))
+        self.assertEqual(self.other_wallet.actual_balance, Decimal("95.00"))
+        for payment in payments:
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, "SUCCESS")
+        self.assertEqual(WalletLedgerEntry.objects.filter(entry_type="CREDIT").count(), 3)
+        self.assertEqual(drain_batch()["events"], 0)
+
+    @patch('payments.views.razorpay_client.order.create')
+    def test_fractional_amount_matches_the_charged_order(self, mock_create):
+        # 19.99 * 100 is 1998.999... as a float, truncating charged 1998 paise
+        mock_create.side_effect = lambda order: {'id': 'order_frac', 'amount': order['amount'], 'currency': 'INR'}
+        payload = {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                   "driver_id": str(self.wallet.driver_id), "amount": "19.99", "payment_method": "UPI"}
+        response = self.client.post(reverse('create_order'), data=payload, content_type='application/json')
+        self.assertEqual(response.json()["amount"], 1999)
+
+        self.deliver(self.event("payment.captured", "order_frac", amount=1999), "evt_1")
+        counts = drain_batch()
+        self.assertEqual((counts["processed"], counts["failed"]), (1, 0))
+        self.assertEqual(Payment.objects.get(razorpay_order_id="order_frac").status, "SUCCESS")
+
+    def test_amount_is_checked_against_the_order(self):
+        payment = self.make_payment(self.wallet, "order_a", amount="1.15")
+        payment.transaction_meta_data = {"id": "order_a", "amount": 114}
+        payment.save()
+        self.deliver(self.event("payment.captured", "order_a", amount=114), "evt_1")
+        self.deliver(self.event("payment.captured", "order_a", amount=115), "evt_2")
+        counts = drain_batch()
+        self.assertEqual((counts["processed"], counts["failed"]), (1, 1))
+
+    def test_payment_verified_by_client_is_not_credited_again(self):
+        payment = self.make_payment(self.wallet, "order_a")
+        payment.status = "SUCCESS"
+        payment.save()
+        self.deliver(self.event("payment.captured", "order_a"), "evt_1")
+        drain_events()
+        self.assertFalse(WalletLedgerEntry.objects.exists())
+        self.assertEqual(WebhookEvent.objects.get().status, "PROCESSED")
+
+    def test_failed_unknown_and_mismatched_events(self):
+        failed = self.make_payment(self.wallet, "order_a")
+        self.make_payment(self.wallet, "order_b")
+        self.deliver(self.event("payment.failed", "order_a"), "evt_1")
+        self.deliver(self.event("payment.captured", "order_missing"), "evt_2")
+        self.deliver(self.event("payment.captured", "order_b", amount=500), "evt_3")
+        self.deliver({"event": "refund.created", "payload": {}}, "evt_4")
+
+        self.assertEqual(drain_events(), {"events": 4, "processed": 1, "ignored": 2, "failed": 1,
+                                          "payments_credited": 0})
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, "FAILED")
+        self.assertIn("does not match", WebhookEvent.objects.get(event_id="evt_3").error)
+        self.assertFalse(WalletLedgerEntry.objects.exists())
+
+    def test_drain_command(self):
+        self.make_payment(self.wallet, "order_a")
+        self.deliver(self.event("payment.captured", "order_a"), "evt_1")
+        out = StringIO()
+        call_command('drain_webhook_events', stdout=out)
+        self.assertIn("1 payments credited", out.getvalue())
+
+
+class BulkCashPaymentTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def ride(self, wallet, amount):
+        return {"ride_id": str(uuid.uuid4()), "rider_id": str(uuid.uuid4()),
+                "driver_id": str(wallet.driver_id), "amount": amount}
+
+    def test_same_balances_as_one_by_one(self):
+        amounts = ["3.00", "120.00", "40.00", "15.50", "200.00", "7.25"]
+        bulk_wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("4.00"),
+                                            a_deduct=Decimal("2.00"))
+        single_wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("4.00"),
+                                              a_deduct=Decimal("2.00"))
+
+        response = self.client.post(reverse('create_cash_payment_bulk'), content_type='application/json',
+                                    data={"payments": [self.ride(bulk_wallet, amount) for amount in amounts]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], len(amounts))
+        for amount in amounts:
+            self.client.post(reverse('create_cash_payment'), data=self.ride(single_wallet, amount),
+                             content_type='application/json')
+
+        bulk_wallet.refresh_from_db()
+        single_wallet.refresh_from_db()
+        for field in ("total_balance", "actual_balance", "a_deduct"):
+            self.assertEqual(getattr(bulk_wallet, field), getattr(single_wallet, field), field)
+        self.assertEqual(
+            sorted(WalletLedgerEntry.objects.filter(wallet=bulk_wallet).values_list("entry_type", "amount")),
+            sorted(WalletLedgerEntry.objects.filter(wallet=single_wallet).values_list("entry_type", "amount")))
+        self.assertEqual(DriverEarningsRollup.objects.get(driver_id=bulk_wallet.driver_id, granularity="DAY").payment_count,
+                         len(amounts))
+
+    def test_invalid_items_are_reported_per_item(self):
+        wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        paid = self.ride(wallet, "10.00")
+        self.client.post(reverse('create_cash_payment'), data=paid, content_type='application/json')
+        duplicate = self.ride(wallet, "5.00")
+        items = [
+            self.ride(wallet, "25.00"),
+            {**self.ride(wallet, "-1"), "rider_id": "not-a-uuid"},
+            {**self.ride(wallet, "10.00"), "driver_id": str(uuid.uuid4())},
+            duplicate,
+            duplicate,
+            paid,
+        ]
+        body = self.client.post(reverse('create_cash_payment_bulk'), data=items,
+                                content_type='application/json').json()
+        self.assertEqual((body["created"], body["failed"]), (2, 4))
+        self.assertEqual([result["status"] for result in body["results"]],
+                         ["SUCCESS", "FAILED", "FAILED", "SUCCESS", "FAILED", "FAILED"])
+        self.assertEqual(set(body["results"][1]["errors"]), {"rider_id", "amount"})
+        self.assertIn("driver_id", body["results"][2]["errors"])
+        self.assertEqual(Payment.objects.filter(ride_id=duplicate["ride_id"]).count(), 1)
+
+    def test_rides_paid_while_waiting_for_the_wallet_lock_are_rejected(self):
+        from .bulk import _lock_wallets
+        wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        racing, fresh = self.ride(wallet, "10.00"), self.ride(wallet, "20.00")
+
+        def lock_after_a_racing_upload(wallet_ids):
+            # Another upload of the same ride commits before this one gets the lock
+            Payment.objects.create(wallet=wallet, ride_id=racing["ride_id"], rider_id=racing["rider_id"],
+                                   driver_id=wallet.driver_id, amount=Decimal("10.00"),
+                                   payment_method="CASH", status="SUCCESS")
+            return _lock_wallets(wallet_ids)
+
+        with patch('payments.bulk._lock_wallets', side_effect=lock_after_a_racing_upload):
+            body = self.client.post(reverse('create_cash_payment_bulk'), data=[racing, fresh],
+                                    content_type='application/json').json()
+        self.assertEqual([result["status"] for result in body["results"]], ["FAILED", "SUCCESS"])
+        self.assertEqual(Payment.objects.filter(ride_id=racing["ride_id"]).count(), 1)
+
+    def test_empty_upload(self):
+        response = self.client.post(reverse('create_cash_payment_bulk'), data={"payments": []},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_queries_do_not_grow_with_rides(self):
+        wallets = [Wallet.objects.create(driver_id=uuid.uuid4()) for _ in range(10)]
+        items = [self.ride(wallets[i % 10], "100.00") for i in range(1000)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('create_cash_payment_bulk'), data={"payments": items},
+                                        content_type='application/json')
+        self.assertEqual(response.json()["created"], 1000)
+        # One balance UPDATE and the rollup upserts per driver; the bulk inserts
+        # are only split by SQLite's limit on query parameters
+        self.assertLess(len(queries), 200)
+        self.assertEqual(Payment.objects.count(), 1000)
+        wallets[0].refresh_from_db()
+        self.assertEqual(wallets[0].total_balance, Decimal("10000.00"))
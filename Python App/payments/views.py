@@ -7,12 +7,30 @@ import os
 from dotenv import load_dotenv
 from .models import Payment
 from wallet.models import Wallet
+from wallet.cache import get_wallet_entry
 from .serializers import CreateOrderSerializer, VerifyPaymentSerializer
 import uuid
 from django.utils import timezone
 from rest_framework.generics import ListAPIView
-from .serializers import PaymentSerializer
+from .serializers import PaymentSerializer, payment_rows
 from django.shortcuts import get_object_or_404
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+from django.db import transaction
+from django.db.models import Max
+from Admin.http_client import get_async_client
+from RideHailingApp.pagination import KeysetPagination, ndjson_response, ndjson_rows_response, wants_ndjson
+from RideHailingApp.fast_rows import FAST_RENDERER_CLASSES, use_fast_rows
+from RideHailingApp.conditional import conditional_response
+from RideHailingApp.db_router import replica_reads
+from RideHailingApp.metrics import instrument_session
+from .idempotency import idempotent
+from Admin.authentication import ADMIN_AUTHENTICATION, ADMIN_PERMISSIONS
+from .bulk import ingest_cash_payments
+from .webhooks import EVENT_ID_HEADER, SIGNATURE_HEADER, store_event, to_paise, verify_webhook_signature
 
 
 # Load .env 
@@ -23,7 +41,41 @@ load_dotenv()
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
 
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET), base_url=settings.RAZORPAY_API_BASE)
+instrument_session(razorpay_client.session, 'razorpay')
+
+
+# Non-blocking razorpay_client.order.create for the async views
+async def acreate_razorpay_order(data):
+    res = await get_async_client('razorpay').post(
+        f"{settings.RAZORPAY_API_BASE}/v1/orders",
+        json=data,
+        auth=(RAZORPAY_KEY_ID or '', RAZORPAY_KEY_SECRET or ''),
+    )
+    if res.status_code != 200:
+        try:
+            description = res.json()['error']['description']
+        except (ValueError, KeyError, TypeError):
+            description = res.text
+        if res.status_code >= 500:
+            raise razorpay.errors.ServerError(description)
+        raise razorpay.errors.BadRequestError(description)
+    return res.json()
+
+
+@transaction.atomic
+def mark_payment_verified(payment_id, data):
+    payment = Payment.objects.select_for_update().get(payment_id=payment_id)
+    if payment.status == 'SUCCESS':
+        # Already confirmed, e.g. by the webhook drainer; never credit twice
+        return payment
+    payment.status = 'SUCCESS'
+    payment.transaction_meta_data.update(data)
+    payment.save(update_fields=['status', 'transaction_meta_data', 'updated_at'])
+
+    # Update wallet balances
+    payment.process_wallet_update()
+    return payment
 
 
 # Create Order View 
@@ -31,18 +83,19 @@ class CreateOrderView(APIView):
     permission_classes = []
     authentication_classes = []
 
+    @idempotent('create_order')
     def post(self, request):
         try:
             serializer = CreateOrderSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             data = serializer.validated_data
 
-            # Fetch wallet dynamically
-            wallet = Wallet.objects.filter(driver_id=data['driver_id']).first()
+            # Fetch wallet dynamically (read-through cache)
+            wallet = get_wallet_entry(data['driver_id'])
             if not wallet:
                 return Response({"error": "Wallet not found for this driver"}, status=400)
 
-            amount_in_paise = int(float(data['amount']) * 100)
+            amount_in_paise = to_paise(data['amount'])
 
             razorpay_order = razorpay_client.order.create({
                 'amount': amount_in_paise,
@@ -51,14 +104,15 @@ class CreateOrderView(APIView):
             })
 
             payment = Payment.objects.create(
-                wallet=wallet,
+                wallet_id=wallet['wallet_id'],
                 ride_id=data['ride_id'],
                 rider_id=data['rider_id'],
                 driver_id=data['driver_id'],
                 amount=data['amount'],
                 payment_method=data['payment_method'],
                 status='PENDING',
-                transaction_meta_data=razorpay_order
+                transaction_meta_data=razorpay_order,
+                razorpay_order_id=razorpay_order.get('id', '')
             )
 
             return Response({
@@ -99,14 +153,8 @@ class VerifyPaymentView(APIView):
             }
             razorpay_client.utility.verify_payment_signature(params_dict)
 
-    
-            payment = Payment.objects.get(payment_id=payment_id)
-            payment.status = 'SUCCESS'
-            payment.transaction_meta_data.update(data)
-            payment.save()
 
-            # Update wallet balances
-            payment.process_wallet_update()
+            mark_payment_verified(payment_id, data)
 
             return Response({"message": "Payment verified successfully", "status": "SUCCESS", "ride_id":ride_id})
 
@@ -115,6 +163,90 @@ class VerifyPaymentView(APIView):
         except Exception as e:
             return Response({"error": str(e), "status": "FAILED"}, status=status.HTTP_400_BAD_REQUEST)
 
+# Async Create Order View (ASGI): Razorpay through httpx, ORM through the async API
+class CreateOrderAsyncView(View):
+    @idempotent('create_order')
+    async def post(self, request):
+        try:
+            serializer = CreateOrderSerializer(data=json.loads(request.body or b'{}'))
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
+
+            wallet = await sync_to_async(get_wallet_entry)(data['driver_id'])
+            if not wallet:
+                return JsonResponse({"error": "Wallet not found for this driver"}, status=400)
+
+            amount_in_paise = to_paise(data['amount'])
+
+            razorpay_order = await acreate_razorpay_order({
+                'amount': amount_in_paise,
+                'currency': 'INR',
+                'payment_capture': '1'
+            })
+
+            payment = await Payment.objects.acreate(
+                wallet_id=wallet['wallet_id'],
+                ride_id=data['ride_id'],
+                rider_id=data['rider_id'],
+                driver_id=data['driver_id'],
+                amount=data['amount'],
+                payment_method=data['payment_method'],
+                status='PENDING',
+                transaction_meta_data=razorpay_order,
+                razorpay_order_id=razorpay_order.get('id', '')
+            )
+
+            return JsonResponse({
+                "ride_id": str(payment.ride_id),
+                "order_id": razorpay_order['id'],
+                "payment_id": str(payment.payment_id),
+                "amount": razorpay_order['amount'],
+                "currency": razorpay_order['currency'],
+                "status": payment.status,
+                "razorpay_key_id": RAZORPAY_KEY_ID
+            })
+
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+
+# Async Verify Payment View (ASGI)
+class VerifyPaymentAsyncView(View):
+    async def post(self, request):
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+        serializer = VerifyPaymentSerializer(data=body)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        data = serializer.validated_data
+
+        try:
+            ride_id = body.get("ride_id")
+            payment_id = body.get("payment_id")
+            if not payment_id:
+                return JsonResponse({"error": "Payment ID missing"}, status=400)
+            if not ride_id:
+                return JsonResponse({"error": "Ride_id missing"})
+
+            # Signature check is a local HMAC, no I/O
+            razorpay_client.utility.verify_payment_signature({
+                'razorpay_order_id': data['razorpay_order_id'],
+                'razorpay_payment_id': data['razorpay_payment_id'],
+                'razorpay_signature': data['razorpay_signature']
+            })
+
+            await sync_to_async(mark_payment_verified)(payment_id, data)
+
+            return JsonResponse({"message": "Payment verified successfully", "status": "SUCCESS", "ride_id": ride_id})
+
+        except Payment.DoesNotExist:
+            return JsonResponse({"error": "Payment not found"}, status=400)
+        except Exception as e:
+            return JsonResponse({"error": str(e), "status": "FAILED"}, status=400)
+
+
 # Check out Page view 
 class CheckoutPageView(APIView):
     def get(self, request):
@@ -122,9 +254,45 @@ class CheckoutPageView(APIView):
 
 
 # Get Completed PAyments By id Or Without Id 
+@replica_reads(when=lambda request, wallet_id=None: wallet_id is None)
 class CompletedPaymentsView(ListAPIView):
     serializer_class = PaymentSerializer
-    
+    pagination_class = KeysetPagination
+    renderer_classes = FAST_RENDERER_CLASSES
+    row_encoder = payment_rows
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
+
+    # Every payment is for admins, one wallet's payments are its driver's
+    def requires_admin(self, request):
+        return 'wallet_id' not in self.kwargs
+
+    def get(self, request, *args, **kwargs):
+        # The dashboard polls this list: 304 until a payment in scope changes
+        return conditional_response(request, self.last_modified(), lambda: self.list(request, *args, **kwargs))
+
+    def last_modified(self):
+        # Every status counts, a payment turning SUCCESS joins the list.
+        # Payments are never deleted, so the newest change is enough.
+        queryset = Payment.objects.all()
+        wallet_id = self.kwargs.get('wallet_id', None)
+        if wallet_id:
+            queryset = queryset.filter(wallet_id=wallet_id)
+        return queryset.aggregate(latest=Max('updated_at'))['latest']
+
+    def list(self, request, *args, **kwargs):
+        if use_fast_rows(self):
+            queryset = self.get_queryset()
+            if wants_ndjson(request):
+                return ndjson_rows_response(queryset, self.row_encoder)
+            page = self.paginator.paginate_rows(queryset, request, self.row_encoder, view=self)
+            if page is not None:
+                return self.get_paginated_response(page)
+            return Response(self.row_encoder.rows(queryset))
+        if wants_ndjson(request):
+            return ndjson_response(self.get_queryset(), self.serializer_class)
+        return super().list(request, *args, **kwargs)
+
     def get_queryset(self):
         queryset = Payment.objects.filter(status='SUCCESS')
         wallet_id = self.kwargs.get('wallet_id', None)
@@ -135,8 +303,15 @@ class CompletedPaymentsView(ListAPIView):
 
 #  Get Payment Details 
 class GetPaymentDetails(APIView):
+    renderer_classes = FAST_RENDERER_CLASSES
+    row_encoder = payment_rows
+
     def get(self, request, ride_id=None):
         if ride_id:
+            if use_fast_rows(self):
+                row = self.row_encoder.first(Payment.objects.filter(ride_id=ride_id))
+                if row is not None:
+                    return Response(row, status=status.HTTP_200_OK)
             payment = Payment.objects.filter(ride_id=ride_id).first()
             serializer = PaymentSerializer(payment)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -146,6 +321,7 @@ class GetPaymentDetails(APIView):
 class CreateCashPaymentView(APIView):
     permission_classes = []  # optional auth
 
+    @idempotent('cash_payment')
     def post(self, request):
         try:
             ride_id = request.data.get("ride_id")
@@ -156,23 +332,24 @@ class CreateCashPaymentView(APIView):
             if not all([ride_id, rider_id, driver_id, amount]):
                 return Response({"error": "Missing required data"}, status=400)
 
-            wallet = Wallet.objects.filter(driver_id=driver_id).first()
+            wallet = get_wallet_entry(driver_id)
             if not wallet:
                 return Response({"error": "Wallet not found for this driver"}, status=400)
 
-            # Create Payment with CASH method
-            payment = Payment.objects.create(
-                wallet=wallet,
-                ride_id=ride_id,
-                rider_id=rider_id,
-                driver_id=driver_id,
-                amount=amount,
-                payment_method="CASH",
-                status="SUCCESS"
-            )
-
-            # Apply wallet logic (same as process_wallet_update)
-            payment.process_wallet_update()
+            with transaction.atomic():
+                # Create Payment with CASH method
+                payment = Payment.objects.create(
+                    wallet_id=wallet['wallet_id'],
+                    ride_id=ride_id,
+                    rider_id=rider_id,
+                    driver_id=driver_id,
+                    amount=amount,
+                    payment_method="CASH",
+                    status="SUCCESS"
+                )
+
+                # Apply wallet logic (same as process_wallet_update)
+                payment.process_wallet_update()
 
             return Response({
                 "payment_id": str(payment.payment_id),
@@ -183,3 +360,40 @@ class CreateCashPaymentView(APIView):
 
         except Exception as e:
             return Response({"error": str(e)}, status=400)
+
+
+# Bulk Cash Payments: {"payments": [{ride_id, rider_id, driver_id, amount}, ...]}
+class CreateBulkCashPaymentView(APIView):
+    permission_classes = []  # optional auth
+
+    @idempotent('cash_payment_bulk')
+    def post(self, request):
+        items = request.data.get("payments") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "A non-empty list of payments is required"}, status=400)
+        if len(items) > settings.BULK_CASH_PAYMENT_MAX_ITEMS:
+            return Response({"error": f"At most {settings.BULK_CASH_PAYMENT_MAX_ITEMS} payments per request"},
+                            status=400)
+
+        results = ingest_cash_payments(items)
+        created = sum(1 for result in results if result["status"] == "SUCCESS")
+        return Response({
+            "created": created,
+            "failed": len(results) - created,
+            "results": results,
+        }, status=201 if created else 400)
+
+
+# Razorpay Webhook: verify, store in the inbox and acknowledge; applied by drain_webhook_events
+class RazorpayWebhookView(APIView):
+    permission_classes = []
+    authentication_classes = []
+
+    def post(self, request):
+        if not verify_webhook_signature(request.body, request.headers.get(SIGNATURE_HEADER, '')):
+            return Response({"error": "Invalid webhook signature"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            _, created = store_event(request.body, request.headers.get(EVENT_ID_HEADER))
+        except ValueError:
+            return Response({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"status": "received" if created else "duplicate"}, status=status.HTTP_200_OK)
@@ -0,0 +1,155 @@
+import hashlib
+import hmac
+import json
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from Admin.earnings import record_payments_rollups
+from wallet.ledger import record_payments_by_wallet
+from .models import Payment, WebhookEvent
+
+
+# Razorpay Webhook Inbox
+#
+# POST /payments/webhook/ only checks the X-Razorpay-Signature HMAC and stores
+# the raw event (deduplicated on X-Razorpay-Event-Id), so Razorpay's delivery
+# bursts cost one insert each. `manage.py drain_webhook_events` then applies
+# RECEIVED events in batches, each batch in one transaction:
+#   - events are claimed with select_for_update(skip_locked=True), so several
+#     drainers can run side by side
+#   - payments are looked up by razorpay_order_id in one query and locked
+#   - a payment captured by several events (payment.captured and order.paid,
+#     or a retried delivery) is credited once; already SUCCESS payments,
+#     e.g. confirmed through /payments/verify-payment/, are not credited again
+#   - credits are grouped by wallet: one ledger posting and one balance
+#     UPDATE per wallet per batch (wallet.ledger.record_payments_by_wallet)
+#   - an event whose amount differs from what the order charged (the
+#     order's stored amount in paise) fails instead of crediting
+
+SIGNATURE_HEADER = 'X-Razorpay-Signature'
+EVENT_ID_HEADER = 'X-Razorpay-Event-Id'
+
+# Razorpay event -> Payment status it confirms
+HANDLED_EVENTS = {
+    'payment.captured': 'SUCCESS',
+    'order.paid': 'SUCCESS',
+    'payment.failed': 'FAILED',
+}
+
+
+def verify_webhook_signature(body, signature):
+    # HMAC-SHA256 of the raw body with the webhook secret (not the API secret)
+    secret = settings.RAZORPAY_WEBHOOK_SECRET
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def store_event(body, event_id=None):
+    """
+    Save a verified webhook body to the inbox. Returns (event, created);
+    a redelivered event is not stored twice. Raises ValueError for a body
+    that is not a JSON object.
+    """
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook body must be a JSON object")
+    event_id = event_id or hashlib.sha256(body).hexdigest()
+    return WebhookEvent.objects.get_or_create(
+        event_id=event_id, defaults={"event_type": str(payload.get("event", ""))[:50], "payload": payload})
+
+
+def event_details(payload):
+    # (razorpay order id, amount in paise, razorpay payment id) of an event
+    entities = payload.get("payload") or {}
+    payment = (entities.get("payment") or {}).get("entity") or {}
+    order = (entities.get("order") or {}).get("entity") or {}
+    amount = payment.get("amount", order.get("amount_paid"))
+    return payment.get("order_id") or order.get("id"), amount, payment.get("id")
+
+
+def to_paise(amount):
+    # Rupees (Decimal, str or float) to integer paise, rounded half up; the
+    # create-order views charge this same value
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def expected_paise(payment):
+    # What Razorpay was asked to charge: the order's own amount when stored
+    order_amount = (payment.transaction_meta_data or {}).get('amount')
+    return order_amount if isinstance(order_amount, int) else to_paise(payment.amount)
+
+
+@transaction.atomic
+def drain_batch(batch_size=None):
+    """
+    Apply up to batch_size RECEIVED events. Returns counts of events
+    processed/ignored/failed and of payments credited.
+    """
+    batch_size = batch_size or settings.WEBHOOK_DRAIN_BATCH_SIZE
+    events = list(WebhookEvent.objects.select_for_update(skip_locked=True)
+                  .filter(status='RECEIVED').order_by('received_at', 'id')[:batch_size])
+    counts = {"events": len(events), "processed": 0, "ignored": 0, "failed": 0, "payments_credited": 0}
+    if not events:
+        return counts
+
+    details = {event.pk: event_details(event.payload) for event in events}
+    order_ids = {order_id for order_id, _, _ in details.values() if order_id}
+    payments = {
+        payment.razorpay_order_id: payment
+        for payment in Payment.objects.select_for_update().filter(razorpay_order_id__in=order_ids)
+    }
+
+    now = timezone.now()
+    credited, changed = [], {}
+    for event in events:
+        event.status, event.processed_at = 'PROCESSED', now
+        order_id, amount, razorpay_payment_id = details[event.pk]
+        target = HANDLED_EVENTS.get(event.event_type)
+        payment = payments.get(order_id)
+        if target is None:
+            event.status, event.error = 'IGNORED', f"Unhandled event type '{event.event_type}'"
+        elif payment is None:
+            event.status, event.error = 'IGNORED', f"No payment for order '{order_id}'"
+        elif amount is not None and amount != expected_paise(payment):
+            event.status, event.error = 'FAILED', f"Amount {amount} does not match payment amount {payment.amount}"
+        elif target == 'SUCCESS' and payment.status != 'SUCCESS':
+            # A capture also settles an earlier failed attempt of the same order
+            payment.status = 'SUCCESS'
+            payment.transaction_meta_data.update(
+                {"razorpay_order_id": order_id, "razorpay_payment_id": razorpay_payment_id})
+            credited.append(payment)
+            changed[payment.pk] = payment
+        elif target == 'FAILED' and payment.status == 'PENDING':
+            payment.status = 'FAILED'
+            changed[payment.pk] = payment
+        counts[event.status.lower()] += 1
+
+    for payment in changed.values():
+        payment.updated_at = now
+    Payment.objects.bulk_update(list(changed.values()), ['status', 'transaction_meta_data', 'updated_at'])
+    if credited:
+        record_payments_by_wallet(credited)
+        record_payments_rollups(credited)
+    counts["payments_credited"] = len(credited)
+
+    WebhookEvent.objects.bulk_update(events, ['status', 'error', 'processed_at'])
+    return counts
+
+
+def drain_events(batch_size=None, max_batches=None):
+    # Batches until the inbox is empty; returns summed counts
+    totals = {"events": 0, "processed": 0, "ignored": 0, "failed": 0, "payments_credited": 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        counts = drain_batch(batch_size)
+        if not counts["events"]:
+            break
+        batches += 1
+        for key, value in counts.items():
+            totals[key] += value
+    return totals
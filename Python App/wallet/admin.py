@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Wallet
+from .models import Wallet, WalletLedgerEntry
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
@@ -14,3 +14,17 @@ class WalletAdmin(admin.ModelAdmin):
 
     # Optional: search bar on top
     search_fields = ("wallet_id", "driver_id")
+
+
+@admin.register(WalletLedgerEntry)
+class WalletLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ("entry_id", "wallet", "entry_type", "amount", "total_delta", "actual_delta", "a_deduct_delta", "created_at")
+    list_filter = ("entry_type", "created_at")
+    search_fields = ("wallet__wallet_id", "wallet__driver_id")
+
+    # Ledger rows are append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,137 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .ledger import credit_bonus, to_amount
+from .models import BonusJob, Wallet
+
+
+logger = logging.getLogger(__name__)
+
+
+# All-wallet Bonus Jobs
+#
+# POST /wallet/bonus/ creates a BonusJob and returns its id right away. The job
+# credits active wallets in wallet_id order, chunk_size wallets at a time; each
+# chunk (ledger entries, one set-based wallet UPDATE and the job's progress
+# cursor) commits in a single transaction, so a crash loses at most the chunk
+# in flight and a resumed job never credits a wallet twice.
+
+FINISHED_STATUSES = ('COMPLETED', 'FAILED')
+
+
+def eligible_wallets(job):
+    # Wallets opened after the bonus was announced do not get it
+    return Wallet.objects.filter(is_active=True, created_at__lte=job.created_at)
+
+
+def create_bonus_job(amount, chunk_size=None):
+    job = BonusJob.objects.create(
+        amount=to_amount(amount),
+        chunk_size=chunk_size or settings.BONUS_JOB_CHUNK_SIZE,
+    )
+    job.total_wallets = eligible_wallets(job).count()
+    job.save(update_fields=['total_wallets', 'updated_at'])
+    return job
+
+
+def run_bonus_chunk(job_id):
+    """
+    Credit the next chunk of a job. Returns the job, with status COMPLETED
+    once no wallets are left.
+    """
+    with transaction.atomic():
+        job = BonusJob.objects.select_for_update().get(job_id=job_id)
+        if job.status in FINISHED_STATUSES:
+            return job
+
+        wallets = eligible_wallets(job)
+        if job.last_wallet_id:
+            wallets = wallets.filter(wallet_id__gt=job.last_wallet_id)
+        rows = list(wallets.select_for_update().order_by('wallet_id')
+                    .values_list('wallet_id', 'a_deduct')[:job.chunk_size])
+
+        if rows:
+            credit_bonus(rows, job.amount)
+            job.processed_wallets += len(rows)
+            job.last_wallet_id = rows[-1][0]
+        if len(rows) < job.chunk_size:
+            job.status = 'COMPLETED'
+            job.finished_at = timezone.now()
+        else:
+            job.status = 'RUNNING'
+        job.save()
+        return job
+
+
+def run_bonus_job(job_id):
+    try:
+        while True:
+            job = run_bonus_chunk(job_id)
+            if job.status in FINISHED_STATUSES:
+                return job
+    except Exception as e:
+        # Committed chunks stay credited, resume_bonus_jobs continues after them
+        logger.exception("Bonus job %s failed", job_id)
+        BonusJob.objects.filter(job_id=job_id).update(status='FAILED', error=str(e), updated_at=timezone.now())
+        raise
+
+
+def _run_in_thread(job_id):
+    try:
+        run_bonus_job(job_id)
+    except Exception:
+        pass
+    finally:
+        connection.close()
+
+
+def start_bonus_job(job):
+    """
+    Run the job once the creating transaction has committed: in a background
+    thread, or inline when BONUS_JOB_RUN_IN_BACKGROUND is off. Inline runs
+    still wait for the commit, inside the caller's transaction every chunk
+    would commit (or roll back) together.
+    """
+    if not settings.BONUS_JOB_RUN_IN_BACKGROUND:
+        transaction.on_commit(lambda: run_bonus_job(job.job_id))
+        return
+    transaction.on_commit(lambda: threading.Thread(
+        target=_run_in_thread, args=(job.job_id,), name=f"bonus-job-{job.job_id}", daemon=True).start())
+
+
+def resumable_jobs(stale_after=None, include_failed=False):
+    """
+    Jobs whose runner died: unfinished and not updated for ``stale_after``
+    seconds (a live runner touches the job after every chunk).
+    """
+    stale_after = settings.BONUS_JOB_STALE_AFTER if stale_after is None else stale_after
+    statuses = ['PENDING', 'RUNNING'] + (['FAILED'] if include_failed else [])
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return BonusJob.objects.filter(status__in=statuses, updated_at__lte=cutoff).order_by('created_at')
+
+
+def resume_bonus_job(job_id):
+    BonusJob.objects.filter(job_id=job_id, status='FAILED').update(status='RUNNING', error="", updated_at=timezone.now())
+    return run_bonus_job(job_id)
+
+
+def job_progress(job):
+    percent = 100.0 if job.status == 'COMPLETED' else (
+        round(job.processed_wallets * 100 / job.total_wallets, 2) if job.total_wallets else 0.0)
+    return {
+        "job_id": str(job.job_id),
+        "status": job.status,
+        "amount": str(job.amount),
+        "total_wallets": job.total_wallets,
+        "processed_wallets": job.processed_wallets,
+        "percent": percent,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+    }
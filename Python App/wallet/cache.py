@@ -0,0 +1,182 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Wallet, WalletStripe
+from .serializers import WalletSerializer
+
+
+# Wallet Read Cache
+#
+# driver_id -> {"wallet_id", "wallet": WalletSerializer data, "modified"} in
+# Django's cache, for the driver-wallet lookups done on nearly every request.
+# "modified" (the wallet's or a stripe's newest updated_at) is the validator
+# of conditional GETs of the wallet (RideHailingApp/conditional.py). Keys are versioned
+# instead of deleted:
+#   wallet:gen                          bumped by bulk writes (all-wallet bonus)
+#   wallet:ver:<driver_id>              bumped by writes to that driver's wallet
+#   wallet:<gen>:<driver_id>:<ver>      the cached entry
+# Readers fetch both versions before reading the database and writers bump them
+# on commit, so an entry loaded from pre-commit data is stored under a version
+# nobody asks for again. Versions start from time.time_ns() so an evicted
+# counter never comes back to a number an old entry is stored under.
+#
+# Concurrent misses for one driver are collapsed with a short cache.add() lock:
+# one request loads and stores the entry, the others wait up to LOCK_WAIT
+# seconds for it before falling back to the database themselves.
+
+GENERATION_KEY = 'wallet:gen'
+
+
+class WalletCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.lock_waits = 0
+        self.wait_hits = 0
+        self.invalidations = 0
+
+    def incr(self, counter, value=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "lock_waits": self.lock_waits,
+            "wait_hits": self.wait_hits,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+stats = WalletCacheStats()
+
+
+def _config():
+    return getattr(settings, 'WALLET_CACHE', {})
+
+
+def enabled():
+    return _config().get('ENABLED', True)
+
+
+def _cache():
+    return caches[_config().get('CACHE_ALIAS', 'default')]
+
+
+def _driver_key(driver_id):
+    # Same key for UUID objects and any spelling of the string
+    return str(uuid.UUID(str(driver_id)))
+
+
+def _version_key(driver_id):
+    return f'wallet:ver:{driver_id}'
+
+
+def _versions(cache, driver_id):
+    version_key = _version_key(driver_id)
+    versions = cache.get_many([GENERATION_KEY, version_key])
+    for key in (GENERATION_KEY, version_key):
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return versions[GENERATION_KEY], versions[version_key]
+
+
+def load_wallet_entry(driver_id):
+    wallet = Wallet.objects.for_driver(driver_id).first()
+    if wallet is None:
+        return None
+    modified = wallet.updated_at
+    if wallet.stripe_count:
+        # Striped credits move the stripes, not the wallet row
+        latest = WalletStripe.objects.filter(wallet_id=wallet.wallet_id).aggregate(latest=Max('updated_at'))['latest']
+        modified = max(modified, latest or modified)
+    return {"wallet_id": str(wallet.wallet_id), "wallet": dict(WalletSerializer(wallet).data), "modified": modified}
+
+
+def get_wallet_entry(driver_id):
+    """
+    Cached {"wallet_id", "wallet", "modified"} for a driver's wallet (active one first),
+    or None when the driver has no wallet. Missing wallets are not cached.
+    """
+    try:
+        driver_key = _driver_key(driver_id)
+    except ValueError:
+        driver_key = None
+    if not enabled() or driver_key is None:
+        return load_wallet_entry(driver_id)
+
+    driver_id = driver_key
+    cache = _cache()
+    generation, version = _versions(cache, driver_id)
+    key = f'wallet:{generation}:{driver_id}:{version}'
+    entry = cache.get(key)
+    if entry is not None:
+        stats.incr("hits")
+        return entry
+    stats.incr("misses")
+
+    config = _config()
+    lock_key = f'{key}:lock'
+    lock_timeout = config.get('LOCK_TIMEOUT', 5)
+    if not cache.add(lock_key, 1, timeout=lock_timeout):
+        # Someone else is loading this entry
+        stats.incr("lock_waits")
+        deadline = time.monotonic() + config.get('LOCK_WAIT', 0.2)
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            entry = cache.get(key)
+            if entry is not None:
+                stats.incr("wait_hits")
+                return entry
+        return load_wallet_entry(driver_id)
+
+    try:
+        entry = load_wallet_entry(driver_id)
+        stats.incr("loads")
+        if entry is not None:
+            cache.set(key, entry, timeout=config.get('TTL', 300))
+        return entry
+    finally:
+        cache.delete(lock_key)
+
+
+def _bump(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted: any fresh number is newer than what entries were stored under
+        cache.add(key, time.time_ns(), timeout=None)
+    stats.incr("invalidations")
+
+
+def invalidate_wallet(driver_id):
+    """
+    Drop the cached wallet of ``driver_id`` once the current transaction
+    commits (right away outside of one).
+    """
+    if enabled():
+        key = _version_key(_driver_key(driver_id))
+        transaction.on_commit(lambda: _bump(key))
+
+
+def invalidate_all_wallets():
+    # For set-based writes that touch many wallets at once
+    if enabled():
+        transaction.on_commit(lambda: _bump(GENERATION_KEY))
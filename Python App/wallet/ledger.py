@@ -0,0 +1,351 @@
+from decimal import Decimal, ROUND_DOWN
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_all_wallets, invalidate_wallet
+from .models import Wallet, WalletLedgerEntry, WalletStripe
+
+
+# Wallet Ledger
+#
+# Every balance movement is written as an append-only WalletLedgerEntry in the
+# same transaction as one atomic UPDATE on the wallet row:
+#   UPDATE wallet SET actual_balance = actual_balance + <delta>, ... WHERE wallet_id = ...
+# The row is locked (select_for_update) only to decide between branches such as
+# "enough balance to take the fee now, or add it to a_deduct"; the arithmetic
+# itself is always done by the database, so concurrent payments never lose updates.
+#
+# Striped wallets (WALLET_STRIPES, wallet/stripes.py) take card/UPI credits on
+# one of their WalletStripe rows instead, without locking the wallet row. The
+# wallet's balance is then the row plus its stripes: every posting that branches
+# on the balance adds the stripe sums in, and its UPDATE still goes to the row.
+
+ADMIN_FEE_RATE = Decimal("0.05")
+CENTS = Decimal("0.01")
+ZERO = Decimal("0")
+
+BALANCE_FIELDS = ("total_balance", "actual_balance", "a_deduct")
+
+
+def stripes_enabled():
+    return getattr(settings, 'WALLET_STRIPES', {}).get('ENABLED', False)
+
+
+def add_stripe_sums(rows):
+    # Fold unfolded stripe credits into {wallet_id: balances} rows of striped wallets
+    striped = [wallet_id for wallet_id, row in rows.items() if row.get("stripe_count")]
+    if not striped:
+        return rows
+    for wallet_id, (total, actual) in WalletStripe.sums(striped).items():
+        rows[wallet_id]["total_balance"] += total
+        rows[wallet_id]["actual_balance"] += actual
+    return rows
+
+
+class InsufficientBalance(Exception):
+    """
+    Raised when a debit is larger than the wallet's actual_balance.
+    """
+
+
+def to_amount(value):
+    return Decimal(value).quantize(CENTS, rounding=ROUND_DOWN)
+
+
+def admin_fee(amount):
+    # Admin fee: 5% of amount
+    return (amount * ADMIN_FEE_RATE).quantize(CENTS, rounding=ROUND_DOWN)
+
+
+class LedgerPosting:
+    """
+    Entries for one wallet inside one transaction. Tracks the running
+    balances so later entries can branch on earlier ones, then writes all
+    entries with bulk_create and the summed deltas with a single UPDATE.
+    """
+
+    def __init__(self, wallet_id, balances=None):
+        self.wallet_id = wallet_id
+        if balances is None:
+            balances = (Wallet.objects.select_for_update().values('driver_id', 'stripe_count', *BALANCE_FIELDS)
+                        .get(wallet_id=wallet_id))
+            balances = add_stripe_sums({wallet_id: balances})[wallet_id]
+        self.driver_id = balances["driver_id"]
+        self.total_balance = balances["total_balance"]
+        self.actual_balance = balances["actual_balance"]
+        self.a_deduct = balances["a_deduct"]
+        self.entries = []
+
+    def add(self, entry_type, amount, total=ZERO, actual=ZERO, a_deduct=ZERO, payment=None, withdraw=None):
+        self.total_balance += total
+        self.actual_balance += actual
+        self.a_deduct += a_deduct
+        self.entries.append(WalletLedgerEntry(
+            wallet_id=self.wallet_id,
+            entry_type=entry_type,
+            amount=amount,
+            total_delta=total,
+            actual_delta=actual,
+            a_deduct_delta=a_deduct,
+            payment=payment,
+            withdraw=withdraw,
+        ))
+
+    def settle_pending(self, payment=None):
+        # Pending deductions are only taken once they can be paid in full
+        if self.a_deduct > 0 and self.actual_balance >= self.a_deduct:
+            pending = self.a_deduct
+            # send pending to admin
+            self.add('PENDING_DEDUCTION', pending, actual=-pending, a_deduct=-pending, payment=payment)
+
+    @classmethod
+    def for_wallets(cls, wallet_ids):
+        # Postings for several wallets, locked by one query in wallet_id order
+        rows = (Wallet.objects.select_for_update().filter(wallet_id__in=wallet_ids).order_by('wallet_id')
+                .values('wallet_id', 'driver_id', 'stripe_count', *BALANCE_FIELDS))
+        rows = add_stripe_sums({row['wallet_id']: row for row in rows})
+        return {wallet_id: cls(wallet_id, row) for wallet_id, row in rows.items()}
+
+    def commit(self):
+        if not self.entries:
+            return self.balances()
+        WalletLedgerEntry.objects.bulk_create(self.entries)
+        return self.apply()
+
+    def apply(self):
+        # The wallet UPDATE for entries that are already written
+        if not self.entries:
+            return self.balances()
+        deltas = {
+            field: sum((getattr(entry, delta) for entry in self.entries), ZERO)
+            for field, delta in zip(BALANCE_FIELDS, ("total_delta", "actual_delta", "a_deduct_delta"))
+        }
+        Wallet.objects.filter(wallet_id=self.wallet_id).update(
+            updated_at=timezone.now(),
+            **{field: F(field) + delta for field, delta in deltas.items() if delta},
+        )
+        invalidate_wallet(self.driver_id)
+        return self.balances()
+
+    def balances(self):
+        return {field: getattr(self, field) for field in BALANCE_FIELDS}
+
+
+def post_payment(posting, payment):
+    """
+    Add a successful payment to a wallet's posting: the full amount is
+    credited to total_balance, card/UPI payments credit actual_balance net of
+    the admin fee, and for cash the fee is taken from actual_balance or, when
+    it does not cover it, added to a_deduct. Pending deductions are settled last.
+    """
+    amount = to_amount(payment.amount)
+    fee = admin_fee(amount)
+
+    if payment.payment_method != 'CASH':
+        posting.add('CREDIT', amount, total=amount, actual=amount, payment=payment)
+        posting.add('FEE', fee, actual=-fee, payment=payment)
+    else:
+        # Cash stays with the driver, only the fee is owed to the platform
+        posting.add('CREDIT', amount, total=amount, payment=payment)
+        if posting.actual_balance >= fee:
+            posting.add('FEE', fee, actual=-fee, payment=payment)
+        else:
+            posting.add('PENDING_DEDUCTION', fee, a_deduct=fee, payment=payment)
+
+    posting.settle_pending(payment=payment)
+
+
+def record_striped_payment(payment, stripe_count, driver_id):
+    """
+    Credit a card/UPI payment to one stripe of a striped wallet: the same
+    CREDIT and FEE entries as post_payment, and one increment of the stripe
+    picked by the payment id, with no lock on the wallet row. Returns False
+    (nothing written) when the stripe row is gone, e.g. while the stripe
+    count is being changed.
+    """
+    amount = to_amount(payment.amount)
+    fee = admin_fee(amount)
+    # Entries first: their foreign key share-locks the wallet row before the
+    # stripe is locked, the same order compaction takes the two locks in
+    entries = WalletLedgerEntry.objects.bulk_create([
+        WalletLedgerEntry(wallet_id=payment.wallet_id, entry_type='CREDIT', amount=amount, total_delta=amount,
+                          actual_delta=amount, payment=payment),
+        WalletLedgerEntry(wallet_id=payment.wallet_id, entry_type='FEE', amount=fee, actual_delta=-fee,
+                          payment=payment),
+    ])
+    stripe = payment.payment_id.int % stripe_count
+    updated = WalletStripe.objects.filter(wallet_id=payment.wallet_id, stripe=stripe).update(
+        total_balance=F("total_balance") + amount,
+        actual_balance=F("actual_balance") + amount - fee,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        WalletLedgerEntry.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+        return False
+    # Pending deductions are settled when the stripes are compacted
+    invalidate_wallet(driver_id)
+    return True
+
+
+@transaction.atomic
+def record_payment(payment):
+    """
+    Post one successful payment. Returns the wallet's new balances, or None
+    when the payment went to a stripe (the wallet row was not read).
+    """
+    if stripes_enabled() and payment.payment_method != 'CASH':
+        stripe_count, driver_id = Wallet.objects.values_list('stripe_count', 'driver_id').get(
+            wallet_id=payment.wallet_id)
+        if stripe_count and record_striped_payment(payment, stripe_count, driver_id):
+            return None
+    posting = LedgerPosting(payment.wallet_id)
+    post_payment(posting, payment)
+    return posting.commit()
+
+
+@transaction.atomic
+def record_payments_by_wallet(payments):
+    """
+    Apply many successful payments at once: wallets locked by one query,
+    every ledger entry written by one bulk insert, and one aggregated
+    balance UPDATE per wallet. Payments of a wallet are posted in the given
+    order, with the same rules as record_payment. Returns {wallet_id: balances}.
+    """
+    postings = LedgerPosting.for_wallets({payment.wallet_id for payment in payments})
+    for payment in payments:
+        post_payment(postings[payment.wallet_id], payment)
+    WalletLedgerEntry.objects.bulk_create(
+        [entry for posting in postings.values() for entry in posting.entries], batch_size=1000)
+    return {wallet_id: posting.apply() for wallet_id, posting in postings.items()}
+
+
+@transaction.atomic
+def settle_pending_deduction(wallet_id):
+    posting = LedgerPosting(wallet_id)
+    posting.settle_pending()
+    return posting.commit()
+
+
+@transaction.atomic
+def record_withdrawal(withdraw):
+    posting = LedgerPosting(withdraw.wallet_id)
+    amount = to_amount(withdraw.amount)
+    if posting.actual_balance < amount:
+        raise InsufficientBalance("Insufficient wallet balance to complete withdrawal")
+    posting.add('WITHDRAWAL', amount, actual=-amount, withdraw=withdraw)
+    return posting.commit()
+
+
+def _post_withdrawal_entries(entries):
+    # One bulk insert and one UPDATE for a batch of withdrawal entries
+    deltas = {}
+    for entry in entries:
+        deltas[entry.wallet_id] = deltas.get(entry.wallet_id, ZERO) + entry.actual_delta
+    WalletLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+    Wallet.objects.filter(wallet_id__in=deltas).update(
+        actual_balance=F("actual_balance") + Case(
+            *(When(wallet_id=wallet_id, then=Value(delta)) for wallet_id, delta in deltas.items()),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        updated_at=timezone.now(),
+    )
+    for driver_id in Wallet.objects.filter(wallet_id__in=deltas).values_list("driver_id", flat=True):
+        invalidate_wallet(driver_id)
+
+
+@transaction.atomic
+def debit_withdrawals(withdrawals):
+    """
+    Debit a batch of withdrawals from their wallets' actual_balance, oldest
+    first per wallet. Returns (debited, insufficient); withdrawals the
+    balance cannot cover are left untouched.
+    """
+    wallet_ids = sorted({withdraw.wallet_id for withdraw in withdrawals})
+    rows = (Wallet.objects.select_for_update().filter(wallet_id__in=wallet_ids).order_by("wallet_id")
+            .values("wallet_id", "stripe_count", *BALANCE_FIELDS))
+    rows = add_stripe_sums({row["wallet_id"]: row for row in rows})
+    balances = {wallet_id: row["actual_balance"] for wallet_id, row in rows.items()}
+    debited, insufficient, entries = [], [], []
+    for withdraw in withdrawals:
+        amount = to_amount(withdraw.amount)
+        if balances[withdraw.wallet_id] < amount:
+            insufficient.append(withdraw)
+            continue
+        balances[withdraw.wallet_id] -= amount
+        entries.append(WalletLedgerEntry(wallet_id=withdraw.wallet_id, entry_type='WITHDRAWAL', amount=amount,
+                                         actual_delta=-amount, withdraw=withdraw))
+        debited.append(withdraw)
+    if entries:
+        _post_withdrawal_entries(entries)
+    return debited, insufficient
+
+
+@transaction.atomic
+def reverse_withdrawals(withdrawals):
+    # Credit failed payouts back to actual_balance
+    entries = [
+        WalletLedgerEntry(wallet_id=withdraw.wallet_id, entry_type='WITHDRAWAL_REVERSAL',
+                          amount=to_amount(withdraw.amount), actual_delta=to_amount(withdraw.amount),
+                          withdraw=withdraw)
+        for withdraw in withdrawals
+    ]
+    if entries:
+        # Same lock order as debit_withdrawals
+        list(Wallet.objects.select_for_update().filter(wallet_id__in={entry.wallet_id for entry in entries})
+             .order_by("wallet_id").values_list("wallet_id", flat=True))
+        _post_withdrawal_entries(entries)
+    return len(entries)
+
+
+def bonus_netting(amount):
+    # Part of a bonus that pays off a_deduct: the whole bonus while a_deduct
+    # covers it, otherwise whatever a_deduct is left
+    return Case(
+        When(a_deduct__gte=amount, then=Value(amount)),
+        When(a_deduct__gt=0, then=F("a_deduct")),
+        default=Value(ZERO),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def credit_bonus(rows, amount):
+    """
+    Credit a bonus to the locked (wallet_id, a_deduct) rows: one bulk insert
+    of ledger entries and one set-based UPDATE for all of them. The bonus is
+    first netted against a_deduct, the rest goes to actual_balance;
+    total_balance always grows by the full bonus.
+    """
+    if not rows:
+        return 0
+    entries = []
+    for wallet_id, pending in rows:
+        # Same rule as bonus_netting(), per row for the ledger
+        netted = min(pending, amount) if pending > 0 else ZERO
+        entries.append(WalletLedgerEntry(
+            wallet_id=wallet_id, entry_type='BONUS', amount=amount, total_delta=amount,
+            actual_delta=amount - netted, a_deduct_delta=-netted))
+    WalletLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+    netted = bonus_netting(amount)
+    Wallet.objects.filter(wallet_id__in=[wallet_id for wallet_id, _ in rows]).update(
+        total_balance=F("total_balance") + amount,
+        actual_balance=F("actual_balance") + amount - netted,
+        a_deduct=F("a_deduct") - netted,
+        updated_at=timezone.now(),
+    )
+    invalidate_all_wallets()
+    return len(rows)
+
+
+@transaction.atomic
+def apply_bonus(wallets, amount):
+    """
+    Credit a bonus to every wallet in a (small) queryset in one go. Returns
+    the number of wallets credited; all-wallet bonuses run as a chunked
+    BonusJob instead (see wallet/bonus_jobs.py).
+    """
+    rows = list(wallets.select_for_update().order_by().values_list("wallet_id", "a_deduct"))
+    return credit_bonus(rows, to_amount(amount))
@@ -0,0 +1,77 @@
+import json
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from Admin.benchmarks import benchmark_database
+from wallet.bonus_jobs import create_bonus_job, run_bonus_job
+from wallet.models import Wallet
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the all-wallet bonus against the old per-wallet save() loop on a throwaway "
+            "copy of the configured database (SQLite or Postgres)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, nargs='+', default=[10_000, 100_000],
+                            help="Wallet counts to benchmark, e.g. 10000 100000 1000000")
+        parser.add_argument('--chunk-size', type=int, nargs='+', default=[2000])
+        parser.add_argument('--legacy-max', type=int, default=10_000,
+                            help="Largest wallet count the per-wallet loop is timed on")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        results = {"vendor": connection.vendor, "runs": []}
+        for count in options['wallets']:
+            with benchmark_database():
+                self.seed(count, random.Random(options['seed']))
+                run = {"wallets": count}
+                for chunk_size in options['chunk_size']:
+                    job = create_bonus_job(Decimal("25.00"), chunk_size=chunk_size)
+                    started = time.perf_counter()
+                    run_bonus_job(job.job_id)
+                    elapsed = time.perf_counter() - started
+                    run[f"chunked_{chunk_size}"] = {
+                        "seconds": round(elapsed, 3), "wallets_per_second": round(count / elapsed, 1)}
+
+                if count <= options['legacy_max']:
+                    elapsed = self.legacy_bonus(Decimal("25.00"))
+                    run["per_wallet_save"] = {
+                        "seconds": round(elapsed, 3), "wallets_per_second": round(count / elapsed, 1)}
+                results["runs"].append(run)
+                self.stderr.write(f"{count} wallets done")
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def seed(count, rng, batch_size=5000):
+        for start in range(0, count, batch_size):
+            Wallet.objects.bulk_create([
+                Wallet(
+                    wallet_id=uuid.uuid4(),
+                    driver_id=uuid.uuid4(),
+                    total_balance=Decimal(rng.randrange(0, 50_000)) / 100,
+                    actual_balance=Decimal(rng.randrange(0, 20_000)) / 100,
+                    # About a third of the drivers owe cash-ride fees
+                    a_deduct=Decimal(rng.randrange(0, 5_000)) / 100 if rng.random() < 0.33 else Decimal(0),
+                )
+                for _ in range(min(batch_size, count - start))
+            ])
+
+    @staticmethod
+    def legacy_bonus(amount):
+        # The loop POST /wallet/bonus/ used to run inside the request
+        started = time.perf_counter()
+        for wallet in Wallet.objects.filter(is_active=True):
+            if wallet.a_deduct > 0:
+                netted = min(wallet.a_deduct, amount)
+                wallet.actual_balance -= netted
+                wallet.a_deduct -= netted
+            wallet.actual_balance += amount
+            wallet.total_balance += amount
+            wallet.save()
+        return time.perf_counter() - started
@@ -0,0 +1,100 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.test import override_settings
+
+from Admin.benchmarks import benchmark_database
+from payments.models import Payment
+from wallet.ledger import record_payment
+from wallet.models import Wallet, WalletLedgerEntry, WalletStripe
+from wallet.stripes import compact_stripes, set_stripe_count
+
+
+class Command(BaseCommand):
+    help = ("Benchmark concurrent card payments into one wallet with 0 (plain row lock) to K stripes "
+            "on a throwaway copy of the configured database; meaningful on Postgres, where writers "
+            "only wait for the rows they touch")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stripes', type=int, nargs='+', default=[0, 1, 4, 16])
+        parser.add_argument('--payments', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=16, help="Concurrent payment threads")
+        parser.add_argument('--hold-ms', type=float, default=2.0,
+                            help="Extra time each payment transaction stays open after the posting, "
+                                 "standing in for the rest of the request's transaction")
+
+    def handle(self, *args, **options):
+        results = {"vendor": connection.vendor, "workers": options['workers'], "hold_ms": options['hold_ms'],
+                   "runs": []}
+        with override_settings(WALLET_STRIPES={'ENABLED': True}):
+            for stripes in options['stripes']:
+                with benchmark_database():
+                    results["runs"].append(self.run(stripes, options['payments'], options['workers'],
+                                                    options['hold_ms'] / 1000))
+                self.stderr.write(f"{stripes} stripes done")
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def run(stripes, count, workers, hold):
+        wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        if stripes:
+            set_stripe_count(wallet.wallet_id, stripes)
+        payments = Payment.objects.bulk_create([
+            Payment(wallet=wallet, ride_id=uuid.uuid4(), rider_id=uuid.uuid4(), driver_id=wallet.driver_id,
+                    amount=Decimal("150.00"), payment_method='CARD', status='SUCCESS')
+            for _ in range(count)
+        ])
+        pending = queue.Queue()
+        for payment in payments:
+            pending.put(payment)
+        retries = []
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        payment = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    # SQLite locks the whole database, writers there retry instead of waiting
+                    for attempt in range(50):
+                        try:
+                            with transaction.atomic():
+                                record_payment(payment)
+                                time.sleep(hold)
+                            break
+                        except OperationalError:
+                            retries.append(1)
+                            time.sleep(0.001 * (attempt + 1))
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        compacted = compact_stripes()
+        wallet.refresh_from_db()
+        ledger = WalletLedgerEntry.objects.filter(wallet=wallet).aggregate(total=Sum('total_delta'))['total']
+        unfolded = WalletStripe.objects.filter(wallet=wallet).aggregate(total=Sum('total_balance'))['total']
+        return {
+            "stripes": stripes,
+            "payments": count,
+            "seconds": round(elapsed, 3),
+            "payments_per_second": round(count / elapsed, 1),
+            "retries": len(retries),
+            "wallets_compacted": compacted,
+            # Every credit landed exactly once
+            "balanced": wallet.total_balance == ledger == Decimal("150.00") * count and not unfolded,
+        }
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wallet.stripes import compact_stripes
+
+
+class Command(BaseCommand):
+    help = "Fold striped wallet balances back into their wallet rows and settle pending deductions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Wallets compacted per pass")
+        parser.add_argument('--loop', action='store_true', help="Keep compacting every --interval seconds")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Seconds between passes with --loop (default WALLET_STRIPES COMPACT_INTERVAL)")
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            interval = settings.WALLET_STRIPES.get('COMPACT_INTERVAL', 60)
+        while True:
+            compacted = total = compact_stripes(options['batch_size'])
+            # A full batch means more wallets are waiting
+            while compacted == options['batch_size']:
+                compacted = compact_stripes(options['batch_size'])
+                total += compacted
+            self.stdout.write(f"Compacted {total} wallets")
+            if not options['loop']:
+                break
+            time.sleep(interval)
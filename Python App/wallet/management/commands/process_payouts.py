@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallet.payouts import get_provider, process_batch
+
+
+class Command(BaseCommand):
+    help = ("Pay out REQUESTED withdrawals in batches through the payout provider "
+            "(run several copies to scale; workers never claim the same withdrawal)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Withdrawals claimed per batch")
+        parser.add_argument('--workers', type=int, default=None, help="Concurrent provider calls")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new withdrawals")
+        parser.add_argument('--sleep', type=float, default=5.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        provider = get_provider()
+        totals = {"claimed": 0, "completed": 0, "failed": 0, "retry": 0}
+        started = time.perf_counter()
+        while True:
+            counts = process_batch(options['batch_size'], options['workers'], provider)
+            for key, value in counts.items():
+                totals[key] += value
+            if counts["claimed"]:
+                self.stdout.write(f"Batch: {counts['completed']} completed, {counts['failed']} failed, "
+                                  f"{counts['retry']} left for retry")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {totals['claimed']} withdrawals in {elapsed:.1f}s: {totals['completed']} completed, "
+            f"{totals['failed']} failed, {totals['retry']} left for retry"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.bonus_jobs import resumable_jobs, resume_bonus_job
+from wallet.models import BonusJob
+
+
+class Command(BaseCommand):
+    help = "Resume all-wallet bonus jobs whose runner died (after a crash or restart)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', help="Resume this job id regardless of when it was last updated")
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help="Seconds without progress before a job counts as abandoned "
+                                 "(default BONUS_JOB_STALE_AFTER)")
+        parser.add_argument('--include-failed', action='store_true', help="Also retry FAILED jobs")
+
+    def handle(self, *args, **options):
+        if options['job']:
+            job_ids = [options['job']]
+            if not BonusJob.objects.filter(job_id=options['job']).exists():
+                raise CommandError(f"Bonus job {options['job']} not found")
+        else:
+            job_ids = list(resumable_jobs(options['stale_after'], options['include_failed'])
+                           .values_list('job_id', flat=True))
+
+        if not job_ids:
+            self.stdout.write("No bonus jobs to resume")
+        for job_id in job_ids:
+            try:
+                job = resume_bonus_job(job_id)
+            except Exception as e:
+                self.stderr.write(f"Bonus job {job_id} failed again: {e}")
+                continue
+            self.stdout.write(f"Bonus job {job_id}: {job.status}, {job.processed_wallets}/{job.total_wallets} wallets")
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.models import Wallet
+from wallet.stripes import set_stripe_count
+
+
+class Command(BaseCommand):
+    help = ("Give the active wallets of high-volume drivers striped balances "
+            "(needs WALLET_STRIPES_ENABLED); --stripes 0 turns striping off again")
+
+    def add_arguments(self, parser):
+        parser.add_argument('driver_ids', nargs='+')
+        parser.add_argument('--stripes', type=int, default=None,
+                            help="Stripes per wallet (default WALLET_STRIPES DEFAULT_COUNT)")
+
+    def handle(self, *args, **options):
+        count = options['stripes']
+        if count is None:
+            count = settings.WALLET_STRIPES.get('DEFAULT_COUNT', 8)
+        if count < 0:
+            raise CommandError("--stripes must be 0 or more")
+        if count and not settings.WALLET_STRIPES.get('ENABLED'):
+            self.stderr.write("WALLET_STRIPES_ENABLED is off: stripes are created but payments will not use them")
+
+        for driver_id in options['driver_ids']:
+            wallet = Wallet.objects.for_driver(driver_id).filter(is_active=True).first()
+            if wallet is None:
+                raise CommandError(f"No active wallet for driver {driver_id}")
+            set_stripe_count(wallet.wallet_id, count)
+            self.stdout.write(f"Wallet {wallet.wallet_id} of driver {driver_id}: {count} stripes")
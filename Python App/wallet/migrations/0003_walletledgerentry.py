@@ -0,0 +1,32 @@
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_initial'),
+        ('wallet', '0002_wallet_a_deduct_wallet_actual_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletLedgerEntry',
+            fields=[
+                ('entry_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('entry_type', models.CharField(choices=[('CREDIT', 'Credit'), ('DEBIT', 'Debit'), ('FEE', 'Fee'), ('BONUS', 'Bonus'), ('WITHDRAWAL', 'Withdrawal'), ('PENDING_DEDUCTION', 'Pending Deduction')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('total_delta', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('actual_delta', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('a_deduct_delta', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payments.payment')),
+                ('wallet', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='wallet.wallet')),
+                ('withdraw', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='wallet.withdraw')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'created_at'], name='wallet_wall_wallet__85cb0f_idx')],
+            },
+        ),
+    ]
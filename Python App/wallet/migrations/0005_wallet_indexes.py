@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_bonusjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wallet',
+            index=models.Index(fields=['driver_id', 'is_active'], name='wallet_wall_driver__052dd9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wallet',
+            index=models.Index(fields=['created_at', 'wallet_id'], name='wallet_wall_created_fdf7a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdraw',
+            index=models.Index(fields=['wallet', 'status'], name='wallet_with_wallet__e23211_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdraw',
+            index=models.Index(fields=['status', 'created_at'], name='wallet_with_status_5965e2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='wallet',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('driver_id',), name='unique_active_wallet_per_driver'),
+        ),
+    ]
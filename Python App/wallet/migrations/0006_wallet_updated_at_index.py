@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0005_wallet_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wallet',
+            index=models.Index(fields=['updated_at', 'wallet_id'], name='wallet_wall_updated_607e50_idx'),
+        ),
+    ]
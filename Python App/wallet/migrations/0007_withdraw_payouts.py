@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0006_wallet_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='withdraw',
+            name='claim_token',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='withdraw',
+            name='failure_reason',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='withdraw',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='withdraw',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='withdraw',
+            name='provider_reference',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='walletledgerentry',
+            name='entry_type',
+            field=models.CharField(choices=[('CREDIT', 'Credit'), ('DEBIT', 'Debit'), ('FEE', 'Fee'), ('BONUS', 'Bonus'), ('WITHDRAWAL', 'Withdrawal'), ('WITHDRAWAL_REVERSAL', 'Withdrawal Reversal'), ('PENDING_DEDUCTION', 'Pending Deduction')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='withdraw',
+            index=models.Index(fields=['claim_token'], name='wallet_with_claim_t_fd74c4_idx'),
+        ),
+    ]
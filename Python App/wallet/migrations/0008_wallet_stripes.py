@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_withdraw_payouts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='stripe_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WalletStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe', models.PositiveSmallIntegerField()),
+                ('total_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('actual_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('wallet', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='stripes', to='wallet.wallet')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletstripe',
+            constraint=models.UniqueConstraint(fields=('wallet', 'stripe'), name='unique_wallet_stripe'),
+        ),
+    ]
@@ -1,6 +1,14 @@
 from django.db import models
 import uuid
 
+
+class WalletQuerySet(models.QuerySet):
+    def for_driver(self, driver_id):
+        # Active wallet first; ordered along the (driver_id, is_active) index
+        # so .first() never needs a sort
+        return self.filter(driver_id=driver_id).order_by('-is_active')
+
+
 # Wallet Model
 class Wallet(models.Model):
     wallet_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -12,15 +20,64 @@ class Wallet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=False)
     updated_at = models.DateTimeField(auto_now=True, null=False)
 
+    # Striped balances (wallet/stripes.py): card/UPI credits of a wallet with
+    # stripe_count > 0 go to one of its WalletStripe rows instead of this row
+    stripe_count = models.PositiveSmallIntegerField(default=0)
+
+    objects = WalletQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Wallet lookups by driver on nearly every request
+            models.Index(fields=["driver_id", "is_active"]),
+            # Keyset pagination of the wallet list
+            models.Index(fields=["created_at", "wallet_id"]),
+            # Incremental analytics snapshot watermark (Admin/snapshot.py)
+            models.Index(fields=["updated_at", "wallet_id"]),
+        ]
+        constraints = [
+            # A deactivated wallet can be replaced, but a driver has one active wallet
+            models.UniqueConstraint(
+                fields=["driver_id"], condition=models.Q(is_active=True), name="unique_active_wallet_per_driver"),
+        ]
+
     def __str__(self):
         return f"Wallet({self.wallet_id}) - Driver: {self.driver_id} - Balance: {self.total_balance}"
     
     def apply_pending_deduction(self):
-        if self.a_deduct > 0 and self.actual_balance >= self.a_deduct:
-            self.actual_balance -= self.a_deduct
-            # send self.a_deduct to admin
-            self.a_deduct = 0
-            self.save()
+        # Settle a_deduct against actual_balance through the ledger
+        from .ledger import settle_pending_deduction
+
+        self.set_balances(settle_pending_deduction(self.wallet_id))
+
+    def set_balances(self, balances):
+        # Mirror balances written by the ledger onto this instance
+        for field, value in balances.items():
+            setattr(self, field, value)
+
+# Wallet Stripe Model (credits not yet folded into the wallet row)
+class WalletStripe(models.Model):
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="stripes", editable=False)
+    stripe = models.PositiveSmallIntegerField()
+    total_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    actual_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["wallet", "stripe"], name="unique_wallet_stripe"),
+        ]
+
+    def __str__(self):
+        return f"WalletStripe({self.wallet_id}/{self.stripe}) - {self.total_balance}"
+
+    @classmethod
+    def sums(cls, wallet_ids):
+        # {wallet_id: (total_balance, actual_balance)} not yet folded into the wallets
+        rows = (cls.objects.filter(wallet_id__in=wallet_ids).order_by().values('wallet_id')
+                .annotate(total=models.Sum('total_balance'), actual=models.Sum('actual_balance')))
+        return {row['wallet_id']: (row['total'], row['actual']) for row in rows}
+
 
 # Withdrwaable Model
 class Withdraw(models.Model):
@@ -31,6 +88,15 @@ class Withdraw(models.Model):
         ('FAILED', 'Failed'),
     ]
 
+    # Allowed status changes (wallet/payouts.py); REQUESTED -> COMPLETED is a
+    # manual settlement through the PATCH endpoint
+    TRANSITIONS = {
+        'REQUESTED': ('PROCESSING', 'COMPLETED', 'FAILED'),
+        'PROCESSING': ('COMPLETED', 'FAILED'),
+        'COMPLETED': (),
+        'FAILED': (),
+    }
+
     withdraw_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="withdrawals", editable=False)
     amount = models.DecimalField(max_digits=12, decimal_places=2, null=False)
@@ -42,5 +108,87 @@ class Withdraw(models.Model):
     status = models.CharField(max_length=20, choices=WITHDRAW_STATUS_CHOICES, default='REQUESTED')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Payout pipeline bookkeeping: the worker batch that claimed the row, when,
+    # and what the payout provider answered
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    provider_reference = models.CharField(max_length=100, blank=True, default="")
+    failure_reason = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["wallet", "status"]),
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["claim_token"]),
+        ]
+
     def __str__(self):
         return f"Withdraw({self.withdraw_id}) - {self.amount} ({self.status})"
+
+    def can_transition(self, new_status):
+        return new_status in self.TRANSITIONS.get(self.status, ())
+
+
+# Wallet Ledger Model (append-only, one row per balance movement)
+class WalletLedgerEntry(models.Model):
+    ENTRY_TYPE_CHOICES = [
+        ('CREDIT', 'Credit'),
+        ('DEBIT', 'Debit'),
+        ('FEE', 'Fee'),
+        ('BONUS', 'Bonus'),
+        ('WITHDRAWAL', 'Withdrawal'),
+        ('WITHDRAWAL_REVERSAL', 'Withdrawal Reversal'),
+        ('PENDING_DEDUCTION', 'Pending Deduction'),
+    ]
+
+    entry_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="ledger_entries", editable=False)
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+    # Signed change applied to each wallet balance by this entry
+    total_delta = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    actual_delta = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    a_deduct_delta = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    payment = models.ForeignKey(
+        "payments.Payment", on_delete=models.SET_NULL, null=True, blank=True, related_name="ledger_entries")
+    withdraw = models.ForeignKey(
+        Withdraw, on_delete=models.SET_NULL, null=True, blank=True, related_name="ledger_entries")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["wallet", "created_at"])]
+
+    def __str__(self):
+        return f"LedgerEntry({self.entry_type}) - {self.amount} - Wallet: {self.wallet_id}"
+
+
+# Bonus Job Model (all-wallet bonus credited in chunks by wallet/bonus_jobs.py)
+class BonusJob(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    chunk_size = models.PositiveIntegerField(default=2000)
+
+    # Progress cursor: wallets are credited in wallet_id order, so a resumed
+    # job continues after the last wallet of the last committed chunk
+    last_wallet_id = models.UUIDField(null=True, blank=True)
+    total_wallets = models.PositiveIntegerField(default=0)
+    processed_wallets = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"BonusJob({self.job_id}) - {self.amount} ({self.status})"
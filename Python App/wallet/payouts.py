@@ -0,0 +1,212 @@
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .ledger import debit_withdrawals, reverse_withdrawals
+from .models import Withdraw
+
+
+logger = logging.getLogger(__name__)
+
+
+# Withdrawal Payout Pipeline
+#
+# `manage.py process_payouts` settles REQUESTED withdrawals in batches:
+#   1. claim   select_for_update(skip_locked=True) a batch, stamp it with a fresh
+#              claim_token (the UPDATE only matches rows still REQUESTED), debit
+#              the wallets in bulk and move the rows to PROCESSING, all in one
+#              transaction; rows the balance cannot cover go straight to FAILED
+#   2. pay     send each claimed withdrawal to the payout provider from a
+#              bounded thread pool, outside any transaction
+#   3. settle  COMPLETED rows keep their debit, FAILED rows are credited back
+#              (WITHDRAWAL_REVERSAL ledger entries) in one bulk posting
+# Workers never see each other's rows, so throughput scales with the number of
+# processes running the command. A provider call that raises is treated as
+# transient and left PROCESSING; once it is STALE_AFTER seconds old another
+# worker claims it again and resends it under the same withdraw_id, which
+# providers use as the idempotency key of the payout.
+
+
+class InvalidTransition(Exception):
+    """
+    Raised for a status change the Withdraw state machine does not allow.
+    """
+
+
+def check_transition(withdraw, new_status):
+    if new_status not in Withdraw.TRANSITIONS:
+        raise InvalidTransition(f"Unknown withdrawal status '{new_status}'")
+    if not withdraw.can_transition(new_status):
+        raise InvalidTransition(f"Cannot move a {withdraw.status} withdrawal to {new_status}")
+
+
+@dataclass
+class PayoutResult:
+    success: bool
+    reference: str = ""
+    reason: str = ""
+
+
+class PayoutProvider:
+    """
+    Sends money to a bank account. send() must be safe to call again for the
+    same withdrawal (use withdraw_id as the provider's idempotency key) and
+    may be called from several threads at once.
+    """
+
+    def send(self, withdraw):
+        raise NotImplementedError
+
+
+class FakePayoutProvider(PayoutProvider):
+    """
+    Local stand-in for development and tests: succeeds after `latency`
+    seconds, except for account numbers starting with FAILING_PREFIX.
+    """
+
+    FAILING_PREFIX = "0000"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def send(self, withdraw):
+        if self.latency:
+            time.sleep(self.latency)
+        if withdraw.account_number.startswith(self.FAILING_PREFIX):
+            return PayoutResult(False, reason="Account rejected by bank")
+        return PayoutResult(True, reference=f"fake_{withdraw.withdraw_id.hex[:16]}")
+
+
+def _config():
+    return getattr(settings, 'PAYOUTS', {})
+
+
+def get_provider():
+    # No default: falling back to the fake would complete payouts that never send money
+    config = _config()
+    if not config.get('PROVIDER'):
+        raise ImproperlyConfigured("PAYOUTS['PROVIDER'] is not set, set PAYOUT_PROVIDER to the payout provider class")
+    provider = import_string(config['PROVIDER'])
+    return provider(**config.get('PROVIDER_OPTIONS', {}))
+
+
+def claim_batch(batch_size, stale_after=None):
+    """
+    Claim up to batch_size withdrawals for this worker and debit them.
+    Returns the claimed PROCESSING withdrawals; REQUESTED rows the wallet
+    cannot cover are failed on the spot.
+    """
+    stale_after = _config().get('STALE_AFTER', 600) if stale_after is None else stale_after
+    now = timezone.now()
+    token = uuid.uuid4()
+    stale = now - timedelta(seconds=stale_after)
+    claimable = Q(status='REQUESTED') | Q(status='PROCESSING', processing_started_at__lt=stale)
+
+    with transaction.atomic():
+        ids = list(Withdraw.objects.select_for_update(skip_locked=True).filter(claimable)
+                   .order_by('created_at').values_list('withdraw_id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        # Re-checks the status, so a row another worker took in between is skipped
+        Withdraw.objects.filter(claimable, withdraw_id__in=ids).update(claim_token=token, processing_started_at=now)
+        claimed = list(Withdraw.objects.filter(claim_token=token).order_by('created_at'))
+
+        # Retried rows were debited when they were first claimed
+        requested = [withdraw for withdraw in claimed if withdraw.status == 'REQUESTED']
+        debited, insufficient = debit_withdrawals(requested)
+        Withdraw.objects.filter(withdraw_id__in=[withdraw.pk for withdraw in debited]).update(status='PROCESSING')
+        Withdraw.objects.filter(withdraw_id__in=[withdraw.pk for withdraw in insufficient]).update(
+            status='FAILED', processed_at=now, failure_reason="Insufficient wallet balance to complete withdrawal")
+
+    for withdraw in debited:
+        withdraw.status = 'PROCESSING'
+    return [withdraw for withdraw in claimed if withdraw.status == 'PROCESSING']
+
+
+def _send(provider, withdraw):
+    try:
+        return provider.send(withdraw)
+    except Exception:
+        logger.exception("Payout of withdrawal %s failed, it will be retried", withdraw.withdraw_id)
+        return None
+
+
+def settle_batch(results):
+    """
+    Record provider results for (withdraw, PayoutResult) pairs: completed
+    payouts keep their debit, failed ones are credited back. Returns
+    (completed, failed) counts.
+    """
+    if not results:
+        return 0, 0
+    now = timezone.now()
+    with transaction.atomic():
+        # Only rows this worker still holds; a reclaimed row belongs to its new worker
+        held = set(Withdraw.objects.filter(
+            status='PROCESSING',
+            withdraw_id__in=[withdraw.pk for withdraw, _ in results],
+            claim_token__in={withdraw.claim_token for withdraw, _ in results},
+        ).values_list('withdraw_id', 'claim_token'))
+
+        completed, failed = [], []
+        for withdraw, result in results:
+            if (withdraw.pk, withdraw.claim_token) not in held:
+                continue
+            check_transition(withdraw, 'COMPLETED' if result.success else 'FAILED')
+            withdraw.processed_at = now
+            withdraw.claim_token = None
+            if result.success:
+                withdraw.status, withdraw.provider_reference = 'COMPLETED', result.reference
+                completed.append(withdraw)
+            else:
+                withdraw.status, withdraw.failure_reason = 'FAILED', result.reason
+                failed.append(withdraw)
+
+        Withdraw.objects.bulk_update(completed + failed, ['status', 'processed_at', 'claim_token',
+                                                          'provider_reference', 'failure_reason'], batch_size=500)
+        reverse_withdrawals(failed)
+    return len(completed), len(failed)
+
+
+def process_batch(batch_size=None, workers=None, provider=None):
+    """
+    Claim, pay and settle one batch. Returns {"claimed", "completed",
+    "failed", "retry"} counts; claimed is 0 when nothing is waiting.
+    """
+    config = _config()
+    batch_size = batch_size or config.get('BATCH_SIZE', 100)
+    workers = workers or config.get('WORKERS', 8)
+    provider = provider or get_provider()
+
+    claimed = claim_batch(batch_size)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        answers = list(pool.map(lambda withdraw: _send(provider, withdraw), claimed))
+
+    results = [(withdraw, result) for withdraw, result in zip(claimed, answers) if result is not None]
+    completed, failed = settle_batch(results)
+    return {"claimed": len(claimed), "completed": completed, "failed": failed,
+            "retry": len(claimed) - len(results)}
+
+
+def process_payouts(batch_size=None, workers=None, provider=None, max_batches=None):
+    # Batches until no REQUESTED withdrawal is left; returns summed counts
+    totals = {"claimed": 0, "completed": 0, "failed": 0, "retry": 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        counts = process_batch(batch_size, workers, provider)
+        if not counts["claimed"]:
+            break
+        batches += 1
+        for key, value in counts.items():
+            totals[key] += value
+    return totals
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Wallet,Withdraw
+from .models import Wallet,Withdraw,WalletStripe
+from RideHailingApp.fast_rows import RowEncoder
 
 # Wallet Serializer 
 class WalletSerializer(serializers.ModelSerializer):
@@ -7,6 +8,15 @@ class WalletSerializer(serializers.ModelSerializer):
         model = Wallet
         fields = '__all__'
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Striped wallets: balances include credits not yet folded into the row
+        if instance.stripe_count:
+            total, actual = WalletStripe.sums([instance.wallet_id]).get(instance.wallet_id, (0, 0))
+            data["total_balance"] = self.fields["total_balance"].to_representation(instance.total_balance + total)
+            data["actual_balance"] = self.fields["actual_balance"].to_representation(instance.actual_balance + actual)
+        return data
+
 
 # Withdraw Serializer 
 class WithdrawSerializer(serializers.ModelSerializer):
@@ -14,4 +24,29 @@ class WithdrawSerializer(serializers.ModelSerializer):
         model=Withdraw
         fields='__all__'
 
-        
\ No newline at end of file
+
+
+# values_list() twins of the serializers above for the read endpoints
+# (RideHailingApp/fast_rows.py); the wallet one adds the stripe sums in like
+# WalletSerializer.to_representation, one query per batch of rows
+class WalletRowEncoder(RowEncoder):
+    def adjust(self, raw_rows):
+        count_index = self.index('stripe_count')
+        striped = [self.value(raw, 'wallet_id') for raw in raw_rows if raw[count_index]]
+        if not striped:
+            return raw_rows
+        sums = {str(wallet_id): balances for wallet_id, balances in WalletStripe.sums(striped).items()}
+        total_index, actual_index = self.index('total_balance'), self.index('actual_balance')
+        adjusted = []
+        for raw in raw_rows:
+            if raw[count_index]:
+                total, actual = sums.get(self.value(raw, 'wallet_id'), (0, 0))
+                raw = list(raw)
+                raw[total_index] += total
+                raw[actual_index] += actual
+            adjusted.append(raw)
+        return adjusted
+
+
+wallet_rows = WalletRowEncoder(WalletSerializer)
+withdraw_rows = RowEncoder(WithdrawSerializer)
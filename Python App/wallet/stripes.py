@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import invalidate_wallet
+from .ledger import ZERO, LedgerPosting
+from .models import Wallet, WalletStripe
+
+
+# Striped Wallet Balances
+#
+# A fleet operator's wallet can take hundreds of concurrent ride payments, and
+# every one of them locks and updates the same Wallet row. With WALLET_STRIPES
+# enabled, a wallet given stripe_count = K gets K WalletStripe rows:
+#   - card/UPI credits increment the stripe picked by the payment id, so K
+#     payments can commit side by side (wallet.ledger.record_striped_payment)
+#   - cash payments, withdrawals and bonuses still lock the wallet row; their
+#     balance checks add the stripe sums in (wallet.ledger.add_stripe_sums)
+#   - reads (WalletSerializer, and so the wallet read cache) report row +
+#     stripes; credits invalidate the cached entry like any other posting
+#   - `manage.py compact_wallet_stripes` periodically folds the stripes back
+#     into the row and settles pending deductions a striped credit skipped
+# Folding moves money between rows of the same wallet, so it writes no
+# ledger entries: the ledger still sums to row + stripes at all times.
+
+
+def _fold(wallet_id):
+    """
+    Move a locked wallet's stripe balances into its row. The stripes are
+    locked too, so a credit in flight either commits before the fold reads
+    its stripe or waits for the fold to commit.
+    """
+    stripes = list(WalletStripe.objects.select_for_update().filter(wallet_id=wallet_id)
+                   .order_by('stripe').values_list('pk', 'total_balance', 'actual_balance'))
+    total = sum((row[1] for row in stripes), ZERO)
+    actual = sum((row[2] for row in stripes), ZERO)
+    if not total and not actual:
+        return False
+    now = timezone.now()
+    WalletStripe.objects.filter(pk__in=[row[0] for row in stripes]).update(
+        total_balance=ZERO, actual_balance=ZERO, updated_at=now)
+    Wallet.objects.filter(wallet_id=wallet_id).update(
+        total_balance=F('total_balance') + total, actual_balance=F('actual_balance') + actual, updated_at=now)
+    return True
+
+
+@transaction.atomic
+def compact_wallet(wallet_id):
+    # Fold one wallet's stripes and settle what it owes; True when anything moved
+    driver_id = Wallet.objects.select_for_update().values_list('driver_id', flat=True).get(wallet_id=wallet_id)
+    folded = _fold(wallet_id)
+    posting = LedgerPosting(wallet_id)
+    posting.settle_pending()
+    posting.commit()
+    if folded:
+        invalidate_wallet(driver_id)
+    return folded or bool(posting.entries)
+
+
+def compact_stripes(batch_size=500):
+    """
+    Compact every wallet with unfolded stripe balances, one short
+    transaction per wallet. Returns the number of wallets compacted.
+    """
+    wallet_ids = list(WalletStripe.objects.filter(~Q(total_balance=0) | ~Q(actual_balance=0))
+                      .order_by('wallet_id').values_list('wallet_id', flat=True).distinct()[:batch_size])
+    return sum(1 for wallet_id in wallet_ids if compact_wallet(wallet_id))
+
+
+@transaction.atomic
+def set_stripe_count(wallet_id, count):
+    """
+    Give a wallet `count` stripes (0 turns striping off). Existing stripes
+    are folded into the row first.
+    """
+    wallet = Wallet.objects.select_for_update().get(wallet_id=wallet_id)
+    _fold(wallet_id)
+    WalletStripe.objects.filter(wallet_id=wallet_id).delete()
+    WalletStripe.objects.bulk_create([WalletStripe(wallet_id=wallet_id, stripe=stripe) for stripe in range(count)])
+    Wallet.objects.filter(wallet_id=wallet_id).update(stripe_count=count, updated_at=timezone.now())
+    invalidate_wallet(wallet.driver_id)
+    return count
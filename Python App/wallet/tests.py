@@ -1,3 +1,756 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+from django.urls import reverse
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import Sum
+from decimal import Decimal
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
-# Create your tests here.
+from .models import Wallet, Withdraw, WalletLedgerEntry, WalletStripe, BonusJob
+from .bonus_jobs import create_bonus_job, run_bonus_chunk
+from . import cache as wallet_cache
+from .payouts import (FakePayoutProvider, PayoutProvider, PayoutResult, claim_batch, process_batch,
+                      process_payouts, settle_batch)
+from .stripes import compact_stripes, set_stripe_count
+from .ledger import record_withdrawal
+from payments.models import Payment
+from RideHailingApp.query_plans import QueryPlanAssertionsMixin, seed_dataset
+from Admin.models import Admin
+from Admin.tokens import auth_header, revocations
+from RideHailingApp.db_router import allow_replica_reads, request_scope, sync_sqlite_replica
+
+
+# Client for the admin-only endpoints (the admin never has to be saved)
+def admin_client():
+    return Client(headers=auth_header(Admin(name="Test Admin", email="admin@example.com")))
+
+
+def make_payment(wallet, amount, method="CARD"):
+    return Payment.objects.create(
+        wallet=wallet,
+        ride_id=uuid.uuid4(),
+        rider_id=uuid.uuid4(),
+        driver_id=wallet.driver_id,
+        amount=Decimal(amount),
+        payment_method=method,
+        status="SUCCESS"
+    )
+
+
+class WalletLedgerTests(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+
+    def assertLedgerMatchesWallet(self, wallet):
+        # Balances must always equal the sum of their ledger deltas
+        wallet.refresh_from_db()
+        sums = wallet.ledger_entries.aggregate(
+            total=Sum("total_delta"), actual=Sum("actual_delta"), pending=Sum("a_deduct_delta"))
+        self.assertEqual(wallet.total_balance, sums["total"] or 0)
+        self.assertEqual(wallet.actual_balance, sums["actual"] or 0)
+        self.assertEqual(wallet.a_deduct, sums["pending"] or 0)
+
+    def test_card_payment_credits_net_of_fee(self):
+        payment = make_payment(self.wallet, "100.00")
+        payment.process_wallet_update()
+
+        self.assertEqual(self.wallet.total_balance, Decimal("100.00"))
+        self.assertEqual(self.wallet.actual_balance, Decimal("95.00"))
+        entries = list(payment.ledger_entries.order_by("entry_type").values_list("entry_type", "amount"))
+        self.assertEqual(entries, [("CREDIT", Decimal("100.00")), ("FEE", Decimal("5.00"))])
+        self.assertLedgerMatchesWallet(self.wallet)
+
+    def test_cash_fee_is_deferred_then_settled(self):
+        make_payment(self.wallet, "200.00", method="CASH").process_wallet_update()
+        self.assertEqual(self.wallet.a_deduct, Decimal("10.00"))
+        self.assertEqual(self.wallet.actual_balance, Decimal("0.00"))
+
+        make_payment(self.wallet, "100.00").process_wallet_update()
+        self.assertEqual(self.wallet.a_deduct, Decimal("0.00"))
+        self.assertEqual(self.wallet.actual_balance, Decimal("85.00"))
+        self.assertEqual(self.wallet.total_balance, Decimal("300.00"))
+        self.assertLedgerMatchesWallet(self.wallet)
+
+    def test_stale_instances_do_not_lose_updates(self):
+        first = make_payment(Wallet.objects.get(pk=self.wallet.pk), "100.00")
+        second = make_payment(Wallet.objects.get(pk=self.wallet.pk), "50.00")
+        first.process_wallet_update()
+        second.process_wallet_update()
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.total_balance, Decimal("150.00"))
+        self.assertEqual(self.wallet.actual_balance, Decimal("142.50"))
+        self.assertLedgerMatchesWallet(self.wallet)
+
+
+@override_settings(BONUS_JOB_RUN_IN_BACKGROUND=False)
+class AdminBonusTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(
+            driver_id=uuid.uuid4(),
+            total_balance=Decimal("100.00"),
+            actual_balance=Decimal("50.00"),
+            a_deduct=Decimal("30.00")
+        )
+
+    def test_bonus_is_netted_against_pending_deduction(self):
+        response = self.client.post(reverse('single-bonus-add', args=[self.wallet.wallet_id]),
+                                    data={"amount": "20"}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.total_balance, Decimal("120.00"))
+        self.assertEqual(self.wallet.actual_balance, Decimal("50.00"))
+        self.assertEqual(self.wallet.a_deduct, Decimal("10.00"))
+
+    def test_bulk_bonus_skips_inactive_wallets(self):
+        inactive = Wallet.objects.create(driver_id=uuid.uuid4(), is_active=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('multiple-bonus-add'), data={"amount": "40"},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+
+        self.wallet.refresh_from_db()
+        inactive.refresh_from_db()
+        self.assertEqual(self.wallet.actual_balance, Decimal("60.00"))
+        self.assertEqual(self.wallet.a_deduct, Decimal("0.00"))
+        self.assertEqual(inactive.total_balance, Decimal("0.00"))
+        self.assertEqual(WalletLedgerEntry.objects.filter(entry_type="BONUS").count(), 1)
+
+    def test_unknown_wallet_returns_404(self):
+        response = self.client.post(reverse('single-bonus-add', args=[uuid.uuid4()]),
+                                    data={"amount": "20"}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(BONUS_JOB_RUN_IN_BACKGROUND=False)
+class BonusJobTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        # a_deduct above, below and without the 20.00 bonus
+        self.wallets = [
+            Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("10.00"), a_deduct=Decimal(pending))
+            for pending in ("30.00", "5.00", "0.00", "0.00", "0.00")
+        ]
+
+    def test_job_credits_all_wallets_in_chunks(self):
+        with self.settings(BONUS_JOB_CHUNK_SIZE=2), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('multiple-bonus-add'), data={"amount": "20"},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+
+        progress = self.client.get(reverse('bonus-job-status', args=[response.json()["job_id"]])).json()
+        self.assertEqual(progress["status"], "COMPLETED")
+        self.assertEqual(progress["processed_wallets"], 5)
+        self.assertEqual(progress["percent"], 100.0)
+
+        balances = [Wallet.objects.values_list("actual_balance", "a_deduct", "total_balance").get(pk=w.pk)
+                    for w in self.wallets]
+        self.assertEqual(balances[0], (Decimal("10.00"), Decimal("10.00"), Decimal("20.00")))
+        self.assertEqual(balances[1], (Decimal("25.00"), Decimal("0.00"), Decimal("20.00")))
+        self.assertEqual(balances[2], (Decimal("30.00"), Decimal("0.00"), Decimal("20.00")))
+
+    def test_resume_after_crash_credits_each_wallet_once(self):
+        job = create_bonus_job(Decimal("20.00"), chunk_size=2)
+        run_bonus_chunk(job.job_id)
+        # Runner dies after the first chunk
+        BonusJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=30))
+
+        call_command('resume_bonus_jobs', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "COMPLETED")
+        self.assertEqual(job.processed_wallets, 5)
+        self.assertEqual(WalletLedgerEntry.objects.filter(entry_type="BONUS").count(), 5)
+        self.assertEqual(WalletLedgerEntry.objects.values("wallet").distinct().count(), 5)
+
+    def test_wallets_opened_after_the_job_are_skipped(self):
+        job = create_bonus_job(Decimal("20.00"))
+        late = Wallet.objects.create(driver_id=uuid.uuid4())
+        Wallet.objects.filter(pk=late.pk).update(created_at=job.created_at + timedelta(seconds=1))
+        run_bonus_chunk(job.job_id)
+
+        late.refresh_from_db()
+        self.assertEqual(late.total_balance, Decimal("0.00"))
+
+
+@override_settings(BONUS_JOB_RUN_IN_BACKGROUND=False, BONUS_JOB_CHUNK_SIZE=2)
+class InlineBonusJobTests(TransactionTestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.wallets = [Wallet.objects.create(driver_id=uuid.uuid4()) for _ in range(5)]
+
+    def test_chunks_commit_outside_the_request_transaction(self):
+        from .ledger import credit_bonus
+        calls = []
+
+        def credit_then_fail(rows, amount):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return credit_bonus(rows, amount)
+
+        with patch('wallet.bonus_jobs.credit_bonus', side_effect=credit_then_fail), \
+                self.assertLogs('wallet.bonus_jobs', level='ERROR'):
+            response = self.client.post(reverse('multiple-bonus-add'), data={"amount": "20"},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+
+        # The first chunk committed on its own and the job can resume after it
+        job = BonusJob.objects.get()
+        self.assertEqual((job.status, job.processed_wallets), ("FAILED", 2))
+        self.assertEqual(WalletLedgerEntry.objects.filter(entry_type="BONUS").count(), 2)
+
+
+class WithdrawStatusTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("50.00"))
+
+    def make_withdraw(self, amount):
+        return Withdraw.objects.create(
+            wallet=self.wallet, amount=Decimal(amount), account_holder_name="Driver",
+            bank_name="Bank", ifsc_code="IFSC0001", account_number="1234567890")
+
+    def test_withdrawal_is_debited_through_ledger(self):
+        withdraw = self.make_withdraw("20.00")
+        response = self.client.patch(reverse('withdraw-update-status', args=[withdraw.withdraw_id]),
+                                     data={"status": "COMPLETED"}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["wallet_balance"], "30.00")
+        self.assertTrue(withdraw.ledger_entries.filter(entry_type="WITHDRAWAL", actual_delta=Decimal("-20.00")).exists())
+
+    def test_insufficient_balance_leaves_status_unchanged(self):
+        withdraw = self.make_withdraw("80.00")
+        response = self.client.patch(reverse('withdraw-update-status', args=[withdraw.withdraw_id]),
+                                     data={"status": "COMPLETED"}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        withdraw.refresh_from_db()
+        self.assertEqual(withdraw.status, "REQUESTED")
+        self.assertFalse(WalletLedgerEntry.objects.exists())
+
+
+class PayoutPipelineTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("100.00"))
+        self.provider = FakePayoutProvider()
+
+    def make_withdraw(self, amount, account_number="1234567890", wallet=None):
+        return Withdraw.objects.create(
+            wallet=wallet or self.wallet, amount=Decimal(amount), account_holder_name="Driver",
+            bank_name="Bank", ifsc_code="IFSC0001", account_number=account_number)
+
+    def test_batch_is_paid_and_debited(self):
+        withdrawals = [self.make_withdraw("20.00") for _ in range(3)]
+        totals = process_payouts(batch_size=2, workers=2, provider=self.provider)
+        self.assertEqual(totals, {"claimed": 3, "completed": 3, "failed": 0, "retry": 0})
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.actual_balance, Decimal("40.00"))
+        for withdraw in withdrawals:
+            withdraw.refresh_from_db()
+            self.assertEqual(withdraw.status, "COMPLETED")
+            self.assertTrue(withdraw.provider_reference.startswith("fake_"))
+            self.assertIsNone(withdraw.claim_token)
+        self.assertEqual(WalletLedgerEntry.objects.filter(entry_type="WITHDRAWAL").count(), 3)
+
+    def test_rejected_payout_is_credited_back(self):
+        withdraw = self.make_withdraw("30.00", account_number="0000111122")
+        self.assertEqual(process_batch(provider=self.provider)["failed"], 1)
+        withdraw.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual(withdraw.status, "FAILED")
+        self.assertEqual(withdraw.failure_reason, "Account rejected by bank")
+        self.assertEqual(self.wallet.actual_balance, Decimal("100.00"))
+        self.assertEqual(withdraw.ledger_entries.filter(entry_type="WITHDRAWAL_REVERSAL").count(), 1)
+
+    def test_withdrawals_beyond_the_balance_fail(self):
+        covered, uncovered = self.make_withdraw("70.00"), self.make_withdraw("70.00")
+        process_batch(provider=self.provider)
+        covered.refresh_from_db()
+        uncovered.refresh_from_db()
+        self.assertEqual((covered.status, uncovered.status), ("COMPLETED", "FAILED"))
+        self.assertFalse(uncovered.ledger_entries.exists())
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.actual_balance, Decimal("30.00"))
+
+    def test_claimed_rows_are_not_claimed_again(self):
+        for _ in range(4):
+            self.make_withdraw("5.00")
+        first, second = claim_batch(3), claim_batch(3)
+        self.assertEqual((len(first), len(second)), (3, 1))
+        self.assertFalse({w.pk for w in first} & {w.pk for w in second})
+        self.assertEqual(claim_batch(3), [])
+
+    def test_transient_error_is_retried_without_second_debit(self):
+        class FlakyProvider(PayoutProvider):
+            calls = 0
+
+            def send(self, withdraw):
+                FlakyProvider.calls += 1
+                if FlakyProvider.calls == 1:
+                    raise ConnectionError("bank timeout")
+                return PayoutResult(True, reference="ref-1")
+
+        withdraw = self.make_withdraw("25.00")
+        with self.assertLogs('wallet.payouts', level='ERROR'):
+            self.assertEqual(process_batch(provider=FlakyProvider())["retry"], 1)
+        withdraw.refresh_from_db()
+        self.assertEqual(withdraw.status, "PROCESSING")
+
+        retried = claim_batch(10, stale_after=0)
+        self.assertEqual([w.pk for w in retried], [withdraw.pk])
+        settle_batch([(retried[0], FlakyProvider().send(retried[0]))])
+        withdraw.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual(withdraw.status, "COMPLETED")
+        self.assertEqual(self.wallet.actual_balance, Decimal("75.00"))
+        self.assertEqual(withdraw.ledger_entries.count(), 1)
+
+    def test_reclaimed_row_is_settled_by_its_new_worker_only(self):
+        self.make_withdraw("10.00")
+        [stale] = claim_batch(1)
+        [current] = claim_batch(1, stale_after=0)
+        self.assertEqual(settle_batch([(stale, PayoutResult(False, reason="late answer"))]), (0, 0))
+        self.assertEqual(settle_batch([(current, PayoutResult(True, reference="ref"))]), (1, 0))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.actual_balance, Decimal("90.00"))
+
+    def test_claimed_row_cannot_be_changed_by_hand(self):
+        withdraw = self.make_withdraw("40.00")
+        claim_batch(1)
+        response = self.client.patch(reverse('withdraw-update-status', args=[withdraw.withdraw_id]),
+                                     data={"status": "FAILED"}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        withdraw.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual(withdraw.status, "PROCESSING")
+        self.assertEqual(self.wallet.actual_balance, Decimal("60.00"))
+        self.assertFalse(withdraw.ledger_entries.filter(entry_type="WITHDRAWAL_REVERSAL").exists())
+
+    @override_settings(PAYOUTS={'PROVIDER': 'wallet.payouts.FakePayoutProvider'})
+    def test_command(self):
+        self.make_withdraw("10.00")
+        out = StringIO()
+        call_command('process_payouts', stdout=out)
+        self.assertIn("1 completed", out.getvalue())
+
+    @override_settings(PAYOUTS={'PROVIDER': ''})
+    def test_command_requires_a_provider(self):
+        withdraw = self.make_withdraw("10.00")
+        with self.assertRaises(ImproperlyConfigured):
+            call_command('process_payouts', stdout=StringIO())
+        withdraw.refresh_from_db()
+        self.assertEqual(withdraw.status, "REQUESTED")
+
+    def test_status_endpoint_follows_the_state_machine(self):
+        withdraw = self.make_withdraw("10.00")
+        url = reverse('withdraw-update-status', args=[withdraw.withdraw_id])
+        response = self.client.patch(url, data={"status": "DONE"}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.patch(url, data={"status": "processing"}, content_type='application/json')
+        self.assertEqual(response.json()["wallet_balance"], "90.00")
+        response = self.client.patch(url, data={"status": "FAILED"}, content_type='application/json')
+        self.assertEqual(response.json()["wallet_balance"], "100.00")
+        response = self.client.patch(url, data={"status": "COMPLETED"}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class WalletListingTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        for _ in range(3):
+            Wallet.objects.create(driver_id=uuid.uuid4())
+
+    def test_wallet_list_pages_and_streams(self):
+        first = self.client.get(reverse('get-all-wallet'), {"limit": 2}).json()
+        self.assertEqual(len(first["results"]), 2)
+        second = self.client.get(reverse('get-all-wallet'), {"limit": 2, "cursor": first["next"]}).json()
+        self.assertEqual(len(second["results"]), 1)
+        self.assertIsNone(second["next"])
+
+        response = self.client.get(reverse('get-all-wallet'), {"stream": "ndjson"})
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 3)
+
+
+class FastReadPathTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), total_balance=Decimal("12.5"),
+                                            actual_balance=Decimal("3"))
+        Wallet.objects.create(driver_id=uuid.uuid4(), is_active=False)
+        Withdraw.objects.create(wallet=self.wallet, amount=Decimal("5"), account_holder_name="Ra\u2028vi \"K\"",
+                                bank_name="Bänk\n", ifsc_code="IFSC0001", account_number="1234567890")
+        Withdraw.objects.create(wallet=self.wallet, amount=Decimal("1.25"), account_holder_name="Driver",
+                                bank_name="Bank", ifsc_code="IFSC0001", account_number="1", contact_info="x",
+                                status="COMPLETED", processed_at=timezone.now(), claim_token=uuid.uuid4())
+
+    def fetch_both(self, url, params=None):
+        # (serializer path, fast path) response bodies
+        bodies = []
+        for enabled in (False, True):
+            with override_settings(FAST_READS_ENABLED=enabled):
+                response = self.client.get(url, params or {})
+            self.assertEqual(response.status_code, 200)
+            bodies.append(b"".join(response.streaming_content) if response.streaming else response.content)
+        return bodies
+
+    def test_wallet_list_is_byte_identical(self):
+        for params in ({}, {"limit": 1}, {"stream": "ndjson"}):
+            slow, fast = self.fetch_both(reverse('get-all-wallet'), params)
+            self.assertEqual(slow, fast, params)
+
+    def test_striped_wallet_list_adds_stripe_sums(self):
+        set_stripe_count(self.wallet.wallet_id, 2)
+        WalletStripe.objects.filter(wallet=self.wallet, stripe=1).update(total_balance=Decimal("7.25"),
+                                                                          actual_balance=Decimal("7.25"))
+        slow, fast = self.fetch_both(reverse('get-all-wallet'))
+        self.assertEqual(slow, fast)
+        self.assertIn('"total_balance":"19.75"', fast.decode())
+
+    def test_withdrawal_lists_are_byte_identical(self):
+        for url in (reverse('get_all_withdraw_req'), reverse('withdraw-list-create', args=[self.wallet.driver_id])):
+            slow, fast = self.fetch_both(url)
+            self.assertEqual(slow, fast, url)
+        self.assertIn(b"\\u2028", fast)
+
+
+class WalletConditionalGetTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        self.url = reverse('wallet-operations', args=[self.wallet.driver_id])
+
+    def test_polling_gets_not_modified_until_the_wallet_changes(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header("Last-Modified"))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_payment(self.wallet, "100.00").process_wallet_update()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["total_balance"], "100.00")
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+    @override_settings(WALLET_STRIPES={'ENABLED': True})
+    def test_striped_credits_change_the_validator(self):
+        set_stripe_count(self.wallet.wallet_id, 2)
+        caches['default'].clear()
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            make_payment(self.wallet, "100.00").process_wallet_update()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["total_balance"], "100.00")
+
+    def test_missing_wallet_has_no_validators(self):
+        response = self.client.get(reverse('wallet-operations', args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+
+
+@override_settings(WALLET_CACHE={'ENABLED': True})
+class WalletQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.wallets = seed_dataset(wallets=2000)
+        cls.driver_id = next(w.driver_id for w in cls.wallets if w.is_active)
+
+    def setUp(self):
+        self.client = admin_client()
+        # Fresh revocation list, the budgets below don't count its refresh
+        revocations.sync()
+        # Measure the database path, not wallet cache hits left by other tests
+        caches['default'].clear()
+
+    def test_wallet_by_driver(self):
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.get(reverse('wallet-operations', args=[self.driver_id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_wallet_by_driver_not_modified(self):
+        etag = self.client.get(reverse('wallet-operations', args=[self.driver_id]))["ETag"]
+        with self.assertIndexedQueries(max_queries=0):
+            response = self.client.get(reverse('wallet-operations', args=[self.driver_id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_open_wallet_for_existing_driver(self):
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.post(reverse('wallet-operations', args=[self.driver_id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_wallet_list_page(self):
+        first = self.client.get(reverse('get-all-wallet'), {"limit": 50}).json()
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.get(reverse('get-all-wallet'), {"limit": 50, "cursor": first["next"]})
+        self.assertEqual(len(response.json()["results"]), 50)
+
+    def test_wallet_stream_reads_in_index_order(self):
+        # The stream returns every wallet, but must not sort them in a temp table
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.get(reverse('get-all-wallet'), {"stream": "ndjson"})
+            lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 2000)
+
+    def test_withdrawals_for_driver(self):
+        with self.assertIndexedQueries(max_queries=2):
+            response = self.client.get(reverse('withdraw-list-create', args=[self.driver_id]))
+        self.assertEqual(len(response.json()), 1)
+
+    def test_pending_withdrawals(self):
+        with self.assertIndexedQueries(max_queries=1):
+            response = self.client.get(reverse('get_all_withdraw_req'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_withdraw_request(self):
+        Wallet.objects.filter(driver_id=self.driver_id).update(actual_balance=Decimal("100.00"))
+        Withdraw.objects.filter(wallet__driver_id=self.driver_id).update(status="COMPLETED")
+        # wallet lookup, balance under the row lock, pending check, insert
+        with self.assertIndexedQueries(max_queries=4):
+            response = self.client.post(reverse('withdraw-list-create', args=[self.driver_id]), data={
+                "amount": "20", "account_holder_name": "Driver", "bank_name": "Bank",
+                "ifsc_code": "IFSC0001", "account_number": "1234567890"}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # A second SQLite file as the replica, refreshed from the primary only by
+    # sync_sqlite_replica(), so any lag is under the test's control
+    def setUp(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # Added to this thread's connections only, the test databases stay as they are
+        connections['replica'] = DatabaseWrapper({**connections['default'].settings_dict,
+                                                  'NAME': os.path.join(directory, 'replica.sqlite3')}, 'replica')
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(connections['replica'].close)
+        caches['default'].clear()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("100.00"))
+        sync_sqlite_replica('replica')
+        # The replica now lags one write behind
+        Wallet.objects.filter(pk=self.wallet.pk).update(actual_balance=Decimal("250.00"))
+
+    def balance(self):
+        return Wallet.objects.get(pk=self.wallet.pk).actual_balance
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_listings_read_from_the_replica(self):
+        client = admin_client()
+        listed = client.get(reverse('get-all-wallet')).json()
+        self.assertEqual(listed[0]["actual_balance"], "100.00")
+        lines = b"".join(client.get(reverse('get-all-wallet'), {"stream": "ndjson"}).streaming_content).splitlines()
+        self.assertIn('"actual_balance":"100.00"', lines[0].decode())
+        # A driver's own wallet, and anything outside a request, stays on the primary
+        response = client.get(reverse('wallet-operations', args=[self.wallet.driver_id]))
+        self.assertEqual(response.json()["actual_balance"], "250.00")
+        self.assertEqual(self.balance(), Decimal("250.00"))
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_no_stale_read_after_a_write_in_the_same_request(self):
+        with request_scope():
+            allow_replica_reads()
+            self.assertEqual(self.balance(), Decimal("100.00"))
+            Wallet.objects.filter(pk=self.wallet.pk).update(actual_balance=Decimal("300.00"))
+            self.assertEqual(self.balance(), Decimal("300.00"))
+            # Pinned: reads stay on the primary for the rest of the request
+            allow_replica_reads()
+            self.assertEqual(self.balance(), Decimal("300.00"))
+
+        with request_scope():
+            allow_replica_reads()
+            with transaction.atomic():
+                self.assertEqual(self.balance(), Decimal("300.00"))
+            self.assertEqual(self.balance(), Decimal("300.00"))
+
+        # The next request starts on the replica again
+        with request_scope():
+            allow_replica_reads()
+            self.assertEqual(self.balance(), Decimal("100.00"))
+
+
+@override_settings(WALLET_CACHE={'ENABLED': True})
+class WalletCacheTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        wallet_cache.stats.reset()
+        self.client = admin_client()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("500.00"))
+
+    def cached_wallet(self):
+        response = self.client.get(reverse('wallet-operations', args=[self.wallet.driver_id]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertFresh(self):
+        # What the cache serves must match the committed row
+        served = self.cached_wallet()
+        self.wallet.refresh_from_db()
+        for field in ("total_balance", "actual_balance", "a_deduct"):
+            self.assertEqual(Decimal(served[field]), getattr(self.wallet, field), field)
+        self.assertEqual(served["is_active"], self.wallet.is_active)
+
+    def test_no_stale_balance_after_committed_writes(self):
+        rng = random.Random(11)
+        writes = [
+            lambda: make_payment(self.wallet, f"{rng.randint(10, 300)}.00",
+                                 method=rng.choice(["CARD", "UPI", "CASH"])).process_wallet_update(),
+            lambda: self.client.post(reverse('single-bonus-add', args=[self.wallet.wallet_id]),
+                                     data={"amount": "15"}, content_type='application/json'),
+            lambda: self.client.patch(reverse('withdraw-update-status', args=[Withdraw.objects.create(
+                wallet=self.wallet, amount=Decimal("5.00"), account_holder_name="Driver", bank_name="Bank",
+                ifsc_code="IFSC0001", account_number="1234567890").withdraw_id]),
+                data={"status": "COMPLETED"}, content_type='application/json'),
+        ]
+        self.assertFresh()
+        for _ in range(30):
+            self.cached_wallet()
+            rng.choice(writes)()
+            self.assertFresh()
+
+        with override_settings(BONUS_JOB_RUN_IN_BACKGROUND=False):
+            self.client.post(reverse('multiple-bonus-add'), data={"amount": "7"}, content_type='application/json')
+        self.assertFresh()
+
+        self.client.patch(reverse('wallet-operations', args=[self.wallet.driver_id]))
+        self.assertFresh()
+
+        stats = self.client.get(reverse('wallet-cache-stats')).json()
+        self.assertGreater(stats["hits"], 0)
+        self.assertGreater(stats["invalidations"], 30)
+
+    def test_withdrawal_is_checked_against_the_database(self):
+        self.assertEqual(self.cached_wallet()["actual_balance"], "500.00")
+        # A write the cache never heard of, as from another worker with its own cache
+        Wallet.objects.filter(pk=self.wallet.pk).update(actual_balance=Decimal("10.00"))
+        response = self.client.post(reverse('withdraw-list-create', args=[self.wallet.driver_id]), data={
+            "amount": "100", "account_holder_name": "Driver", "bank_name": "Bank",
+            "ifsc_code": "IFSC0001", "account_number": "1234567890"}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Withdraw.objects.exists())
+
+    def test_repeat_reads_are_served_from_cache(self):
+        self.cached_wallet()
+        with self.assertNumQueries(0):
+            self.cached_wallet()
+        self.assertEqual(wallet_cache.stats.as_dict()["hit_rate"], 0.5)
+
+    def test_concurrent_misses_load_once(self):
+        loads = []
+        real_load = wallet_cache.load_wallet_entry
+
+        def slow_load(driver_id):
+            loads.append(driver_id)
+            time.sleep(0.05)
+            return real_load(driver_id)
+
+        with patch.object(wallet_cache, 'load_wallet_entry', side_effect=slow_load), \
+                override_settings(WALLET_CACHE={'LOCK_WAIT': 2}):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                entries = list(pool.map(lambda _: wallet_cache.get_wallet_entry(self.wallet.driver_id), range(8)))
+
+        self.assertEqual(len(loads), 1)
+        self.assertTrue(all(entry["wallet_id"] == str(self.wallet.wallet_id) for entry in entries))
+        self.assertEqual(wallet_cache.stats.wait_hits, 7)
+
+
+class WithdrawIdempotencyTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4(), actual_balance=Decimal("500.00"))
+        self.payload = {"amount": "100.00", "account_holder_name": "Driver", "bank_name": "Bank",
+                        "ifsc_code": "IFSC0001", "account_number": "1234567890"}
+
+    def test_duplicate_withdraw_request_is_replayed(self):
+        responses = [
+            self.client.post(reverse('withdraw-list-create', args=[self.wallet.driver_id]), data=self.payload,
+                             content_type='application/json', headers={"Idempotency-Key": "withdraw-key"})
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[1].json(), responses[0].json())
+        self.assertEqual(Withdraw.objects.count(), 1)
+
+
+@override_settings(WALLET_STRIPES={'ENABLED': True})
+class StripedWalletTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.wallet = Wallet.objects.create(driver_id=uuid.uuid4())
+        set_stripe_count(self.wallet.wallet_id, 4)
+
+    def stripe_totals(self):
+        return WalletStripe.sums([self.wallet.wallet_id]).get(self.wallet.wallet_id)
+
+    def ledger_total(self, field):
+        return WalletLedgerEntry.objects.filter(wallet=self.wallet).aggregate(total=Sum(field))["total"]
+
+    def test_card_credits_go_to_stripes(self):
+        for _ in range(8):
+            make_payment(self.wallet, "100.00").process_wallet_update()
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.total_balance, self.wallet.actual_balance), (Decimal("0"), Decimal("0")))
+        self.assertEqual(self.stripe_totals(), (Decimal("800.00"), Decimal("760.00")))
+        self.assertEqual(self.ledger_total("actual_delta"), Decimal("760.00"))
+
+        # Reads, cached or not, report the row plus its stripes
+        response = self.client.get(f"/wallet/driver-wallet/{self.wallet.driver_id}/")
+        self.assertEqual((response.json()["total_balance"], response.json()["actual_balance"]), ("800.00", "760.00"))
+
+    def test_debits_see_the_stripes(self):
+        make_payment(self.wallet, "100.00").process_wallet_update()
+        # Cash fee is taken from the striped 95.00 instead of being deferred
+        make_payment(self.wallet, "40.00", method="CASH").process_wallet_update()
+        withdraw = Withdraw.objects.create(wallet=self.wallet, amount=Decimal("90.00"), account_holder_name="Driver",
+                                           bank_name="Bank", ifsc_code="IFSC0001", account_number="1234567890")
+        record_withdrawal(withdraw)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.a_deduct, Decimal("0"))
+        total, actual = self.stripe_totals()
+        self.assertEqual(self.wallet.actual_balance + actual, Decimal("3.00"))
+        self.assertEqual(self.wallet.actual_balance + actual, self.ledger_total("actual_delta"))
+
+    def test_compaction_folds_stripes_and_settles_pending(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(a_deduct=Decimal("10.00"))
+        make_payment(self.wallet, "100.00").process_wallet_update()
+
+        self.assertEqual(compact_stripes(), 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.stripe_totals(), (Decimal("0"), Decimal("0")))
+        self.assertEqual(self.wallet.total_balance, Decimal("100.00"))
+        self.assertEqual(self.wallet.actual_balance, Decimal("85.00"))
+        self.assertEqual(self.wallet.a_deduct, Decimal("0"))
+        self.assertEqual(compact_stripes(), 0)
+
+    def test_turning_striping_off_folds_the_stripes(self):
+        make_payment(self.wallet, "100.00").process_wallet_update()
+        set_stripe_count(self.wallet.wallet_id, 0)
+        make_payment(self.wallet, "100.00").process_wallet_update()
+        self.wallet.refresh_from_db()
+        self.assertFalse(WalletStripe.objects.filter(wallet=self.wallet).exists())
+        self.assertEqual(self.wallet.actual_balance, Decimal("190.00"))
+
+    @override_settings(WALLET_STRIPES={'ENABLED': False})
+    def test_disabled_mode_uses_the_wallet_row(self):
+        make_payment(self.wallet, "100.00").process_wallet_update()
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.actual_balance, Decimal("95.00"))
+        self.assertEqual(self.stripe_totals(), (Decimal("0"), Decimal("0")))
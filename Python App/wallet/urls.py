@@ -1,6 +1,6 @@
 
 from django.urls import path
-from .views import Wallet_Oprs,Withdraw_Oprs,Admin_Bonus
+from .views import Wallet_Oprs,Withdraw_Oprs,Admin_Bonus,BonusJobStatusView,WalletCacheStatsView
 
 urlpatterns = [
      
@@ -14,5 +14,8 @@ urlpatterns = [
     path('withdraw/status/<uuid:withdraw_id>/', Withdraw_Oprs.as_view(), name='withdraw-update-status'),
 
     path('bonus/<uuid:wallet_id>/',Admin_Bonus.as_view(),name='single-bonus-add'),
-    path('bonus/',Admin_Bonus.as_view(),name='multiple-bonus-add')
+    path('bonus/',Admin_Bonus.as_view(),name='multiple-bonus-add'),
+    path('bonus/jobs/<uuid:job_id>/',BonusJobStatusView.as_view(),name='bonus-job-status'),
+
+    path('cache-stats/',WalletCacheStatsView.as_view(),name='wallet-cache-stats'),
 ]
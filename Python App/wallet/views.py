@@ -3,73 +3,130 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Wallet,Withdraw
-from .serializers import WalletSerializer,WithdrawSerializer
+from .serializers import WalletSerializer,WithdrawSerializer,wallet_rows,withdraw_rows
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.utils import timezone
  
 from decimal import Decimal
+from .ledger import InsufficientBalance, LedgerPosting, apply_bonus, record_withdrawal, reverse_withdrawals
+from .payouts import InvalidTransition, check_transition
+from .bonus_jobs import create_bonus_job, job_progress, start_bonus_job
+from .cache import get_wallet_entry, invalidate_wallet, stats as wallet_cache_stats
+from .models import BonusJob
+from RideHailingApp.pagination import KeysetPagination, ndjson_response, ndjson_rows_response, wants_ndjson
+from RideHailingApp.fast_rows import FAST_RENDERER_CLASSES, use_fast_rows
+from RideHailingApp.conditional import conditional_response
+from RideHailingApp.db_router import replica_reads
+from payments.idempotency import idempotent
+from Admin.authentication import ADMIN_AUTHENTICATION, ADMIN_PERMISSIONS
  
 
 
 # all the apis with single view
+@replica_reads(when=lambda request, driver_id=None: driver_id is None)
 class Wallet_Oprs(APIView):
+    renderer_classes = FAST_RENDERER_CLASSES
+    row_encoder = wallet_rows
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
+
+    # Listing every wallet is for admins, a driver's own wallet is not
+    def requires_admin(self, request):
+        return request.method == 'GET' and 'driver_id' not in self.kwargs
+
     def get(self, request, driver_id=None):
-        if driver_id:  # If a driver_id is provided, return that wallet
-            wallet = Wallet.objects.filter(driver_id=driver_id).first()
-            if not wallet:
+        if driver_id:  # If a driver_id is provided, return that wallet (read-through cache)
+            entry = get_wallet_entry(driver_id)
+            if not entry:
                 return Response({"detail": "Wallet not found"}, status=status.HTTP_404_NOT_FOUND)
-            serializer = WalletSerializer(wallet)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # Polled by the driver app: 304 until the wallet changes
+            return conditional_response(request, entry.get("modified"),
+                                        lambda: Response(entry["wallet"], status=status.HTTP_200_OK))
         
-        # Otherwise, return all wallets
+        # Otherwise, return all wallets (streamed or page by page when asked)
         wallets = Wallet.objects.all()
+        if use_fast_rows(self):
+            if wants_ndjson(request):
+                return ndjson_rows_response(wallets, self.row_encoder)
+            paginator = KeysetPagination()
+            page = paginator.paginate_rows(wallets, request, self.row_encoder, view=self)
+            if page is not None:
+                return paginator.get_paginated_response(page)
+            return Response(self.row_encoder.rows(wallets), status=status.HTTP_200_OK)
+        if wants_ndjson(request):
+            return ndjson_response(wallets, WalletSerializer)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(wallets, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(WalletSerializer(page, many=True).data)
         serializer = WalletSerializer(wallets, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, driver_id):
-        existing_wallet = Wallet.objects.filter(driver_id=driver_id).first()
+        # Active wallet comes first, at most one per driver (unique_active_wallet_per_driver)
+        existing_wallet = Wallet.objects.for_driver(driver_id).first()
 
         if existing_wallet and existing_wallet.is_active:
             serializer = WalletSerializer(existing_wallet)
             return Response(serializer.data, status=status.HTTP_200_OK)
         
         new_wallet = Wallet.objects.create(driver_id=driver_id)
+        invalidate_wallet(driver_id)
         serializer = WalletSerializer(new_wallet)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     def patch(self, request, driver_id):
-        existing_wallet = Wallet.objects.filter(driver_id=driver_id).first()
+        existing_wallet = Wallet.objects.for_driver(driver_id).first()
         if not existing_wallet:
             return Response({"detail": "Wallet not found"}, status=status.HTTP_404_NOT_FOUND)
         
         if existing_wallet.is_active:
             existing_wallet.is_active = False
-            existing_wallet.save()  
+            existing_wallet.save(update_fields=['is_active', 'updated_at'])
+            invalidate_wallet(driver_id)
             return Response({"detail": "Wallet deactivated successfully"}, status=status.HTTP_200_OK)
         
         return Response({"detail": "Wallet is already deactivated"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Pending withdrawals (the admin list) may be read from a replica
+@replica_reads(when=lambda request, driver_id=None, **kwargs: driver_id is None)
 class Withdraw_Oprs(APIView):
+    renderer_classes = FAST_RENDERER_CLASSES
+    row_encoder = withdraw_rows
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
+
+    # Admins list pending requests and settle them, drivers list and request their own
+    def requires_admin(self, request):
+        return request.method == 'PATCH' or (request.method == 'GET' and 'driver_id' not in self.kwargs)
+
     # Get all withdrawals for a driver's wallet
     def get(self, request, driver_id=None):
         if driver_id==None:
             
             withdrawals = Withdraw.objects.filter(status="REQUESTED")
+            if use_fast_rows(self):
+                return Response(self.row_encoder.rows(withdrawals), status=status.HTTP_200_OK)
             serializer = WithdrawSerializer(withdrawals, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
 
         wallet = get_object_or_404(Wallet, driver_id=driver_id)
         withdrawals = Withdraw.objects.filter(wallet=wallet)
+        if use_fast_rows(self):
+            return Response(self.row_encoder.rows(withdrawals), status=status.HTTP_200_OK)
         serializer = WithdrawSerializer(withdrawals, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     # Create a new withdrawal request
+    @idempotent('withdraw_request')
     def post(self, request, driver_id):
-        wallet = Wallet.objects.filter(driver_id=driver_id).first()
-        if not wallet:
+        entry = get_wallet_entry(driver_id)
+        if not entry:
             return Response({'details': 'Wallet Not Found'}, status=status.HTTP_404_NOT_FOUND)
+        wallet_id = entry["wallet_id"]
 
         # Safely convert amount to float (or Decimal)
         try:
@@ -80,29 +137,32 @@ class Withdraw_Oprs(APIView):
         if amount <= 0:
             return Response({"details": "Amount must be greater than zero"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if amount > wallet.actual_balance:
-            return Response(
-                {"details": f"Enter a lesser amount. You have only {wallet.actual_balance} in your account."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        with transaction.atomic():
+            # The balance from the locked row plus its stripes, never the cached entry
+            actual_balance = LedgerPosting(wallet_id).actual_balance
+            if amount > actual_balance:
+                return Response(
+                    {"details": f"Enter a lesser amount. You have only {actual_balance} in your account."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        # Check if there is already a pending withdrawal request
-        if Withdraw.objects.filter(wallet=wallet, status="REQUESTED").exists():
-            return Response(
-                {"details": "Wait for the completion or rejection of the request you already made."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            # Check if there is already a pending withdrawal request
+            if Withdraw.objects.filter(wallet_id=wallet_id, status="REQUESTED").exists():
+                return Response(
+                    {"details": "Wait for the completion or rejection of the request you already made."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        # Create withdrawal
-        withdrawal = Withdraw.objects.create(
-            wallet=wallet,
-            amount=amount,
-            account_holder_name=request.data.get('account_holder_name'),
-            bank_name=request.data.get('bank_name'),
-            ifsc_code=request.data.get('ifsc_code'),
-            account_number=request.data.get('account_number'),
-            contact_info=request.data.get('contact_info')
-        )
+            # Create withdrawal
+            withdrawal = Withdraw.objects.create(
+                wallet_id=wallet_id,
+                amount=amount,
+                account_holder_name=request.data.get('account_holder_name'),
+                bank_name=request.data.get('bank_name'),
+                ifsc_code=request.data.get('ifsc_code'),
+                account_number=request.data.get('account_number'),
+                contact_info=request.data.get('contact_info')
+            )
 
         serializer = WithdrawSerializer(withdrawal)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -114,23 +174,29 @@ class Withdraw_Oprs(APIView):
 
         if not new_status:
             return Response({'details': 'Status is required'}, status=status.HTTP_400_BAD_REQUEST)
+        new_status = new_status.strip().upper()
 
-        withdrawal.status = new_status.strip()
-        withdrawal.save()
+        # Debit (or refund of a failed payout) and status change commit together, or not at all
+        try:
+            with transaction.atomic():
+                withdrawal = Withdraw.objects.select_for_update().get(pk=withdrawal.pk)
+                if withdrawal.claim_token is not None:
+                    # A payout worker owns the row until it settles, it may already be paying it out
+                    return Response({"details": "Withdrawal is being processed by a payout worker"},
+                                    status=status.HTTP_409_CONFLICT)
+                check_transition(withdrawal, new_status)
+                if withdrawal.status == 'REQUESTED' and new_status in ('PROCESSING', 'COMPLETED'):
+                    record_withdrawal(withdrawal)
+                elif withdrawal.status == 'PROCESSING' and new_status == 'FAILED':
+                    reverse_withdrawals([withdrawal])
+                withdrawal.status = new_status
+                if new_status in ('COMPLETED', 'FAILED'):
+                    withdrawal.processed_at = timezone.now()
+                withdrawal.save(update_fields=['status', 'processed_at'])
+        except (InsufficientBalance, InvalidTransition) as e:
+            return Response({"details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         wallet = withdrawal.wallet
-        withdrawal_amount = Decimal(withdrawal.amount)
-        if wallet.actual_balance >= withdrawal_amount:
-            wallet.actual_balance -= withdrawal_amount
-            print(wallet.actual_balance)
-            wallet.save()
-        else:
-
-            return Response(
-                     {"details": "Insufficient wallet balance to complete withdrawal"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
         serializer = WithdrawSerializer(withdrawal)
         return Response({
             "withdrawal": serializer.data,
@@ -141,6 +207,9 @@ class Withdraw_Oprs(APIView):
 
 # Admin Bonus view 
 class Admin_Bonus(APIView):
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
+
     def post(self, request, wallet_id=None):
         try:
             amount = request.data.get("amount")
@@ -150,33 +219,38 @@ class Admin_Bonus(APIView):
             # Convert amount to Decimal
             amount = Decimal(amount)
 
+            # Bonus is netted against any pending deduction first (see ledger.apply_bonus)
             if wallet_id:
-                wallet = Wallet.objects.filter(wallet_id=wallet_id,is_active=True).first()
-                if not wallet:
+                wallets = Wallet.objects.filter(wallet_id=wallet_id, is_active=True)
+                if not apply_bonus(wallets, amount):
                     return Response({"error": "Wallet not found"}, status=status.HTTP_404_NOT_FOUND)
-
-                # Deduct adjustment if any
-                if wallet.a_deduct > 0:
-                    wallet.actual_balance = amount - wallet.a_deduct if wallet.a_deduct < amount else Decimal(0)
-                    wallet.a_deduct = wallet.a_deduct - amount if wallet.a_deduct > amount else Decimal(0)
-
-                # Add bonus amount
-                wallet.actual_balance += amount
-                wallet.total_balance += amount
-                wallet.save()
-            
             else:
-                # Bulk update for all active wallets
-                wallets = Wallet.objects.filter(is_active=True)
-                for wallet in wallets:
-                    if wallet.a_deduct > 0:
-                        wallet.actual_balance = amount - wallet.a_deduct if wallet.a_deduct < amount else Decimal(0)
-                        wallet.a_deduct = Decimal(0)
-                    wallet.actual_balance += amount
-                    wallet.total_balance += amount
-                    wallet.save()
+                # All active wallets: chunked background job, poll bonus/jobs/<job_id>/
+                with transaction.atomic():
+                    job = create_bonus_job(amount)
+                    start_bonus_job(job)
+                return Response({"message": "Bonus job queued", **job_progress(job)}, status=status.HTTP_202_ACCEPTED)
 
             return Response({"message": "Bonus added successfully"}, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Bonus Job Progress view
+class BonusJobStatusView(APIView):
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
+
+    def get(self, request, job_id):
+        job = get_object_or_404(BonusJob, job_id=job_id)
+        return Response(job_progress(job), status=status.HTTP_200_OK)
+
+
+# Wallet Read Cache Counters
+class WalletCacheStatsView(APIView):
+    authentication_classes = ADMIN_AUTHENTICATION
+    permission_classes = ADMIN_PERMISSIONS
+
+    def get(self, request):
+        return Response(wallet_cache_stats.as_dict(), status=status.HTTP_200_OK)